@@ -12,9 +12,12 @@ import urllib.request
 import asyncio
 import datetime
 from utils.fund_radar import FundRadar
+from utils.money_flow import MoneyFlow
+from utils.watchlist_scheduler import get_scheduler, RequestBudget
 from plotly.utils import PlotlyJSONEncoder
 from utils.charts import create_candlestick_chart, get_demo_fenxing_data, get_chart_data
-from utils.simulator_logic import generate_simulation_data, analyze_action, resample_klines, analyze_advanced_action, get_chanlun_shapes
+from utils.simulator_logic import analyze_action, analyze_advanced_action, get_chanlun_shapes
+from utils.game_pool import GamePool
 from pages.market_sentiment_page import render_sentiment_view
 from pages.shared import setup_common_ui, custom_plotly
 from pages.social_security_demo import social_security_page_instance
@@ -82,6 +85,56 @@ async def run_background_tasks():
 
 app.on_startup(run_background_tasks)
 
+# --- 自选股股东户数预取 ---
+HOLDER_PREFETCH_INTERVAL = 30 * 60  # 秒；只下载缺失或过期的条目，数据新鲜时几乎没有开销
+
+async def run_holder_prefetch():
+    """后台任务：非交易时段把自选股的股东户数与个股信息下载到本地，盘中点击时直接命中缓存"""
+    loop = asyncio.get_running_loop()
+    mf = MoneyFlow()
+    while True:
+        try:
+            if not FundRadar.is_trading_time():
+                refreshed = await loop.run_in_executor(None, mf.prefetch_holder_data)
+                if refreshed:
+                    print(f"[HolderPrefetch] Refreshed {refreshed} entries")
+        except Exception as e:
+            print(f"[HolderPrefetch] Task error: {e}")
+        await asyncio.sleep(HOLDER_PREFETCH_INTERVAL)
+
+app.on_startup(run_holder_prefetch)
+
+# --- 自选股预计算 ---
+# 全局上游请求预算 (次/分钟)，可通过环境变量调整
+watch_scheduler = get_scheduler()
+watch_scheduler.budget = RequestBudget(per_minute=int(os.environ.get('WATCH_BUDGET_PER_MIN', 60)))
+
+async def run_watch_scheduler():
+    """后台任务：按市场时钟预计算已登记自选股的资金流与买卖助手"""
+    await watch_scheduler.run()
+
+app.on_startup(run_watch_scheduler)
+
+# --- 模拟器对局池 ---
+# 每种模式预先准备的局数和池子内存上限 (MB)，可通过环境变量调整
+game_pool = GamePool(
+    size=int(os.environ.get('SIM_POOL_SIZE', 2)),
+    max_bytes=int(os.environ.get('SIM_POOL_MAX_MB', 64)) * 1024 * 1024,
+)
+
+async def run_game_pool():
+    """后台任务：空闲时补充模拟器对局池"""
+    loop = asyncio.get_running_loop()
+    while True:
+        built = False
+        try:
+            built = await loop.run_in_executor(None, game_pool.refill_once)
+        except Exception as e:
+            print(f"[GamePool] Refill error: {e}")
+        await asyncio.sleep(0.1 if built else 1)
+
+app.on_startup(run_game_pool)
+
 # Enable Gzip compression to reduce the size of large static files (like index.js)
 # This significantly reduces transfer size (e.g. 1.4MB -> ~400KB)
 from starlette.middleware.gzip import GZipMiddleware
@@ -194,6 +247,19 @@ class LearnState:
         self.sim_macd_week = {}
         self.sim_macd_month = {}
         self.sim_macd_60d = {}
+        # 日线位置 -> 周/月K序号的查表数组 (day_to_bar_map)
+        self.sim_week_map = None
+        self.sim_month_map = None
+        # 当前模拟行情的随机种子，相同种子可复盘同一局
+        self.sim_seed = None
+        # 日/周/月线的背驰索引 (DivergenceIndex)
+        self.sim_div_index = None
+        self.sim_div_index_week = None
+        self.sim_div_index_month = None
+        # 各级别的增量缠论引擎，随 sim_index 推进逐根 push
+        self.sim_engine = None
+        self.sim_engine_week = None
+        self.sim_engine_month = None
         self.sim_index = 0
         self.sim_balance = 100000  
         self.sim_shares = 0
@@ -344,15 +410,19 @@ def learn_page():
     def set_mode(mode): state.sim_mode = mode; start_new_game()
     def switch_sim_period(p): state.sim_view_period = p; render_content()
     def start_new_game():
-        data_len = 2000 if state.sim_mode == 'advanced' else 400
-        data, macd = generate_simulation_data(initial_price=20, length=data_len)
-        state.sim_data = data; state.sim_macd = macd
+        # 从对局池取出预先生成好的一局 (各级别K线、MACD、查表数组、背驰索引、预热的增量引擎)
+        game = game_pool.get(state.sim_mode)
+        state.sim_seed = game.seed; state.sim_index = game.index
+        state.sim_data = game.data; state.sim_macd = game.macd
         if state.sim_mode == 'advanced':
-            state.sim_data_week, state.sim_macd_week = resample_klines(data, 5)
-            state.sim_data_month, state.sim_macd_month = resample_klines(data, 20)
-            state.sim_data_60d, state.sim_macd_60d = resample_klines(data, 60)
-            state.sim_index = 1250
-        else: state.sim_index = 80
+            state.sim_data_week, state.sim_macd_week = game.data_week, game.macd_week
+            state.sim_data_month, state.sim_macd_month = game.data_month, game.macd_month
+            state.sim_data_60d, state.sim_macd_60d = game.data_60d, game.macd_60d
+            state.sim_week_map = game.week_map; state.sim_month_map = game.month_map
+        state.sim_engine = game.engine
+        state.sim_engine_week = game.engine_week; state.sim_engine_month = game.engine_month
+        state.sim_div_index = game.div_index
+        state.sim_div_index_week = game.div_index_week; state.sim_div_index_month = game.div_index_month
         state.sim_balance = 100000; state.sim_shares = 0; state.sim_game_active = True
         state.sim_feedback = "游戏开始！请观察当前走势。"; state.sim_stats = {'correct': 0, 'wrong': 0, 'total': 0}; state.sim_shapes = []
         render_content()
@@ -373,16 +443,17 @@ def learn_page():
         else: msg = "观望"
         
         if state.sim_mode == 'advanced':
-             fb, sc, sh = analyze_advanced_action(action, state.sim_index, state.sim_data[:state.sim_index+1], {k: v[:state.sim_index+1] for k, v in state.sim_macd.items()}, state.sim_data_week, state.sim_macd_week, state.sim_data_month, state.sim_macd_month)
+             fb, sc, sh = analyze_advanced_action(action, state.sim_index, state.sim_data[:state.sim_index+1], {k: v[:state.sim_index+1] for k, v in state.sim_macd.items()}, state.sim_data_week, state.sim_macd_week, state.sim_data_month, state.sim_macd_month, state.sim_engine, state.sim_week_map, state.sim_month_map, state.sim_div_index, state.sim_div_index_week, state.sim_div_index_month)
         else:
-             fb, sc, sh = analyze_action(action, state.sim_data[:state.sim_index+1], {k: v[:state.sim_index+1] for k, v in state.sim_macd.items()}, state.sim_index)
+             fb, sc, sh = analyze_action(action, state.sim_data[:state.sim_index+1], {k: v[:state.sim_index+1] for k, v in state.sim_macd.items()}, state.sim_index, state.sim_engine, state.sim_div_index)
         
         state.sim_shapes = sh
         if sc > 0: state.sim_stats['correct'] += 1
         elif sc == -1: state.sim_stats['wrong'] += 1
         state.sim_stats['total'] += 1
         state.sim_feedback = f"**操作**: {action.upper()} - {msg}\n\n**分析**: {fb}"
-        if state.sim_index < len(state.sim_data) - 1: state.sim_index += 1
+        if state.sim_index < len(state.sim_data) - 1:
+            state.sim_index += 1; state.sim_engine.push(state.sim_data[state.sim_index])
         else: state.sim_game_active = False
         render_content()
 
@@ -434,16 +505,18 @@ def learn_page():
                 else:
                     source = state.sim_data_week if state.sim_view_period == 'week' else state.sim_data_month
                     m_source = state.sim_macd_week if state.sim_view_period == 'week' else state.sim_macd_month
+                    engine = state.sim_engine_week if state.sim_view_period == 'week' else state.sim_engine_month
+                    div_index = state.sim_div_index_week if state.sim_view_period == 'week' else state.sim_div_index_month
+                    bar_map = state.sim_week_map if state.sim_view_period == 'week' else state.sim_month_map
                     curr_time = state.sim_data[idx]['time']
-                    cut = 0
-                    for i, k in enumerate(source):
-                        if k['start_day_idx'] <= curr_time: cut = i + 1
-                        else: break
+                    # 当前日线所在的周/月K (含) 之前的K线数量
+                    cut = int(bar_map[curr_time]) + 1 if bar_map is not None and curr_time < len(bar_map) else 0
                     vs = max(0, cut - 80); ve = cut
                     chart_data = source[vs:ve]
                     chart_macd = {k: v[vs:ve] for k, v in m_source.items()}
+                    if engine is not None and len(engine) <= cut: engine.extend(source[len(engine):cut])
                     if len(source[:cut]) > 3:
-                        raw = get_chanlun_shapes(source[:cut], {k: v[:cut] for k, v in m_source.items()}, cut-1)
+                        raw = get_chanlun_shapes(source[:cut], {k: v[:cut] for k, v in m_source.items()}, cut-1, engine, div_index)
                         for s in raw:
                             if max(s.get('x0', 0), s.get('x1', 0)) >= vs:
                                 ns = s.copy(); ns['x0'] -= vs; ns['x1'] -= vs; disp_sh.append(ns)
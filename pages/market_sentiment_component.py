@@ -3,6 +3,7 @@ from utils.market_sentiment import MarketSentiment
 from utils.index_data import IndexDataManager
 from utils.macro_data import get_savings_mv_ratio_data
 from pages.shibor_component import render_shibor_panel
+from pages.shared import custom_plotly, downsampled_plotly
 import plotly.graph_objects as go
 import pandas as pd
 import asyncio
@@ -14,6 +15,9 @@ from concurrent.futures import ThreadPoolExecutor
 executor = ThreadPoolExecutor(max_workers=2)
 
 def render_market_sentiment_panel(plotly_renderer, is_mobile=False):
+    # 长序列 (多年日线温度 + 指数) 降采样发送，缩放后按可见区间补全
+    plot_long = downsampled_plotly if plotly_renderer is custom_plotly else plotly_renderer
+
     # Top Layout: Info + Gauge
     # Modified for Mobile: Stack vertically on mobile (flex-col), row on PC (md:flex-row)
     # Unified gap to gap-6 for consistency
@@ -423,7 +427,7 @@ def render_market_sentiment_panel(plotly_renderer, is_mobile=False):
         if chart_plot_area.is_deleted: return
         chart_plot_area.clear()
         with chart_plot_area:
-            plotly_renderer(fig).classes('w-full h-full')
+            plot_long(fig).classes('w-full h-full')
         
         if data_container.is_deleted: return
         data_container.classes(remove='hidden')
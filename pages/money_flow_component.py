@@ -5,12 +5,21 @@ import asyncio
 import pandas as pd
 import json
 from utils.money_flow import MoneyFlow
+from utils.chart_stream import FigureStream
+from utils.fund_radar import FundRadar
+from utils.security_master import get_master
+from utils.watchlist_scheduler import get_scheduler
+from pages.shared import custom_plotly, downsampled_plotly, stream_plotly
+
+LIVE_REFRESH_SEC = 15  # 盘中买卖助手增量刷新间隔
 
 def render_money_flow_panel(plotly_renderer=None):
     mf = MoneyFlow()
     
     # Use provided renderer or fallback to ui.plotly
     plot_func = plotly_renderer if plotly_renderer else ui.plotly
+    # 散户数量等长序列降采样发送，缩放后按可见区间补全
+    plot_long = downsampled_plotly if plot_func is custom_plotly else plot_func
 
     # State
     # Use app.storage.browser for initial loading from browser local storage
@@ -36,8 +45,15 @@ def render_money_flow_panel(plotly_renderer=None):
         'kline_window': '近60个',
         'render_ticket': 0,
         'subs': [],  # Start empty, load later
-        'groups': ['默认']
+        'groups': ['默认'],
+        'quotes': {},  # code -> 批量实时行情
     }
+    # 买卖助手盘中推送：当前图表的 FigureStream 与 DOM id，切换股票/周期时整图重绘并重置
+    live = {'stream': None, 'busy': False}
+    # 自选股登记到后台调度器预计算，点击时优先用预计算结果；页面断开时注销
+    scheduler = get_scheduler()
+    client_id = ui.context.client.id
+    ui.context.client.on_disconnect(lambda: scheduler.forget(client_id))
     
     def get_subs():
         return state['subs']
@@ -48,6 +64,7 @@ def render_money_flow_panel(plotly_renderer=None):
         ui.run_javascript(js_cmd)
 
     def save_subs_to_browser():
+        scheduler.watch(client_id, [s['code'] for s in state['subs']])
         # Sync current state to browser LocalStorage
         js_val = json.dumps(state['subs'], ensure_ascii=False)
         # Escape for JS string
@@ -87,6 +104,9 @@ def render_money_flow_panel(plotly_renderer=None):
             data_str = await ui.run_javascript('return localStorage.getItem("stock_subscriptions")')
             if data_str:
                 state['subs'] = json.loads(data_str)
+                # 登记到服务端，非交易时段预取股东户数，并由调度器后台预计算
+                mf.watch_codes([s['code'] for s in state['subs']])
+                scheduler.watch(client_id, [s['code'] for s in state['subs']])
             
             # Read Groups
             groups_str = await ui.run_javascript('return localStorage.getItem("stock_groups")')
@@ -104,10 +124,28 @@ def render_money_flow_panel(plotly_renderer=None):
                 state['groups'].insert(0, '默认')
                 
             refresh_list()
+            await refresh_quotes()
         except Exception as e:
             # Maybe silenced if not on browser context yet, but should be fine inside a timer
             print(f"Error loading subs: {e}")  
 
+    async def refresh_quotes():
+        # 整个自选列表一次批量请求：最新价/涨跌幅，并补全未命名股票的名称
+        codes = [s['code'] for s in state['subs']]
+        if not codes:
+            return
+        loop = asyncio.get_event_loop()
+        state['quotes'] = await loop.run_in_executor(None, mf.get_quotes, codes)
+        renamed = False
+        for s in state['subs']:
+            q = state['quotes'].get(s['code'])
+            if q and q.get('name') and s.get('name', s['code']) == s['code']:
+                s['name'] = q['name']
+                renamed = True
+        if renamed:
+            save_subs_to_browser()
+        refresh_list()
+
 
     # -- Logic Manager Functions --
     # Dialog for Group Management
@@ -214,13 +252,52 @@ def render_money_flow_panel(plotly_renderer=None):
             # Input Area
             with ui.column().classes('w-full gap-3 bg-gray-50 p-3 rounded-lg border border-gray-200'):
                 ui.label('添加新股票').classes('text-xs font-bold text-gray-500 uppercase tracking-wider')
-                code_input = ui.input(placeholder='代码 (如 600000)').props('outlined dense bg-white').classes('w-full')
+                code_input = ui.input(placeholder='代码 / 名称 / 拼音首字母 (如 600000、茅台、GZMT)').props('outlined dense bg-white').classes('w-full')
+                # 本地证券主表联想，输入即查，不走网络
+                suggest_box = ui.column().classes('w-full gap-0 bg-white rounded border border-gray-200 hidden')
                 name_input = ui.input(placeholder='名称 (可选)').props('outlined dense bg-white').classes('w-full')
-                
+                suggestions = []
+
+                def pick_suggestion(row):
+                    code_input.value = row['code']
+                    name_input.value = row['name']
+                    suggestions.clear()
+                    suggest_box.clear()
+                    suggest_box.classes(add='hidden')
+
+                def on_code_input(e):
+                    val = (e.value or '').strip()
+                    suggestions[:] = get_master().search(val) if val else []
+                    # 已是完整代码且唯一命中时不必再弹出
+                    if len(suggestions) == 1 and suggestions[0]['code'] == val:
+                        suggestions.clear()
+                    suggest_box.clear()
+                    if not suggestions:
+                        suggest_box.classes(add='hidden')
+                        return
+                    suggest_box.classes(remove='hidden')
+                    with suggest_box:
+                        for row in suggestions:
+                            with ui.row().classes('w-full px-2 py-1 gap-2 items-center cursor-pointer hover:bg-blue-50') \
+                                    .on('mousedown', lambda _, r=row: pick_suggestion(r)):
+                                ui.label(row['code']).classes('text-xs font-mono text-gray-500')
+                                ui.label(row['name']).classes('text-sm text-gray-800')
+                                ui.label(row['initials']).classes('text-xs text-gray-400 ml-auto')
+
+                code_input.on_value_change(on_code_input)
+
                 # Auto-fetch name logic
                 async def on_code_changed(e):
-                    val = e.value
+                    val = (e.value or '').strip()
+                    if val and not val.isdigit() and suggestions:
+                        # 输入名称或拼音后回车，取第一条联想
+                        pick_suggestion(suggestions[0])
+                        val = code_input.value
                     if val and len(val) >= 6 and val.isdigit():
+                        row = get_master().get(val)
+                        if row:
+                            name_input.value = row['name']
+                            return
                         # Try fetch
                         loop = asyncio.get_event_loop()
                         name = await loop.run_in_executor(None, mf.get_stock_name, val)
@@ -254,9 +331,11 @@ def render_money_flow_panel(plotly_renderer=None):
                     success, msg = add_sub(code, name, group)
                     if success:
                         ui.notify(f'已添加 {code}')
+                        mf.watch_codes([code])
                         code_input.value = ''
                         name_input.value = ''
                         refresh_list()
+                        await refresh_quotes()
                     else:
                         ui.notify(msg, type='negative')
 
@@ -278,6 +357,7 @@ def render_money_flow_panel(plotly_renderer=None):
                 with ui.row().classes('items-center gap-3 flex-shrink-0'):
                     ui.icon('analytics', color='primary').classes('text-3xl')
                     header_label = ui.label('请选择左侧股票查看个股医生指标').classes('text-2xl font-bold text-gray-800 tracking-tight')
+                    fresh_label = ui.label('').classes('text-xs text-gray-400 whitespace-nowrap')
                 
                 controls_container = ui.row().classes('items-center gap-2 flex-nowrap overflow-x-auto custom-scrollbar pb-1')
             
@@ -368,12 +448,450 @@ def render_money_flow_panel(plotly_renderer=None):
 
     # -- Logic Functions --
     
+    def build_assistant_figure(kdf, analysis, period):
+        """买卖助手主图 (K线/均线/笔/买卖点 + MACD/BOLL 副图)，返回 (fig, 最后一根K线时间)"""
+        # Map bi_points to real indices in FULL kdf
+        raw_bi_points = analysis.get('bi_points', [])
+        valid_bi_points = []
+        if not kdf.empty:
+            # Create a map for faster lookup if needed, but get_loc is fast for DatetimeIndex
+            for p in raw_bi_points:
+                try:
+                    p_dt = pd.to_datetime(p['date'])
+                    # Ensure we find the exact index
+                    if p_dt in kdf.index:
+                        p['real_idx'] = kdf.index.get_loc(p_dt)
+                        valid_bi_points.append(p)
+                except:
+                    continue
+        raw_bi_points = valid_bi_points
+
+        if not kdf.empty:
+            _closes = pd.to_numeric(kdf.get('close'), errors='coerce').ffill().bfill()
+            kdf['boll_mid'] = _closes.rolling(window=20, min_periods=2).mean().ffill().bfill()
+            _std = _closes.rolling(window=20, min_periods=2).std().fillna(0)
+            kdf['boll_upper'] = kdf['boll_mid'] + 2 * _std
+            kdf['boll_lower'] = kdf['boll_mid'] - 2 * _std
+
+        # Slice for display AFTER calculation
+        bar_count = 180
+
+        start_idx = 0
+        full_len = len(kdf)
+        if bar_count and full_len > bar_count:
+            start_idx = full_len - bar_count
+            kdf = kdf.iloc[-bar_count:]
+
+        date_fmt = '%Y-%m-%d' if period in ['day', 'week'] else '%Y-%m-%d %H:%M'
+        x_labels = kdf.index.strftime(date_fmt)
+
+        # Filter and Format bi_points to match visible x-axis
+        bi_points = []
+        if not kdf.empty:
+            # 1. Add boundary crossing point (interpolation)
+            if start_idx > 0 and raw_bi_points:
+                for i in range(len(raw_bi_points) - 1):
+                    p1 = raw_bi_points[i]
+                    p2 = raw_bi_points[i+1]
+                    idx1 = p1.get('real_idx', -1)
+                    idx2 = p2.get('real_idx', -1)
+
+                    # Check if segment crosses start_idx
+                    if idx1 < start_idx and idx2 >= start_idx:
+                        # Interpolate price at start_idx
+                        if idx2 != idx1:
+                            ratio = (start_idx - idx1) / (idx2 - idx1)
+                            price_at_start = p1['price'] + ratio * (p2['price'] - p1['price'])
+
+                            # Add virtual start point at the first visible date
+                            start_date_str = kdf.index[0].strftime(date_fmt)
+                            bi_points.append({
+                                'date': start_date_str,
+                                'price': price_at_start,
+                                'type': 'virtual'
+                            })
+                        break
+
+            # 2. Add visible points
+            for p in raw_bi_points:
+                if p.get('real_idx', -1) >= start_idx:
+                    p_copy = p.copy()
+                    p_dt = pd.to_datetime(p['date'])
+                    p_copy['date'] = p_dt.strftime(date_fmt) # Update to match x_labels format
+                    bi_points.append(p_copy)
+
+        macd_hist = pd.to_numeric(kdf.get('macd_hist'), errors='coerce').fillna(0)
+        dif = pd.to_numeric(kdf.get('dif'), errors='coerce').fillna(0)
+        dea = pd.to_numeric(kdf.get('dea'), errors='coerce').fillna(0)
+        boll_mid = kdf.get('boll_mid', pd.Series(0, index=kdf.index))
+        boll_upper = kdf.get('boll_upper', pd.Series(0, index=kdf.index))
+        boll_lower = kdf.get('boll_lower', pd.Series(0, index=kdf.index))
+        macd_colors = ['#ef4444' if v >= 0 else '#10b981' for v in macd_hist]
+        gc_mask = kdf.get('golden_cross', pd.Series(False, index=kdf.index)).fillna(False).values
+        dc_mask = kdf.get('dead_cross', pd.Series(False, index=kdf.index)).fillna(False).values
+        last_date = kdf.index.max()
+        gap_days = (pd.Timestamp.now().normalize() - pd.Timestamp(last_date).normalize()).days if pd.notna(last_date) else 0
+
+        # 浅色金融科技风配色方案
+        COLOR_UP = '#ef4444'     # 红色 (涨)
+        COLOR_DOWN = '#22c55e'   # 绿色 (跌)
+        COLOR_MA5 = '#f59e0b'    # 橙色
+        COLOR_MA10 = '#3b82f6'   # 蓝色
+        COLOR_MA20 = '#8b5cf6'   # 紫色
+        COLOR_MA30 = '#ec4899'   # 粉色
+        COLOR_MA60 = '#64748b'   # 灰色
+        COLOR_BI = '#94a3b8'     # 笔 (Slate-400)
+        COLOR_BG = '#ffffff'     # 背景纯白
+        COLOR_GRID = '#f1f5f9'   # 网格极淡 (Slate-100)
+        COLOR_TEXT = '#475569'   # 文本 (Slate-600)
+
+        fig = make_subplots(
+            rows=2, cols=1,
+            shared_xaxes=True,
+            vertical_spacing=0.05, # 压缩主副图间距
+            row_heights=[0.75, 0.25] # 主副图区域分配，因为底部还有滑块被单独计算
+        )
+
+        visible_macd = []
+        visible_boll = []
+
+        def _add_trace(trace, row, col, kind='all'):
+            fig.add_trace(trace, row=row, col=col)
+            if kind == 'all':
+                visible_macd.append(True)
+                visible_boll.append(True)
+            elif kind == 'macd':
+                visible_macd.append(True)
+                visible_boll.append(False)
+                fig.data[-1].visible = True
+            elif kind == 'boll':
+                visible_macd.append(False)
+                visible_boll.append(True)
+                fig.data[-1].visible = False
+
+        # 1. K线图
+        _add_trace(go.Candlestick(
+            x=x_labels,
+            open=kdf['open'],
+            high=kdf['high'],
+            low=kdf['low'],
+            close=kdf['close'],
+            increasing_line_color=COLOR_UP,
+            decreasing_line_color=COLOR_DOWN,
+            increasing_fillcolor=COLOR_UP,
+            decreasing_fillcolor=COLOR_DOWN,
+            name='K线'
+        ), row=1, col=1)
+
+        # 2. 均线
+        _add_trace(go.Scatter(x=x_labels, y=kdf['ma5'], mode='lines', line=dict(color=COLOR_MA5, width=1), name='MA5'), row=1, col=1)
+        _add_trace(go.Scatter(x=x_labels, y=kdf['ma10'], mode='lines', line=dict(color=COLOR_MA10, width=1), name='MA10'), row=1, col=1)
+        _add_trace(go.Scatter(x=x_labels, y=kdf['ma20'], mode='lines', line=dict(color=COLOR_MA20, width=1), name='MA20'), row=1, col=1)
+        _add_trace(go.Scatter(x=x_labels, y=kdf['ma30'], mode='lines', line=dict(color=COLOR_MA30, width=1), name='MA30'), row=1, col=1)
+        _add_trace(go.Scatter(x=x_labels, y=kdf['ma60'], mode='lines', line=dict(color=COLOR_MA60, width=1.2, dash='dot'), name='MA60'), row=1, col=1)
+
+        # 3. 缠论笔与分型
+        # bi_points already filtered and formatted above
+        if len(bi_points) >= 2:
+            # Dates are already formatted to match x_labels
+            bi_x = [p['date'] for p in bi_points]
+            bi_y = [p['price'] for p in bi_points]
+            # 笔线
+            _add_trace(go.Scatter(
+                x=bi_x,
+                y=bi_y,
+                mode='lines+markers',
+                line=dict(color=COLOR_BI, width=1.5, dash='solid'), # 笔改为实线更清晰，或保留虚线
+                marker=dict(size=4, color=COLOR_BI),
+                name='缠论笔',
+                opacity=0.8
+            ), row=1, col=1)
+
+            # 顶底分型
+            top_x = [p['date'] for p in bi_points if p.get('type') == 'top']
+            top_y = [p['price'] for p in bi_points if p.get('type') == 'top']
+            bot_x = [p['date'] for p in bi_points if p.get('type') == 'bottom']
+            bot_y = [p['price'] for p in bi_points if p.get('type') == 'bottom']
+
+            if top_x:
+                _add_trace(go.Scatter(
+                    x=top_x, y=top_y, mode='markers',
+                    marker=dict(size=6, color=COLOR_DOWN, symbol='circle-open', line=dict(width=1.5)),
+                    name='顶分型', showlegend=False
+                ), row=1, col=1)
+            if bot_x:
+                _add_trace(go.Scatter(
+                    x=bot_x, y=bot_y, mode='markers',
+                    marker=dict(size=6, color=COLOR_UP, symbol='circle-open', line=dict(width=1.5)),
+                    name='底分型', showlegend=False
+                ), row=1, col=1)
+
+        # 4. 买卖点标记
+        buy_mask = kdf['buy_signal'].fillna(False).values
+        sell_mask = kdf['sell_signal'].fillna(False).values
+
+        # 增强买卖点显示
+        if buy_mask.any():
+            _add_trace(go.Scatter(
+                x=x_labels[buy_mask],
+                y=kdf['buy_y'][buy_mask],
+                mode='markers+text',
+                marker=dict(
+                    size=16, 
+                    color=COLOR_UP, 
+                    symbol='triangle-up',
+                    line=dict(width=1, color='white')
+                ),
+                text=['<b>买</b>'] * int(buy_mask.sum()),
+                textfont=dict(color=COLOR_UP, size=14), # 字体加大加粗
+                textposition='bottom center', # 文字在图标下方
+                name='买点'
+            ), row=1, col=1)
+        if sell_mask.any():
+            _add_trace(go.Scatter(
+                x=x_labels[sell_mask],
+                y=kdf['sell_y'][sell_mask],
+                mode='markers+text',
+                marker=dict(
+                    size=16, 
+                    color=COLOR_DOWN, 
+                    symbol='triangle-down',
+                    line=dict(width=1, color='white')
+                ),
+                text=['<b>卖</b>'] * int(sell_mask.sum()),
+                textfont=dict(color=COLOR_DOWN, size=14), # 字体加大加粗
+                textposition='top center', # 文字在图标上方
+                name='卖点'
+            ), row=1, col=1)
+
+        # 5. 副图指标（MACD）
+        _add_trace(go.Bar(
+            x=x_labels,
+            y=macd_hist,
+            marker_color=macd_colors,
+            name='MACD柱',
+            marker_line_width=0, # 去掉柱子边框
+            hovertemplate='%{y:.3f}<extra></extra>'
+        ), row=2, col=1, kind='macd')
+        _add_trace(go.Scatter(x=x_labels, y=dif, mode='lines', line=dict(color=COLOR_MA10, width=1.5), name='DIF'), row=2, col=1, kind='macd')
+        _add_trace(go.Scatter(x=x_labels, y=dea, mode='lines', line=dict(color=COLOR_MA5, width=1.5), name='DEA'), row=2, col=1, kind='macd')
+
+        if gc_mask.any():
+            _add_trace(go.Scatter(
+                x=x_labels[gc_mask], y=dif[gc_mask], mode='markers',
+                marker=dict(color=COLOR_UP, size=6, symbol='diamond'),
+                name='金叉', showlegend=False
+            ), row=2, col=1, kind='macd')
+        if dc_mask.any():
+            _add_trace(go.Scatter(
+                x=x_labels[dc_mask], y=dif[dc_mask], mode='markers',
+                marker=dict(color=COLOR_DOWN, size=6, symbol='diamond'),
+                name='死叉', showlegend=False
+            ), row=2, col=1, kind='macd')
+
+        # 副图指标（布林线）
+        # 使用自定义Bar伪造K线，完全避开 Plotly 底层 Candlestick 组件在控制隐藏时引发的 Margin 塌陷 Bug
+        kline_colors = ['rgba(239,68,68,0.7)' if c >= o else 'rgba(34,197,94,0.7)' for c, o in zip(kdf['close'], kdf['open'])]
+        body_y = [max(abs(c - o), 0.01) for c, o in zip(kdf['close'], kdf['open'])] # 保证十字星也有极小的一点高度
+        body_base = [min(c, o) for c, o in zip(kdf['close'], kdf['open'])]
+
+        # 辅助K线：影线 (High-Low)
+        _add_trace(go.Bar(
+            x=x_labels, y=kdf['high'] - kdf['low'], base=kdf['low'],
+            marker_color=kline_colors, width=0.1, # 细线
+            name='K线(辅)影线', showlegend=False, hoverinfo='skip'
+        ), row=2, col=1, kind='boll')
+
+        # 辅助K线：实体 (Open-Close)
+        _add_trace(go.Bar(
+            x=x_labels, y=body_y, base=body_base,
+            marker_color=kline_colors, width=0.6, # 宽条
+            name='K线(辅)实体', showlegend=False, hoverinfo='skip'
+        ), row=2, col=1, kind='boll')
+
+        _add_trace(go.Scatter(
+            x=x_labels, y=boll_upper, mode='lines', line=dict(color=COLOR_MA20, width=1.5), name='BOLL上轨'
+        ), row=2, col=1, kind='boll')
+        _add_trace(go.Scatter(
+            x=x_labels, y=boll_mid, mode='lines', line=dict(color=COLOR_MA60, width=1.3), name='BOLL中轨'
+        ), row=2, col=1, kind='boll')
+        _add_trace(go.Scatter(
+            x=x_labels, y=boll_lower, mode='lines', line=dict(color=COLOR_MA10, width=1.5), name='BOLL下轨'
+        ), row=2, col=1, kind='boll')
+
+        # 6. Layout 布局优化
+        fig.update_layout(
+            height=600, # 强制图表总高度固定为600px（主图70%, 副图25%, 留些给图例和间距）
+            margin=dict(l=10, r=10, t=30, b=10),
+            paper_bgcolor=COLOR_BG,
+            plot_bgcolor=COLOR_BG,
+            hovermode='x unified',
+            xaxis_rangeslider_visible=False,
+            xaxis2_rangeslider_visible=True, # 开启副图自带的滑块 (5%)
+            # 图例样式
+            legend=dict(
+                orientation='h',
+                yanchor='bottom', y=1.02,
+                xanchor='left', x=0,
+                bgcolor='rgba(255,255,255,0.8)',
+                bordercolor=COLOR_GRID,
+                borderwidth=0,
+                font=dict(size=10, color=COLOR_TEXT),
+                itemwidth=30
+            ),
+            font=dict(family="Roboto, 'Segoe UI', 'Microsoft YaHei', sans-serif", color=COLOR_TEXT, size=11),
+            # 构建主副图中间的切换按钮
+            updatemenus=[
+                dict(
+                    type="buttons",
+                    direction="right",
+                    active=0,
+                    x=0.01,
+                    y=0.258, # 精确定位在主副图之间（无遮挡）
+                    xanchor="left",
+                    yanchor="middle",
+                    pad={"r": 10, "t": 0, "b": 0},
+                    showactive=True,
+                    buttons=list([
+                        dict(
+                            label="MACD",
+                            method="update",
+                            args=[
+                                {"visible": visible_macd},
+                                {"yaxis2.autorange": True}
+                            ]
+                        ),
+                        dict(
+                            label="BOLL",
+                            method="update",
+                            args=[
+                                {"visible": visible_boll},
+                                {"yaxis2.autorange": True}
+                            ]
+                        )
+                    ]),
+                    bgcolor="#F8FAFC",
+                    bordercolor="#E2E8F0",
+                    font=dict(color="#475569", size=11)
+                )
+            ],
+            # 分隔线
+            shapes=[
+                dict(
+                    type='line', xref='paper', yref='paper',
+                    x0=0, x1=1, y0=0.26, y1=0.26, # 主副图分隔
+                    line=dict(color=COLOR_GRID, width=1)
+                )
+            ]
+        )
+
+        # 滑块范围及副图设置
+        fig.update_xaxes(
+            rangeslider=dict(
+                visible=True,
+                thickness=0.06, # 占据约5%-6%的高度
+                bgcolor="#F8FAFC",
+                bordercolor="#E2E8F0"
+            ),
+            row=2, col=1
+        )
+
+        # 坐标轴优化
+        common_axis_config = dict(
+            showgrid=True,
+            gridcolor=COLOR_GRID,
+            gridwidth=1,
+            showline=True,
+            linecolor=COLOR_GRID,
+            mirror=True,
+            tickfont=dict(color=COLOR_TEXT, size=10)
+        )
+
+        # 计算默认可见区间 (最后 60 个)，供 rangeslider 使用
+        total_points = len(x_labels)
+        default_range = [max(0, total_points - 60 - 0.5), total_points - 1 + 0.5] if total_points > 0 else None
+
+        fig.update_xaxes(**common_axis_config, zeroline=False, type='category', tickmode='auto', nticks=8, range=default_range)
+        fig.update_yaxes(**common_axis_config, zeroline=False, row=1, col=1)
+        fig.update_yaxes(**common_axis_config, zeroline=True, zerolinecolor=COLOR_GRID, row=2, col=1)
+
+        # 移除主图X轴标签（因为共享）
+        fig.update_xaxes(showticklabels=False, row=1, col=1)
+
+        return fig, last_date
+
+    def render_assistant_panel(code, name, analysis, last_date):
+        """右侧缠论分析面板"""
+        ui.label(f'{name} ({code})').classes('text-lg font-bold text-slate-800 leading-tight')
+
+        # 1. 核心结论
+        with ui.row().classes('items-center gap-2'):
+            status_color = 'text-red-500' if '上涨' in analysis.get('structure', '') else 'text-green-500' if '下跌' in analysis.get('structure', '') else 'text-slate-500'
+            ui.label(analysis.get('structure', '未知结构')).classes(f'text-xl font-black {status_color}')
+            ui.badge(analysis.get('ma_alignment', '均线缠绕'), color='blue' if analysis.get('ma_alignment')=='多头排列' else 'grey').props('outline')
+
+        ui.separator().classes('my-1')
+
+        # 2. 关键点位
+        with ui.grid(columns=2).classes('w-full gap-2'):
+            def info_item(label, value, color='slate-700'):
+                with ui.column().classes('gap-0'):
+                    ui.label(label).classes('text-xs text-slate-400')
+                    ui.label(str(value)).classes(f'text-sm font-bold text-{color}')
+
+            info_item('支撑位', analysis.get('support_price', '-'), 'red-500')
+            info_item('压力位', analysis.get('pressure_price', '-'), 'green-500')
+            info_item('RSI', analysis.get('rsi', '-'), 'purple-500')
+            info_item('MACD', analysis.get('macd', '-'), 'slate-700')
+
+        # 3. 操作区间
+        with ui.column().classes('w-full bg-slate-50 p-3 rounded-lg gap-1 border border-slate-100'):
+            ui.label('操作建议区间').classes('text-xs font-bold text-slate-500 mb-1')
+            with ui.row().classes('w-full justify-between items-center'):
+                ui.label('低吸区').classes('text-xs text-slate-400')
+                ui.label(analysis.get('buy_zone', '-')).classes('text-xs font-mono font-bold text-red-500')
+            with ui.row().classes('w-full justify-between items-center'):
+                ui.label('高抛区').classes('text-xs text-slate-400')
+                ui.label(analysis.get('sell_zone', '-')).classes('text-xs font-mono font-bold text-green-500')
+            with ui.row().classes('w-full justify-between items-center'):
+                ui.label('风控线').classes('text-xs text-slate-400')
+                ui.label(analysis.get('risk_line', '-')).classes('text-xs font-mono font-bold text-slate-700')
+
+        ui.separator().classes('my-1')
+
+        # 4. 详细策略
+        ui.label('策略建议').classes('text-sm font-bold text-slate-700')
+        with ui.column().classes('gap-2'):
+            for i, plan in enumerate(analysis.get('action_plan', [])):
+                with ui.row().classes('items-start gap-2'):
+                    ui.label(str(i+1)+'.').classes('text-xs font-bold text-slate-400 mt-0.5')
+                    ui.label(plan).classes('text-xs text-slate-600 leading-relaxed')
+
+        # 底部提示
+        ui.element('div').classes('flex-grow')
+        ui.label(f'更新时间: {last_date}').classes('text-xs text-slate-300 text-center w-full')
+
+    def show_freshness(computed_at, precomputed=False):
+        """computed_at: 北京时间；None 表示刚刚现场计算"""
+        if fresh_label.is_deleted:
+            return
+        if computed_at is None:
+            fresh_label.text = '实时计算'
+        else:
+            fresh_label.text = f"{'后台预计算' if precomputed else '更新'}于 {computed_at.strftime('%H:%M:%S')}"
+
     async def render_chart(code, name, force=False):
         if chart_container.is_deleted or header_label.is_deleted: return
         state['render_ticket'] = state.get('render_ticket', 0) + 1
         current_ticket = state['render_ticket']
+        live['stream'] = None
         chart_container.clear()
         header_label.text = f'{name} ({code}) {state["indicator"]}趋势'
+        fresh_label.text = ''
+        if state['indicator'] == '散户数量':
+            scheduler.focus(client_id, 'flow', code)
+        else:
+            scheduler.focus(client_id, 'assistant', code, state.get('assistant_period', 'day'))
         
         with chart_container:
             ui.spinner('dots').classes('absolute-center')
@@ -381,7 +899,17 @@ def render_money_flow_panel(plotly_renderer=None):
         loop = asyncio.get_event_loop()
         df = None
         if state['indicator'] == '散户数量':
-            df = await loop.run_in_executor(None, mf.get_flow_data, code, force)
+            entry = None if force else scheduler.get('flow', code)
+            if entry is not None:
+                df = entry.value
+                show_freshness(entry.computed_at, precomputed=True)
+            else:
+                df = await loop.run_in_executor(None, mf.get_flow_data, code, force)
+                if df is not None and not df.empty:
+                    # 资金流数据可能来自上游短期缓存，显示其实际下载时间
+                    fetched_at = mf.flow_fetched_at(code)
+                    scheduler.store('flow', code, None, df, fetched_at)
+                    show_freshness(fetched_at)
             if current_ticket != state.get('render_ticket'):
                 return
             if df is not None and not df.empty:
@@ -505,460 +1033,113 @@ def render_money_flow_panel(plotly_renderer=None):
                 fig.update_yaxes(**common_axis_config, hoverformat='.2f', row=2, col=1)
             else:
                 period = state.get('assistant_period', 'day')
-                kline_df = await loop.run_in_executor(None, mf.get_kline_data, code, period, force)
-                if current_ticket != state.get('render_ticket'):
-                    return
-                if kline_df is None or kline_df.empty:
-                    with ui.column().classes('w-full h-full items-center justify-center'):
-                        ui.label('买卖助手暂无可用K线').classes('text-gray-400 text-lg')
-                    return
+                entry = None if force else scheduler.get('assistant', code, period)
+                if entry is not None:
+                    kline_df, assistant = entry.value
+                    show_freshness(entry.computed_at, precomputed=True)
+                else:
+                    kline_df = await loop.run_in_executor(None, mf.get_kline_data, code, period, force)
+                    if current_ticket != state.get('render_ticket'):
+                        return
+                    if kline_df is None or kline_df.empty:
+                        with ui.column().classes('w-full h-full items-center justify-center'):
+                            ui.label('买卖助手暂无可用K线').classes('text-gray-400 text-lg')
+                        return
 
-                end_dt = kline_df.index.max()
-                # if pd.notna(end_dt):
-                #    kline_df = kline_df[kline_df.index >= (end_dt - pd.Timedelta(days=180))]
+                    end_dt = kline_df.index.max()
+                    # if pd.notna(end_dt):
+                    #    kline_df = kline_df[kline_df.index >= (end_dt - pd.Timedelta(days=180))]
 
-                # Calculate on FULL data first for accurate Chan Lun structures
-                assistant = await loop.run_in_executor(None, mf.build_buy_sell_assistant, kline_df)
-                if current_ticket != state.get('render_ticket'):
-                    return
-                kdf = assistant.get('kline', pd.DataFrame())
+                    # Calculate on FULL data first for accurate Chan Lun structures
+                    assistant = await loop.run_in_executor(None, mf.build_buy_sell_assistant, kline_df, (code, period))
+                    if current_ticket != state.get('render_ticket'):
+                        return
+                    scheduler.store('assistant', code, period, (kline_df, assistant))
+                    show_freshness(None)
+                # 预计算结果可能被多个页面共用，作图前复制 (作图会追加 BOLL 列)
+                kdf = assistant.get('kline', pd.DataFrame()).copy()
                 analysis = assistant.get('analysis', {})
                 if kdf is None or kdf.empty:
                     with ui.column().classes('w-full h-full items-center justify-center'):
                         ui.label('买卖助手计算失败').classes('text-gray-400 text-lg')
                     return
 
-                # Map bi_points to real indices in FULL kdf
-                raw_bi_points = analysis.get('bi_points', [])
-                valid_bi_points = []
-                if not kdf.empty:
-                    # Create a map for faster lookup if needed, but get_loc is fast for DatetimeIndex
-                    for p in raw_bi_points:
-                        try:
-                            p_dt = pd.to_datetime(p['date'])
-                            # Ensure we find the exact index
-                            if p_dt in kdf.index:
-                                p['real_idx'] = kdf.index.get_loc(p_dt)
-                                valid_bi_points.append(p)
-                        except:
-                            continue
-                raw_bi_points = valid_bi_points
-
-                if not kdf.empty:
-                    _closes = pd.to_numeric(kdf.get('close'), errors='coerce').ffill().bfill()
-                    kdf['boll_mid'] = _closes.rolling(window=20, min_periods=2).mean().ffill().bfill()
-                    _std = _closes.rolling(window=20, min_periods=2).std().fillna(0)
-                    kdf['boll_upper'] = kdf['boll_mid'] + 2 * _std
-                    kdf['boll_lower'] = kdf['boll_mid'] - 2 * _std
-
-                # Slice for display AFTER calculation
-                bar_count = 180
-
-                start_idx = 0
-                full_len = len(kdf)
-                if bar_count and full_len > bar_count:
-                    start_idx = full_len - bar_count
-                    kdf = kdf.iloc[-bar_count:]
-
-                date_fmt = '%Y-%m-%d' if period in ['day', 'week'] else '%Y-%m-%d %H:%M'
-                x_labels = kdf.index.strftime(date_fmt)
-
-                # Filter and Format bi_points to match visible x-axis
-                bi_points = []
-                if not kdf.empty:
-                    # 1. Add boundary crossing point (interpolation)
-                    if start_idx > 0 and raw_bi_points:
-                        for i in range(len(raw_bi_points) - 1):
-                            p1 = raw_bi_points[i]
-                            p2 = raw_bi_points[i+1]
-                            idx1 = p1.get('real_idx', -1)
-                            idx2 = p2.get('real_idx', -1)
-                            
-                            # Check if segment crosses start_idx
-                            if idx1 < start_idx and idx2 >= start_idx:
-                                # Interpolate price at start_idx
-                                if idx2 != idx1:
-                                    ratio = (start_idx - idx1) / (idx2 - idx1)
-                                    price_at_start = p1['price'] + ratio * (p2['price'] - p1['price'])
-                                    
-                                    # Add virtual start point at the first visible date
-                                    start_date_str = kdf.index[0].strftime(date_fmt)
-                                    bi_points.append({
-                                        'date': start_date_str,
-                                        'price': price_at_start,
-                                        'type': 'virtual'
-                                    })
-                                break
-
-                    # 2. Add visible points
-                    for p in raw_bi_points:
-                        if p.get('real_idx', -1) >= start_idx:
-                            p_copy = p.copy()
-                            p_dt = pd.to_datetime(p['date'])
-                            p_copy['date'] = p_dt.strftime(date_fmt) # Update to match x_labels format
-                            bi_points.append(p_copy)
-
-                macd_hist = pd.to_numeric(kdf.get('macd_hist'), errors='coerce').fillna(0)
-                dif = pd.to_numeric(kdf.get('dif'), errors='coerce').fillna(0)
-                dea = pd.to_numeric(kdf.get('dea'), errors='coerce').fillna(0)
-                boll_mid = kdf.get('boll_mid', pd.Series(0, index=kdf.index))
-                boll_upper = kdf.get('boll_upper', pd.Series(0, index=kdf.index))
-                boll_lower = kdf.get('boll_lower', pd.Series(0, index=kdf.index))
-                macd_colors = ['#ef4444' if v >= 0 else '#10b981' for v in macd_hist]
-                gc_mask = kdf.get('golden_cross', pd.Series(False, index=kdf.index)).fillna(False).values
-                dc_mask = kdf.get('dead_cross', pd.Series(False, index=kdf.index)).fillna(False).values
-                last_date = kdf.index.max()
-                gap_days = (pd.Timestamp.now().normalize() - pd.Timestamp(last_date).normalize()).days if pd.notna(last_date) else 0
-
-                # 浅色金融科技风配色方案
-                COLOR_UP = '#ef4444'     # 红色 (涨)
-                COLOR_DOWN = '#22c55e'   # 绿色 (跌)
-                COLOR_MA5 = '#f59e0b'    # 橙色
-                COLOR_MA10 = '#3b82f6'   # 蓝色
-                COLOR_MA20 = '#8b5cf6'   # 紫色
-                COLOR_MA30 = '#ec4899'   # 粉色
-                COLOR_MA60 = '#64748b'   # 灰色
-                COLOR_BI = '#94a3b8'     # 笔 (Slate-400)
-                COLOR_BG = '#ffffff'     # 背景纯白
-                COLOR_GRID = '#f1f5f9'   # 网格极淡 (Slate-100)
-                COLOR_TEXT = '#475569'   # 文本 (Slate-600)
-
-                fig = make_subplots(
-                    rows=2, cols=1,
-                    shared_xaxes=True,
-                    vertical_spacing=0.05, # 压缩主副图间距
-                    row_heights=[0.75, 0.25] # 主副图区域分配，因为底部还有滑块被单独计算
-                )
-                
-                visible_macd = []
-                visible_boll = []
-
-                def _add_trace(trace, row, col, kind='all'):
-                    fig.add_trace(trace, row=row, col=col)
-                    if kind == 'all':
-                        visible_macd.append(True)
-                        visible_boll.append(True)
-                    elif kind == 'macd':
-                        visible_macd.append(True)
-                        visible_boll.append(False)
-                        fig.data[-1].visible = True
-                    elif kind == 'boll':
-                        visible_macd.append(False)
-                        visible_boll.append(True)
-                        fig.data[-1].visible = False
-                
-                # 1. K线图
-                _add_trace(go.Candlestick(
-                    x=x_labels,
-                    open=kdf['open'],
-                    high=kdf['high'],
-                    low=kdf['low'],
-                    close=kdf['close'],
-                    increasing_line_color=COLOR_UP,
-                    decreasing_line_color=COLOR_DOWN,
-                    increasing_fillcolor=COLOR_UP,
-                    decreasing_fillcolor=COLOR_DOWN,
-                    name='K线'
-                ), row=1, col=1)
-
-                # 2. 均线
-                _add_trace(go.Scatter(x=x_labels, y=kdf['ma5'], mode='lines', line=dict(color=COLOR_MA5, width=1), name='MA5'), row=1, col=1)
-                _add_trace(go.Scatter(x=x_labels, y=kdf['ma10'], mode='lines', line=dict(color=COLOR_MA10, width=1), name='MA10'), row=1, col=1)
-                _add_trace(go.Scatter(x=x_labels, y=kdf['ma20'], mode='lines', line=dict(color=COLOR_MA20, width=1), name='MA20'), row=1, col=1)
-                _add_trace(go.Scatter(x=x_labels, y=kdf['ma30'], mode='lines', line=dict(color=COLOR_MA30, width=1), name='MA30'), row=1, col=1)
-                _add_trace(go.Scatter(x=x_labels, y=kdf['ma60'], mode='lines', line=dict(color=COLOR_MA60, width=1.2, dash='dot'), name='MA60'), row=1, col=1)
-
-                # 3. 缠论笔与分型
-                # bi_points already filtered and formatted above
-                if len(bi_points) >= 2:
-                    # Dates are already formatted to match x_labels
-                    bi_x = [p['date'] for p in bi_points]
-                    bi_y = [p['price'] for p in bi_points]
-                    # 笔线
-                    _add_trace(go.Scatter(
-                        x=bi_x,
-                        y=bi_y,
-                        mode='lines+markers',
-                        line=dict(color=COLOR_BI, width=1.5, dash='solid'), # 笔改为实线更清晰，或保留虚线
-                        marker=dict(size=4, color=COLOR_BI),
-                        name='缠论笔',
-                        opacity=0.8
-                    ), row=1, col=1)
-                    
-                    # 顶底分型
-                    top_x = [p['date'] for p in bi_points if p.get('type') == 'top']
-                    top_y = [p['price'] for p in bi_points if p.get('type') == 'top']
-                    bot_x = [p['date'] for p in bi_points if p.get('type') == 'bottom']
-                    bot_y = [p['price'] for p in bi_points if p.get('type') == 'bottom']
-                    
-                    if top_x:
-                        _add_trace(go.Scatter(
-                            x=top_x, y=top_y, mode='markers',
-                            marker=dict(size=6, color=COLOR_DOWN, symbol='circle-open', line=dict(width=1.5)),
-                            name='顶分型', showlegend=False
-                        ), row=1, col=1)
-                    if bot_x:
-                        _add_trace(go.Scatter(
-                            x=bot_x, y=bot_y, mode='markers',
-                            marker=dict(size=6, color=COLOR_UP, symbol='circle-open', line=dict(width=1.5)),
-                            name='底分型', showlegend=False
-                        ), row=1, col=1)
-
-                # 4. 买卖点标记
-                buy_mask = kdf['buy_signal'].fillna(False).values
-                sell_mask = kdf['sell_signal'].fillna(False).values
-                
-                # 增强买卖点显示
-                if buy_mask.any():
-                    _add_trace(go.Scatter(
-                        x=x_labels[buy_mask],
-                        y=kdf['buy_y'][buy_mask],
-                        mode='markers+text',
-                        marker=dict(
-                            size=16, 
-                            color=COLOR_UP, 
-                            symbol='triangle-up',
-                            line=dict(width=1, color='white')
-                        ),
-                        text=['<b>买</b>'] * int(buy_mask.sum()),
-                        textfont=dict(color=COLOR_UP, size=14), # 字体加大加粗
-                        textposition='bottom center', # 文字在图标下方
-                        name='买点'
-                    ), row=1, col=1)
-                if sell_mask.any():
-                    _add_trace(go.Scatter(
-                        x=x_labels[sell_mask],
-                        y=kdf['sell_y'][sell_mask],
-                        mode='markers+text',
-                        marker=dict(
-                            size=16, 
-                            color=COLOR_DOWN, 
-                            symbol='triangle-down',
-                            line=dict(width=1, color='white')
-                        ),
-                        text=['<b>卖</b>'] * int(sell_mask.sum()),
-                        textfont=dict(color=COLOR_DOWN, size=14), # 字体加大加粗
-                        textposition='top center', # 文字在图标上方
-                        name='卖点'
-                    ), row=1, col=1)
-
-                # 5. 副图指标（MACD）
-                _add_trace(go.Bar(
-                    x=x_labels,
-                    y=macd_hist,
-                    marker_color=macd_colors,
-                    name='MACD柱',
-                    marker_line_width=0, # 去掉柱子边框
-                    hovertemplate='%{y:.3f}<extra></extra>'
-                ), row=2, col=1, kind='macd')
-                _add_trace(go.Scatter(x=x_labels, y=dif, mode='lines', line=dict(color=COLOR_MA10, width=1.5), name='DIF'), row=2, col=1, kind='macd')
-                _add_trace(go.Scatter(x=x_labels, y=dea, mode='lines', line=dict(color=COLOR_MA5, width=1.5), name='DEA'), row=2, col=1, kind='macd')
-
-                if gc_mask.any():
-                    _add_trace(go.Scatter(
-                        x=x_labels[gc_mask], y=dif[gc_mask], mode='markers',
-                        marker=dict(color=COLOR_UP, size=6, symbol='diamond'),
-                        name='金叉', showlegend=False
-                    ), row=2, col=1, kind='macd')
-                if dc_mask.any():
-                    _add_trace(go.Scatter(
-                        x=x_labels[dc_mask], y=dif[dc_mask], mode='markers',
-                        marker=dict(color=COLOR_DOWN, size=6, symbol='diamond'),
-                        name='死叉', showlegend=False
-                    ), row=2, col=1, kind='macd')
-
-                # 副图指标（布林线）
-                # 使用自定义Bar伪造K线，完全避开 Plotly 底层 Candlestick 组件在控制隐藏时引发的 Margin 塌陷 Bug
-                kline_colors = ['rgba(239,68,68,0.7)' if c >= o else 'rgba(34,197,94,0.7)' for c, o in zip(kdf['close'], kdf['open'])]
-                body_y = [max(abs(c - o), 0.01) for c, o in zip(kdf['close'], kdf['open'])] # 保证十字星也有极小的一点高度
-                body_base = [min(c, o) for c, o in zip(kdf['close'], kdf['open'])]
-                
-                # 辅助K线：影线 (High-Low)
-                _add_trace(go.Bar(
-                    x=x_labels, y=kdf['high'] - kdf['low'], base=kdf['low'],
-                    marker_color=kline_colors, width=0.1, # 细线
-                    name='K线(辅)影线', showlegend=False, hoverinfo='skip'
-                ), row=2, col=1, kind='boll')
-                
-                # 辅助K线：实体 (Open-Close)
-                _add_trace(go.Bar(
-                    x=x_labels, y=body_y, base=body_base,
-                    marker_color=kline_colors, width=0.6, # 宽条
-                    name='K线(辅)实体', showlegend=False, hoverinfo='skip'
-                ), row=2, col=1, kind='boll')
-
-                _add_trace(go.Scatter(
-                    x=x_labels, y=boll_upper, mode='lines', line=dict(color=COLOR_MA20, width=1.5), name='BOLL上轨'
-                ), row=2, col=1, kind='boll')
-                _add_trace(go.Scatter(
-                    x=x_labels, y=boll_mid, mode='lines', line=dict(color=COLOR_MA60, width=1.3), name='BOLL中轨'
-                ), row=2, col=1, kind='boll')
-                _add_trace(go.Scatter(
-                    x=x_labels, y=boll_lower, mode='lines', line=dict(color=COLOR_MA10, width=1.5), name='BOLL下轨'
-                ), row=2, col=1, kind='boll')
-
-                # 6. Layout 布局优化
-                fig.update_layout(
-                    height=600, # 强制图表总高度固定为600px（主图70%, 副图25%, 留些给图例和间距）
-                    margin=dict(l=10, r=10, t=30, b=10),
-                    paper_bgcolor=COLOR_BG,
-                    plot_bgcolor=COLOR_BG,
-                    hovermode='x unified',
-                    xaxis_rangeslider_visible=False,
-                    xaxis2_rangeslider_visible=True, # 开启副图自带的滑块 (5%)
-                    # 图例样式
-                    legend=dict(
-                        orientation='h',
-                        yanchor='bottom', y=1.02,
-                        xanchor='left', x=0,
-                        bgcolor='rgba(255,255,255,0.8)',
-                        bordercolor=COLOR_GRID,
-                        borderwidth=0,
-                        font=dict(size=10, color=COLOR_TEXT),
-                        itemwidth=30
-                    ),
-                    font=dict(family="Roboto, 'Segoe UI', 'Microsoft YaHei', sans-serif", color=COLOR_TEXT, size=11),
-                    # 构建主副图中间的切换按钮
-                    updatemenus=[
-                        dict(
-                            type="buttons",
-                            direction="right",
-                            active=0,
-                            x=0.01,
-                            y=0.258, # 精确定位在主副图之间（无遮挡）
-                            xanchor="left",
-                            yanchor="middle",
-                            pad={"r": 10, "t": 0, "b": 0},
-                            showactive=True,
-                            buttons=list([
-                                dict(
-                                    label="MACD",
-                                    method="update",
-                                    args=[
-                                        {"visible": visible_macd},
-                                        {"yaxis2.autorange": True}
-                                    ]
-                                ),
-                                dict(
-                                    label="BOLL",
-                                    method="update",
-                                    args=[
-                                        {"visible": visible_boll},
-                                        {"yaxis2.autorange": True}
-                                    ]
-                                )
-                            ]),
-                            bgcolor="#F8FAFC",
-                            bordercolor="#E2E8F0",
-                            font=dict(color="#475569", size=11)
-                        )
-                    ],
-                    # 分隔线
-                    shapes=[
-                        dict(
-                            type='line', xref='paper', yref='paper',
-                            x0=0, x1=1, y0=0.26, y1=0.26, # 主副图分隔
-                            line=dict(color=COLOR_GRID, width=1)
-                        )
-                    ]
-                )
-                
-                # 滑块范围及副图设置
-                fig.update_xaxes(
-                    rangeslider=dict(
-                        visible=True,
-                        thickness=0.06, # 占据约5%-6%的高度
-                        bgcolor="#F8FAFC",
-                        bordercolor="#E2E8F0"
-                    ),
-                    row=2, col=1
-                )
-                
-                # 坐标轴优化
-                common_axis_config = dict(
-                    showgrid=True,
-                    gridcolor=COLOR_GRID,
-                    gridwidth=1,
-                    showline=True,
-                    linecolor=COLOR_GRID,
-                    mirror=True,
-                    tickfont=dict(color=COLOR_TEXT, size=10)
-                )
-
-                # 计算默认可见区间 (最后 60 个)，供 rangeslider 使用
-                total_points = len(x_labels)
-                default_range = [max(0, total_points - 60 - 0.5), total_points - 1 + 0.5] if total_points > 0 else None
-
-                fig.update_xaxes(**common_axis_config, zeroline=False, type='category', tickmode='auto', nticks=8, range=default_range)
-                fig.update_yaxes(**common_axis_config, zeroline=False, row=1, col=1)
-                fig.update_yaxes(**common_axis_config, zeroline=True, zerolinecolor=COLOR_GRID, row=2, col=1)
-
-                # 移除主图X轴标签（因为共享）
-                fig.update_xaxes(showticklabels=False, row=1, col=1)
+                fig, last_date = build_assistant_figure(kdf, analysis, period)
 
             chart_container.clear()
             
             if state['indicator'] == '散户数量':
                 # 散户数量模式：全屏图表
                 with ui.card().classes('w-full p-0 shadow-sm border border-slate-100 rounded-xl overflow-hidden').style('height: 600px;'):
-                     plot_func(fig).classes('w-full h-full')
+                     plot_long(fig).classes('w-full h-full')
             else:
+                stream = FigureStream(fig)
                 # 买卖助手模式：左图右分析布局，强制给定高度
                 with ui.row().classes('w-full gap-3 items-stretch no-wrap').style('height: 600px;'):
                     # 左侧：图表 (占据大部分空间)
                     with ui.card().classes('flex-grow h-full min-w-0 p-0 shadow-sm border border-slate-100 rounded-xl overflow-hidden relative'):
-                        plot_func(fig).classes('w-full h-full z-0')
+                        chart = plot_func(stream.figure).classes('w-full h-full z-0')
                     
                     # 右侧：缠论分析面板 (固定宽度)
-                    with ui.card().classes('w-80 h-full p-4 shadow-sm border border-slate-100 rounded-xl bg-white overflow-y-auto flex-shrink-0 flex flex-col gap-3'):
-                         ui.label(f'{name} ({code})').classes('text-lg font-bold text-slate-800 leading-tight')
-                         
-                         # 1. 核心结论
-                         with ui.row().classes('items-center gap-2'):
-                             status_color = 'text-red-500' if '上涨' in analysis.get('structure', '') else 'text-green-500' if '下跌' in analysis.get('structure', '') else 'text-slate-500'
-                             ui.label(analysis.get('structure', '未知结构')).classes(f'text-xl font-black {status_color}')
-                             ui.badge(analysis.get('ma_alignment', '均线缠绕'), color='blue' if analysis.get('ma_alignment')=='多头排列' else 'grey').props('outline')
-
-                         ui.separator().classes('my-1')
-                         
-                         # 2. 关键点位
-                         with ui.grid(columns=2).classes('w-full gap-2'):
-                             def info_item(label, value, color='slate-700'):
-                                 with ui.column().classes('gap-0'):
-                                     ui.label(label).classes('text-xs text-slate-400')
-                                     ui.label(str(value)).classes(f'text-sm font-bold text-{color}')
-                             
-                             info_item('支撑位', analysis.get('support_price', '-'), 'red-500')
-                             info_item('压力位', analysis.get('pressure_price', '-'), 'green-500')
-                             info_item('RSI', analysis.get('rsi', '-'), 'purple-500')
-                             info_item('MACD', analysis.get('macd', '-'), 'slate-700')
-
-                         # 3. 操作区间
-                         with ui.column().classes('w-full bg-slate-50 p-3 rounded-lg gap-1 border border-slate-100'):
-                             ui.label('操作建议区间').classes('text-xs font-bold text-slate-500 mb-1')
-                             with ui.row().classes('w-full justify-between items-center'):
-                                 ui.label('低吸区').classes('text-xs text-slate-400')
-                                 ui.label(analysis.get('buy_zone', '-')).classes('text-xs font-mono font-bold text-red-500')
-                             with ui.row().classes('w-full justify-between items-center'):
-                                 ui.label('高抛区').classes('text-xs text-slate-400')
-                                 ui.label(analysis.get('sell_zone', '-')).classes('text-xs font-mono font-bold text-green-500')
-                             with ui.row().classes('w-full justify-between items-center'):
-                                 ui.label('风控线').classes('text-xs text-slate-400')
-                                 ui.label(analysis.get('risk_line', '-')).classes('text-xs font-mono font-bold text-slate-700')
-
-                         ui.separator().classes('my-1')
-
-                         # 4. 详细策略
-                         ui.label('策略建议').classes('text-sm font-bold text-slate-700')
-                         with ui.column().classes('gap-2'):
-                             for i, plan in enumerate(analysis.get('action_plan', [])):
-                                 with ui.row().classes('items-start gap-2'):
-                                     ui.label(str(i+1)+'.').classes('text-xs font-bold text-slate-400 mt-0.5')
-                                     ui.label(plan).classes('text-xs text-slate-600 leading-relaxed')
-                         
-                         # 底部提示
-                         ui.element('div').classes('flex-grow')
-                         ui.label(f'更新时间: {last_date}').classes('text-xs text-slate-300 text-center w-full')
+                    analysis_card = ui.card().classes('w-80 h-full p-4 shadow-sm border border-slate-100 rounded-xl bg-white overflow-y-auto flex-shrink-0 flex flex-col gap-3')
+                    with analysis_card:
+                        render_assistant_panel(code, name, analysis, last_date)
+
+                # custom_plotly 渲染的图表带 DOM id，盘中可只推送变化的点
+                chart_id = chart.props.get('id')
+                if chart_id:
+                    live.update(stream=stream, chart_id=chart_id, code=code, name=name,
+                                period=period, panel=analysis_card, ticket=current_ticket)
+
+    async def live_refresh():
+        """
+        盘中刷新买卖助手：增量计算最后一根K线，只把变化的点 (最后一根更新/新增K线/新信号)
+        推送到浏览器，分析面板重建；图表结构变化时整图重绘
+        """
+        stream = live.get('stream')
+        if stream is None or live['busy'] or state['indicator'] != '买卖助手':
+            return
+        if live.get('ticket') != state.get('render_ticket') or chart_container.is_deleted:
+            return
+        if not FundRadar.is_trading_time():
+            return
+        code, name, period = live['code'], live['name'], live['period']
+        live['busy'] = True
+        try:
+            loop = asyncio.get_event_loop()
+            kline_df = await loop.run_in_executor(None, mf.get_kline_data, code, period, False)
+            if kline_df is None or kline_df.empty:
+                return
+            assistant = await loop.run_in_executor(None, mf.build_buy_sell_assistant, kline_df, (code, period))
+            kdf = assistant.get('kline', pd.DataFrame())
+            analysis = assistant.get('analysis', {})
+            if kdf is None or kdf.empty or live.get('stream') is not stream:
+                return
+            scheduler.store('assistant', code, period, (kline_df, assistant))
+            show_freshness(None)
+            kdf = kdf.copy()
+            fig, last_date = build_assistant_figure(kdf, analysis, period)
+            ops = stream.diff(fig)
+            if ops is None:
+                await render_chart(code, name)
+                return
+            if ops:
+                try:
+                    applied = await stream_plotly(live['chart_id'], ops)
+                except TimeoutError:
+                    applied = True
+                if not applied:
+                    live['stream'] = None
+                    return
+            panel = live['panel']
+            if not panel.is_deleted:
+                panel.clear()
+                with panel:
+                    render_assistant_panel(code, name, analysis, last_date)
+        except Exception as e:
+            print(f"[MoneyFlow] Live refresh failed for {code}: {e}")
+        finally:
+            live['busy'] = False
 
     def refresh_list():
         # Update group select options
@@ -1007,6 +1188,13 @@ def render_money_flow_panel(plotly_renderer=None):
                                     with ui.column().classes('gap-0 min-w-0 flex-1'):
                                         ui.label(name).classes(f'font-bold {text_cls} leading-tight truncate w-full text-sm')
                                         ui.label(code).classes('text-xs text-gray-400')
+                                    q = state['quotes'].get(code)
+                                    if q and q.get('price') and q.get('prev_close'):
+                                        pct = (q['price'] / q['prev_close'] - 1) * 100
+                                        pct_cls = 'text-red-500' if pct > 0 else ('text-green-600' if pct < 0 else 'text-gray-500')
+                                        with ui.column().classes('gap-0 items-end flex-none'):
+                                            ui.label(f"{q['price']:.2f}").classes(f'text-sm font-bold {pct_cls}')
+                                            ui.label(f"{pct:+.2f}%").classes(f'text-xs {pct_cls}')
                                 
                                 # Click Handler for Selection
                                 async def on_select(e, c=code, n=name):
@@ -1034,3 +1222,4 @@ def render_money_flow_panel(plotly_renderer=None):
     
     # Trigger load from client local storage
     ui.timer(0, load_subs_from_browser, once=True)
+    ui.timer(LIVE_REFRESH_SEC, live_refresh)
@@ -1,8 +1,10 @@
 
-from nicegui import ui
+from nicegui import ui, context
 import uuid
 import json
+import weakref
 from plotly.utils import PlotlyJSONEncoder
+from utils.downsample import MAX_POINTS, ViewportDownsampler
 
 def setup_common_ui():
     """Sets up common UI elements like styles and scripts for Plotly."""
@@ -186,6 +188,7 @@ def setup_common_ui():
                                  try {
                                      Plotly.newPlot(item.id, item.data, item.layout, item.config).then(function(gd){
                                          try { Plotly.Plots.resize(gd); } catch(ex){}
+                                         window._bindViewport(gd);
                                      });
                                      window._chartQueue.splice(i, 1);
                                  } catch(e) {
@@ -222,10 +225,112 @@ def setup_common_ui():
             };
 
             window.renderPlotly = window.addToChartQueue; 
+
+            // 降采样图表 (pages/shared.downsampled_plotly)：缩放或拖动后把可见区间发回服务端
+            window._viewportCharts = window._viewportCharts || {};
+            window._bindViewport = function(gd) {
+                if (!window._viewportCharts[gd.id] || gd._viewportBound) return;
+                gd._viewportBound = true;
+                var timer = null;
+                gd.on('plotly_relayout', function(ev) {
+                    var range = null, changed = false;
+                    for (var k in ev) {
+                        var m = k.match(/^(xaxis\\d*)\\.(range|autorange)(\\[|$)/);
+                        if (!m) continue;
+                        changed = true;
+                        if (m[2] === 'range' && gd.layout[m[1]].range) range = gd.layout[m[1]].range.slice();
+                    }
+                    if (!changed) return;
+                    clearTimeout(timer);
+                    timer = setTimeout(function() {
+                        emitEvent('chart_viewport', {id: gd.id, range: range});
+                    }, 250);
+                });
+            };
+            // 用服务端按可见区间重新降采样的数据重绘；category 轴的点序号会变，同时重设 range
+            window.replotViewport = function(id, data, range) {
+                var gd = document.getElementById(id);
+                if (!gd || !gd.data) return;
+                if (range) {
+                    for (var k in gd.layout) {
+                        if (/^xaxis\\d*$/.test(k)) {
+                            gd.layout[k].range = range.slice();
+                            gd.layout[k].autorange = false;
+                        }
+                    }
+                }
+                Plotly.react(gd, data, gd.layout);
+            };
+
+            // 把增量 ops 直接写入 trace 数据 (用于尚在队列中未绘制的图表，以及逐点 patch)
+            window._applyChartOps = function(data, layout, ops) {
+                var target = function(trace, attr) {
+                    var obj = trace, path = attr.split('.');
+                    for (var j = 0; j < path.length - 1; j++) {
+                        if (obj[path[j]] == null) obj[path[j]] = {};
+                        obj = obj[path[j]];
+                    }
+                    return [obj, path[path.length - 1]];
+                };
+                (ops.extend || []).forEach(function(g) {
+                    g.traces.forEach(function(t, n) {
+                        for (var k in g.update) {
+                            var r = target(data[t], k);
+                            var arr = Array.prototype.slice.call(r[0][r[1]] || []).concat(g.update[k][n]);
+                            r[0][r[1]] = arr.slice(Math.max(0, arr.length - g.max));
+                        }
+                    });
+                });
+                (ops.restyle || []).forEach(function(rs) {
+                    for (var k in rs.update) {
+                        var r = target(data[rs.trace], k);
+                        if (rs.update[k] === null) delete r[0][r[1]]; else r[0][r[1]] = rs.update[k];
+                    }
+                });
+                (ops.patch || []).forEach(function(p) {
+                    var r = target(data[p[0]], p[1]);
+                    r[0][r[1]][p[2]] = p[3];
+                });
+                for (var key in (ops.relayout || {})) {
+                    if (ops.relayout[key] === null) delete layout[key]; else layout[key] = ops.relayout[key];
+                }
+            };
+
+            // 增量更新图表 (ops 由 utils/chart_stream.FigureStream.diff 生成)
+            // 已绘制的图表走 extendTraces/restyle/relayout；仍在队列中的直接改队列数据
+            // 图表已不存在时返回 false
+            window.streamPlotly = function(id, ops) {
+                var gd = document.getElementById(id);
+                if (!gd) return false;
+                if (!gd.data || typeof window.Plotly === 'undefined') {
+                    for (var i = 0; i < window._chartQueue.length; i++) {
+                        var item = window._chartQueue[i];
+                        if (item.id === id) {
+                            window._applyChartOps(item.data, item.layout, ops);
+                            return true;
+                        }
+                    }
+                    return false;
+                }
+                (ops.extend || []).forEach(function(g) {
+                    Plotly.extendTraces(gd, g.update, g.traces, g.max);
+                });
+                (ops.restyle || []).forEach(function(r) {
+                    var update = {};
+                    for (var k in r.update) update[k] = [r.update[k]];
+                    Plotly.restyle(gd, update, [r.trace]);
+                });
+                if (ops.patch && ops.patch.length) {
+                    window._applyChartOps(gd.data, gd.layout, {patch: ops.patch});
+                    Plotly.redraw(gd);
+                }
+                if (ops.relayout) Plotly.relayout(gd, ops.relayout);
+                return true;
+            };
         </script>
     ''')
 
-def custom_plotly(fig):
+def custom_plotly(fig, viewport=False):
     """Renders a Plotly figure using the custom queue mechanism."""
     chart_id = f"chart_{uuid.uuid4().hex}"
     
@@ -245,6 +350,8 @@ def custom_plotly(fig):
     j_config = json.dumps(config, cls=PlotlyJSONEncoder)
     
     js = f'window.addToChartQueue("{chart_id}", {j_data}, {j_layout}, {j_config});'
+    if viewport:
+        js = f'window._viewportCharts["{chart_id}"] = true; ' + js
 
     try:
         ui.timer(0, lambda: ui.run_javascript(js), once=True)
@@ -252,3 +359,40 @@ def custom_plotly(fig):
         ui.run_javascript(js)
     
     return c
+
+_viewport_charts = weakref.WeakKeyDictionary()  # client -> {chart_id: (元素, ViewportDownsampler)}
+
+def _on_viewport(charts, e):
+    chart_id = (e.args or {}).get('id')
+    entry = charts.get(chart_id)
+    if entry is None or entry[0].is_deleted:
+        return
+    fig, x_range = entry[1].render(e.args.get('range'))
+    j_data = json.dumps(fig['data'], cls=PlotlyJSONEncoder)
+    ui.run_javascript(f'window.replotViewport("{chart_id}", {j_data}, {json.dumps(x_range)});')
+
+def downsampled_plotly(fig, max_points=MAX_POINTS):
+    """
+    长序列图表：先发降采样后的图 (utils/downsample)，缩放/拖动后前端回传可见区间，
+    服务端对该区间补全分辨率再发回。点数不超过 max_points 时与 custom_plotly 相同
+    """
+    ds = ViewportDownsampler(fig, max_points)
+    if not ds.needed:
+        return custom_plotly(ds.full)
+    small, _ = ds.render()
+    c = custom_plotly(small, viewport=True)
+
+    client = context.client
+    charts = _viewport_charts.get(client)
+    if charts is None:
+        charts = _viewport_charts[client] = {}
+        ui.on('chart_viewport', lambda e: _on_viewport(charts, e))
+    for key in [k for k, (el, _) in charts.items() if el.is_deleted]:
+        del charts[key]
+    charts[c.props['id']] = (c, ds)
+    return c
+
+def stream_plotly(chart_id, ops):
+    """把 FigureStream.diff 的结果推送给已绘制的图表，await 得到前端是否已应用"""
+    j_ops = json.dumps(ops, cls=PlotlyJSONEncoder)
+    return ui.run_javascript(f'window.streamPlotly("{chart_id}", {j_ops})')
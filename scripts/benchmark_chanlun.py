@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+缠论核心计算的基准测试 (离线，行情由 generate_simulation_data 生成)
+对每个函数在不同长度的序列上测量 ops/sec 和峰值内存，并拟合耗时随长度增长的幂次 (scaling)。
+用法:
+    python scripts/benchmark_chanlun.py                          # 运行并打印
+    python scripts/benchmark_chanlun.py --save                   # 写入基线 JSON
+    python scripts/benchmark_chanlun.py --compare                # 与基线比较，退化时返回非 0
+    python scripts/benchmark_chanlun.py --sizes 400 2000 --kernels find_bi process_baohan
+"""
+
+import sys
+import os
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.kline_array import KLineArray
+from utils.money_flow import MoneyFlow
+from utils.simulator_logic import (
+    generate_simulation_data, process_baohan, find_bi, calculate_bi_and_centers,
+    check_divergence, calculate_macd, resample_klines,
+)
+
+DEFAULT_SIZES = [400, 2000, 20000, 200000]
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+
+def make_fixture(size, seed=0, array=False):
+    """
+    生成一组长度为 size 的测试行情 (日线 + MACD + 合并K线 + DataFrame)
+    array=True 时以 KLineArray 作为输入，否则为 list of dict
+    """
+    data, macd = generate_simulation_data(initial_price=20, length=size, seed=seed)
+    klines = KLineArray.from_records(data) if array else data
+
+    df = pd.DataFrame(data).drop(columns=['time'])
+    df.index = pd.bdate_range('1990-01-01', periods=size, name='date')
+    df['volume'] = 1e6
+    df['amount'] = df['close'] * 1e6
+    return {
+        'klines': klines,
+        'macd': macd,
+        'closes': [k['close'] for k in data],
+        'merged': process_baohan(klines),
+        'df': df,
+    }
+
+
+def _divergence_sweep(fx):
+    # 模拟器逐根复盘的用法：在每一根K线上判断一次背驰
+    klines, macd = fx['klines'], fx['macd']
+    for i in range(len(klines)):
+        check_divergence(klines, macd, i)
+
+
+KERNELS = {
+    'process_baohan': lambda fx: process_baohan(fx['klines']),
+    'find_bi': lambda fx: find_bi(fx['merged']),
+    'calculate_bi_and_centers': lambda fx: calculate_bi_and_centers(fx['merged']),
+    'check_divergence': _divergence_sweep,
+    'calculate_macd': lambda fx: calculate_macd(fx['closes']),
+    'resample_klines': lambda fx: resample_klines(fx['klines'], 5),
+    'build_buy_sell_assistant': lambda fx: MoneyFlow().build_buy_sell_assistant(fx['df']),
+}
+
+
+def measure(func, fx, min_time=0.5, max_calls=1000):
+    """
+    先在 tracemalloc 下调用一次取峰值内存，再重复调用至累计 min_time 秒，
+    返回 {'ops_per_sec', 'sec_per_op', 'calls', 'peak_kb'}
+    """
+    tracemalloc.start()
+    func(fx)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    times = []
+    total = 0.0
+    while total < min_time and len(times) < max_calls:
+        start = time.perf_counter()
+        func(fx)
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+        total += elapsed
+    sec = float(np.median(times))
+    return {
+        'ops_per_sec': 1.0 / sec if sec > 0 else float('inf'),
+        'sec_per_op': sec,
+        'calls': len(times),
+        'peak_kb': peak / 1024,
+    }
+
+
+def scaling_exponent(sizes, secs):
+    """
+    log(耗时) 对 log(长度) 的拟合斜率：≈1 为线性，≈2 为平方
+    """
+    if len(sizes) < 2:
+        return None
+    return float(np.polyfit(np.log(sizes), np.log(secs), 1)[0])
+
+
+def run(kernels, sizes, seed=0, array=False, min_time=0.5):
+    results = {name: {} for name in kernels}
+    for size in sizes:
+        fx = make_fixture(size, seed, array)
+        for name in kernels:
+            r = measure(KERNELS[name], fx, min_time)
+            results[name][str(size)] = r
+            print(f"{name:<26}{size:>8}  {r['ops_per_sec']:>12.2f} ops/s  {r['peak_kb']:>10.0f} KB  ({r['calls']} calls)")
+        del fx
+
+    for name, by_size in results.items():
+        sz = [int(s) for s in by_size]
+        by_size['scaling'] = scaling_exponent(sz, [by_size[str(s)]['sec_per_op'] for s in sz])
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    与基线比较：ops/sec 下降或峰值内存上升超过 tolerance 记为退化，返回退化项列表
+    """
+    regressions = []
+    for name, by_size in results.items():
+        base = baseline.get(name, {})
+        for size, r in by_size.items():
+            if size == 'scaling' or size not in base:
+                continue
+            b = base[size]
+            speed = r['ops_per_sec'] / b['ops_per_sec']
+            memory = r['peak_kb'] / b['peak_kb'] if b['peak_kb'] > 0 else 1.0
+            flag = ''
+            if speed < 1 - tolerance:
+                flag += ' SLOWER'
+                regressions.append((name, size, 'ops_per_sec', speed))
+            if memory > 1 + tolerance:
+                flag += ' MORE-MEMORY'
+                regressions.append((name, size, 'peak_kb', memory))
+            print(f"{name:<26}{size:>8}  speed x{speed:6.2f}  memory x{memory:6.2f}{flag}")
+    return regressions
+
+
+def baseline_mismatch(meta, seed, array):
+    """
+    基线与本次运行的输入口径 (seed、records/array) 不一致时返回差异说明列表，结果不可比
+    """
+    current = {'seed': seed, 'input': 'array' if array else 'records'}
+    return [f"{key}: baseline {meta.get(key)!r}, current {value!r}"
+            for key, value in current.items() if meta.get(key) != value]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Chanlun kernels on synthetic series')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='series lengths (bars)')
+    parser.add_argument('--kernels', nargs='+', default=list(KERNELS), choices=list(KERNELS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--array', action='store_true', help='feed KLineArray instead of list of dict')
+    parser.add_argument('--min-time', type=float, default=0.5, help='seconds spent timing each case')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='baseline JSON path')
+    parser.add_argument('--save', action='store_true', help='write results as the new baseline')
+    parser.add_argument('--compare', action='store_true', help='compare with the baseline and fail on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown / memory growth')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        # 先读基线，口径不一致时不必跑完整个基准
+        if not os.path.exists(args.baseline):
+            print(f"Baseline not found: {args.baseline}")
+            return 1
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        mismatch = baseline_mismatch(baseline.get('_meta', {}), args.seed, args.array)
+        if mismatch:
+            print(f"Baseline {args.baseline} was recorded with different inputs:")
+            for line in mismatch:
+                print(f"  {line}")
+            print("Re-run with matching --seed/--array or save a new baseline")
+            return 1
+
+    results = run(args.kernels, args.sizes, args.seed, args.array, args.min_time)
+
+    print("\nScaling (log-log slope of time vs bars):")
+    for name, by_size in results.items():
+        slope = by_size['scaling']
+        print(f"{name:<26}{'-' if slope is None else f'{slope:.2f}':>8}")
+
+    if args.save:
+        payload = {
+            '_meta': {
+                'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'pandas': pd.__version__,
+                'machine': platform.machine(),
+                'seed': args.seed,
+                'input': 'array' if args.array else 'records',
+            },
+            **results,
+        }
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if baseline is not None:
+        print(f"\nCompared with baseline ({baseline.get('_meta', {}).get('created', '?')}):")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            return 1
+        print("\nNo regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
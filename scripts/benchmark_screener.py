@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+全市场选股的吞吐基准 (离线，日线由 generate_simulation_paths 生成并写入临时 KLineStore)
+分别测量读取面板、向量化信号、进程池笔识别三个阶段的耗时和每秒处理的股票数。
+用法:
+    python scripts/benchmark_screener.py                         # 5000 只 × 300 根，默认进程数
+    python scripts/benchmark_screener.py --workers 1 4 8          # 比较不同进程数
+    python scripts/benchmark_screener.py --budget 60              # 总耗时超过 60 秒时返回非 0
+"""
+
+import sys
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.kline_store import KLineStore
+from utils.screener import MarketScreener, PANEL_BARS, default_workers
+from utils.simulator_logic import generate_simulation_paths
+
+
+class _Master:
+    """只提供代码列表，名称留空"""
+    def __init__(self, codes):
+        self._codes = codes
+
+    def codes(self):
+        return list(self._codes)
+
+    def get(self, code):
+        return None
+
+
+def make_store(root, stocks, length, seed=0):
+    """
+    生成 stocks 只股票、每只 length 根日线并写入 root 下的 KLineStore，返回 (store, 代码列表)
+    """
+    store = KLineStore(root, max_entries=stocks + 1)
+    paths = generate_simulation_paths(stocks, length, initial_price=20, seed=seed)
+    volume = np.random.default_rng(seed).uniform(1e5, 1e7, (stocks, length))
+    index = pd.bdate_range(end='2024-12-31', periods=length, name='date')
+    codes = [f"{600000 + i:06d}" for i in range(stocks)]
+    with store.batch():
+        for i, code in enumerate(codes):
+            store.save(code, 'day', pd.DataFrame({
+                'open': paths['open'][i], 'high': paths['high'][i], 'low': paths['low'][i],
+                'close': paths['close'][i], 'volume': volume[i], 'amount': paths['close'][i] * volume[i],
+            }, index=index))
+    return store, codes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the market screener on synthetic daily bars')
+    parser.add_argument('--stocks', type=int, default=5000)
+    parser.add_argument('--length', type=int, default=300, help='bars stored per stock')
+    parser.add_argument('--bars', type=int, default=PANEL_BARS, help='bars per stock in the panel')
+    parser.add_argument('--workers', type=int, nargs='+', default=[default_workers()])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--budget', type=float, default=60.0, help='fail when a full run takes longer (seconds)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        store, codes = make_store(root, args.stocks, args.length, args.seed)
+        print(f"Generated {args.stocks} stocks x {args.length} bars in {time.perf_counter() - start:.1f}s\n")
+
+        print(f"{'workers':>8}{'load':>9}{'signals':>9}{'strokes':>9}{'total':>9}{'stocks/s':>11}")
+        slow = False
+        for workers in args.workers:
+            screener = MarketScreener(store, _Master(codes), bars=args.bars, workers=workers)
+            screener.run()
+            t = screener.timings
+            print(f"{workers:>8}{t['load']:>8.2f}s{t['signals']:>8.2f}s{t['strokes']:>8.2f}s{t['total']:>8.2f}s"
+                  f"{t['stocks'] / t['total']:>11.0f}")
+            slow = slow or t['total'] > args.budget
+
+    if slow:
+        print(f"\nSlower than the {args.budget:.0f}s budget")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
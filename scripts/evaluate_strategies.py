@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+批量评估模拟器评分规则的统计表现
+用法:
+    python scripts/evaluate_strategies.py --series 1000 --length 2000 --policy tutorial
+    python scripts/evaluate_strategies.py --cached --policy divergence
+"""
+
+import sys
+import os
+import json
+import argparse
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.strategy_eval import POLICIES, run_generated, run_cached, load_cached_klines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate simulator scoring rules over many series')
+    parser.add_argument('--policy', default='tutorial', choices=sorted(POLICIES))
+    parser.add_argument('--series', type=int, default=1000, help='number of generated series')
+    parser.add_argument('--length', type=int, default=2000, help='bars per generated series')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--horizon', type=int, default=5, help='bars ahead used to judge a signal')
+    parser.add_argument('--workers', type=int, default=None, help='process count (1 = single process)')
+    parser.add_argument('--cached', action='store_true', help='use cached sector K-lines instead of generated data')
+    args = parser.parse_args()
+
+    if args.cached:
+        series = load_cached_klines()
+        print(f"Loaded {len(series)} cached series")
+        report = run_cached(series, policy=args.policy, horizon=args.horizon, workers=args.workers)
+    else:
+        report = run_generated(n_series=args.series, length=args.length, policy=args.policy,
+                               seed=args.seed, horizon=args.horizon, workers=args.workers)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils import money_flow
+from utils.money_flow import MoneyFlow
+
+
+def _kline(seed, n=300):
+    rng = np.random.default_rng(seed)
+    close = np.round(np.exp(np.cumsum(rng.normal(0, 0.02, n))) * 10, 2)
+    close[100:120] = close[100]
+    open_ = np.round(close * (1 + rng.normal(0, 0.005, n)), 2)
+    high = np.round(np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, n))), 2)
+    low = np.round(np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, n))), 2)
+    volume = rng.uniform(1e5, 1e6, n)
+    index = pd.DatetimeIndex(pd.bdate_range('2020-01-01', periods=n), name='date').astype('datetime64[ns]')
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close,
+                         'volume': volume, 'amount': volume * close}, index=index)
+
+
+class TestBuySellAssistant(unittest.TestCase):
+    def setUp(self):
+        money_flow._ASSISTANT_STATES.clear()
+        self.addCleanup(money_flow._ASSISTANT_STATES.clear)
+
+    def test_incremental_matches_full(self):
+        mf = MoneyFlow()
+        rng = np.random.default_rng(9)
+        for seed in range(5):
+            df = _kline(seed)
+            key = ('000001', f'day{seed}')
+            mf.build_buy_sell_assistant(df, key)
+            state = money_flow._ASSISTANT_STATES[key]
+            for _ in range(3):
+                # 盘中最后一根K线变化，历史不变
+                live = df.copy()
+                close = round(float(live['close'].iloc[-2]) * (1 + rng.normal(0, 0.03)), 2)
+                live.iloc[-1, live.columns.get_indexer(['close', 'high', 'low', 'volume'])] = [
+                    close, close * 1.02, close * 0.98, rng.uniform(1e5, 2e6)]
+                inc = mf.build_buy_sell_assistant(live, key)
+                full = mf.build_buy_sell_assistant(live)
+                self.assertIs(money_flow._ASSISTANT_STATES[key], state)
+                pd.testing.assert_frame_equal(inc['kline'], full['kline'])
+                self.assertEqual(inc['analysis'], full['analysis'])
+
+    def test_history_change_rebuilds_state(self):
+        mf = MoneyFlow()
+        df = _kline(1)
+        key = ('000001', 'day')
+        mf.build_buy_sell_assistant(df, key)
+        state = money_flow._ASSISTANT_STATES[key]
+        changed = df.copy()
+        changed.iloc[50, changed.columns.get_loc('close')] *= 1.01  # 复权等导致历史变化
+        result = mf.build_buy_sell_assistant(changed, key)
+        self.assertIsNot(money_flow._ASSISTANT_STATES[key], state)
+        self.assertEqual(result['analysis'], mf.build_buy_sell_assistant(changed)['analysis'])
+        # 新的一天: 昨天的K线进入历史
+        mf.build_buy_sell_assistant(_kline(1, 301), key)
+        self.assertEqual(len(money_flow._ASSISTANT_STATES[key]), 300)
+
+
+if __name__ == '__main__':
+    unittest.main()
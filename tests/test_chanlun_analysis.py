@@ -0,0 +1,57 @@
+import random
+import unittest
+from unittest import mock
+import numpy as np
+from utils import simulator_logic
+from utils.chanlun_engine import ChanlunEngine
+from utils.kline_array import KLineArray
+from utils.simulator_logic import (
+    generate_simulation_data, process_baohan, find_bi, calculate_bi_and_centers,
+    calculate_bi_and_zhongshu_shapes, check_divergence, identify_fenxing,
+    get_chanlun_analysis, get_chanlun_shapes, analyze_action,
+)
+
+
+class TestChanlunAnalysis(unittest.TestCase):
+    def setUp(self):
+        random.seed(5)
+        np.random.seed(5)
+        self.data, self.macd = generate_simulation_data(initial_price=20, length=300)
+
+    def test_fields_match_standalone_functions(self):
+        for klines in (self.data, KLineArray.from_records(self.data)):
+            analysis = get_chanlun_analysis(klines, self.macd, 250)
+            self.assertEqual((analysis.bi_list, analysis.centers), calculate_bi_and_centers(klines))
+            self.assertEqual(analysis.zhongshu_shapes, calculate_bi_and_zhongshu_shapes(klines))
+            self.assertEqual(analysis.divergence, check_divergence(klines, self.macd, 250))
+            self.assertEqual(analysis.fenxing, identify_fenxing(klines[248:251]))
+            processed = process_baohan(klines)
+            self.assertEqual(get_chanlun_analysis(processed).bi_points, find_bi(processed))
+
+    def test_memoized_by_identity_and_length(self):
+        klines = self.data[:200]
+        macd = {k: v[:200] for k, v in self.macd.items()}
+        first = get_chanlun_analysis(klines, macd, 199)
+        self.assertIs(get_chanlun_analysis(klines, macd, 199), first)
+        self.assertIsNot(get_chanlun_analysis(list(klines), macd, 199), first)
+        # 带引擎的调用不能拿到之前无引擎的结果
+        engine = ChanlunEngine(klines)
+        self.assertIs(get_chanlun_analysis(klines, macd, 199, engine).engine, engine)
+        klines.append(self.data[200])
+        self.assertIsNot(get_chanlun_analysis(klines, macd, 199), first)
+
+    def test_action_scoring_scans_structure_once(self):
+        idx = 220
+        klines = self.data[:idx + 1]
+        macd = {k: v[:idx + 1] for k, v in self.macd.items()}
+        expected_shapes = get_chanlun_shapes(list(klines), dict(macd), idx)
+        with mock.patch.object(simulator_logic, '_fenxing_chain', wraps=simulator_logic._fenxing_chain) as chain, \
+                mock.patch.object(simulator_logic, 'check_divergence', wraps=simulator_logic.check_divergence) as div:
+            _, _, shapes = analyze_action('buy', klines, macd, idx)
+        self.assertEqual(chain.call_count, 1)
+        self.assertEqual(div.call_count, 1)
+        self.assertEqual(shapes, expected_shapes)
+
+
+if __name__ == '__main__':
+    unittest.main()
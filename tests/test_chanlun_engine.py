@@ -0,0 +1,75 @@
+import random
+import unittest
+import numpy as np
+from utils.chanlun_engine import ChanlunEngine
+from utils.kline_array import KLineArray
+from utils.simulator_logic import (
+    generate_simulation_data, process_baohan, find_bi,
+    calculate_bi_and_centers, calculate_bi_and_zhongshu_shapes, get_chanlun_shapes,
+)
+
+
+class TestChanlunEngine(unittest.TestCase):
+    def _series(self, seed, length=300):
+        random.seed(seed)
+        np.random.seed(seed)
+        data, macd = generate_simulation_data(initial_price=20, length=length)
+        return data, macd
+
+    def test_matches_batch_functions_bar_by_bar(self):
+        for seed in range(5):
+            data, _ = self._series(seed)
+            engine = ChanlunEngine()
+            for i, bar in enumerate(data):
+                engine.push(bar)
+                if i % 5 and i != len(data) - 1:
+                    continue
+                klines = data[:i + 1]
+                processed = process_baohan(klines)
+                self.assertEqual(engine.merged_bars(), processed)
+                # 列式实现与引擎共用同一条包含规则 (merge_baohan)；单根K线时 dict 版不补 high_date
+                columnar = process_baohan(KLineArray.from_records(klines))
+                if len(processed) > 1:
+                    self.assertEqual([(r['high'], r['low'], r['high_date'], r['low_date']) for r in columnar],
+                                     [(r['high'], r['low'], r['high_date'], r['low_date']) for r in processed])
+                self.assertEqual(engine.bi_points(), find_bi(processed))
+                self.assertEqual(engine.bi_and_centers(), calculate_bi_and_centers(processed))
+                self.assertEqual(engine.bi_and_centers(merged=False), calculate_bi_and_centers(klines))
+                self.assertEqual(engine.shapes(), calculate_bi_and_zhongshu_shapes(klines))
+
+    def test_checkpoint_rollback_tentative_bar(self):
+        data, _ = self._series(7)
+        rng = random.Random(7)
+        engine = ChanlunEngine()
+        for i, bar in enumerate(data[:-1]):
+            engine.push(bar)
+            if i < 20 or i % 7:
+                continue
+            token = engine.checkpoint()
+            for _ in range(3):
+                # 盘中同一根K线反复变化
+                tentative = dict(data[i + 1], high=data[i + 1]['high'] * rng.uniform(0.95, 1.05),
+                                 low=data[i + 1]['low'] * rng.uniform(0.95, 1.05))
+                engine.push(tentative)
+                processed = process_baohan(data[:i + 1] + [tentative])
+                self.assertEqual(engine.bi_points(), find_bi(processed))
+                self.assertEqual(engine.bi_and_centers(), calculate_bi_and_centers(processed))
+                self.assertEqual(engine.shapes(), calculate_bi_and_zhongshu_shapes(data[:i + 1] + [tentative]))
+                engine.rollback(token)
+            processed = process_baohan(data[:i + 1])
+            self.assertEqual(engine.merged_bars(), processed)
+            self.assertEqual(engine.bi_and_centers(), calculate_bi_and_centers(processed))
+
+    def test_get_chanlun_shapes_uses_engine(self):
+        data, macd = self._series(11, length=200)
+        engine = ChanlunEngine(data[:151])
+        klines = data[:151]
+        macd_cut = {k: v[:151] for k, v in macd.items()}
+        self.assertEqual(
+            get_chanlun_shapes(klines, macd_cut, 150, engine),
+            get_chanlun_shapes(klines, macd_cut, 150),
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import copy
+import unittest
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from utils.chart_stream import FigureStream, figure_dict
+
+
+def _figure(close, window=20, title='K线'):
+    """与买卖助手结构相同的简化图：K线 + 均线 + 稀疏买点 + 带颜色数组的柱"""
+    dates = pd.bdate_range('2024-01-01', periods=len(close))
+    df = pd.DataFrame({'close': close}, index=dates).iloc[-window:]
+    x = df.index.strftime('%Y-%m-%d')
+    c = df['close']
+    buy = (c.diff() > 0.5).values
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True)
+    fig.add_trace(go.Candlestick(x=x, open=c - 0.1, high=c + 0.2, low=c - 0.2, close=c, name='K线'), row=1, col=1)
+    fig.add_trace(go.Scatter(x=x, y=c.rolling(5).mean(), mode='lines', name='MA5'), row=1, col=1)
+    fig.add_trace(go.Scatter(x=x[buy], y=c[buy], mode='markers+text', text=['买'] * int(buy.sum()), name='买点'), row=1, col=1)
+    fig.add_trace(go.Bar(x=x, y=c.diff().fillna(0), marker_color=['red' if v >= 0 else 'green' for v in c.diff().fillna(0)],
+                         name='MACD柱'), row=2, col=1)
+    fig.update_layout(title=title, xaxis_type='category')
+    return fig
+
+
+def _apply(figure, ops):
+    """按前端 window.streamPlotly 的语义应用 ops"""
+    data, layout = figure['data'], figure['layout']
+
+    def target(trace, attr):
+        path = attr.split('.')
+        for key in path[:-1]:
+            trace = trace.setdefault(key, {})
+        return trace, path[-1]
+
+    for g in ops.get('extend', []):
+        for n, t in enumerate(g['traces']):
+            for k, vals in g['update'].items():
+                obj, key = target(data[t], k)
+                arr = obj.get(key, []) + vals[n]
+                obj[key] = arr[max(0, len(arr) - g['max']):]
+    for r in ops.get('restyle', []):
+        for k, v in r['update'].items():
+            obj, key = target(data[r['trace']], k)
+            if v is None:
+                obj.pop(key, None)
+            else:
+                obj[key] = v
+    for t, k, i, v in ops.get('patch', []):
+        obj, key = target(data[t], k)
+        obj[key][i] = v
+    for k, v in ops.get('relayout', {}).items():
+        if v is None:
+            layout.pop(k, None)
+        else:
+            layout[k] = v
+
+
+class TestChartStream(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.close = np.round(10 + np.cumsum(rng.normal(0, 0.5, 60)), 2)
+
+    def assertStreamed(self, stream, fig):
+        before = copy.deepcopy(stream.figure)
+        ops = stream.diff(fig)
+        self.assertIsNotNone(ops)
+        _apply(before, ops)
+        self.assertEqual(before, figure_dict(fig))
+        return ops
+
+    def test_last_bar_update_is_patched(self):
+        stream = FigureStream(_figure(self.close[:50]))
+        close = self.close[:50].copy()
+        close[-1] += 0.03
+        ops = self.assertStreamed(stream, _figure(close))
+        self.assertEqual(set(ops), {'patch'})
+        self.assertTrue(all(p[2] == 19 for p in ops['patch']))
+        self.assertEqual(stream.diff(_figure(close)), {})
+
+    def test_appended_bar_slides_window(self):
+        stream = FigureStream(_figure(self.close[:50]))
+        for t in range(51, 60):
+            ops = self.assertStreamed(stream, _figure(self.close[:t]))
+            self.assertIn('extend', ops)
+            self.assertTrue(all(g['max'] for g in ops['extend']))
+        # K线、均线、柱的数组都只追加一个点
+        candle = next(g for g in ops['extend'] if 0 in g['traces'])
+        self.assertEqual([len(v[0]) for v in candle['update'].values()], [1] * len(candle['update']))
+
+    def test_layout_and_structure_changes(self):
+        stream = FigureStream(_figure(self.close[:50]))
+        ops = self.assertStreamed(stream, _figure(self.close[:50], title='新标题'))
+        self.assertEqual(set(ops), {'relayout'})
+        fig = _figure(self.close[:50])
+        fig.add_trace(go.Scatter(x=['2024-01-01'], y=[1], name='卖点'))
+        self.assertIsNone(stream.diff(fig))
+
+
+if __name__ == '__main__':
+    unittest.main()
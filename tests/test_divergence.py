@@ -0,0 +1,46 @@
+import random
+import unittest
+import numpy as np
+from utils.divergence import SparseTable, DivergenceIndex, divergence_flags, BOTTOM, TOP
+from utils.kline_array import KLineArray
+from utils.simulator_logic import generate_simulation_data, check_divergence
+
+
+class TestDivergenceIndex(unittest.TestCase):
+    def setUp(self):
+        random.seed(9)
+        np.random.seed(9)
+        self.data, self.macd = generate_simulation_data(initial_price=20, length=500)
+        self.div_index = DivergenceIndex.from_klines(self.data, self.macd)
+
+    def test_sparse_table_returns_first_extremum(self):
+        values = np.array([3, 1, 4, 1, 5, 9, 2, 6, 1, 3], dtype=float)
+        table = SparseTable(values)
+        for l in range(len(values)):
+            for r in range(l + 1, len(values) + 1):
+                self.assertEqual(table.argmin(l, r), l + int(np.argmin(values[l:r])))
+        l = np.array([0, 2, 4, 5])
+        r = np.array([10, 5, 9, 6])
+        np.testing.assert_array_equal(table.argmin(l, r), [1, 3, 8, 5])
+
+    def test_query_matches_scan(self):
+        karr = KLineArray.from_records(self.data)
+        for lookback in (5, 30, 64):
+            for i in range(len(self.data)):
+                expected = check_divergence(self.data, self.macd, i, lookback)
+                self.assertEqual(check_divergence(self.data, self.macd, i, lookback, self.div_index), expected)
+                self.assertEqual(check_divergence(karr, self.macd, i, lookback), expected)
+
+    def test_batch_flags(self):
+        flags = divergence_flags(self.data, self.macd, lookback=30)
+        expected = []
+        for i in range(len(self.data)):
+            desc, _ = check_divergence(self.data, self.macd, i, 30)
+            expected.append(0 if desc is None else (BOTTOM if '底背驰' in desc else TOP))
+        np.testing.assert_array_equal(flags, expected)
+        self.assertTrue(np.any(flags != 0))
+        self.assertFalse(np.any(DivergenceIndex([1.0], [2.0], [0.0]).flags()))
+
+
+if __name__ == '__main__':
+    unittest.main()
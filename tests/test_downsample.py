@@ -0,0 +1,81 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from utils.downsample import ViewportDownsampler, lttb_indices, minmax_indices
+
+
+class TestDownsample(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.n = 1200
+        self.dates = pd.bdate_range('2020-01-01', periods=self.n)
+        self.close = 10 + np.cumsum(rng.normal(0, 0.2, self.n))
+        self.bars = rng.normal(0, 1, self.n)
+        self.bars[333] = 50
+
+    def test_selectors(self):
+        idx = lttb_indices(self.close, 100)
+        self.assertEqual(len(idx), 100)
+        self.assertEqual((idx[0], idx[-1]), (0, self.n - 1))
+        self.assertTrue(np.all(np.diff(idx) > 0))
+        mm = minmax_indices(self.bars, 100)
+        self.assertIn(333, mm)
+        self.assertIn(int(np.argmin(self.bars)), mm)
+        np.testing.assert_array_equal(lttb_indices(self.close[:50], 100), np.arange(50))
+
+    def test_category_keeps_extremes_and_markers(self):
+        x = self.dates.strftime('%Y-%m-%d')
+        c = self.close
+        fig = make_subplots(rows=2, cols=1, shared_xaxes=True)
+        fig.add_trace(go.Candlestick(x=x, open=c, high=c + 0.3, low=c - 0.3, close=c + 0.1, name='K线'), row=1, col=1)
+        fig.add_trace(go.Scatter(x=x, y=c, mode='lines', name='MA'), row=1, col=1)
+        tops = list(x[[101, 502, 777]])
+        fig.add_trace(go.Scatter(x=tops, y=[1, 2, 3], mode='markers', name='顶分型'), row=1, col=1)
+        fig.add_trace(go.Bar(x=x, y=self.bars, marker_color=['red' if v > 0 else 'green' for v in self.bars],
+                             name='柱'), row=2, col=1)
+        fig.update_xaxes(type='category', range=[1000, 1199])
+
+        ds = ViewportDownsampler(fig, max_points=200)
+        small, _ = ds.render()
+        candle, line, marks, bar = small['data']
+        self.assertLess(len(candle['x']), 300)
+        self.assertEqual(candle['x'], line['x'])
+        self.assertEqual(candle['x'], bar['x'])
+        self.assertTrue(set(tops) <= set(candle['x']))
+        self.assertEqual(marks['x'], tops)
+        self.assertAlmostEqual(max(candle['high']), (c + 0.3).max())
+        self.assertAlmostEqual(min(candle['low']), (c - 0.3).min())
+        self.assertEqual(max(bar['y']), 50)
+        self.assertEqual(len(bar['marker']['color']), len(bar['x']))
+        lo, hi = small['layout']['xaxis']['range']
+        self.assertEqual(candle['x'][int(round(hi))], x[-1])
+
+        # 缩放到约 60 根K线：区间内全分辨率，返回换算后的 range
+        zoom, rng = ds.render([lo, lo + 10])
+        shown = zoom['data'][0]['x']
+        first, last = int(np.ceil(rng[0])), int(np.floor(rng[1]))
+        window = shown[first:last + 1]
+        start = list(x).index(window[0])
+        self.assertEqual(window, list(x[start:start + len(window)]))
+
+    def test_values_axis(self):
+        fig = go.Figure(go.Scatter(x=self.dates, y=self.close, mode='lines', name='温度'))
+        fig.add_trace(go.Scatter(x=self.dates[[5, 600]], y=[1, 1], mode='markers', name='高温'))
+        ds = ViewportDownsampler(fig, max_points=200)
+        small, rng = ds.render()
+        self.assertIsNone(rng)
+        line = small['data'][0]
+        self.assertLessEqual(len(line['x']), 202)
+        self.assertIn(self.dates[600].isoformat(), line['x'])
+        zoom, _ = ds.render(['2021-01-01', '2021-03-01 12:00:00.5'])
+        inside = [v for v in zoom['data'][0]['x'] if '2021-01-01' <= v <= '2021-03-02']
+        self.assertEqual(len(inside), len(pd.bdate_range('2021-01-01', '2021-03-01')))
+        self.assertFalse(ViewportDownsampler(go.Figure(go.Scatter(x=self.dates[:100], y=self.close[:100]))).needed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from utils.game_pool import GamePool, build_game
+from utils.simulator_logic import analyze_advanced_action, analyze_action, get_chanlun_shapes, resample_klines
+
+
+class TestGamePool(unittest.TestCase):
+    def test_built_game_matches_direct_computation(self):
+        game = build_game('advanced', seed=123)
+        self.assertEqual(game.index, 1250)
+        self.assertEqual(len(game.engine), game.index + 1)
+        self.assertEqual((game.data_week, game.macd_week), resample_klines(game.data, 5))
+        self.assertEqual(build_game('advanced', seed=123).data.close.tolist(), game.data.close.tolist())
+
+        i = game.index
+        klines = game.data[:i + 1]
+        macd = {k: v[:i + 1] for k, v in game.macd.items()}
+        plain = analyze_advanced_action('buy', i, klines, macd, game.data_week, game.macd_week,
+                                        game.data_month, game.macd_month)
+        pooled = analyze_advanced_action('buy', i, game.data[:i + 1], dict(macd), game.data_week, game.macd_week,
+                                         game.data_month, game.macd_month, game.engine, game.week_map, game.month_map,
+                                         game.div_index, game.div_index_week, game.div_index_month)
+        self.assertEqual(pooled, plain)
+
+        cut = int(game.week_map[i]) + 1
+        game.engine_week.extend(game.data_week[len(game.engine_week):cut])
+        week_macd = {k: v[:cut] for k, v in game.macd_week.items()}
+        self.assertEqual(
+            get_chanlun_shapes(game.data_week[:cut], week_macd, cut - 1, game.engine_week, game.div_index_week),
+            get_chanlun_shapes(list(game.data_week[:cut]), dict(week_macd), cut - 1),
+        )
+
+    def test_basic_game_steps(self):
+        game = build_game('basic', seed=5)
+        for i in range(game.index, game.index + 30):
+            klines = game.data[:i + 1]
+            macd = {k: v[:i + 1] for k, v in game.macd.items()}
+            self.assertEqual(analyze_action('sell', klines, macd, i, game.engine, game.div_index),
+                             analyze_action('sell', list(klines), dict(macd), i))
+            game.engine.push(game.data[i + 1])
+
+    def test_pool_size_memory_cap_and_idle(self):
+        built = []
+
+        def builder(mode):
+            built.append(mode)
+            return build_game(mode, seed=len(built))
+
+        pool = GamePool(size=2, modes=('basic',), idle_delay=60, builder=builder)
+        pool.fill()
+        self.assertEqual(len(pool), 2)
+        game = pool.get('basic')
+        self.assertEqual(game.mode, 'basic')
+        self.assertEqual(len(pool), 1)
+        self.assertFalse(pool.refill_once())  # 刚取过局，等待空闲
+        self.assertEqual(len(built), 2)
+        self.assertIsNot(pool.get('basic'), pool.get('basic'))  # 池空时当场生成
+
+        capped = GamePool(size=5, max_bytes=build_game('basic', seed=1).nbytes + 1, modes=('basic',), idle_delay=0)
+        capped.fill()
+        self.assertEqual(len(capped), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
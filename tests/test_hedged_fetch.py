@@ -0,0 +1,84 @@
+import time
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from utils import hedged_fetch as hf
+
+
+def _source(delay, result, calls, name):
+    def fetch(code):
+        calls.append(name)
+        time.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return fetch
+
+
+class TestHedgedFetch(unittest.TestCase):
+    def test_hedge_after_delay_and_first_valid_wins(self):
+        calls = []
+        fetcher = hf.HedgedFetcher('test_hedge', [
+            ('slow', _source(1.3, {'src': 'slow'}, calls, 'slow')),
+            ('fast', _source(0.05, {'src': 'fast'}, calls, 'fast')),
+            ('unused', _source(0.0, {'src': 'unused'}, calls, 'unused')),
+        ])
+        with mock.patch.object(hf, 'DEFAULT_DELAY', 0.1):
+            start = time.perf_counter()
+            self.assertEqual(fetcher('600519'), {'src': 'fast'})
+            self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(calls, ['slow', 'fast'])
+        stats = fetcher.stats()
+        self.assertEqual((stats['fast']['wins'], stats['fast']['hedges']), (1, 1))
+        time.sleep(1.3)  # 被放弃的慢请求结束后仍计入延迟
+        self.assertEqual(fetcher.stats()['slow']['requests'], 1)
+        # 慢来源的 EWMA 延迟更高，下次先请求快的
+        self.assertEqual([name for name, _ in fetcher.ranked('600519')], ['fast', 'unused', 'slow'])
+
+    def test_failures_fall_through_and_demote(self):
+        calls = []
+        fetcher = hf.HedgedFetcher('test_fail', [
+            ('broken', _source(0.0, ValueError('blocked'), calls, 'broken')),
+            ('empty', _source(0.0, None, calls, 'empty')),
+            ('ok', _source(0.0, [1], calls, 'ok')),
+            ('minute_only', _source(0.0, [2], calls, 'minute_only'), lambda code: code != '600519'),
+        ])
+        start = time.perf_counter()
+        self.assertEqual(fetcher('600519'), [1])
+        self.assertLess(time.perf_counter() - start, 0.5)  # 失败立即换下一个，不等对冲延迟
+        self.assertEqual(calls, ['broken', 'empty', 'ok'])
+        self.assertEqual(fetcher.ranked('600519')[0][0], 'ok')
+        self.assertIn('test_fail', hf.stats())
+
+        fetcher.sources = fetcher.sources[:2]
+        self.assertIsNone(fetcher('600519'))
+
+
+class TestSourceConventions(unittest.TestCase):
+    def test_stored_kline_sources_share_units(self):
+        from utils import money_flow as mf
+        # 新浪不复权，不参与落盘序列的竞速；其余来源的成交量统一为股
+        self.assertEqual([source[0] for source in mf._kline_fetcher.sources], ['em', 'akshare'])
+        raw = pd.DataFrame({'日期': ['2024-01-02'], '收盘': [10.0], '成交量': [12.0], '成交额': [12000.0]})
+        with mock.patch.object(mf, '_fetch_em_kline_direct', return_value=raw):
+            df = mf._kline_fetcher.sources[0][1]('600519', 'day', '', '20240102')
+        self.assertEqual((df['成交量'].iloc[0], df['成交额'].iloc[0]), (1200.0, 12000.0))
+
+    def test_live_turnover_merged_whichever_source_wins(self):
+        from utils import market_sentiment
+        ms = market_sentiment.MarketSentiment()
+        history = pd.Series([3e11], index=pd.to_datetime(['2024-01-02']))
+        live = pd.Series([1e11], index=pd.to_datetime(['2024-01-03']))
+        for winner in ('em', 'sina'):
+            with mock.patch.object(market_sentiment, '_turnover_fetcher',
+                                   return_value=history if winner == 'em' else None), \
+                    mock.patch.object(ms, '_turnover_from_sina', return_value=history), \
+                    mock.patch.object(ms, 'fetch_sina_live', return_value=live):
+                total = ms.get_sh_sz_turnover()
+            self.assertEqual(list(total.round(2)), [0.6, 0.2])
+
+
+if __name__ == '__main__':
+    unittest.main()
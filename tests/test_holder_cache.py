@@ -0,0 +1,68 @@
+import datetime
+import tempfile
+import time
+import unittest
+
+import pandas as pd
+
+from utils import holder_cache as hc
+
+
+def _gdhs(n):
+    return pd.DataFrame({'股东户数统计截止日': [datetime.date(2024, 3, 31)], '股东户数-本次': [n]})
+
+
+class TestHolderCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.calls = []
+
+        def fetch_gdhs(code):
+            self.calls.append(code)
+            return None if code == 'bad' else _gdhs(len(self.calls))
+
+        self.cache = hc.HolderCache(self.tmp.name, fetchers={'gdhs': fetch_gdhs})
+
+    def test_report_season_expiry(self):
+        dt = datetime.datetime
+        # 披露窗口内只用到次日
+        self.assertEqual(hc.gdhs_expiry(dt(2024, 4, 15, 20)), dt(2024, 4, 16))
+        self.assertEqual(hc.gdhs_expiry(dt(2024, 8, 31, 9)), dt(2024, 9, 1))
+        # 窗口外用到下一个窗口开始，最长 GDHS_MAX_TTL_DAYS 天
+        self.assertEqual(hc.gdhs_expiry(dt(2024, 9, 28, 16)), dt(2024, 10, 1))
+        self.assertEqual(hc.gdhs_expiry(dt(2024, 12, 29)), dt(2025, 1, 1))
+        self.assertEqual(hc.gdhs_expiry(dt(2024, 5, 10)), dt(2024, 5, 17))
+
+    def test_persisted_and_refreshed_in_background(self):
+        self.assertIsNone(self.cache.lookup('600519', 'gdhs'))
+        self.assertEqual(self.calls, [])  # lookup 不走网络
+        self.assertEqual(self.cache.refresh_async('600519', 'gdhs').result(1)['股东户数-本次'].iloc[0], 1)
+
+        reopened = hc.HolderCache(self.tmp.name, fetchers=self.cache.fetchers)
+        df, fresh = reopened.get('600519', 'gdhs')
+        self.assertTrue(fresh)
+        self.assertEqual(pd.to_datetime(df['股东户数统计截止日']).iloc[0], pd.Timestamp('2024-03-31'))
+
+        # 过期数据照常返回，同时后台刷新
+        later = datetime.datetime.now() + datetime.timedelta(days=120)
+        self.assertEqual(reopened.lookup('600519', 'gdhs', now=later)['股东户数-本次'].iloc[0], 1)
+        for _ in range(50):
+            if len(self.calls) == 2 and not reopened._inflight:
+                break
+            time.sleep(0.02)
+        self.assertEqual(reopened.get('600519', 'gdhs')[0]['股东户数-本次'].iloc[0], 2)
+
+    def test_prefetch_watched(self):
+        now = time.time()
+        self.cache.watch(['600519', 'bad'], now=now)
+        self.cache.watch(['000001'], now=now - 40 * 86400)  # 很久未登记
+        self.assertEqual(self.cache.watched(now), ['600519', 'bad'])
+        self.assertEqual(self.cache.prefetch(pause=0), 1)
+        self.assertEqual(sorted(self.calls), ['600519', 'bad'])
+        self.assertEqual(self.cache.prefetch(pause=0), 0)  # 未过期的不再下载，失败的再试
+        self.assertEqual(sorted(self.calls), ['600519', 'bad', 'bad'])
+
+
+if __name__ == '__main__':
+    unittest.main()
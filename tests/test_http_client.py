@@ -0,0 +1,89 @@
+import json
+import threading
+import time
+import unittest
+import concurrent.futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.http_client import HttpClient, HttpError, unwrap_jsonp
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            hits = server.hits[self.path]
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            if self.path.startswith('/slow'):
+                time.sleep(0.05)
+            if self.path == '/flaky' and hits < 3:
+                self._send(503, b'busy')
+            elif self.path == '/jsonp':
+                payload = {'data': {'klines': ['a'] if hits >= 2 else []}}
+                self._send(200, f"jQuery1_2({json.dumps(payload)});".encode())
+            elif self.path == '/missing':
+                self._send(404, b'')
+            else:
+                self._send(200, b'{"ok": 1}')
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def _send(self, code, body):
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHttpClient(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+        self.server.lock = threading.Lock()
+        self.server.hits, self.server.active, self.server.max_active = {}, 0, 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.host = f"127.0.0.1:{self.server.server_address[1]}"
+        self.base = f"http://{self.host}"
+
+    def test_keep_alive_reuse_and_stats(self):
+        client = HttpClient(backoff=0)
+        for _ in range(5):
+            self.assertEqual(client.get_json(self.base + '/ok'), {'ok': 1})
+        stats = client.stats()[self.host]
+        self.assertEqual(stats['requests'], 5)
+        self.assertEqual((stats['connections'], stats['reused']), (1, 4))
+        self.assertIsNotNone(stats['p95_ms'])
+
+    def test_retry_jsonp_and_errors(self):
+        client = HttpClient(retries=2, backoff=0)
+        self.assertEqual(client.get(self.base + '/flaky').text, '{"ok": 1}')
+        data = client.get_json(self.base + '/jsonp', jsonp=True, validate=lambda d: d['data']['klines'])
+        self.assertEqual(data['data']['klines'], ['a'])
+        self.assertEqual(client.stats()[self.host]['retries'], 3)
+
+        with self.assertRaises(HttpError):
+            client.get(self.base + '/missing')
+        self.assertEqual(self.server.hits['/missing'], 1)  # 4xx 不重试
+        self.assertEqual(unwrap_jsonp('cb({"a": [1]});'), '{"a": [1]}')
+        self.assertEqual(unwrap_jsonp('{"a": "(x)"}'), '{"a": "(x)"}')
+
+    def test_per_host_concurrency_limit(self):
+        client = HttpClient(host_limits={self.host: 2}, backoff=0)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda i: client.get(f"{self.base}/slow{i}"), range(16)))
+        self.assertLessEqual(self.server.max_active, 2)
+        self.assertLessEqual(client.stats()[self.host]['connections'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import numpy as np
+import pandas as pd
+from utils import indicators
+from utils.simulator_logic import calculate_macd, calculate_rsi, calculate_bollinger_bands
+
+
+def _loop_ema(values, span):
+    alpha = 2 / (span + 1)
+    out = [values[0]]
+    for v in values[1:]:
+        out.append(alpha * v + (1 - alpha) * out[-1])
+    return np.array(out)
+
+
+class TestIndicators(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.closes = 20 * np.cumprod(1 + rng.normal(0, 0.02, 500))
+
+    def test_ema_matches_loop(self):
+        np.testing.assert_allclose(indicators.ema(self.closes, 12), _loop_ema(self.closes, 12), rtol=1e-12)
+        self.assertEqual(indicators.ema([], 12).size, 0)
+
+    def test_macd_wrapper_keeps_list_contract(self):
+        macd = calculate_macd(self.closes.tolist())
+        self.assertIsInstance(macd['dif'], list)
+        dif = _loop_ema(self.closes, 12) - _loop_ema(self.closes, 26)
+        dea = _loop_ema(dif, 9)
+        np.testing.assert_allclose(macd['dif'], dif, rtol=1e-10, atol=1e-12)
+        np.testing.assert_allclose(macd['hist'], (dif - dea) * 2, rtol=1e-9, atol=1e-12)
+        self.assertEqual(calculate_macd([]), {'dif': [], 'dea': [], 'hist': []})
+
+    def test_rsi_matches_pandas(self):
+        prices = pd.Series(self.closes)
+        delta = prices.diff()
+        ma_up = delta.clip(lower=0).ewm(com=13, adjust=False).mean()
+        ma_down = (-delta.clip(upper=0)).ewm(com=13, adjust=False).mean()
+        expected = (100 - 100 / (1 + ma_up / ma_down)).fillna(50.0)
+        np.testing.assert_allclose(calculate_rsi(self.closes), expected.values, rtol=1e-10)
+        self.assertEqual(calculate_rsi([1, 2, 3]), [50.0, 50.0, 50.0])
+
+    def test_bollinger_matches_pandas(self):
+        prices = pd.Series(self.closes)
+        boll = calculate_bollinger_bands(self.closes)
+        middle = prices.rolling(20).mean()
+        upper = middle + prices.rolling(20).std() * 2
+        np.testing.assert_allclose(boll['middle'], middle.fillna(0).values, rtol=1e-10)
+        np.testing.assert_allclose(boll['upper'], upper.fillna(0).values, rtol=1e-10)
+
+    def test_tdx_sma_and_hhv_llv(self):
+        values = self.closes[:50]
+        expected, prev = [], values[0]
+        for v in values:
+            prev = (1 * v + 2 * prev) / 3
+            expected.append(prev)
+        np.testing.assert_allclose(indicators.tdx_sma(values, 3, 1), expected, rtol=1e-12)
+        series = pd.Series(values)
+        np.testing.assert_array_equal(indicators.hhv(values, 9), series.rolling(9, min_periods=1).max().values)
+        np.testing.assert_array_equal(indicators.llv(values, 9), series.rolling(9, min_periods=1).min().values)
+
+
+if __name__ == '__main__':
+    unittest.main()
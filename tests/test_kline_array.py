@@ -0,0 +1,63 @@
+import random
+import unittest
+import numpy as np
+import pandas as pd
+from utils.kline_array import KLineArray
+from utils.simulator_logic import (
+    generate_simulation_data, process_baohan, find_bi, calculate_bi_and_centers,
+    calculate_bi_and_zhongshu_shapes, analyze_action,
+)
+
+
+class TestKLineArray(unittest.TestCase):
+    def setUp(self):
+        random.seed(3)
+        np.random.seed(3)
+        self.data, self.macd = generate_simulation_data(initial_price=20, length=400)
+        self.karr = KLineArray.from_records(self.data)
+
+    def test_slices_are_views(self):
+        view = self.karr[100:200]
+        self.assertEqual(len(view), 100)
+        self.assertTrue(np.shares_memory(view.close, self.karr.close))
+        self.assertEqual(view[0]['time'], 100)
+        self.assertEqual(view[-1]['close'], self.data[199]['close'])
+
+    def test_chanlun_functions_match_dict_version(self):
+        merged = process_baohan(self.karr)
+        processed = process_baohan(self.data)
+        self.assertEqual(len(merged), len(processed))
+        for rec, ref in zip(merged, processed):
+            for key in ('high', 'low', 'high_date', 'low_date'):
+                self.assertEqual(rec[key], ref[key])
+        self.assertEqual(find_bi(merged), find_bi(processed))
+        self.assertEqual(calculate_bi_and_centers(merged), calculate_bi_and_centers(processed))
+        self.assertEqual(calculate_bi_and_centers(self.karr), calculate_bi_and_centers(self.data))
+        self.assertEqual(calculate_bi_and_zhongshu_shapes(self.karr), calculate_bi_and_zhongshu_shapes(self.data))
+
+    def test_dataframe_dates_round_trip(self):
+        df = pd.DataFrame(self.data).drop(columns=['time'])
+        df['date'] = pd.date_range('2024-01-01', periods=len(df), freq='D').strftime('%Y-%m-%d')
+        karr = KLineArray.from_dataframe(df)
+        self.assertEqual(karr.time_kind, 'date')
+        self.assertEqual(find_bi(process_baohan(karr)), find_bi(process_baohan(df.to_dict('records'))))
+
+        indexed = df.drop(columns=['date']).set_index(pd.DatetimeIndex(pd.to_datetime(df['date']), name='date'))
+        karr = KLineArray.from_dataframe(indexed)
+        records = indexed.reset_index().to_dict('records')
+        self.assertEqual(karr.time_kind, 'datetime')
+        self.assertEqual(find_bi(process_baohan(karr)), find_bi(process_baohan(records)))
+        self.assertEqual(calculate_bi_and_centers(process_baohan(karr)),
+                         calculate_bi_and_centers(process_baohan(records)))
+
+    def test_analyze_action_accepts_array(self):
+        for idx in (60, 150, 399):
+            macd = {k: v[:idx + 1] for k, v in self.macd.items()}
+            self.assertEqual(
+                analyze_action('buy', self.karr[:idx + 1], macd, idx),
+                analyze_action('buy', self.data[:idx + 1], macd, idx),
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from utils import money_flow
+from utils.kline_store import KLineStore, merge_tail
+
+
+def _frame(start, n, close_shift=0.0):
+    index = pd.bdate_range(start, periods=n, name='date').astype('datetime64[ns]')
+    close = np.arange(n, dtype=float) + 10 + close_shift
+    return pd.DataFrame({'open': close, 'high': close + 1, 'low': close - 1, 'close': close,
+                         'volume': 100.0, 'amount': close * 100}, index=index)
+
+
+def _raw(df):
+    # 模拟下载接口返回的中文列格式
+    out = df.reset_index().rename(columns={'date': '日期', 'open': '开盘', 'high': '最高', 'low': '最低',
+                                           'close': '收盘', 'volume': '成交量', 'amount': '成交额'})
+    out['日期'] = out['日期'].dt.strftime('%Y-%m-%d')
+    return out
+
+
+class TestKLineStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_roundtrip_tail_and_reopen(self):
+        store = KLineStore(self.tmp.name)
+        df = _frame('2024-01-01', 50)
+        store.save('600000', 'day', df)
+        pd.testing.assert_frame_equal(store.load('600000', 'day'), df, check_freq=False)
+        pd.testing.assert_frame_equal(store.load('600000', 'day', tail=3), df.iloc[-3:], check_freq=False)
+        self.assertEqual([f for f in os.listdir(self.tmp.name) if f.endswith('.tmp')], [])
+
+        reopened = KLineStore(self.tmp.name)  # 模拟重启
+        self.assertEqual(reopened.info('600000', 'day')['rows'], 50)
+        self.assertTrue(reopened.load('000001', 'day').empty)
+
+    def test_merge_tail(self):
+        stored = _frame('2024-01-01', 20)
+        fresh = _frame('2024-01-01', 25).iloc[-8:]
+        fresh.iloc[2, fresh.columns.get_loc('close')] += 0.5  # 已存储的最后一根是盘中数据，允许被修正
+        merged = merge_tail(stored, fresh)
+        self.assertEqual(len(merged), 25)
+        self.assertEqual(merged['close'].iloc[19], fresh['close'].iloc[2])
+
+        self.assertIsNone(merge_tail(stored, _frame('2024-03-01', 5)))  # 接不上
+        self.assertIsNone(merge_tail(stored, _frame('2024-01-01', 25, close_shift=1).iloc[-8:]))  # 复权变化
+
+    def test_eviction(self):
+        store = KLineStore(self.tmp.name, max_entries=2, max_idle_days=1)
+        store.save('a', 'day', _frame('2024-01-01', 5))
+        store.save('b', 'day', _frame('2024-01-01', 5))
+        store.load('a', 'day')  # a 最近访问过，超出数量时先淘汰 b
+        store._index()[store.key('a', 'day')]['last_access'] += 1
+        store.save('c', 'day', _frame('2024-01-01', 5))
+        self.assertIsNone(store.info('b', 'day'))
+        self.assertFalse(os.path.exists(store.path('b', 'day')))
+        self.assertEqual(sorted(store.evict(now=time.time() + 2 * 86400)), [store.key('a', 'day'), store.key('c', 'day')])
+
+    def test_money_flow_fetches_only_tail(self):
+        store = KLineStore(self.tmp.name)
+        full = _frame('2024-01-01', 300)
+        store.save('600000', '60m', full.iloc[:295])
+        calls = []
+
+        def fetch(code, period, start, end, limit=1000):
+            calls.append(limit)
+            return _raw(full.iloc[-limit:])
+
+        with mock.patch.object(money_flow, '_kline_store', store), \
+                mock.patch.object(money_flow, '_fetch_kline_hist', side_effect=fetch), \
+                mock.patch.object(money_flow, '_kline_tail_limit', return_value=10):
+            mf = money_flow.MoneyFlow()
+            df = mf._get_stored_kline('600000', '60m', force_update=True)
+            self.assertEqual(calls, [10])
+            self.assertEqual(len(df), 300)
+            self.assertEqual(store.info('600000', '60m')['rows'], 300)
+            mf._get_stored_kline('600000', '60m')  # TTL 内不再下载
+            self.assertEqual(calls, [10])
+
+    def test_retention_trims_and_drops_seeds(self):
+        store = KLineStore(self.tmp.name)
+        full = _frame('2024-01-01', 300)
+        store.save('600000', '5m', full.iloc[:295])
+        store.save('600000', '60m', _frame('2023-06-01', 50))
+
+        with mock.patch.object(money_flow, '_kline_store', store), \
+                mock.patch.object(money_flow, '_fetch_kline_hist', return_value=_raw(full.iloc[-10:])), \
+                mock.patch.object(money_flow, '_kline_tail_limit', return_value=10), \
+                mock.patch.dict(money_flow._KLINE_RETENTION, {'5m': 200}):
+            df = money_flow.MoneyFlow()._get_stored_kline('600000', '5m', force_update=True)
+        self.assertEqual(len(df), 200)
+        self.assertEqual(df.index[-1], full.index[-1])
+        self.assertEqual(store.info('600000', '5m')['rows'], 200)
+        self.assertIsNone(store.info('600000', '60m'))  # 截断后与种子之间有缺口，种子作废
+
+    def test_periods_derived_from_5m_base(self):
+        store = KLineStore(self.tmp.name)
+        days = pd.bdate_range('2024-03-04', periods=10)
+        stamps = [d + pd.Timedelta(hours=9, minutes=30) + pd.Timedelta(minutes=m)
+                  for d in days for m in list(range(5, 121, 5)) + list(range(215, 331, 5))]
+        close = np.arange(len(stamps), dtype=float) + 10
+        base = pd.DataFrame({'open': close, 'high': close + 1, 'low': close - 1, 'close': close,
+                             'volume': 100.0, 'amount': close * 100}, index=pd.DatetimeIndex(stamps, name='date'))
+        # 种子: 更早的 60 分钟历史
+        seed = _frame('2023-06-01', 100)
+        seed.index = seed.index + pd.Timedelta(hours=10, minutes=30)
+        store.save('600000', '5m', base)
+        store.save('600000', '60m', seed)
+
+        calls = []
+
+        def fetch(code, period, start, end, limit=1000):
+            calls.append(period)
+            return None
+
+        with mock.patch.object(money_flow, '_kline_store', store), \
+                mock.patch.object(money_flow, '_fetch_kline_hist', side_effect=fetch), \
+                mock.patch.dict(money_flow._KLINE_STORE_TTL, {'5m': 3600}):
+            mf = money_flow.MoneyFlow()
+            h60 = mf.get_kline_data('600000', '60m')
+            self.assertEqual(len(h60), 100 + 40)
+            self.assertEqual(h60.index[-1], pd.Timestamp('2024-03-15 15:00'))
+            self.assertEqual(h60.index[100], pd.Timestamp('2024-03-04 10:30'))
+            h120 = mf.get_kline_data('600000', '120m')
+            self.assertEqual([t.strftime('%H:%M') for t in h120.index[-2:]], ['11:30', '15:00'])
+            self.assertEqual(calls, [])  # 切换周期不走网络
+            self.assertEqual(len(mf.get_kline_data('600000', '15m')), 160)
+            self.assertEqual(calls, ['15m'])  # 不足 _KLINE_DERIVED_MIN_BARS 时尝试下载一次种子
+            self.assertIs(mf.get_kline_data('600000', '60m'), h60)  # 基础序列未变，直接用缓存
+
+
+if __name__ == '__main__':
+    unittest.main()
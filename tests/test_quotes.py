@@ -0,0 +1,68 @@
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from utils import quotes
+
+
+def _tencent_line(code, name, price):
+    f = [''] * 80
+    f[0], f[1], f[2], f[3], f[4], f[5], f[6] = '1', name, code, str(price), '10.00', '10.10', '1000'
+    f[30], f[33], f[34], f[37], f[72] = '20240315150003', '10.50', '9.90', '12.5', '2000000'
+    return f'v_{quotes.market_symbol(code)}="{"~".join(f)}";\n'
+
+
+def _sina_line(code, name, price):
+    f = [name, '10.10', '10.00', str(price), '10.50', '9.90', '0', '0', '100000', '1250000'] + ['0'] * 20
+    f += ['2024-03-15', '15:00:03', '00']
+    return f'var hq_str_{quotes.market_symbol(code)}="{",".join(f)}";\n'
+
+
+class _Resp:
+    def __init__(self, text):
+        self.text = text
+        self.encoding = None
+
+
+class TestQuotes(unittest.TestCase):
+    def setUp(self):
+        quotes.clear_cache()
+        self.addCleanup(quotes.clear_cache)
+
+    def test_parsers(self):
+        q = quotes._parse_tencent(_tencent_line('600000', '浦发银行', 10.2))['600000']
+        self.assertEqual((q['name'], q['price'], q['high'], q['low']), ('浦发银行', 10.2, 10.5, 9.9))
+        self.assertEqual((q['volume'], q['amount'], q['float_shares']), (100000, 125000, 2000000))
+        self.assertEqual(q['date'], pd.Timestamp('2024-03-15'))
+
+        s = quotes._parse_sina(_sina_line('000001', '平安银行', 10.2) + 'var hq_str_sz000002="";\n')
+        self.assertEqual(list(s), ['000001'])
+        self.assertEqual((s['000001']['open'], s['000001']['volume']), (10.1, 100000))
+        self.assertEqual(quotes.market_symbol('830799'), 'bj830799')
+
+    def test_batch_fallback_and_ttl(self):
+        codes = [f"{600000 + i}" for i in range(100)]
+        urls = []
+
+        def fake_get(url, headers=None, timeout=None):
+            urls.append(url)
+            symbols = url.split('=', 1)[1].split(',')
+            if url.startswith(quotes.TENCENT_URL):
+                # 腾讯缺最后一只，由新浪补齐
+                return _Resp(''.join(_tencent_line(s[2:], 'T', 10) for s in symbols if s != 'sh600099'))
+            return _Resp(''.join(_sina_line(s[2:], 'S', 11) for s in symbols))
+
+        with mock.patch.object(quotes.http_client, 'get', side_effect=fake_get):
+            result = quotes.get_quotes(codes)
+            self.assertEqual(list(result), codes)
+            self.assertEqual(result['600099']['price'], 11)
+            self.assertEqual(len(urls), 3)  # 腾讯 2 批 + 新浪 1 批
+            self.assertEqual(quotes.get_quote('600001')['name'], 'T')
+            self.assertEqual(len(urls), 3)  # TTL 内走缓存
+            quotes.get_quotes(['600001'], ttl=0)
+            self.assertEqual(len(urls), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import random
+import unittest
+import numpy as np
+import pandas as pd
+from utils.resample import resample_frame, resample_session
+from utils.kline_array import KLineArray
+from utils.simulator_logic import generate_simulation_data, resample_klines, day_to_bar_map, _locate_bar
+
+AGG = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum', 'amount': 'sum'}
+
+
+def _ohlc_frame(index, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 20 * np.cumprod(1 + rng.normal(0, 0.01, len(index)))
+    return pd.DataFrame({
+        'open': close * (1 + rng.normal(0, 0.003, len(index))),
+        'high': close * 1.01,
+        'low': close * 0.99,
+        'close': close,
+        'volume': rng.integers(100, 1000, len(index)).astype(float),
+        'amount': rng.random(len(index)) * 1e6,
+    }, index=pd.DatetimeIndex(index, name='date'))
+
+
+class TestResample(unittest.TestCase):
+    def test_weekly_matches_pandas(self):
+        df = _ohlc_frame(pd.bdate_range('2023-01-02', periods=300))
+        df = df.drop(df.index[[5, 6, 7, 8, 9, 40]])  # 整周停牌与单日缺失
+        df.iloc[12, df.columns.get_loc('high')] = np.nan
+        expected = df.resample('W-FRI').agg(AGG).dropna(subset=['open', 'high', 'low', 'close'])
+        pd.testing.assert_frame_equal(resample_frame(df, 'W-FRI'), expected, check_freq=False)
+
+    def test_120m_matches_pandas(self):
+        days = pd.bdate_range('2024-03-01', periods=5)
+        stamps = [d + pd.Timedelta(hours=9, minutes=30) + pd.Timedelta(minutes=m)
+                  for d in days for m in list(range(1, 121)) + list(range(211, 331))]
+        df = _ohlc_frame(stamps, seed=1)
+        expected = df.resample('120min', label='right', closed='right').agg(AGG).dropna(subset=['open', 'close', 'high', 'low'])
+        pd.testing.assert_frame_equal(resample_frame(df, '120min'), expected, check_freq=False)
+
+    def test_session_resample_skips_lunch_break(self):
+        days = pd.bdate_range('2024-03-04', periods=3)
+        stamps = [d + pd.Timedelta(hours=9, minutes=30) + pd.Timedelta(minutes=m)
+                  for d in days for m in list(range(5, 121, 5)) + list(range(215, 331, 5))]
+        df = _ohlc_frame(stamps, seed=4)
+        h60 = resample_session(df, 60)
+        self.assertEqual([t.strftime('%H:%M') for t in h60.index[:4]], ['10:30', '11:30', '14:00', '15:00'])
+        self.assertEqual(len(h60), 12)
+        h120 = resample_session(df, 120)
+        self.assertEqual([t.strftime('%H:%M') for t in h120.index[:2]], ['11:30', '15:00'])
+        afternoon = df.loc['2024-03-04 13:05':'2024-03-04 15:00']
+        self.assertEqual(h120.iloc[1]['open'], afternoon['open'].iloc[0])
+        self.assertEqual(h120.iloc[1]['high'], afternoon['high'].max())
+        self.assertEqual(h120.iloc[1]['volume'], afternoon['volume'].sum())
+        # 已对齐的 60 分钟K线再合成 60 分钟不变，合成 120 分钟与由 5 分钟直接合成一致
+        pd.testing.assert_frame_equal(resample_session(h60, 60), h60)
+        pd.testing.assert_frame_equal(resample_session(h60, 120), h120)
+        # 集合竞价 (9:25) 并入第一根
+        auction = pd.concat([_ohlc_frame([days[0] + pd.Timedelta(hours=9, minutes=25)], seed=5), df])
+        self.assertEqual(len(resample_session(auction, 30)), len(resample_session(df, 30)))
+
+    def test_fixed_period_and_day_map(self):
+        random.seed(2)
+        np.random.seed(2)
+        data, _ = generate_simulation_data(initial_price=20, length=203)
+        for source in (data, KLineArray.from_records(data)):
+            week, macd = resample_klines(source, 5)
+            self.assertEqual(len(week), 41)
+            self.assertEqual(len(macd['dif']), 41)
+            last = data[200:]
+            self.assertEqual(week[-1], {
+                'time': 40, 'open': last[0]['open'], 'high': max(k['high'] for k in last),
+                'low': min(k['low'] for k in last), 'close': last[-1]['close'],
+                'start_day_idx': 200, 'end_day_idx': 202,
+            })
+        bar_map = day_to_bar_map(week)
+        for day in range(len(data)):
+            self.assertEqual(_locate_bar(week, bar_map, day), _locate_bar(week, None, day))
+        self.assertEqual(_locate_bar(week, bar_map, len(data)), -1)
+
+    def test_calendar_month_for_dated_series(self):
+        df = _ohlc_frame(pd.bdate_range('2024-01-01', periods=90), seed=3)
+        records = df.reset_index().assign(date=lambda d: d['date'].dt.strftime('%Y-%m-%d')).to_dict('records')
+        months, _ = resample_klines(records, 'M')
+        self.assertEqual([m['date'] for m in months], ['2024-01-31', '2024-02-29', '2024-03-31', '2024-04-30', '2024-05-31'])
+        self.assertEqual(months[1]['high'], df.loc['2024-02', 'high'].max())
+        self.assertEqual(months[1]['start_day_idx'], 23)
+        with self.assertRaises(ValueError):
+            resample_klines([{'time': 0, 'open': 1, 'high': 1, 'low': 1, 'close': 1}], 'W')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils.money_flow import retail_scores, retail_count_index, sector_retail_crowding
+
+
+class TestRetailCount(unittest.TestCase):
+    def test_matches_iterative_formula(self):
+        rng = np.random.default_rng(1)
+        small = rng.normal(0, 5e6, 120)
+        price = rng.uniform(0.05, 20, 120)
+        scores = retail_scores(small, price, 2e8)
+        counts = retail_count_index(scores, 40000.0)
+
+        n = 40000.0
+        for i in range(120):
+            p = max(price[i], 0.1)
+            score = ((small[i] / p) / 10000.0) / (2e8 / 10000.0) * 10000
+            n = n + n * score / 10000.0
+            self.assertAlmostEqual(scores[i], score)
+            self.assertAlmostEqual(counts[i], n, places=6)
+
+    def test_sector_panel(self):
+        dates = pd.bdate_range('2024-01-01', periods=50)
+        rng = np.random.default_rng(2)
+        small = pd.DataFrame(rng.normal(0, 5e6, (50, 3)), index=dates, columns=['a', 'b', 'c'])
+        price = pd.DataFrame(rng.uniform(5, 20, (50, 3)), index=dates, columns=['a', 'b', 'c'])
+        small.iloc[10, 2] = np.nan
+        shares = pd.Series({'a': 1e8, 'b': 3e8, 'c': 2e8})
+        out = sector_retail_crowding(small, price, shares, n0=pd.Series({'a': 1e4, 'b': 2e4}))
+
+        single = retail_count_index(retail_scores(small['a'].values, price['a'].values, 1e8), 1e4)
+        np.testing.assert_allclose(out['counts']['a'].values, single)
+        self.assertEqual(out['aggregate']['coverage'].iloc[10], 2)
+        self.assertEqual(out['counts']['c'].iloc[10], out['counts']['c'].iloc[9])  # 缺数据当日数量不变
+
+        row = out['scores'].iloc[0]
+        self.assertAlmostEqual(out['aggregate']['retail_score'].iloc[0], float((row * shares).sum() / shares.sum()))
+        total0 = out['counts'].iloc[0].sum() / 8e4 * 100
+        self.assertAlmostEqual(out['aggregate']['retail_count_index'].iloc[0], total0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from utils import screener as sc
+from utils.kline_store import KLineStore
+from utils.money_flow import MoneyFlow
+from utils.simulator_logic import generate_simulation_paths
+
+
+class _Master:
+    def __init__(self, codes):
+        self._codes = codes
+
+    def codes(self):
+        return list(self._codes)
+
+    def get(self, code):
+        return {'code': code, 'name': f'股票{code}'}
+
+
+def _frames(n, length, seed=0):
+    paths = generate_simulation_paths(n, length, initial_price=20, seed=seed)
+    index = pd.bdate_range('2023-01-02', periods=length, name='date')
+    rng = np.random.default_rng(seed)
+    return [pd.DataFrame({'open': paths['open'][i], 'high': paths['high'][i], 'low': paths['low'][i],
+                          'close': paths['close'][i], 'volume': rng.uniform(1e5, 1e6, length),
+                          'amount': 0.0}, index=index) for i in range(n)]
+
+
+class TestScreener(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = KLineStore(self.tmp.name)
+        self.frames = dict(zip(['600000', '600001', '600002', '600003'], _frames(4, 300)))
+        self.frames['688999'] = _frames(1, 120, seed=1)[0]  # 次新股，K线数不同，单独成组
+        self.frames['830000'] = _frames(1, 30, seed=2)[0]  # 不足 MIN_BARS，跳过
+        with self.store.batch():
+            for code, df in self.frames.items():
+                self.store.save(code, 'day', df)
+
+    def test_matches_single_stock_assistant(self):
+        screener = sc.MarketScreener(self.store, _Master(list(self.frames)), workers=1)
+        result = screener.run()
+        self.assertEqual(sorted(result.index), ['600000', '600001', '600002', '600003', '688999'])
+        self.assertEqual(screener.timings['stocks'], 5)
+        self.assertEqual(result.loc['600000', 'name'], '股票600000')
+
+        mf = MoneyFlow()
+        for code in result.index:
+            out = mf.build_buy_sell_assistant(self.frames[code].tail(sc.PANEL_BARS))
+            kline, analysis, row = out['kline'], out['analysis'], result.loc[code]
+            self.assertEqual(row['bars'], len(kline))
+            self.assertEqual(bool(row['buy_signal']), bool(kline['buy_signal'].iloc[-1]))
+            self.assertEqual(bool(row['golden_cross']), bool(kline['golden_cross'].iloc[-1]))
+            self.assertAlmostEqual(row['wave_pct'], kline['wave_pct'].iloc[-1], places=9)
+            self.assertAlmostEqual(row['dif'], kline['dif'].iloc[-1], places=9)
+            self.assertEqual(row['macd'], analysis['macd'])
+            self.assertEqual(row['ma_alignment'], analysis['ma_alignment'])
+            self.assertEqual(row['mid_term'], analysis['mid_term'])
+            self.assertEqual(f"笔{row['bi_count']} / 中枢{row['center_count']}", analysis['structure'].split(' · ')[0])
+            if row['bi_count']:
+                self.assertEqual(str(row['last_point_date']), analysis['bi_points'][-1]['date'])
+            buys = np.flatnonzero(kline['buy_signal'].values)
+            if len(buys):
+                self.assertEqual(row['bars_since_buy'], len(kline) - 1 - buys[-1])
+            else:
+                self.assertTrue(np.isnan(row['bars_since_buy']))
+
+    def test_process_pool_and_screen(self):
+        serial = sc.MarketScreener(self.store, _Master(list(self.frames)), workers=1).run()
+        with mock.patch.object(sc, 'STROKE_CHUNK', 2):
+            pooled = sc.MarketScreener(self.store, _Master(list(self.frames)), workers=2).run()
+        pd.testing.assert_frame_equal(serial, pooled)
+
+        picked = sc.screen(serial, {'bi_count': lambda s: s > 0, 'macd': ['金叉', '死叉']},
+                           sort_by='pct_chg', ascending=False, limit=3)
+        self.assertEqual(len(picked), 3)
+        self.assertTrue(picked['pct_chg'].is_monotonic_decreasing)
+        self.assertTrue(sc.screen(serial, {'buy_signal': True})['buy_signal'].all())
+
+
+if __name__ == '__main__':
+    unittest.main()
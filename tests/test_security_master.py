@@ -0,0 +1,70 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from utils import security_master as sm
+
+ROWS = [
+    ('600519', '贵州茅台', 'sh'),
+    ('000001', '平安银行', 'sz'),
+    ('601318', '中国平安', 'sh'),
+    ('600036', '招商银行', 'sh'),
+    ('600221', '*ST海航', 'sh'),
+    ('430047', '诺思兰德', 'bj'),
+    ('000625', '长安汽车', 'sz'),
+]
+
+
+class TestSecurityMaster(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'security_master.json')
+        self.master = sm.SecurityMaster(path=self.path, fetch=lambda: list(ROWS))
+        self.assertTrue(self.master.refresh())
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_pinyin_initials(self):
+        self.assertEqual(sm.pinyin_initials('贵州茅台'), 'GZMT')
+        self.assertEqual(sm.pinyin_initials('平安银行'), 'PAYH')
+        self.assertEqual(sm.pinyin_initials('*ST海航'), 'STHH')
+
+    def test_search(self):
+        codes = lambda rows: [r['code'] for r in rows]
+        self.assertEqual(codes(self.master.search('6005')), ['600519'])
+        self.assertEqual(codes(self.master.search('60')), ['600036', '600221', '600519', '601318'])
+        self.assertEqual(codes(self.master.search('gzmt')), ['600519'])
+        self.assertEqual(codes(self.master.search('ZS')), ['600036'])
+        self.assertEqual(codes(self.master.search('平安')), ['000001', '601318'])
+        self.assertEqual(codes(self.master.search('银行', limit=1)), ['000001'])
+        self.assertEqual(self.master.search('不存在'), [])
+        self.assertEqual(self.master.search(''), [])
+
+    def test_get_market_and_persistence(self):
+        self.assertEqual(self.master.get('1')['name'], '平安银行')
+        self.assertEqual(self.master.market('430047'), 'bj')
+        self.assertIsNone(self.master.market('999999'))
+
+        with open(self.path, encoding='utf-8') as f:
+            content = json.load(f)
+        self.assertEqual(content['_meta']['count'], len(ROWS))
+
+        # 新实例从文件懒加载，当天的数据不再触发刷新
+        calls = []
+        loaded = sm.SecurityMaster(path=self.path, fetch=lambda: calls.append(1) or [])
+        self.assertEqual(loaded.get('600519')['initials'], 'GZMT')
+        self.assertEqual(len(loaded), len(ROWS))
+        time.sleep(0.05)
+        self.assertEqual(calls, [])
+
+    def test_failed_refresh_keeps_data(self):
+        self.master.fetch = lambda: []
+        self.assertFalse(self.master.refresh())
+        self.assertEqual(len(self.master), len(ROWS))
+
+
+if __name__ == '__main__':
+    unittest.main()
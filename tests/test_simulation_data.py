@@ -0,0 +1,37 @@
+import unittest
+import numpy as np
+from utils.simulator_logic import generate_simulation_data, generate_simulation_paths
+
+
+class TestSimulationData(unittest.TestCase):
+    def test_seed_replays_same_game(self):
+        data, macd = generate_simulation_data(initial_price=20, length=400, seed=42)
+        again, macd_again = generate_simulation_data(initial_price=20, length=400, seed=42)
+        self.assertEqual(data, again)
+        self.assertEqual(macd, macd_again)
+        self.assertNotEqual(data, generate_simulation_data(initial_price=20, length=400, seed=43)[0])
+        self.assertEqual([k['time'] for k in data], list(range(400)))
+        self.assertEqual(len(macd['hist']), 400)
+
+    def test_batch_paths_respect_limits(self):
+        paths = generate_simulation_paths(50, 1500, initial_price=900, seed=7)
+        o, h, l, c = (paths[k] for k in ('open', 'high', 'low', 'close'))
+        self.assertEqual(c.shape, (50, 1500))
+        self.assertTrue(np.all(h >= np.maximum(o, c)))
+        self.assertTrue(np.all(l <= np.minimum(o, c)))
+        self.assertTrue(np.all((l >= 1.0) & (h <= 1000.0)))
+        prev = np.concatenate([np.full((50, 1), 900.0), c[:, :-1]], axis=1)
+        # 涨跌停 10% (价格已四舍五入到分，留出 1 分钱误差)
+        self.assertTrue(np.all(h <= prev * 1.1 + 0.01))
+        self.assertTrue(np.all(l >= prev * 0.9 - 0.01))
+        self.assertGreater(len({row.tobytes() for row in c}), 1)
+
+    def test_global_seed_without_seed_argument(self):
+        np.random.seed(5)
+        first = generate_simulation_paths(3, 50)
+        np.random.seed(5)
+        np.testing.assert_array_equal(generate_simulation_paths(3, 50)['close'], first['close'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pandas as pd
+
+from utils import single_flight as sf
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_threads_coalesce_and_cache(self):
+        calls = []
+        gate = threading.Event()
+
+        @sf.single_flight(maxsize=2)
+        def fetch(code, period='day'):
+            calls.append((code, period))
+            gate.wait(2)
+            return pd.DataFrame({'close': [1.0]})
+
+        with ThreadPoolExecutor(10) as pool:
+            futures = [pool.submit(fetch, '600519') for _ in range(10)]
+            time.sleep(0.1)
+            gate.set()
+            results = [f.result() for f in futures]
+        self.assertEqual(calls, [('600519', 'day')])
+        self.assertTrue(all(r is results[0] for r in results))
+        stats = fetch.stats()
+        self.assertEqual((stats['executions'], stats['coalesced']), (1, 9))
+
+        self.assertIs(fetch('600519'), results[0])  # 成功结果缓存
+        fetch('600519', period='week')
+        fetch('000001')
+        self.assertEqual(len(calls), 3)
+        fetch('600519')  # 超出 maxsize 已被淘汰
+        self.assertEqual(len(calls), 4)
+        self.assertIn(f'{__name__}.TestSingleFlight.test_threads_coalesce_and_cache.<locals>.fetch', sf.stats())
+
+    def test_failures_cached_briefly(self):
+        calls = []
+
+        @sf.single_flight(error_ttl=30)
+        def fetch(code):
+            calls.append(code)
+            if code == 'bad':
+                raise ValueError('blocked')
+            return None
+
+        now = [100.0]
+        with mock.patch.object(sf.time, 'monotonic', side_effect=lambda: now[0]):
+            self.assertIsNone(fetch('empty'))
+            self.assertIsNone(fetch('empty'))
+            for _ in range(2):
+                with self.assertRaises(ValueError):
+                    fetch('bad')
+            self.assertEqual(calls, ['empty', 'bad'])
+            self.assertEqual(fetch.stats()['failure_hits'], 2)
+            now[0] += 31
+            fetch('empty')
+            self.assertEqual(calls, ['empty', 'bad', 'empty'])
+            fetch.cache_clear()
+            fetch('empty')
+            self.assertEqual(len(calls), 4)
+
+    def test_success_ttl(self):
+        calls = []
+
+        @sf.single_flight(ttl=120)
+        def fetch(code):
+            calls.append(code)
+            return {'n': len(calls)}
+
+        now = [100.0]
+        with mock.patch.object(sf.time, 'monotonic', side_effect=lambda: now[0]), \
+                mock.patch.object(sf.time, 'time', side_effect=lambda: now[0] + 1e9):
+            self.assertIsNone(fetch.fetched_at('600519'))
+            fetch('600519')
+            now[0] += 60
+            self.assertEqual(fetch('600519'), {'n': 1})
+            self.assertEqual(fetch.fetched_at('600519'), 100.0 + 1e9)  # 实际抓取时间，不是命中时间
+            now[0] += 60
+            self.assertEqual(fetch('600519'), {'n': 2})
+            self.assertEqual(fetch.fetched_at('600519'), 220.0 + 1e9)
+
+    def test_asyncio_and_threads_share_flight(self):
+        calls = []
+
+        @sf.single_flight(maxsize=0)
+        def fetch(code):
+            calls.append(code)
+            time.sleep(0.2)
+            return {'code': code}
+
+        async def main():
+            loop = asyncio.get_running_loop()
+            thread_call = loop.run_in_executor(None, fetch, '600519')
+            await asyncio.sleep(0.05)
+            return await asyncio.gather(thread_call, *[fetch.acall('600519') for _ in range(5)])
+
+        results = asyncio.run(main())
+        self.assertEqual(calls, ['600519'])
+        self.assertEqual(results, [{'code': '600519'}] * 6)
+        self.assertEqual(fetch.stats()['coalesced'], 5)
+        fetch('600519')  # maxsize=0 不缓存结果
+        self.assertEqual(len(calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+import numpy as np
+from utils.kline_array import KLineArray
+from utils.simulator_logic import generate_simulation_data, analyze_action
+from utils.strategy_eval import (
+    signal_features, action_scores, backtest, evaluate_series, run_generated, run_cached, BUY, SELL,
+)
+
+
+class TestStrategyEval(unittest.TestCase):
+    def test_scores_match_analyze_action(self):
+        data, macd = generate_simulation_data(initial_price=20, length=300, seed=11)
+        klines = KLineArray.from_records(data)
+        features = signal_features(klines, macd)
+        for action in ('buy', 'sell', 'hold'):
+            scores = action_scores(features, action)
+            for i in range(len(data)):
+                sub_macd = {k: v[:i + 1] for k, v in macd.items()}
+                _, score, _ = analyze_action(action, data[:i + 1], sub_macd, i)
+                self.assertEqual(scores[i], score, (action, i))
+
+    def test_backtest_positions_and_hits(self):
+        close = np.array([10, 11, 12, 11, 10, 12, 13], dtype=float)
+        signals = np.array([BUY, 0, SELL, 0, BUY, 0, 0], dtype=np.int8)
+        result = backtest(close, signals, horizon=1)
+        self.assertEqual(result['trades'], 2)
+        self.assertEqual((result['signals'], result['hits']), (3, 3))
+        self.assertAlmostEqual(result['pnl'], (12 / 10) * (13 / 10) - 1)
+        self.assertAlmostEqual(result['max_drawdown'], 0.0)
+        held = backtest(close, np.array([BUY, 0, 0, 0, 0, 0, 0], dtype=np.int8), horizon=1)
+        self.assertAlmostEqual(held['max_drawdown'], 1 - 10 / 12)
+
+    def test_generated_and_cached_runs(self):
+        report = run_generated(n_series=6, length=400, seed=3, workers=1, chunk_size=4)
+        self.assertEqual(report['series'], 6)
+        self.assertEqual(report['bars'], 2400)
+        self.assertGreater(report['signals'], 0)
+        self.assertTrue(0 <= report['hit_rate'] <= 1)
+        self.assertGreater(report['bars_per_sec'], 0)
+        self.assertEqual(run_generated(n_series=6, length=400, seed=3, workers=2, chunk_size=4)['pnl'], report['pnl'])
+
+        data, _ = generate_simulation_data(initial_price=20, length=200, seed=1)
+        klines = KLineArray.from_records(data)
+        cached = run_cached({'a': klines, 'short': klines[:10]}, policy='divergence', workers=1)
+        self.assertEqual(cached['series'], 1)
+        self.assertEqual(cached['trades'], evaluate_series(klines, 'divergence')['trades'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils import indicators
+from utils.tdx_formula import FormulaError, compile_formula
+
+
+class TestTdxFormula(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.close = np.round(10 + np.cumsum(rng.normal(0, 0.2, 300)), 2)
+        self.close[100:130] = self.close[100]  # 价格不变的一段
+        self.high = self.close + rng.uniform(0, 0.3, 300)
+        self.low = self.close - rng.uniform(0, 0.3, 300)
+        self.vol = rng.uniform(1e5, 1e6, 300)
+
+    def test_parse_and_shared_nodes(self):
+        f = compile_formula('''
+            {注释} A:=MA(CLOSE,5); // 行尾注释
+            X:MA(C,5)+1, COLORRED;
+            Y:A*2 > 1 && NOT(C<0);
+            C*-1;
+        ''')
+        self.assertEqual([name for name, _ in f.outputs], ['X', 'Y', 'OUT1'])
+        out = f.evaluate({'close': self.close})
+        ma5 = pd.Series(self.close).rolling(5, min_periods=1).mean().values
+        np.testing.assert_allclose(out['X'], ma5 + 1)
+        np.testing.assert_array_equal(out['Y'], np.ones(300))
+        np.testing.assert_allclose(out['OUT1'], -self.close)
+        # MA(CLOSE,5) 与 MA(C,5) 是同一个节点
+        self.assertEqual(sum(1 for op, _ in f.nodes if op == 'MA'), 1)
+        # 前缀 NOT 作用于整个比较，与函数写法 NOT(...) 共用节点
+        g = compile_formula('X:NOT C>10 AND C>0; Y:NOT(C>10) AND C>0; Z:not not C>10;')
+        out = g.evaluate({'close': self.close})
+        np.testing.assert_array_equal(out['X'], (self.close <= 10).astype(float))
+        np.testing.assert_array_equal(out['Y'], out['X'])
+        np.testing.assert_array_equal(out['Z'], (self.close > 10).astype(float))
+        self.assertEqual(sum(1 for op, _ in g.nodes if op == 'NOT'), 2)
+        self.assertIs(compile_formula('X:MA(C,5);'), compile_formula('X:MA(C,5);'))
+
+        for bad in ('X:MA(C);', 'X:FOO(C,1);', 'X:(C+1;', 'X:MA(C,N);'):
+            with self.assertRaises(FormulaError):
+                compile_formula(bad)
+        with self.assertRaises(FormulaError):
+            compile_formula('X:MA(H,5);').evaluate({'close': self.close})
+
+    def test_matches_pandas(self):
+        f = compile_formula('''
+            E:EMA(C,13); S:SMA(C,3,1); HH:HHV(H,9); LL:LLV(L,9); R:REF(C,1);
+            X:CROSS(C,E); D:(C-LL)/(HH-LL)*100; Z:C/0;
+        ''')
+        out = f.evaluate({'close': self.close, 'high': self.high, 'low': self.low})
+        c = pd.Series(self.close)
+        e = c.ewm(span=13, adjust=False).mean()
+        np.testing.assert_allclose(out['E'], e.values)
+        np.testing.assert_allclose(out['S'], indicators.tdx_sma(self.close, 3, 1))
+        np.testing.assert_allclose(out['HH'], pd.Series(self.high).rolling(9, min_periods=1).max().values)
+        np.testing.assert_allclose(out['LL'], pd.Series(self.low).rolling(9, min_periods=1).min().values)
+        np.testing.assert_allclose(out['R'][1:], self.close[:-1])
+        self.assertTrue(np.isnan(out['R'][0]))
+        cross = ((c > e) & (c.shift(1) <= e.shift(1))).values
+        np.testing.assert_array_equal(out['X'].astype(bool), cross)
+        np.testing.assert_array_equal(out['Z'], np.zeros(300))
+        self.assertEqual(out['E'][0], self.close[0])
+
+    def test_panel_matches_single(self):
+        f = compile_formula('M:MA(C,20); Q:EMA(C,13); B:CROSS(C,Q) AND V>MA(V,20)*1.5; K:SMA((C-LLV(L,9))/(HHV(H,9)-LLV(L,9))*100,3,1);')
+        panel = {
+            'close': np.vstack([self.close, self.close[::-1]]),
+            'high': np.vstack([self.high, self.high[::-1]]),
+            'low': np.vstack([self.low, self.low[::-1]]),
+            'vol': np.vstack([self.vol, self.vol[::-1]]),
+        }
+        out = f.evaluate(panel)
+        for row in range(2):
+            single = f.evaluate({k: v[row] for k, v in panel.items()})
+            for name, _ in f.outputs:
+                self.assertEqual(out[name].shape, (2, 300))
+                np.testing.assert_allclose(out[name][row], single[name])
+        # 价格不变时均线严格等于价格
+        np.testing.assert_array_equal(out['M'][0, 120:130], self.close[120:130])
+
+    def test_step_matches_full_evaluation(self):
+        f = compile_formula('''
+            M:MA(C,20); Q:EMA(C,13); K:SMA((C-LLV(L,9))/(HHV(H,9)-LLV(L,9))*100,3,1);
+            U:MA(C,60)>REF(MA(C,60),1); X:CROSS(C,Q); S:SUM(V,5); N:COUNT(C>REF(C,1),10);
+            B:BARSLAST(X); T:STD(C,10); A:HHV(H,0);
+        ''')
+        data = {'close': self.close, 'high': self.high, 'low': self.low, 'vol': self.vol}
+        full = f.evaluate(data)
+        for t in (1, 5, 59, 60, 115, 125, 299):
+            state = f.prime({k: v[:t] for k, v in data.items()})
+            last = f.step(state, {k: v[t] for k, v in data.items()})
+            for name, _ in f.outputs:
+                np.testing.assert_array_equal(last[name], full[name][t], err_msg=f'{name} @ {t}')
+        # 价格不变时 MA60 保持不变，不会因舍入误差出现 "向上"
+        np.testing.assert_array_equal(full['U'][120:130], np.zeros(10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import datetime
+import unittest
+
+from utils import watchlist_scheduler as ws
+
+
+class _Clock:
+    def __init__(self, now, trading=True):
+        self.value = now
+        self.trading = trading
+
+    def now(self):
+        return self.value
+
+    def is_trading(self, now):
+        return self.trading
+
+    def last_close(self, now):
+        return datetime.datetime.combine(now.date(), datetime.time(15, 0))
+
+
+class TestWatchlistScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = _Clock(datetime.datetime(2024, 3, 4, 10, 0))
+        self.calls = []
+
+        def compute(kind):
+            def run(code, period):
+                self.calls.append((kind, code, period))
+                return None if code == 'bad' else {'kind': kind, 'code': code}
+            return run
+
+        self.sched = ws.WatchlistScheduler(
+            {'flow': compute('flow'), 'assistant': compute('assistant')},
+            now=self.clock.now, is_trading=self.clock.is_trading, last_close=self.clock.last_close)
+
+    def drain(self):
+        while True:
+            key = self.sched.next_job()
+            if key is None:
+                return
+            self.sched.run_job(key)
+
+    def test_focus_first_then_cadence(self):
+        self.sched.watch('c1', ['600519', '000001'])
+        self.sched.focus('c1', 'assistant', '000001', '60m')
+        self.assertEqual(self.sched.next_job()[1], '000001')
+        self.drain()
+        self.assertEqual(len(self.calls), 5)
+        self.assertEqual(self.sched.get('assistant', '000001', '60m').value['code'], '000001')
+        self.assertEqual(self.sched.get('flow', '600519').computed_at, self.clock.value)
+
+        # 盘中: 屏幕上的买卖助手 30 秒后刷新，其余自选股还没到期
+        self.clock.value += datetime.timedelta(seconds=40)
+        self.assertEqual(self.sched.next_job(), ('assistant', '000001', '60m'))
+        self.sched.run_job(self.sched.next_job())
+        self.assertIsNone(self.sched.next_job())
+
+        # 收盘后每个结果刷新一次，之后不再请求
+        self.clock.trading = False
+        self.clock.value = datetime.datetime(2024, 3, 4, 15, 30)
+        self.drain()
+        self.assertEqual(len(self.calls), 11)
+        self.assertIsNotNone(self.sched.get('assistant', '600519', 'day'))
+
+        self.sched.forget('c1')
+        self.assertIsNone(self.sched.next_job())
+        self.assertIsNone(self.sched.get('flow', '600519'))
+
+    def test_focus_only_kind_on_screen_and_fetch_time(self):
+        # 上游缓存: 每次拿到的都是 90 秒前下载的数据
+        age = datetime.timedelta(seconds=90)
+        self.sched.compute['flow'] = lambda code, period: ws.Result({'code': code}, self.clock.value - age)
+        self.sched.watch('c1', ['600519'])
+        self.sched.focus('c1', 'flow', '600519', '60m')
+        self.drain()
+        self.assertEqual(self.sched.get('flow', '600519').computed_at, self.clock.value - age)
+        # 数据实际下载于 90 秒前，再过 40 秒资金流到期；屏幕上没有显示的买卖助手不跟着刷新
+        self.clock.value += datetime.timedelta(seconds=40)
+        self.assertEqual(self.sched.next_job(), ('flow', '600519', None))
+        self.sched.run_job(self.sched.next_job())
+        self.assertIsNone(self.sched.next_job())
+
+    def test_failures_back_off(self):
+        self.sched.watch('c1', ['bad'])
+        self.drain()
+        self.assertEqual(len(self.calls), 2)
+        self.assertIsNone(self.sched.get('flow', 'bad'))
+        self.clock.value += datetime.timedelta(seconds=ws.RETRY_AFTER + 1)
+        self.assertIsNotNone(self.sched.next_job())
+
+    def test_request_budget(self):
+        t = [0.0]
+        budget = ws.RequestBudget(per_minute=60, burst=3, clock=lambda: t[0])
+        self.assertEqual(budget.take(3), 0)
+        self.assertAlmostEqual(budget.take(1), 1.0)
+        t[0] += 2
+        self.assertEqual(budget.take(2), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,490 @@
+"""
+增量缠论结构引擎
+
+模拟器每前进一根K线都会重新扫描全部历史来识别分型、笔和中枢。
+ChanlunEngine 把这些结构作为状态保存下来，push(bar) 只处理新增的一根K线：
+
+- 包含处理: 新K线要么并入最后一根合并K线，要么追加一根新的；之前的合并K线不再变化
+- 分型链: 顶底交替 + 间隔>=3 的贪心连接规则，只有最后一个端点可能被更极端的同类分型替换
+- 笔/中枢: 除最后一个端点外的端点已确定，由它们构成的笔和中枢被"冻结"并缓存，
+  查询时只需对尾部 (至多 2 笔) 重新计算
+
+输出与 simulator_logic 中的批量函数逐项一致：
+    merged_bars()                 == process_baohan(bars)
+    bi_points()                   == find_bi(process_baohan(bars))
+    bi_and_centers()              == calculate_bi_and_centers(process_baohan(bars))
+    bi_and_centers(merged=False)  == calculate_bi_and_centers(bars)
+    shapes()                      == calculate_bi_and_zhongshu_shapes(bars)
+
+返回的列表中会复用已冻结部分的 dict，调用方如需修改请先 copy (main.py 中已如此处理)。
+"""
+from abc import ABC, abstractmethod
+
+BI_LINE_STYLE = {'color': 'rgba(70, 70, 70, 0.6)', 'width': 2}
+ZS_FILL_COLOR = 'rgba(255, 165, 0, 0.15)'
+ZS_BORDER_STYLE = {'color': 'rgba(255, 165, 0, 0.6)', 'width': 1.5, 'dash': 'dot'}
+
+
+def detect_fenxing(k1, k2, k3):
+    """
+    判断三根K线中间一根是否为分型 (顶分型优先)，与 identify_fenxing 规则一致
+    """
+    if k2['high'] > k1['high'] and k2['high'] > k3['high']:
+        return 'top'
+    if k2['low'] < k1['low'] and k2['low'] < k3['low']:
+        return 'bottom'
+    return None
+
+
+def merge_baohan(result, curr, direction):
+    """
+    process_baohan 的单步: 把已转换格式的K线 curr 并入 result，返回新的方向
+    """
+    if not result:
+        result.append(curr)
+        return direction
+
+    prev = result[-1]
+    if 'high_date' not in prev: prev['high_date'] = prev['date']
+    if 'low_date' not in prev: prev['low_date'] = prev['date']
+    curr_high_date = curr.get('high_date', curr['date'])
+    curr_low_date = curr.get('low_date', curr['date'])
+
+    is_included = (prev['high'] >= curr['high'] and prev['low'] <= curr['low']) or \
+                  (curr['high'] >= prev['high'] and curr['low'] <= prev['low'])
+
+    if is_included:
+        if direction == 1: # 向上趋势，取高高，低高
+            if curr['high'] >= prev['high']:
+                new_high, new_high_date = curr['high'], curr_high_date
+            else:
+                new_high, new_high_date = prev['high'], prev['high_date']
+            if curr['low'] >= prev['low']:
+                new_low, new_low_date = curr['low'], curr_low_date
+            else:
+                new_low, new_low_date = prev['low'], prev['low_date']
+        else: # 向下趋势，取低低，高低
+            if curr['high'] <= prev['high']:
+                new_high, new_high_date = curr['high'], curr_high_date
+            else:
+                new_high, new_high_date = prev['high'], prev['high_date']
+            if curr['low'] <= prev['low']:
+                new_low, new_low_date = curr['low'], curr_low_date
+            else:
+                new_low, new_low_date = prev['low'], prev['low_date']
+
+        prev['high'] = new_high
+        prev['low'] = new_low
+        prev['high_date'] = new_high_date
+        prev['low_date'] = new_low_date
+        prev['date'] = curr['date']
+        prev['original'] = curr['original']
+        return direction
+
+    if curr['high'] > prev['high']:
+        direction = 1
+    elif curr['low'] < prev['low']:
+        direction = -1
+    curr['high_date'] = curr_high_date
+    curr['low_date'] = curr_low_date
+    result.append(curr)
+    return direction
+
+
+def feed_fenxing(points, fx):
+    """
+    分型链的贪心连接规则 (原地修改 points):
+    同类取更极端者替换，异类且间隔>=3 时追加，否则忽略
+    """
+    if not points:
+        points.append(fx)
+        return
+    last = points[-1]
+    if last['type'] != fx['type']:
+        if fx['index'] - last['index'] >= 3:
+            points.append(fx)
+    elif fx['type'] == 'top':
+        if fx['price'] > last['price']:
+            points[-1] = fx
+    elif fx['price'] < last['price']:
+        points[-1] = fx
+
+
+def make_bi(p1, p2, bars):
+    """
+    由两个端点生成 calculate_bi_and_centers 格式的笔
+    """
+    return {
+        'start_index': p1['index'],
+        'start_val': p1['price'],
+        'start_date': bars[p1['index']].get('date', ''),
+        'end_index': p2['index'],
+        'end_val': p2['price'],
+        'end_date': bars[p2['index']].get('date', ''),
+        'type': 'up' if p2['price'] > p1['price'] else 'down'
+    }
+
+
+def bi_shape(bi):
+    return {
+        'type': 'line',
+        'xref': 'x', 'yref': 'y',
+        'x0': bi['start_index'], 'y0': bi['start_val'],
+        'x1': bi['end_index'], 'y1': bi['end_val'],
+        'line': BI_LINE_STYLE,
+    }
+
+
+def zhongshu_shapes(z):
+    return [
+        {
+            'type': 'rect',
+            'xref': 'x', 'yref': 'y',
+            'x0': z['x0'], 'x1': z['x1'],
+            'y0': z['y0'], 'y1': z['y1'],
+            'fillcolor': ZS_FILL_COLOR,
+            'line': {'width': 0},
+        },
+        {
+            'type': 'rect',
+            'xref': 'x', 'yref': 'y',
+            'x0': z['x0'], 'x1': z['x1'],
+            'y0': z['y0'], 'y1': z['y1'],
+            'line': ZS_BORDER_STYLE,
+            'fillcolor': 'rgba(0,0,0,0)'
+        },
+    ]
+
+
+def raw_zhongshu(b1, b2, b3):
+    """
+    三笔价格区间的交集 (calculate_bi_and_zhongshu_shapes 口径)，无交集返回 None
+    """
+    overlap_min = max(min(b['start_val'], b['end_val']) for b in (b1, b2, b3))
+    overlap_max = min(max(b['start_val'], b['end_val']) for b in (b1, b2, b3))
+    if overlap_min < overlap_max:
+        return {'x0': b1['start_index'], 'x1': b3['end_index'], 'y0': overlap_min, 'y1': overlap_max}
+    return None
+
+
+def raw_center(b1, b2, b3):
+    """
+    三笔重叠构成的中枢 (calculate_bi_and_centers 口径)，无重叠返回 None
+    """
+    zg = min(max(b['start_val'], b['end_val']) for b in (b1, b2, b3))
+    zd = max(min(b['start_val'], b['end_val']) for b in (b1, b2, b3))
+    if zg > zd:
+        return {
+            'start_index': b1['end_index'],
+            'end_index': b3['end_index'],
+            'visual_end_index': b2['end_index'],
+            'start_date': b1['end_date'],
+            'end_date': b3['end_date'],
+            'visual_end_date': b2['end_date'],
+            'zg': zg,
+            'zd': zd,
+            'is_up': b1['type'] == 'up'
+        }
+    return None
+
+
+def build_centers(bi_list):
+    """
+    由笔列表批量生成合并后的中枢 (calculate_bi_and_centers 口径)
+    """
+    fold = _CenterFold()
+    for i in range(len(bi_list) - 2):
+        c = raw_center(*bi_list[i:i + 3])
+        if c is not None:
+            fold.push(c)
+    return fold.closed + ([fold.current] if fold.current is not None else [])
+
+
+def build_zhongshu_shapes(bi_list):
+    """
+    由笔列表批量生成笔连线和中枢矩形的形状 (calculate_bi_and_zhongshu_shapes 口径)
+    """
+    fold = _ZhongshuFold()
+    for i in range(len(bi_list) - 2):
+        z = raw_zhongshu(*bi_list[i:i + 3])
+        if z is not None:
+            fold.push(z)
+    shapes = [bi_shape(b) for b in bi_list]
+    for z in fold.closed + ([fold.current] if fold.current is not None else []):
+        shapes.extend(zhongshu_shapes(z))
+    return shapes
+
+
+class _MergeFold(ABC):
+    """
+    对按时间顺序到达的原始中枢做"相邻重叠即合并"的折叠。
+    closed 中的元素不再变化；current 可能继续吸收后续中枢。
+    子类实现 _try_merge，决定两个中枢是否重叠以及如何合并。
+    """
+    def __init__(self):
+        self.closed = []
+        self.current = None
+
+    def _start(self, item):
+        return dict(item)
+
+    @abstractmethod
+    def _try_merge(self, cur, nxt):
+        """重叠时把 nxt 并入 cur 并返回 True，否则返回 False"""
+
+    def _step(self, closed, cur, item):
+        if cur is None:
+            return self._start(item)
+        if self._try_merge(cur, item):
+            return cur
+        closed.append(cur)
+        return self._start(item)
+
+    def push(self, item):
+        self.current = self._step(self.closed, self.current, item)
+
+    def checkpoint(self):
+        return len(self.closed), dict(self.current) if self.current is not None else None
+
+    def rollback(self, token):
+        n_closed, current = token
+        del self.closed[n_closed:]
+        self.current = dict(current) if current is not None else None
+
+    def preview(self, tail):
+        """
+        在不修改状态的前提下追加尾部元素，返回 (新关闭的元素, 当前元素)
+        """
+        closed = []
+        cur = dict(self.current) if self.current is not None else None
+        for item in tail:
+            cur = self._step(closed, cur, item)
+        return closed, cur
+
+
+class _ZhongshuFold(_MergeFold):
+    def _try_merge(self, cur, nxt):
+        if max(cur['y0'], nxt['y0']) < min(cur['y1'], nxt['y1']):
+            cur['x1'] = max(cur['x1'], nxt['x1'])
+            cur['y0'] = min(cur['y0'], nxt['y0'])
+            cur['y1'] = max(cur['y1'], nxt['y1'])
+            return True
+        return False
+
+
+class _CenterFold(_MergeFold):
+    def _start(self, item):
+        c = dict(item)
+        c['end_index'] = c['visual_end_index']
+        c['end_date'] = c['visual_end_date']
+        return c
+
+    def _try_merge(self, cur, nxt):
+        if max(cur['zd'], nxt['zd']) < min(cur['zg'], nxt['zg']):
+            cur['end_index'] = max(cur['end_index'], nxt['visual_end_index'])
+            cur['end_date'] = nxt['visual_end_date']
+            cur['zd'] = min(cur['zd'], nxt['zd'])
+            cur['zg'] = max(cur['zg'], nxt['zg'])
+            return True
+        return False
+
+
+class _StructureTracker:
+    """
+    维护一条K线序列上的分型链、笔和中枢。
+
+    points 为已确认分型构成的端点链，只有最后一个端点可能被替换，
+    因此 points[:-1] 之间的笔 (frozen) 以及由它们产生的中枢都是最终结果。
+    """
+    def __init__(self, bars):
+        self.bars = bars
+        self.points = []
+        self.frozen = []
+        self.frozen_shapes = []
+        self.zs_fold = _ZhongshuFold()
+        self.zs_closed_shapes = []
+        self.center_fold = _CenterFold()
+
+    def make_point(self, index, fx_type):
+        # 端点格式与 find_bi 一致: 合并K线优先使用真实的最高/最低点日期
+        bar = self.bars[index]
+        if fx_type == 'top':
+            return {'type': 'top', 'index': index, 'price': bar['high'], 'date': bar.get('high_date', bar.get('date'))}
+        return {'type': 'bottom', 'index': index, 'price': bar['low'], 'date': bar.get('low_date', bar.get('date'))}
+
+    def detect(self, index):
+        """
+        检测 index 处的分型，返回端点或 None
+        """
+        if index < 1 or index + 1 >= len(self.bars):
+            return None
+        fx_type = detect_fenxing(self.bars[index - 1], self.bars[index], self.bars[index + 1])
+        return self.make_point(index, fx_type) if fx_type else None
+
+    def add(self, fx):
+        feed_fenxing(self.points, fx)
+        while len(self.frozen) < len(self.points) - 2:
+            j = len(self.frozen)
+            bi = make_bi(self.points[j], self.points[j + 1], self.bars)
+            self.frozen.append(bi)
+            self.frozen_shapes.append(bi_shape(bi))
+            if len(self.frozen) >= 3:
+                self._fold(*self.frozen[-3:])
+
+    def _fold(self, b1, b2, b3):
+        z = raw_zhongshu(b1, b2, b3)
+        if z is not None:
+            n_closed = len(self.zs_fold.closed)
+            self.zs_fold.push(z)
+            for closed in self.zs_fold.closed[n_closed:]:
+                self.zs_closed_shapes.extend(zhongshu_shapes(closed))
+        c = raw_center(b1, b2, b3)
+        if c is not None:
+            self.center_fold.push(c)
+
+    def checkpoint(self):
+        return (len(self.points), self.points[-1] if self.points else None, len(self.frozen),
+                len(self.zs_closed_shapes), self.zs_fold.checkpoint(), self.center_fold.checkpoint())
+
+    def rollback(self, token):
+        n_points, last_point, n_frozen, n_zs_shapes, zs_fold, center_fold = token
+        del self.points[n_points:]
+        if n_points:
+            self.points[-1] = last_point
+        del self.frozen[n_frozen:]
+        del self.frozen_shapes[n_frozen:]
+        del self.zs_closed_shapes[n_zs_shapes:]
+        self.zs_fold.rollback(zs_fold)
+        self.center_fold.rollback(center_fold)
+
+    def tail(self, tentative=None):
+        """
+        返回未冻结部分: (尾部端点, 尾部笔, 尾部原始中枢, 尾部原始中枢(中枢口径))
+        """
+        start = len(self.frozen)
+        points = self.points[start:]
+        if tentative is not None:
+            feed_fenxing(points, tentative)
+        bis = [make_bi(points[i], points[i + 1], self.bars) for i in range(len(points) - 1)]
+        window = self.frozen[-2:] + bis
+        zs, centers = [], []
+        for i in range(len(window) - 2 - len(bis), len(window) - 2):
+            if i < 0:
+                continue
+            z = raw_zhongshu(*window[i:i + 3])
+            if z is not None:
+                zs.append(z)
+            c = raw_center(*window[i:i + 3])
+            if c is not None:
+                centers.append(c)
+        return points, bis, zs, centers
+
+
+class ChanlunEngine:
+    """
+    增量缠论结构引擎，push(bar) 为均摊 O(1)。
+
+    bars 为 simulator 格式的 dict ({'time'/'date', 'open', 'high', 'low', 'close'})。
+    同时维护两条结构链：原始K线上的 (模拟器画图口径) 和包含处理后K线上的 (MoneyFlow 口径)。
+    """
+    def __init__(self, bars=None):
+        self.bars = []
+        self.merged = []
+        self._direction = 1
+        self._raw = _StructureTracker(self.bars)
+        self._merged = _StructureTracker(self.merged)
+        if bars:
+            self.extend(bars)
+
+    def __len__(self):
+        return len(self.bars)
+
+    def push(self, bar):
+        self.bars.append(bar)
+        # 原始K线: 新K线到来后，前一根是否为分型即可确定
+        fx = self._raw.detect(len(self.bars) - 2)
+        if fx:
+            self._raw.add(fx)
+
+        # 包含处理: 只有追加了新的合并K线时，倒数第三根合并K线上的分型才被确认
+        n_before = len(self.merged)
+        self._direction = merge_baohan(self.merged, {
+            'high': float(bar['high']),
+            'low': float(bar['low']),
+            'date': bar.get('time', bar.get('date')),
+            'original': bar
+        }, self._direction)
+        if len(self.merged) > n_before:
+            fx = self._merged.detect(len(self.merged) - 3)
+            if fx:
+                self._merged.add(fx)
+
+    def extend(self, bars):
+        for bar in bars:
+            self.push(bar)
+
+    def checkpoint(self):
+        """
+        记录当前状态。盘中最后一根K线尚未收盘时: token = checkpoint(); push(bar); 读取结果; rollback(token)，
+        下次报价再对新的 bar 重复，历史部分无需重算
+        """
+        last = dict(self.merged[-1]) if self.merged else None
+        return (len(self.bars), len(self.merged), last, self._direction,
+                self._raw.checkpoint(), self._merged.checkpoint())
+
+    def rollback(self, token):
+        """
+        撤销 checkpoint 之后 push 的K线
+        """
+        n_bars, n_merged, last, direction, raw, merged = token
+        del self.bars[n_bars:]
+        del self.merged[n_merged:]
+        if last is not None:
+            # 包含处理会原地修改最后一根合并K线，按原样恢复 (保持对象身份不变)
+            self.merged[-1].clear()
+            self.merged[-1].update(last)
+        self._direction = direction
+        self._raw.rollback(raw)
+        self._merged.rollback(merged)
+
+    def _merged_tail(self):
+        # 倒数第二根合并K线上的分型依赖仍可能变化的最后一根，查询时临时计算
+        return self._merged.tail(self._merged.detect(len(self.merged) - 2))
+
+    def merged_bars(self):
+        """
+        包含处理后的K线 (等价于 process_baohan)
+        """
+        return list(self.merged)
+
+    def bi_points(self):
+        """
+        笔端点 (等价于 find_bi(process_baohan(bars)))
+        """
+        if len(self.merged) < 5:
+            return []
+        points, _, _, _ = self._merged_tail()
+        return self._merged.points[:len(self._merged.frozen)] + points
+
+    def bi_and_centers(self, merged=True):
+        """
+        笔和中枢 (等价于 calculate_bi_and_centers，merged=False 时基于原始K线)
+        """
+        tracker = self._merged if merged else self._raw
+        _, bis, _, tail_centers = self._merged_tail() if merged else tracker.tail()
+        closed, cur = tracker.center_fold.preview(tail_centers)
+        centers = tracker.center_fold.closed + closed + ([cur] if cur is not None else [])
+        return tracker.frozen + bis, centers
+
+    def shapes(self):
+        """
+        笔和中枢的 Plotly 形状 (等价于 calculate_bi_and_zhongshu_shapes(bars))
+        """
+        tracker = self._raw
+        _, bis, tail_zs, _ = tracker.tail()
+        closed, cur = tracker.zs_fold.preview(tail_zs)
+        shapes = tracker.frozen_shapes + [bi_shape(b) for b in bis]
+        shapes.extend(tracker.zs_closed_shapes)
+        for z in closed + ([cur] if cur is not None else []):
+            shapes.extend(zhongshu_shapes(z))
+        return shapes
@@ -0,0 +1,171 @@
+"""
+Plotly 图表增量推送
+
+FigureStream 记住上一次发给浏览器的图，新图到来时只算出变化的部分:
+- extend:  末尾新增的点 (Plotly.extendTraces，max 为 trace 的点数，窗口右移时丢弃最早的点)
+- patch:   已有点的值变化 (盘中最后一根K线)，前端原地改数组后重绘
+- restyle: 其余变化的 trace 属性整体替换 (笔、分型等中间有改动的 trace)
+- relayout: 变化的 layout 顶层属性
+trace 数量或类型变化时 diff 返回 None，需要整图重发。
+
+    stream = FigureStream(fig)
+    custom_plotly(stream.figure)      # 首次整图渲染 (数组已转成普通 list)
+    ops = stream.diff(new_fig)        # None: 整图重发; {}: 无变化; 否则交给前端 window.streamPlotly
+"""
+import base64
+
+import numpy as np
+
+# 变化点超过该比例时不再逐点 patch，整条 restyle
+PATCH_RATIO = 0.25
+
+
+def _decode_typed_array(spec):
+    """
+    plotly 把 numpy 数组序列化为 {'dtype': 'f8', 'bdata': base64, 'shape': '2, 3'}
+    """
+    arr = np.frombuffer(base64.b64decode(spec['bdata']), dtype=np.dtype(spec['dtype']))
+    if spec.get('shape'):
+        arr = arr.reshape([int(s) for s in str(spec['shape']).split(',')])
+    return _plain(arr.tolist())
+
+
+def _plain(value):
+    """转成可直接比较的 JSON 结构：数组 -> list，NaN -> None"""
+    if hasattr(value, 'to_plotly_json'):
+        value = value.to_plotly_json()
+    if isinstance(value, dict):
+        if 'bdata' in value and 'dtype' in value:
+            return _decode_typed_array(value)
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if hasattr(value, 'tolist'):
+        return _plain(value.tolist())
+    if isinstance(value, float) and value != value:
+        return None
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def figure_dict(fig):
+    if hasattr(fig, 'to_dict'):
+        fig = fig.to_dict()
+    return {
+        'data': [_plain(t) for t in fig.get('data', [])],
+        'layout': _plain(fig.get('layout', {})),
+    }
+
+
+def _is_array(value):
+    return isinstance(value, list) and not any(isinstance(v, (dict, list)) for v in value)
+
+
+def _flatten(trace, prefix=''):
+    """{'marker': {'color': [...]}} -> {'marker.color': [...]}"""
+    out = {}
+    for k, v in trace.items():
+        if isinstance(v, dict) and v:
+            out.update(_flatten(v, f'{prefix}{k}.'))
+        else:
+            out[f'{prefix}{k}'] = v
+    return out
+
+
+def _shift(old_x, new_x):
+    """
+    最小的 s 使 old_x[s:] 是 new_x 的前缀 (窗口右移 s 个点)；不存在返回 None
+    """
+    n = len(old_x)
+    if not n:
+        return None
+    for s in range(n):
+        if new_x[:n - s] == old_x[s:]:
+            return s
+    return None
+
+
+def _diff_trace(i, old, new):
+    """
+    返回 (extend, patches, restyle)
+    extend: {attr: [新点]} 与 max，patches: [[trace, attr, idx, value]]，restyle: {attr: value}
+    """
+    old, new = _flatten(old), _flatten(new)
+    restyle = {k: None for k in old if k not in new}
+    extend, patches = {}, []
+
+    old_x, new_x = old.get('x'), new.get('x')
+    s = _shift(old_x, new_x) if _is_array(old_x) and _is_array(new_x) else None
+    if s is not None:
+        n_old, n_new = len(old_x), len(new_x)
+        keep = n_old - s  # 重叠部分的点数
+        point_attrs = [k for k, v in new.items()
+                       if _is_array(v) and len(v) == n_new and _is_array(old.get(k)) and len(old[k]) == n_old]
+        tail_len = n_new - keep
+        for k in point_attrs:
+            o, v = old[k][s:], new[k]
+            changed = [j for j in range(keep) if o[j] != v[j]]
+            if len(changed) > max(1, keep * PATCH_RATIO):
+                restyle[k] = v
+                continue
+            patches.extend([i, k, j, v[j]] for j in changed)
+            if tail_len:
+                extend[k] = v[keep:]
+        if extend and any(k in restyle for k in extend):
+            # 同一 trace 中部分属性整体替换时，extend 会让长度错位，全部改为 restyle
+            for k in point_attrs:
+                restyle[k] = new[k]
+            extend, patches = {}, []
+        elif s and not extend:
+            # 只丢弃了最早的点没有新增：不能用 extendTraces 表达
+            for k in point_attrs:
+                restyle[k] = new[k]
+            patches = []
+        handled = set(point_attrs)
+    else:
+        handled = set()
+
+    for k, v in new.items():
+        if k not in handled and old.get(k) != v:
+            restyle[k] = v
+    return (extend, len(new_x) if extend else None), patches, restyle
+
+
+class FigureStream:
+    def __init__(self, fig):
+        self.figure = figure_dict(fig)
+
+    def diff(self, fig):
+        new = figure_dict(fig)
+        old = self.figure
+        if len(new['data']) != len(old['data']):
+            return None
+        for o, n in zip(old['data'], new['data']):
+            if o.get('type') != n.get('type') or o.get('name') != n.get('name'):
+                return None
+
+        ops = {}
+        extend_groups = {}  # (属性集合, max) -> {'traces': [...], 'update': {attr: [[...], ...]}}
+        for i, (o, n) in enumerate(zip(old['data'], new['data'])):
+            (extend, max_points), patches, restyle = _diff_trace(i, o, n)
+            if extend:
+                group = extend_groups.setdefault((tuple(sorted(extend)), max_points), {
+                    'traces': [], 'update': {k: [] for k in sorted(extend)}, 'max': max_points})
+                group['traces'].append(i)
+                for k, v in extend.items():
+                    group['update'][k].append(v)
+            if patches:
+                ops.setdefault('patch', []).extend(patches)
+            if restyle:
+                ops.setdefault('restyle', []).append({'trace': i, 'update': restyle})
+        if extend_groups:
+            ops['extend'] = list(extend_groups.values())
+
+        relayout = {k: v for k, v in new['layout'].items() if old['layout'].get(k) != v}
+        relayout.update({k: None for k in old['layout'] if k not in new['layout']})
+        if relayout:
+            ops['relayout'] = relayout
+
+        self.figure = new
+        return ops
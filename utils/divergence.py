@@ -0,0 +1,150 @@
+"""
+背驰索引
+
+check_divergence 每次都要切出前 lookback 根K线，循环找最低价/最高价和 MACD 柱的极值，
+逐根扫描整条序列时是 O(n·lookback)。DivergenceIndex 为一条序列预先建好稀疏表
+(Sparse Table)，任意区间的极值及其位置都能 O(1) 查询：
+
+    div_index = DivergenceIndex.from_klines(klines, macd_data)
+    div_index.query(i)            # 与 check_divergence(klines, macd_data, i) 的判断一致
+    div_index.flags(lookback=30)  # 全部K线的背驰标记，1=底背驰，-1=顶背驰，0=无
+
+判断只用到 index 及之前的数据，所以对整条序列建一次索引，再查询任意历史位置不会引入未来数据。
+"""
+import numpy as np
+
+from utils.kline_array import KLineArray
+
+BOTTOM = 1
+TOP = -1
+
+
+class SparseTable:
+    """
+    区间最小值稀疏表，argmin 返回最小值首次出现的位置 (与 list.index / np.argmin 一致)。
+    区间为左闭右开 [l, r)，l、r 可以是整数或等长数组 (批量查询)。
+    """
+    def __init__(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.values = values
+        n = len(values)
+        self.table = [np.arange(n, dtype=np.int64)]
+        span = 1
+        while span * 2 <= n:
+            prev = self.table[-1]
+            left, right = prev[:n - span * 2 + 1], prev[span:n - span + 1]
+            # 相等时取左侧，保证得到首次出现的位置
+            self.table.append(np.where(values[right] < values[left], right, left))
+            span *= 2
+
+    @property
+    def nbytes(self):
+        return sum(level.nbytes for level in self.table)
+
+    def argmin(self, l, r):
+        if np.ndim(l) == 0 and np.ndim(r) == 0:
+            if r <= l:
+                raise ValueError("Empty range")
+            level = int(r - l).bit_length() - 1
+            row = self.table[level]
+            left, right = row[l], row[r - (1 << level)]
+            return right if self.values[right] < self.values[left] else left
+
+        l, r = np.asarray(l, dtype=np.int64), np.asarray(r, dtype=np.int64)
+        length = r - l
+        if np.any(length <= 0):
+            raise ValueError("Empty range")
+        level = np.floor(np.log2(length)).astype(np.int64)
+        left = np.empty(len(l), dtype=np.int64)
+        right = np.empty(len(l), dtype=np.int64)
+        for lv in np.unique(level).tolist():
+            mask = level == lv
+            row = self.table[lv]
+            left[mask] = row[l[mask]]
+            right[mask] = row[r[mask] - (1 << lv)]
+        return np.where(self.values[right] < self.values[left], right, left)
+
+
+def _column(klines, name):
+    if isinstance(klines, KLineArray):
+        return getattr(klines, name)
+    return np.array([k[name] for k in klines], dtype=np.float64)
+
+
+class DivergenceIndex:
+    """
+    一条序列的背驰查询索引 (最低价/最高价/MACD柱各自的区间极值表)
+    """
+    def __init__(self, low, high, hist):
+        self.low = np.asarray(low, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.hist = np.asarray(hist, dtype=np.float64)
+        self._low_min = SparseTable(self.low)
+        self._high_max = SparseTable(-self.high)
+        self._hist_min = SparseTable(self.hist)
+        self._hist_max = SparseTable(-self.hist)
+
+    @classmethod
+    def from_klines(cls, klines, macd_data):
+        return cls(_column(klines, 'low'), _column(klines, 'high'), macd_data['hist'])
+
+    def __len__(self):
+        return len(self.low)
+
+    @property
+    def nbytes(self):
+        tables = (self._low_min, self._high_max, self._hist_min, self._hist_max)
+        return sum(t.nbytes for t in tables) + self.low.nbytes + self.high.nbytes + self.hist.nbytes
+
+    def query(self, index, lookback=30):
+        """
+        判断 index 处是否背驰，返回 (类型, 前极值位置, 前极值价格, 前MACD极值位置, 前MACD极值)，
+        类型为 'bottom' / 'top'；无背驰返回 None。规则与 check_divergence 相同。
+        """
+        if index < lookback or lookback <= 0:
+            return None
+        start = index - lookback
+        hist = self.hist[index]
+
+        # 底背驰：价格创新低，但绿柱没有创新低
+        low_idx = int(self._low_min.argmin(start, index))
+        if self.low[index] < self.low[low_idx]:
+            hist_idx = int(self._hist_min.argmin(start, index))
+            if hist < 0 and hist > self.hist[hist_idx]:
+                return 'bottom', low_idx, float(self.low[low_idx]), hist_idx, float(self.hist[hist_idx])
+
+        # 顶背驰：价格创新高，但红柱没有创新高
+        high_idx = int(self._high_max.argmin(start, index))
+        if self.high[index] > self.high[high_idx]:
+            hist_idx = int(self._hist_max.argmin(start, index))
+            if hist > 0 and hist < self.hist[hist_idx]:
+                return 'top', high_idx, float(self.high[high_idx]), hist_idx, float(self.hist[hist_idx])
+        return None
+
+    def flags(self, lookback=30):
+        """
+        批量计算全部K线的背驰标记 (np.int8)：BOTTOM(1)=底背驰，TOP(-1)=顶背驰，0=无
+        """
+        n = len(self)
+        out = np.zeros(n, dtype=np.int8)
+        if lookback <= 0 or n <= lookback:
+            return out
+        idx = np.arange(lookback, n)
+        start = idx - lookback
+        hist = self.hist[idx]
+        prev_low = self.low[self._low_min.argmin(start, idx)]
+        prev_high = self.high[self._high_max.argmin(start, idx)]
+        hist_min = self.hist[self._hist_min.argmin(start, idx)]
+        hist_max = self.hist[self._hist_max.argmin(start, idx)]
+        bottom = (self.low[idx] < prev_low) & (hist < 0) & (hist > hist_min)
+        top = (self.high[idx] > prev_high) & (hist > 0) & (hist < hist_max)
+        out[idx[bottom]] = BOTTOM
+        out[idx[top]] = TOP
+        return out
+
+
+def divergence_flags(klines, macd_data, lookback=30):
+    """
+    整条序列的背驰标记，供选股/回测批量使用 (见 DivergenceIndex.flags)
+    """
+    return DivergenceIndex.from_klines(klines, macd_data).flags(lookback)
@@ -0,0 +1,250 @@
+"""
+长序列图表的服务端降采样
+
+- 折线: LTTB (Largest-Triangle-Three-Buckets)，保留视觉形状
+- 柱状: 分桶取最大/最小值，尖峰不丢
+- K线: 按区间聚合 OHLC (开=首、收=尾、高=最高、低=最低)
+- 纯标记 trace (分型、笔端点、买卖点、高温/冰点等): 不降采样，且其所在位置强制保留
+
+ViewportDownsampler 保存全分辨率图，render(x_range) 对可见区间给出更高分辨率、区间外粗略的图：
+
+    ds = ViewportDownsampler(fig, max_points=400)
+    fig_small, _ = ds.render()                 # 首次渲染
+    fig_zoom, rng = ds.render(['2024-01-01', '2024-03-01'])   # 缩放后按可见区间补全
+
+category 轴 (K线按交易日排列) 的 range 是点的序号，降采样后序号会变；render 返回换算后的 range
+(非 category 轴返回 None)，前端据此重设坐标范围。
+"""
+import numpy as np
+import pandas as pd
+
+from utils.chart_stream import figure_dict
+
+MAX_POINTS = 400
+
+
+def lttb_indices(y, n_out, x=None):
+    """
+    LTTB 选点，返回保留点的下标 (含首尾)。NaN 按前后值填充参与面积计算
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=float) if x is None else np.asarray(x, dtype=float)
+    y = pd.Series(y).ffill().bfill().fillna(0).values
+
+    every = (n - 2) / (n_out - 2)
+    edges = (np.arange(n_out - 1) * every).astype(int) + 1
+    edges[-1] = n - 1
+    out = np.empty(n_out, dtype=int)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            nlo, nhi = edges[i + 1], edges[i + 2]
+            cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        else:
+            cx, cy = x[-1], y[-1]
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def minmax_indices(y_max, n_out, y_min=None):
+    """
+    分 n_out/2 个桶，每桶保留 y_max 最大与 y_min 最小 (默认同 y_max) 的位置，含首尾
+    """
+    y_max = np.asarray(y_max, dtype=float)
+    y_min = y_max if y_min is None else np.asarray(y_min, dtype=float)
+    n = len(y_max)
+    if n_out >= n:
+        return np.arange(n)
+    edges = np.linspace(0, n, max(n_out // 2, 1) + 1).astype(int)
+    picks = [0, n - 1]
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        if hi <= lo:
+            continue
+        hi_seg, lo_seg = y_max[lo:hi], y_min[lo:hi]
+        if not np.isnan(hi_seg).all():
+            picks.append(lo + int(np.nanargmax(hi_seg)))
+        if not np.isnan(lo_seg).all():
+            picks.append(lo + int(np.nanargmin(lo_seg)))
+    return np.unique(picks)
+
+
+def _kind(trace):
+    t = trace.get('type', 'scatter')
+    if t in ('candlestick', 'ohlc'):
+        return 'candle'
+    if t == 'bar':
+        return 'bar'
+    if t in ('scatter', 'scattergl'):
+        mode = trace.get('mode') or 'lines'
+        return 'line' if 'lines' in mode else 'markers'
+    return 'other'
+
+
+def _numbers(values):
+    """x 轴值转为可比较的数值 (日期 -> 纳秒)"""
+    try:
+        return np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        return pd.to_datetime(pd.Series(values), format='ISO8601', errors='coerce').values.astype('datetime64[ns]').astype('int64').astype(float)
+
+
+def _floats(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+def _pick(trace, kind, xnum, n_out):
+    if kind == 'line':
+        return lttb_indices(_floats(trace['y']), n_out, xnum)
+    if kind == 'candle':
+        return minmax_indices(_floats(trace['high']), n_out, _floats(trace['low']))
+    return minmax_indices(_floats(trace['y']), n_out)
+
+
+def _select(trace, kind, xnum, n_out, window=None):
+    """
+    保留点下标: 全局粗采样 + 可见区间 [lo, hi) 内的细采样
+    """
+    n = len(xnum)
+    if window is None:
+        return _pick(trace, kind, xnum, n_out)
+    lo, hi = window
+    coarse = _pick(trace, kind, xnum, max(n_out // 4, 3))
+    if hi - lo <= n_out:
+        fine = np.arange(lo, hi)
+    else:
+        sub = _slice(trace, n, lo, hi)
+        fine = lo + _pick(sub, kind, xnum[lo:hi], n_out)
+    return np.union1d(coarse, fine)
+
+
+def _slice(trace, n, lo, hi):
+    return {k: (v[lo:hi] if isinstance(v, list) and len(v) == n else v) for k, v in trace.items()}
+
+
+def _take(value, n, idx):
+    """trace 中所有长度为 n 的数组 (含 marker.color 等嵌套属性) 取 idx 位置"""
+    if isinstance(value, dict):
+        return {k: _take(v, n, idx) for k, v in value.items()}
+    if isinstance(value, list) and len(value) == n:
+        return [value[i] for i in idx]
+    return value
+
+
+def _reduce(trace, kind, keep, labels=None):
+    """
+    按保留位置切成区间 [keep[j], keep[j+1]) 聚合:
+    折线取区间起点；柱取区间内绝对值最大的柱；K线聚合 OHLC。
+    labels 给定时 (category 轴) x 统一取区间起点的标签
+    """
+    n = len(trace['x'])
+    starts = np.asarray(keep, dtype=int)
+    if kind == 'bar':
+        y = np.abs(np.nan_to_num(_floats(trace['y'])))
+        ends = np.append(starts[1:], n)
+        rep = [s + int(np.argmax(y[s:e])) for s, e in zip(starts, ends)]
+    else:
+        rep = starts
+    out = _take(trace, n, rep)
+    if kind == 'candle':
+        high, low = _floats(trace['high']), _floats(trace['low'])
+        out['open'] = [trace['open'][i] for i in starts]
+        out['close'] = [trace['close'][i - 1] for i in np.append(starts[1:], n)]
+        out['high'] = [None if np.isnan(v) else float(v) for v in np.fmax.reduceat(high, starts)]
+        out['low'] = [None if np.isnan(v) else float(v) for v in np.fmin.reduceat(low, starts)]
+        out['x'] = [trace['x'][i] for i in starts]
+    if labels is not None:
+        out['x'] = [labels[i] for i in starts]
+    return out
+
+
+class ViewportDownsampler:
+    def __init__(self, fig, max_points=MAX_POINTS):
+        self.full = figure_dict(fig)
+        self.max_points = max_points
+        layout = self.full['layout']
+        self.category = any(isinstance(v, dict) and v.get('type') == 'category'
+                            for k, v in layout.items() if k.startswith('xaxis'))
+        traces = [t for t in self.full['data'] if isinstance(t.get('x'), list)]
+        self.labels = max((t['x'] for t in traces), key=len, default=[])
+        self.positions = None  # category 轴当前显示的点在全量中的位置
+
+    @property
+    def needed(self):
+        return any(isinstance(t.get('x'), list) and len(t['x']) > self.max_points
+                   and _kind(t) in ('line', 'bar', 'candle') for t in self.full['data'])
+
+    def render(self, x_range=None):
+        """
+        x_range: 前端当前可见区间 (category 轴为显示序号，其余为 x 值)；None 为全部
+        返回 (降采样后的图, 换算后的 category range 或 None)
+        """
+        if self.category:
+            return self._render_category(x_range)
+        return self._render_values(x_range), None
+
+    def _render_category(self, x_range):
+        labels = self.labels
+        n = len(labels)
+        pos_of = {label: i for i, label in enumerate(labels)}
+        dense, protected = [], set()
+        for i, t in enumerate(self.full['data']):
+            kind = _kind(t)
+            if t.get('x') == labels and kind in ('line', 'bar', 'candle'):
+                dense.append((i, kind))
+            elif isinstance(t.get('x'), list):
+                protected.update(pos_of[x] for x in t['x'] if x in pos_of)
+
+        window = full_range = None
+        if x_range is not None and self.positions is not None:
+            shown = np.arange(len(self.positions))
+            full_range = r0, r1 = np.interp(x_range, shown, self.positions)
+            window = (max(int(np.floor(r0)), 0), min(int(np.ceil(r1)) + 1, n))
+        if not dense or (n <= self.max_points and window is None):
+            keep = np.arange(n)
+        else:
+            i, kind = dense[0]
+            keep = _select(self.full['data'][i], kind, np.arange(n, dtype=float), self.max_points, window)
+            keep = np.union1d(keep, sorted(protected)).astype(int)
+
+        data = list(self.full['data'])
+        for i, kind in dense:
+            data[i] = _reduce(data[i], kind, keep, labels)
+        layout = dict(self.full['layout'])
+        shown = np.arange(len(keep))
+        for k, v in layout.items():
+            if k.startswith('xaxis') and isinstance(v, dict) and isinstance(v.get('range'), list):
+                layout[k] = dict(v, range=np.interp(v['range'], keep, shown).tolist())
+        self.positions = keep
+        display_range = np.interp(full_range, keep, shown).tolist() if window else None
+        return {'data': data, 'layout': layout}, display_range
+
+    def _render_values(self, x_range):
+        sparse_x = set()
+        for t in self.full['data']:
+            if _kind(t) == 'markers' and isinstance(t.get('x'), list):
+                sparse_x.update(t['x'])
+        lo_hi = _numbers(x_range) if x_range is not None else None
+
+        data = []
+        for t in self.full['data']:
+            kind = _kind(t)
+            x = t.get('x')
+            if kind not in ('line', 'bar', 'candle') or not isinstance(x, list) or len(x) <= self.max_points:
+                data.append(t)
+                continue
+            xnum = _numbers(x)
+            window = None
+            if lo_hi is not None:
+                lo, hi = np.searchsorted(xnum, lo_hi[0]), np.searchsorted(xnum, lo_hi[1], side='right')
+                window = (int(lo), int(hi))
+            keep = _select(t, kind, xnum, self.max_points, window)
+            protected = [i for i, v in enumerate(x) if v in sparse_x]
+            data.append(_reduce(t, kind, np.union1d(keep, protected).astype(int)))
+        return {'data': data, 'layout': self.full['layout']}
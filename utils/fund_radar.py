@@ -222,13 +222,15 @@ class FundRadar:
             return False
         return True
 
-    def is_trading_time(self, cn_now=None):
+    @classmethod
+    def is_trading_time(cls, cn_now=None):
         """判断当前是否在A股盘中时段（交易日 + 开盘时间段）"""
         if cn_now is None:
-            cn_now = self._get_china_now()
+            utc_now = datetime.datetime.now(datetime.timezone.utc)
+            cn_now = utc_now + datetime.timedelta(hours=8)
         
         # 非交易日直接返回 False
-        if not self.is_trading_day(cn_now):
+        if not cls.is_trading_day(cn_now):
             return False
         
         t = cn_now.time()
@@ -0,0 +1,175 @@
+"""
+模拟器对局池
+
+开新局需要生成行情、重采样出周/月/60日K、计算各级别 MACD，
+还要把增量引擎预热到起始位置，这些原本都在点击回调里同步完成。
+GamePool 在后台按模式预先准备好若干局 (build_game)，开局时直接取出：
+
+- 各级别K线、MACD 和 日线->周/月K 查表数组
+- 各级别的 DivergenceIndex：任意位置的背驰判断为 O(1) 查询
+- 已预热到起始位置的日/周/月增量缠论引擎：之后每步只需 push 一根K线
+
+逐步的笔/中枢形状不逐位置落盘保存 (内存为 O(n·笔数))，由预热的增量引擎按需给出。
+池子大小和内存上限可配置，补充只在空闲时进行 (距离上次取局超过 idle_delay 秒)。
+"""
+import random
+import threading
+import time
+
+from utils.chanlun_engine import ChanlunEngine
+from utils.divergence import DivergenceIndex
+from utils.kline_array import KLineArray
+from utils.simulator_logic import generate_simulation_data, resample_klines, day_to_bar_map
+
+# 各模式的行情长度和起始位置
+GAME_MODES = {
+    'basic': {'length': 400, 'start_index': 80},
+    'advanced': {'length': 2000, 'start_index': 1250},
+}
+INITIAL_PRICE = 20
+# resample_klines 输出的每根K线 (dict) 及增量引擎中每根K线的大致内存占用
+_DICT_BAR_BYTES = 600
+
+
+class SimulatorGame:
+    """
+    一局准备就绪的模拟行情，字段与 main.py 中 LearnState 的 sim_* 状态一一对应
+    """
+    def __init__(self, mode, seed):
+        self.mode = mode
+        self.seed = seed
+        self.index = GAME_MODES[mode]['start_index']
+        self.data = None
+        self.macd = {}
+        self.data_week, self.macd_week = [], {}
+        self.data_month, self.macd_month = [], {}
+        self.data_60d, self.macd_60d = [], {}
+        self.week_map = None
+        self.month_map = None
+        self.engine = None
+        self.engine_week = None
+        self.engine_month = None
+        self.div_index = None
+        self.div_index_week = None
+        self.div_index_month = None
+
+    @property
+    def nbytes(self):
+        """
+        估算内存占用 (字节)，用于对局池的内存上限
+        """
+        total = self.data.nbytes + 3 * 8 * len(self.data)
+        for bars in (self.data_week, self.data_month, self.data_60d):
+            total += len(bars) * (_DICT_BAR_BYTES + 3 * 8)
+        for bar_map in (self.week_map, self.month_map):
+            if bar_map is not None:
+                total += bar_map.nbytes
+        for engine in (self.engine, self.engine_week, self.engine_month):
+            if engine is not None:
+                total += len(engine) * _DICT_BAR_BYTES
+        for div_index in (self.div_index, self.div_index_week, self.div_index_month):
+            if div_index is not None:
+                total += div_index.nbytes
+        return total
+
+
+def build_game(mode, seed=None):
+    """
+    生成一局完整的模拟行情 (耗时操作，由对局池在后台调用)
+    """
+    if seed is None:
+        seed = random.randrange(2**32)
+    cfg = GAME_MODES[mode]
+    game = SimulatorGame(mode, seed)
+    data, game.macd = generate_simulation_data(initial_price=INITIAL_PRICE, length=cfg['length'], seed=seed)
+    game.data = KLineArray.from_records(data)
+    game.div_index = DivergenceIndex.from_klines(game.data, game.macd)
+    game.engine = ChanlunEngine(game.data[:game.index + 1])
+
+    if mode == 'advanced':
+        game.data_week, game.macd_week = resample_klines(game.data, 5)
+        game.data_month, game.macd_month = resample_klines(game.data, 20)
+        game.data_60d, game.macd_60d = resample_klines(game.data, 60)
+        game.week_map = day_to_bar_map(game.data_week)
+        game.month_map = day_to_bar_map(game.data_month)
+        game.div_index_week = DivergenceIndex.from_klines(game.data_week, game.macd_week)
+        game.div_index_month = DivergenceIndex.from_klines(game.data_month, game.macd_month)
+        # 周/月引擎预热到起始日所在K线之前，当前这根由界面按需 extend
+        game.engine_week = ChanlunEngine(game.data_week[:int(game.week_map[game.index])])
+        game.engine_month = ChanlunEngine(game.data_month[:int(game.month_map[game.index])])
+    else:
+        game.engine_week, game.engine_month = ChanlunEngine(), ChanlunEngine()
+    return game
+
+
+class GamePool:
+    """
+    按模式缓存若干局准备好的行情。
+    size: 每种模式保留的局数；max_bytes: 池中全部对局的内存上限；
+    idle_delay: 距离上次取局多少秒后才开始补充，避免与开局的界面刷新争抢 CPU
+    """
+    def __init__(self, size=2, max_bytes=64 * 1024 * 1024, modes=tuple(GAME_MODES), idle_delay=1.0, builder=build_game):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.modes = modes
+        self.idle_delay = idle_delay
+        self.builder = builder
+        self._games = {mode: [] for mode in modes}
+        self._lock = threading.Lock()
+        self._last_get = float('-inf')
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(games) for games in self._games.values())
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(g.nbytes for games in self._games.values() for g in games)
+
+    def get(self, mode):
+        """
+        取出一局 (每局只能用一次)；池中没有时当场生成
+        """
+        with self._lock:
+            self._last_get = time.monotonic()
+            games = self._games.get(mode)
+            if games:
+                return games.pop(0)
+        return self.builder(mode)
+
+    def _next_mode(self):
+        """
+        最缺局的模式；已满或超出内存上限时返回 None
+        """
+        used = sum(g.nbytes for games in self._games.values() for g in games)
+        if used >= self.max_bytes:
+            return None
+        mode = min(self.modes, key=lambda m: len(self._games[m]))
+        return mode if len(self._games[mode]) < self.size else None
+
+    def refill_once(self):
+        """
+        空闲时补充一局，返回是否生成了新局 (后台任务循环调用)
+        """
+        with self._lock:
+            if time.monotonic() - self._last_get < self.idle_delay:
+                return False
+            mode = self._next_mode()
+        if mode is None:
+            return False
+        game = self.builder(mode)
+        with self._lock:
+            used = sum(g.nbytes for games in self._games.values() for g in games)
+            if len(self._games[mode]) >= self.size or used + game.nbytes > self.max_bytes:
+                return False
+            self._games[mode].append(game)
+        return True
+
+    def fill(self):
+        """
+        同步补满 (测试或预热时使用)，忽略空闲等待
+        """
+        self._last_get = float('-inf')
+        while self.refill_once():
+            pass
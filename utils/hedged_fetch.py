@@ -0,0 +1,160 @@
+"""
+多数据源对冲抓取 (hedged request)
+
+同一份数据有多个来源 (东财 / akshare ...) 时，不再逐个串行尝试：
+- 先请求历史上最快的来源；超过它的 p90 延迟仍未返回 (或已失败) 时，再发起下一个来源作为对冲
+- 谁先返回有效结果就用谁，其余未开始的请求取消，已在进行中的请求结果丢弃
+  (线程中的 HTTP 请求无法强行中断，但它结束时仍会计入延迟统计)
+- 每个来源按 EWMA 记录延迟与成功率，排序分数 = 延迟 + (1 - 成功率) * 失败惩罚，来源顺序自动调整
+  (很快就失败的来源也会被排到后面)
+- 参与竞速的来源必须返回同一份数据 (同样的复权口径和单位)；口径不同的来源 (如不复权、无成交额的新浪)
+  只放在竞速之后兜底
+
+    _fetcher = HedgedFetcher('daily_hist', [
+        ('em', _daily_from_em),
+        ('akshare', _daily_from_ak, lambda code, start, end: ak is not None),  # 第三项: 是否支持这组参数
+    ])
+    df = _fetcher('600519', '20240101', '20241231')   # 全部来源失败时返回 None
+    if df is None:
+        df = _daily_from_sina('600519', '20240101', '20241231')
+    hedged_fetch.stats()   # {'daily_hist': {'em': {'ewma_ms': .., 'p90_ms': .., 'success_rate': .., 'wins': ..}, ...}}
+"""
+import collections
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from utils.single_flight import is_failure
+
+EWMA_ALPHA = 0.2
+DEFAULT_DELAY = 1.0  # 没有延迟记录时的对冲等待 (秒)
+MIN_DELAY = 0.2
+MAX_DELAY = 5.0
+FAILURE_PENALTY = 5.0  # 秒，连续失败的来源排到最后，但仍会作为对冲被尝试
+LATENCY_WINDOW = 50
+
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='hedged_fetch')
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class _SourceStats:
+    def __init__(self):
+        self.ewma = None  # 秒
+        self.success = 1.0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)  # 成功请求的延迟
+        self.requests = 0
+        self.failures = 0
+        self.wins = 0
+        self.hedges = 0  # 作为对冲 (非首选) 发起的次数
+
+    def record(self, latency, ok):
+        self.requests += 1
+        self.ewma = latency if self.ewma is None else EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.ewma
+        self.success = EWMA_ALPHA * ok + (1 - EWMA_ALPHA) * self.success
+        if ok:
+            self.latencies.append(latency)
+        else:
+            self.failures += 1
+
+    def score(self):
+        return (DEFAULT_DELAY if self.ewma is None else self.ewma) + (1 - self.success) * FAILURE_PENALTY
+
+    def hedge_delay(self):
+        if not self.latencies:
+            return DEFAULT_DELAY
+        return float(min(MAX_DELAY, max(MIN_DELAY, np.percentile(self.latencies, 90))))
+
+
+class HedgedFetcher:
+    """
+    sources: [(名称, fn), ...] 或 [(名称, fn, accepts), ...]，按初始优先级排列。
+    fn 接收调用时的参数，返回结果；抛异常或 validate(结果) 为 False 视为失败。
+    accepts(*args, **kwargs) 为 False 时该来源不参与本次调用 (如不支持某个周期)
+    """
+    def __init__(self, name, sources, validate=None, timeout=30):
+        self.name = name
+        self.sources = [(s[0], s[1], s[2] if len(s) > 2 else None) for s in sources]
+        self.validate = validate or (lambda result: not is_failure(result))
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._stats = {s[0]: _SourceStats() for s in self.sources}
+        with _registry_lock:
+            _registry[name] = self
+
+    def ranked(self, *args, **kwargs):
+        """本次调用可用的来源，按 (分数, 初始顺序) 排序"""
+        with self._lock:
+            order = [(self._stats[name].score(), i, name, fn) for i, (name, fn, accepts) in enumerate(self.sources)
+                     if accepts is None or accepts(*args, **kwargs)]
+        return [(name, fn) for _, _, name, fn in sorted(order)]
+
+    def _run(self, name, fn, args, kwargs):
+        start = time.perf_counter()
+        result, ok = None, False
+        try:
+            result = fn(*args, **kwargs)
+            ok = bool(self.validate(result))
+        except Exception as e:
+            print(f"[HedgedFetch] {self.name}/{name} failed: {e}")
+        with self._lock:
+            self._stats[name].record(time.perf_counter() - start, ok)
+        return result, ok
+
+    def __call__(self, *args, **kwargs):
+        pending = collections.deque(self.ranked(*args, **kwargs))
+        running = {}
+        deadline = time.monotonic() + self.timeout
+
+        def launch(hedge):
+            name, fn = pending.popleft()
+            running[_executor.submit(self._run, name, fn, args, kwargs)] = name
+            with self._lock:
+                self._stats[name].hedges += hedge
+                return self._stats[name].hedge_delay()
+
+        delay = launch(False) if pending else None
+        while running:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            wait_for = min(delay, remaining) if pending else remaining
+            done, _ = wait(running, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                result, ok = future.result()
+                if ok:
+                    for other in running:
+                        other.cancel()
+                    with self._lock:
+                        self._stats[name].wins += 1
+                    return result
+            if pending and (not done or not running):
+                # 超过对冲等待仍无结果，或正在进行的来源都已失败：发起下一个来源
+                delay = launch(True)
+        for other in running:
+            other.cancel()
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    'requests': s.requests,
+                    'failures': s.failures,
+                    'wins': s.wins,
+                    'hedges': s.hedges,
+                    'ewma_ms': None if s.ewma is None else s.ewma * 1000,
+                    'p90_ms': s.hedge_delay() * 1000 if s.latencies else None,
+                    'success_rate': s.success,
+                }
+                for name, s in self._stats.items()
+            }
+
+
+def stats():
+    with _registry_lock:
+        fetchers = dict(_registry)
+    return {name: fetcher.stats() for name, fetcher in fetchers.items()}
@@ -0,0 +1,199 @@
+"""
+股东户数 (GDHS) 与个股基础信息的本地缓存
+
+股东户数只在披露新报告时变化，每只股票一个 JSON 文件 (data/holder_cache/{code}.json)，重启后仍可用：
+- 定期报告披露窗口内 (1/1-4/30 年报与一季报、7/1-8/31 半年报、10/1-10/31 三季报) 只用到次日，
+  窗口外用到下一个窗口开始，最长 GDHS_MAX_TTL_DAYS 天 (部分公司在窗口外也会披露户数)
+- 个股信息 (名称、流通股) 用到次日
+- 过期数据照常返回，同时在后台刷新；只有本地完全没有时才需要现场下载
+- 自选股通过 watch() 登记，非交易时段由 prefetch() 批量把过期的条目刷新好
+
+    cache = HolderCache(fetchers={'gdhs': _fetch_gdhs, 'info': _fetch_stock_info})
+    df = cache.lookup('600519', 'gdhs')         # 不走网络，没有时为 None
+    future = cache.refresh_async('600519', 'gdhs')
+    cache.watch(['600519', '000001'])
+    cache.prefetch()
+"""
+import datetime
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from utils.single_flight import is_failure
+
+HOLDER_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'holder_cache')
+WATCHLIST_FILE = 'watchlist.json'
+# 定期报告披露窗口 ((起始月, 日), (结束月, 日))
+REPORT_SEASONS = (((1, 1), (4, 30)), ((7, 1), (8, 31)), ((10, 1), (10, 31)))
+GDHS_MAX_TTL_DAYS = 7
+WATCH_IDLE_DAYS = 30  # 超过该天数未再登记的自选股不再预取
+PREFETCH_PAUSE = 0.5  # 预取时两次下载之间的间隔 (秒)，避免集中请求被限流
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='holder_cache')
+
+
+def _next_midnight(now):
+    return datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time.min)
+
+
+def gdhs_expiry(now):
+    """
+    now 时刻下载的股东户数用到何时
+    """
+    today = now.date()
+    for (sm, sd), (em, ed) in REPORT_SEASONS:
+        if datetime.date(today.year, sm, sd) <= today <= datetime.date(today.year, em, ed):
+            return _next_midnight(now)
+    starts = [datetime.date(today.year, sm, sd) for (sm, sd), _ in REPORT_SEASONS]
+    next_start = min([d for d in starts if d > today] + [datetime.date(today.year + 1, 1, 1)])
+    latest = today + datetime.timedelta(days=GDHS_MAX_TTL_DAYS)
+    return datetime.datetime.combine(min(next_start, latest), datetime.time.min)
+
+
+EXPIRY = {'gdhs': gdhs_expiry, 'info': _next_midnight}
+
+
+class HolderCache:
+    """
+    fetchers: {kind: fn(code) -> DataFrame}，返回 None 或空表视为失败
+    """
+    def __init__(self, root=HOLDER_CACHE_DIR, fetchers=None):
+        self.root = root
+        self.fetchers = dict(fetchers or {})
+        self._lock = threading.Lock()
+        self._entries = {}  # code -> 文件内容
+        self._inflight = {}  # (code, kind) -> Future
+
+    def _path(self, code):
+        return os.path.join(self.root, f"{code}.json")
+
+    def _write_json(self, path, content):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(content, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _read_json(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"[HolderCache] Unreadable {path}: {e}")
+            return None
+
+    def _entry(self, code):
+        with self._lock:
+            if code not in self._entries:
+                self._entries[code] = self._read_json(self._path(code)) or {}
+            return self._entries[code]
+
+    def get(self, code, kind, now=None):
+        """
+        返回 (DataFrame 或 None, 是否未过期)，不走网络
+        """
+        section = self._entry(str(code)).get(kind)
+        if not section:
+            return None, False
+        now = now or datetime.datetime.now()
+        fresh = now < datetime.datetime.fromisoformat(section['expires'])
+        return pd.DataFrame(section['records']), fresh
+
+    def put(self, code, kind, df, now=None):
+        code = str(code)
+        now = now or datetime.datetime.now()
+        records = json.loads(df.to_json(orient='records', date_format='iso', force_ascii=False))
+        with self._lock:
+            content = dict(self._entries.get(code) or self._read_json(self._path(code)) or {})
+            content['_meta'] = {'last_updated': now.strftime('%Y-%m-%d %H:%M:%S'), 'version': '1.0'}
+            content[kind] = {
+                'fetched_at': now.isoformat(timespec='seconds'),
+                'expires': EXPIRY[kind](now).isoformat(timespec='seconds'),
+                'records': records,
+            }
+            self._write_json(self._path(code), content)
+            self._entries[code] = content
+
+    def refresh(self, code, kind):
+        """
+        同步下载并落盘，失败时返回 None (保留旧数据)
+        """
+        df = self.fetchers[kind](str(code))
+        if is_failure(df):
+            return None
+        self.put(code, kind, df)
+        return df
+
+    def refresh_async(self, code, kind):
+        """
+        后台下载，同一 (code, kind) 同时只有一个下载；返回 Future
+        """
+        key = (str(code), kind)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = _executor.submit(self._refresh_quietly, *key)
+                future.add_done_callback(lambda _: self._inflight.pop(key, None))
+            return future
+
+    def _refresh_quietly(self, code, kind):
+        try:
+            return self.refresh(code, kind)
+        except Exception as e:
+            print(f"[HolderCache] Refresh {kind} failed for {code}: {e}")
+            return None
+
+    def lookup(self, code, kind, now=None):
+        """
+        本地数据 (可能已过期，过期时在后台刷新)；本地没有时返回 None，由调用方决定是否现场下载
+        """
+        df, fresh = self.get(code, kind, now)
+        if df is not None and not fresh:
+            self.refresh_async(code, kind)
+        return df
+
+    # --- 自选股预取 ---
+    def watch(self, codes, now=None):
+        """
+        登记自选股代码 (记录最近登记时间)，供 prefetch 使用
+        """
+        now = time.time() if now is None else now
+        path = os.path.join(self.root, WATCHLIST_FILE)
+        with self._lock:
+            content = self._read_json(path) or {}
+            seen = content.get('codes', {})
+            for code in codes:
+                seen[str(code)] = now
+            content = {'_meta': {'last_updated': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                                 'version': '1.0'},
+                       'codes': seen}
+            self._write_json(path, content)
+
+    def watched(self, now=None):
+        now = time.time() if now is None else now
+        content = self._read_json(os.path.join(self.root, WATCHLIST_FILE)) or {}
+        cutoff = now - WATCH_IDLE_DAYS * 86400
+        return sorted(code for code, seen in content.get('codes', {}).items() if seen >= cutoff)
+
+    def prefetch(self, codes=None, kinds=None, pause=PREFETCH_PAUSE):
+        """
+        把 (默认) 自选股中缺失或过期的条目逐个下载好，返回成功刷新的条目数
+        """
+        codes = self.watched() if codes is None else codes
+        kinds = list(self.fetchers) if kinds is None else kinds
+        refreshed = 0
+        for code in codes:
+            for kind in kinds:
+                df, fresh = self.get(code, kind)
+                if fresh:
+                    continue
+                if self._refresh_quietly(code, kind) is not None:
+                    refreshed += 1
+                time.sleep(pause)
+        return refreshed
@@ -0,0 +1,238 @@
+"""
+共享 HTTP 传输层
+
+所有直连东方财富/新浪/腾讯等接口的请求都走这里：
+- 一个 requests.Session，按 host 复用 keep-alive 连接 (urllib3 连接池)
+- 每个 host 的并发上限 (信号量)，避免对同一站点瞬间打出过多请求被限流
+- 统一的超时、重试和指数退避 (连接错误、超时、429/5xx、返回内容校验失败时重试)
+- JSONP 解包 (jQuery123_456({...}); -> dict)
+- 每个 host 的请求数、失败/重试次数、延迟分位数和连接复用统计
+
+    from utils import http_client
+    data = http_client.get_json(url, jsonp=True, validate=lambda d: d.get('data'))
+    text = http_client.get(url, headers={'Referer': 'http://finance.sina.com.cn'}).text
+"""
+import collections
+import json
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = 5
+DEFAULT_RETRIES = 1
+BACKOFF_BASE = 0.5  # 第 n 次重试前等待 BACKOFF_BASE * 2**n 秒 (带抖动)
+BACKOFF_MAX = 4.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+DEFAULT_HOST_LIMIT = 6
+HOST_LIMITS = {
+    'push2his.eastmoney.com': 4,
+    'push2.eastmoney.com': 4,
+    'datacenter-web.eastmoney.com': 4,
+    'hq.sinajs.cn': 8,
+    'quotes.sina.cn': 4,
+    'qt.gtimg.cn': 8,
+}
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
+    "Accept": "*/*",
+}
+LATENCY_WINDOW = 500  # 每个 host 保留最近多少次请求的延迟用于分位数
+
+
+class HttpError(Exception):
+    """重试用尽后仍失败 (状态码不对、内容校验失败或网络错误)"""
+
+
+def unwrap_jsonp(text):
+    """
+    去掉 JSONP 回调包装，返回 JSON 字符串；不是 JSONP 时原样返回
+    """
+    text = text.strip()
+    start = text.find('(')
+    end = text.rfind(')')
+    if start == -1 or end < start or text[:1] in '{[':
+        return text
+    return text[start + 1:end]
+
+
+class _HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+
+
+class HttpClient:
+    """
+    host_limits: {host: 最大并发}，未列出的 host 使用 default_limit
+    """
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, host_limits=None,
+                 default_limit=DEFAULT_HOST_LIMIT, backoff=BACKOFF_BASE, headers=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.host_limits = dict(HOST_LIMITS if host_limits is None else host_limits)
+        self.default_limit = default_limit
+
+        pool_size = max([default_limit, *self.host_limits.values()])
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS if headers is None else headers)
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._stats = collections.defaultdict(_HostStats)
+
+    def _semaphore(self, host):
+        with self._lock:
+            sem = self._semaphores.get(host)
+            if sem is None:
+                sem = self._semaphores[host] = threading.BoundedSemaphore(self.host_limits.get(host, self.default_limit))
+            return sem
+
+    def _sleep_backoff(self, attempt):
+        time.sleep(min(BACKOFF_MAX, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0))
+
+    def request(self, method, url, timeout=None, retries=None, validate=None, **kwargs):
+        """
+        发送请求并返回 requests.Response。validate(response) 返回 False 时视为失败并重试。
+        重试用尽抛出 HttpError
+        """
+        host = urlsplit(url).netloc
+        retries = self.retries if retries is None else retries
+        timeout = self.timeout if timeout is None else timeout
+        error = None
+        for attempt in range(retries + 1):
+            if attempt:
+                self._record(host, retry=True)
+                self._sleep_backoff(attempt - 1)
+            start = time.perf_counter()
+            try:
+                with self._semaphore(host):
+                    resp = self.session.request(method, url, timeout=timeout, **kwargs)
+            except requests.RequestException as e:
+                error = e
+                self._record(host, failed=True)
+                continue
+            latency = time.perf_counter() - start
+            if resp.status_code in RETRY_STATUS:
+                error = HttpError(f"HTTP {resp.status_code} from {host}")
+            elif resp.status_code >= 400:
+                self._record(host, latency, failed=True)
+                raise HttpError(f"HTTP {resp.status_code} from {host}")
+            elif validate is not None and not validate(resp):
+                error = HttpError(f"Invalid response from {host}")
+            else:
+                self._record(host, latency)
+                return resp
+            self._record(host, latency, failed=True)
+        raise HttpError(f"{method} {url} failed after {retries + 1} attempts: {error}")
+
+    def _record(self, host, latency=None, failed=False, retry=False):
+        with self._lock:
+            s = self._stats[host]
+            if retry:
+                s.retries += 1
+                return
+            s.requests += 1
+            s.failures += failed
+            if latency is not None:
+                s.latencies.append(latency)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def get_json(self, url, jsonp=False, validate=None, **kwargs):
+        """
+        GET 并解析 JSON (jsonp=True 时先解包)。validate(data) 返回 False 时重试
+        """
+        parsed = {}
+
+        def check(resp):
+            try:
+                text = unwrap_jsonp(resp.text) if jsonp else resp.text
+                parsed['data'] = json.loads(text)
+            except ValueError:
+                return False
+            return validate is None or bool(validate(parsed['data']))
+
+        self.get(url, validate=check, **kwargs)
+        return parsed['data']
+
+    def stats(self):
+        """
+        每个 host 的统计: requests, failures, retries, p50_ms, p95_ms, connections (新建连接数), reused (复用次数)
+        """
+        out = {}
+        with self._lock:
+            snapshot = [(host, s.requests, s.failures, s.retries, list(s.latencies)) for host, s in self._stats.items()]
+        for host, requests_count, failures, retries, latencies in snapshot:
+            lat = np.asarray(latencies) * 1000
+            connections = reused = 0
+            for scheme in ('http', 'https'):
+                pool = self._pool(scheme, host)
+                if pool is not None:
+                    connections += pool.num_connections
+                    reused += max(0, pool.num_requests - pool.num_connections)
+            out[host] = {
+                'requests': requests_count,
+                'failures': failures,
+                'retries': retries,
+                'p50_ms': float(np.percentile(lat, 50)) if len(lat) else None,
+                'p95_ms': float(np.percentile(lat, 95)) if len(lat) else None,
+                'connections': connections,
+                'reused': reused,
+            }
+        return out
+
+    def _pool(self, scheme, host):
+        manager = self.session.get_adapter(f"{scheme}://{host}").poolmanager
+        hostname, _, port = host.partition(':')
+        for k in list(manager.pools.keys()):
+            if k.key_scheme == scheme and k.key_host == hostname.lower() and \
+                    (not port or k.key_port == int(port)):
+                return manager.pools.get(k)
+        return None
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient()
+    return _client
+
+
+def get(url, **kwargs):
+    return get_client().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return get_client().post(url, **kwargs)
+
+
+def get_json(url, **kwargs):
+    return get_client().get_json(url, **kwargs)
+
+
+def stats():
+    return get_client().stats()
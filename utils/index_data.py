@@ -1,5 +1,5 @@
 import pandas as pd
-import requests
+from utils import http_client
 import datetime
 import os
 import json
@@ -68,7 +68,7 @@ class IndexDataManager:
         """
         api_url = f"https://quotes.sina.cn/cn/api/json_v2.php/CN_MarketDataService.getKLineData?symbol={code}&scale={scale}&ma=no&datalen={datalen}"
         try:
-            res = requests.get(api_url, headers=self.headers, timeout=5)
+            res = http_client.get(api_url, headers=self.headers, timeout=5)
             data = res.json()
             if not data:
                 return None
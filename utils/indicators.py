@@ -0,0 +1,140 @@
+"""
+向量化指标内核
+
+所有函数输入/输出均为 float64 的 NumPy 数组，不做 list 往返转换。
+utils.simulator_logic 中的 calculate_* 函数以及 MoneyFlow / SectorAnalyzer
+的指标计算都以这里为底层实现。
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+
+
+def as_float_array(values):
+    """
+    将 list / Series / ndarray 转为一维 float64 数组 (已是 float64 时不复制)
+    """
+    return np.asarray(getattr(values, 'values', values), dtype=np.float64).reshape(-1)
+
+
+def recursive_smooth(values, alpha):
+    """
+    一阶递推平滑: y[i] = alpha * x[i] + (1 - alpha) * y[i-1], 且 y[0] = x[0]
+
+    EMA、通达信 SMA、Wilder 平滑都是这个递推式的特例。
+    用 lfilter 在 C 层完成递推，初始状态 zi 取 (1-alpha)*x[0]，
+    从而保证首值与逐根循环的写法完全一致。
+    """
+    x = as_float_array(values)
+    if x.size == 0:
+        return np.array([], dtype=np.float64)
+    decay = 1.0 - alpha
+    y, _ = lfilter([alpha], [1.0, -decay], x, zi=[decay * x[0]])
+    return y
+
+
+def ema(values, span):
+    """
+    指数移动平均，alpha = 2 / (span + 1)，首值等于第一根数据
+    """
+    return recursive_smooth(values, 2.0 / (span + 1))
+
+
+def tdx_sma(values, n, m=1):
+    """
+    通达信 SMA(X, N, M): Y = (M*X + (N-M)*Y') / N，NaN 按 0 处理
+    """
+    x = np.nan_to_num(as_float_array(values), nan=0.0)
+    return recursive_smooth(x, m / n)
+
+
+def macd(close, fast_period=12, slow_period=26, signal_period=9):
+    """
+    MACD，返回 (dif, dea, hist) 三个数组，hist = (dif - dea) * 2
+    """
+    x = as_float_array(close)
+    if x.size == 0:
+        empty = np.array([], dtype=np.float64)
+        return empty, empty.copy(), empty.copy()
+    dif = ema(x, fast_period) - ema(x, slow_period)
+    dea = ema(dif, signal_period)
+    hist = (dif - dea) * 2
+    return dif, dea, hist
+
+
+def rsi(prices, period=14):
+    """
+    RSI (Wilder 平滑，alpha = 1/period)，与 pandas ewm(com=period-1, adjust=False) 口径一致。
+    数据不足 period+1 根时全部返回 50；首根以及 0/0 的位置同样填 50。
+    """
+    x = as_float_array(prices)
+    n = x.size
+    if n < period + 1:
+        return np.full(n, 50.0)
+    delta = np.diff(x)
+    up = np.clip(delta, 0, None)
+    down = -np.clip(delta, None, 0)
+    alpha = 1.0 / period
+    ma_up = recursive_smooth(up, alpha)
+    ma_down = recursive_smooth(down, alpha)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = ma_up / ma_down
+        values = 100 - (100 / (1 + rs))
+    out = np.empty(n)
+    out[0] = 50.0
+    out[1:] = np.where(np.isnan(values), 50.0, values)
+    return out
+
+
+def rolling_mean(values, period):
+    """
+    滚动均值，前 period-1 个位置为 NaN (对应 pandas rolling(period).mean())
+    """
+    x = as_float_array(values)
+    out = np.full(x.size, np.nan)
+    if 0 < period <= x.size:
+        out[period - 1:] = sliding_window_view(x, period).mean(axis=1)
+    return out
+
+
+def rolling_std(values, period, ddof=1):
+    """
+    滚动标准差 (默认样本标准差)，前 period-1 个位置为 NaN
+    """
+    x = as_float_array(values)
+    out = np.full(x.size, np.nan)
+    if 0 < period <= x.size and period > ddof:
+        out[period - 1:] = sliding_window_view(x, period).std(axis=1, ddof=ddof)
+    return out
+
+
+def bollinger(prices, period=20, num_std=2):
+    """
+    布林线，返回 (upper, middle, lower)，前 period-1 个位置为 NaN
+    """
+    middle = rolling_mean(prices, period)
+    std = rolling_std(prices, period)
+    return middle + std * num_std, middle, middle - std * num_std
+
+
+def _rolling_extreme(values, period, func, pad_value):
+    x = as_float_array(values)
+    if x.size == 0 or period <= 1:
+        return x.copy()
+    # 前补 period-1 个哨兵值，使开头不足一个窗口时也按已有数据取极值 (min_periods=1)
+    padded = np.concatenate([np.full(period - 1, pad_value), x])
+    return func(sliding_window_view(padded, period), axis=1)
+
+
+def hhv(values, period):
+    """
+    通达信 HHV: 最近 period 根 (含当根) 的最高值，开头不足 period 根时取已有数据
+    """
+    return _rolling_extreme(values, period, np.nanmax, -np.inf)
+
+
+def llv(values, period):
+    """
+    通达信 LLV: 最近 period 根 (含当根) 的最低值，开头不足 period 根时取已有数据
+    """
+    return _rolling_extreme(values, period, np.nanmin, np.inf)
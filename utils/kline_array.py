@@ -0,0 +1,172 @@
+"""
+列式 (struct-of-arrays) K线容器
+
+list-of-dict 的K线每根都要分配一个 dict，包含处理/笔识别时还会再复制一遍。
+KLineArray 用连续的 float64/int64 数组保存整条序列，切片返回共享内存的视图，
+缠论函数 (process_baohan / find_bi / calculate_bi_and_centers 等) 可直接接收。
+
+时间列统一存为 int64:
+- 'index':    模拟器的逻辑序号，行记录中的键为 'time'
+- 'datetime': 纳秒时间戳，行记录中的键为 'date'，还原为 pd.Timestamp
+- 'date':     纳秒时间戳，行记录中的键为 'date'，还原为 'YYYY-MM-DD' 字符串 (板块缓存的格式)
+"""
+import numpy as np
+import pandas as pd
+
+TIME_KEYS = {'index': 'time', 'datetime': 'date', 'date': 'date'}
+
+
+class KLineArray:
+    """
+    K线序列的列式容器。
+
+    high_time / low_time 为包含处理后合并K线的真实最高/最低点时间，
+    未经合并的序列二者与 time 共用同一数组。
+    """
+    __slots__ = ('time', 'open', 'high', 'low', 'close', 'volume', 'high_time', 'low_time', 'time_kind')
+
+    def __init__(self, time, open, high, low, close, volume=None, high_time=None, low_time=None, time_kind='index'):
+        if time_kind not in TIME_KEYS:
+            raise ValueError(f"Unknown time_kind: {time_kind}")
+        self.time = np.ascontiguousarray(time, dtype=np.int64)
+        self.open = np.ascontiguousarray(open, dtype=np.float64)
+        self.high = np.ascontiguousarray(high, dtype=np.float64)
+        self.low = np.ascontiguousarray(low, dtype=np.float64)
+        self.close = np.ascontiguousarray(close, dtype=np.float64)
+        self.volume = np.zeros(len(self.time)) if volume is None else np.ascontiguousarray(volume, dtype=np.float64)
+        self.high_time = self.time if high_time is None else np.ascontiguousarray(high_time, dtype=np.int64)
+        self.low_time = self.time if low_time is None else np.ascontiguousarray(low_time, dtype=np.int64)
+        self.time_kind = time_kind
+
+    # --- 构造 ---
+    @classmethod
+    def from_records(cls, records):
+        """
+        由 simulator 格式的 list of dict ({'time', 'open', 'high', 'low', 'close'}) 构造
+        """
+        n = len(records)
+        cols = {name: np.empty(n) for name in ('open', 'high', 'low', 'close', 'volume')}
+        time = np.empty(n, dtype=np.int64)
+        for i, k in enumerate(records):
+            time[i] = k.get('time', i)
+            cols['open'][i] = k['open']
+            cols['high'][i] = k['high']
+            cols['low'][i] = k['low']
+            cols['close'][i] = k['close']
+            cols['volume'][i] = k.get('volume', 0.0) or 0.0
+        return cls(time, time_kind='index', **cols)
+
+    @classmethod
+    def from_dataframe(cls, df, date_col='date'):
+        """
+        由 DataFrame 构造。时间取自 date_col 列，其次是 DatetimeIndex，都没有时使用行号。
+        字符串日期 ('YYYY-MM-DD') 会被解析，输出时再格式化回同样的字符串。
+        """
+        if date_col in df.columns:
+            raw = df[date_col]
+        elif isinstance(df.index, pd.DatetimeIndex):
+            raw = pd.Series(df.index)
+        else:
+            raw = None
+
+        if raw is None:
+            time, kind = np.arange(len(df), dtype=np.int64), 'index'
+        elif pd.api.types.is_datetime64_any_dtype(raw):
+            time, kind = pd.to_datetime(raw).values.astype('datetime64[ns]').astype(np.int64), 'datetime'
+        else:
+            parsed = pd.to_datetime(raw.astype(str), errors='coerce')
+            if parsed.isna().any():
+                raise ValueError(f"Unparseable dates in column '{date_col}'")
+            as_date = (parsed.dt.strftime('%Y-%m-%d') == raw.astype(str)).all()
+            time, kind = parsed.values.astype('datetime64[ns]').astype(np.int64), 'date' if as_date else 'datetime'
+
+        def col(name):
+            if name not in df.columns:
+                return None if name == 'volume' else np.full(len(df), np.nan)
+            return pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=np.float64)
+
+        return cls(time, col('open'), col('high'), col('low'), col('close'), col('volume'), time_kind=kind)
+
+    # --- 访问 ---
+    def __len__(self):
+        return len(self.time)
+
+    @property
+    def is_merged(self):
+        return self.high_time is not self.time
+
+    def time_value(self, t):
+        """
+        把 int64 时间还原为行记录中使用的值
+        """
+        if self.time_kind == 'index':
+            return int(t)
+        ts = pd.Timestamp(int(t))
+        return ts.strftime('%Y-%m-%d') if self.time_kind == 'date' else ts
+
+    def record(self, i):
+        """
+        第 i 根K线的 dict 视图 (给 UI 或仍按 dict 读取的旧代码使用)
+        """
+        rec = {
+            TIME_KEYS[self.time_kind]: self.time_value(self.time[i]),
+            'open': float(self.open[i]),
+            'high': float(self.high[i]),
+            'low': float(self.low[i]),
+            'close': float(self.close[i]),
+            'volume': float(self.volume[i]),
+        }
+        if self.is_merged:
+            rec['high_date'] = self.time_value(self.high_time[i])
+            rec['low_date'] = self.time_value(self.low_time[i])
+        return rec
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return KLineArray(
+                self.time[key], self.open[key], self.high[key], self.low[key], self.close[key], self.volume[key],
+                self.high_time[key] if self.is_merged else None,
+                self.low_time[key] if self.is_merged else None,
+                time_kind=self.time_kind,
+            )
+        return self.record(int(key))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.record(i)
+
+    def to_records(self):
+        return [self.record(i) for i in range(len(self))]
+
+    def to_dataframe(self):
+        """
+        转为以时间为索引的 DataFrame (open/high/low/close/volume)
+        """
+        if self.time_kind == 'index':
+            index = pd.Index(self.time, name='time')
+        else:
+            index = pd.DatetimeIndex(self.time.astype('datetime64[ns]'), name='date')
+        return pd.DataFrame({
+            'open': self.open, 'high': self.high, 'low': self.low,
+            'close': self.close, 'volume': self.volume,
+        }, index=index)
+
+    @property
+    def nbytes(self):
+        total = sum(getattr(self, name).nbytes for name in ('time', 'open', 'high', 'low', 'close', 'volume'))
+        if self.is_merged:
+            total += self.high_time.nbytes + self.low_time.nbytes
+        return total
+
+
+def fractal_positions(high, low):
+    """
+    向量化识别分型，返回 (位置数组, 是否顶分型数组)。规则与 identify_fenxing 一致 (顶分型优先)。
+    """
+    if len(high) < 3:
+        return np.array([], dtype=np.int64), np.array([], dtype=bool)
+    h_mid, l_mid = high[1:-1], low[1:-1]
+    is_top = (h_mid > high[:-2]) & (h_mid > high[2:])
+    is_bottom = ~is_top & (l_mid < low[:-2]) & (l_mid < low[2:])
+    pos = np.flatnonzero(is_top | is_bottom)
+    return pos + 1, is_top[pos]
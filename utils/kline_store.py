@@ -0,0 +1,225 @@
+"""
+K线本地存储
+
+每个 (代码, 周期, 复权) 一个 .npy 文件 (结构化数组，列: date/open/high/low/close/volume/amount)，
+读取时内存映射，只取需要的行；写入先写临时文件再 os.replace，保证中途退出不会留下半个文件。
+index.json 记录每个键的行数、首末时间、最近刷新和最近访问时间，用于增量刷新和淘汰冷门标的。
+
+    store = KLineStore()
+    df = store.load('600519', 'day')          # 索引为 date 的 DataFrame，不存在时为空
+    store.save('600519', 'day', merge_tail(df, fresh_df))
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+KLINE_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'kline_store')
+COLUMNS = ('open', 'high', 'low', 'close', 'volume', 'amount')
+DTYPE = np.dtype([('date', '<i8')] + [(c, '<f8') for c in COLUMNS])
+
+
+def _to_records(df):
+    rec = np.empty(len(df), dtype=DTYPE)
+    rec['date'] = np.asarray(pd.DatetimeIndex(df.index), dtype='datetime64[ns]').view('<i8')
+    for col in COLUMNS:
+        rec[col] = pd.to_numeric(df[col], errors='coerce').to_numpy(np.float64) if col in df.columns else np.nan
+    return rec
+
+
+def _to_frame(rec):
+    index = pd.DatetimeIndex(np.asarray(rec['date']).astype('datetime64[ns]'), name='date')
+    return pd.DataFrame({col: np.array(rec[col]) for col in COLUMNS}, index=index)
+
+
+def merge_tail(stored, fresh, rtol=1e-4):
+    """
+    把新下载的尾部K线接到已存储的序列后面 (同一时间以新数据为准，最后一根可能是盘中未走完的K线)
+    尾部必须与已存储数据重叠；重叠区间 (除已存储的最后一根) 收盘价不一致说明复权基准变了，
+    这两种情况返回 None，调用方应整段重新下载
+    """
+    if stored is None or stored.empty:
+        return fresh
+    if fresh is None or fresh.empty:
+        return stored
+    first = fresh.index[0]
+    if first > stored.index[-1]:
+        return None
+
+    common = stored.index[:-1].intersection(fresh.index)
+    if len(common):
+        old = stored.loc[common, 'close'].to_numpy(np.float64)
+        new = fresh.loc[common, 'close'].to_numpy(np.float64)
+        if not np.allclose(old, new, rtol=rtol, atol=0):
+            return None
+    return pd.concat([stored[stored.index < first], fresh[list(COLUMNS)]])
+
+
+class KLineStore:
+    """
+    max_entries: 最多保存的 (代码, 周期, 复权) 数量，超出时淘汰最久未访问的
+    max_idle_days: 超过该天数未访问的条目在淘汰时删除
+    """
+    INDEX_FILE = 'index.json'
+    INDEX_FLUSH_SEC = 60  # 只读访问时最多每隔多久落盘一次 index
+
+    def __init__(self, root=KLINE_STORE_DIR, max_entries=2000, max_idle_days=60):
+        self.root = root
+        self.max_entries = max_entries
+        self.max_idle_days = max_idle_days
+        self._lock = threading.RLock()
+        self._entries = None
+        self._flushed_at = 0.0
+        self._batch = 0
+
+    @staticmethod
+    def key(code, period, adjust='qfq'):
+        return f"{str(code).strip()}_{period}_{adjust or 'none'}"
+
+    def path(self, code, period, adjust='qfq'):
+        return os.path.join(self.root, self.key(code, period, adjust) + '.npy')
+
+    # --- index ---
+    def _index(self):
+        if self._entries is None:
+            self._entries = {}
+            path = os.path.join(self.root, self.INDEX_FILE)
+            if os.path.exists(path):
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        self._entries = json.load(f).get('entries', {})
+                except Exception as e:
+                    print(f"[KLineStore] Index unreadable, rebuilding: {e}")
+        return self._entries
+
+    def _write_atomic(self, path, write):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _flush_index(self):
+        content = {
+            '_meta': {
+                'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'version': '1.0',
+            },
+            'entries': self._index(),
+        }
+        data = json.dumps(content, ensure_ascii=False, indent=1).encode('utf-8')
+        self._write_atomic(os.path.join(self.root, self.INDEX_FILE), lambda f: f.write(data))
+        self._flushed_at = time.time()
+
+    def info(self, code, period, adjust='qfq'):
+        """
+        返回 {'rows', 'first', 'last', 'refreshed_at', 'last_access'}，未存储时为 None
+        """
+        with self._lock:
+            entry = self._index().get(self.key(code, period, adjust))
+            if entry and not os.path.exists(self.path(code, period, adjust)):
+                return None
+            return dict(entry) if entry else None
+
+    # --- 读写 ---
+    def load(self, code, period, adjust='qfq', tail=None):
+        """
+        读取存储的K线 (DataFrame，索引为 date)；tail 为最多读取的末尾行数。不存在或损坏时返回空表
+        """
+        return _to_frame(self.load_records(code, period, adjust, tail))
+
+    def load_records(self, code, period, adjust='qfq', tail=None):
+        """
+        同 load，但返回结构化数组 (DTYPE)，批量读取大量股票时省去 DataFrame 的构造开销
+        """
+        path = self.path(code, period, adjust)
+        with self._lock:
+            if not os.path.exists(path):
+                return np.empty(0, dtype=DTYPE)
+            try:
+                mm = np.load(path, mmap_mode='r')
+                rec = np.array(mm[-tail:] if tail else mm)
+                del mm
+            except Exception as e:
+                print(f"[KLineStore] Read failed for {path}: {e}")
+                return np.empty(0, dtype=DTYPE)
+
+            entry = self._index().get(self.key(code, period, adjust))
+            if entry is not None:
+                entry['last_access'] = time.time()
+                if time.time() - self._flushed_at > self.INDEX_FLUSH_SEC:
+                    self._flush_index()
+            return rec
+
+    def save(self, code, period, df, adjust='qfq'):
+        """
+        原子写入整段K线 (df 索引为时间，需含 open/high/low/close，可含 volume/amount)，并记为刚刷新
+        """
+        rec = _to_records(df.sort_index())
+        with self._lock:
+            self._write_atomic(self.path(code, period, adjust), lambda f: np.save(f, rec))
+            now = time.time()
+            self._index()[self.key(code, period, adjust)] = {
+                'code': str(code), 'period': period, 'adjust': adjust,
+                'rows': int(len(rec)),
+                'first': str(df.index.min()) if len(rec) else None,
+                'last': str(df.index.max()) if len(rec) else None,
+                'refreshed_at': now,
+                'last_access': now,
+            }
+            if not self._batch:
+                self.evict(now, flush=False)
+                self._flush_index()
+
+    @contextmanager
+    def batch(self):
+        """
+        批量写入 (如全市场下载) 期间 save 不再每次淘汰和落盘 index，退出时统一做一次
+        """
+        with self._lock:
+            self._batch += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch -= 1
+                if not self._batch:
+                    self.evict(flush=False)
+                    self._flush_index()
+
+    def remove(self, code, period, adjust='qfq'):
+        with self._lock:
+            self._remove(self.key(code, period, adjust))
+            self._flush_index()
+
+    def _remove(self, name):
+        self._index().pop(name, None)
+        try:
+            os.remove(os.path.join(self.root, name + '.npy'))
+        except FileNotFoundError:
+            pass
+
+    def evict(self, now=None, flush=True):
+        """
+        删除超过 max_idle_days 未访问的条目，并在超出 max_entries 时按最久未访问淘汰，返回被删除的键
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            entries = self._index()
+            by_access = sorted(entries, key=lambda k: entries[k].get('last_access', 0))
+            idle = now - self.max_idle_days * 86400
+            stale = [k for k in by_access if entries[k].get('last_access', 0) < idle]
+            overflow = by_access[:max(0, len(entries) - self.max_entries)]
+            removed = list(dict.fromkeys(stale + overflow))
+            for name in removed:
+                self._remove(name)
+            if removed and flush:
+                self._flush_index()
+            return removed
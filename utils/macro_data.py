@@ -1,5 +1,5 @@
 import pandas as pd
-import requests
+from utils import http_client
 import os
 import time
 from io import StringIO
@@ -36,13 +36,10 @@ def fetch_rmb_deposit_data(force_update=False):
 
     try:
         print(f"Fetching data from {URL}...")
-        response = requests.get(URL, headers=HEADERS)
+        # 失败时回退到已有缓存，不再重试
+        response = http_client.get(URL, headers=HEADERS, timeout=30, retries=0)
         response.encoding = 'gbk'
 
-        if response.status_code != 200:
-            print(f"Failed to fetch data: {response.status_code}")
-            return None
-        
         # Use StringIO to avoid FutureWarning
         html_io = StringIO(response.text)
         dfs = pd.read_html(html_io)
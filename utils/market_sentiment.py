@@ -1,5 +1,6 @@
 import pandas as pd
-import requests
+from utils import http_client
+from utils.hedged_fetch import HedgedFetcher
 import datetime
 import time
 import urllib3
@@ -71,25 +72,136 @@ class MarketSentiment:
         url = f"http://hq.sinajs.cn/list={code}"
         headers = {"Referer": "https://finance.sina.com.cn/"}
         try:
-            r = requests.get(url, headers=headers, timeout=5)
-            if r.status_code == 200:
-                text = r.text
-                if code in text and '"' in text:
-                    content = text.split('"')[1]
-                    parts = content.split(',')
-                    if len(parts) > 30:
-                        date_str = parts[30]
-                        # time_str = parts[31]
-                        # Index 9 is amount in Yuan
-                        amt = float(parts[9])
-                        
-                        df = pd.DataFrame({'date': [date_str], 'amount': [amt]})
-                        df['date'] = pd.to_datetime(df['date'])
-                        return df.set_index('date')['amount']
+            r = http_client.get(url, headers=headers, timeout=5, retries=0)
+            text = r.text
+            if code in text and '"' in text:
+                content = text.split('"')[1]
+                parts = content.split(',')
+                if len(parts) > 30:
+                    date_str = parts[30]
+                    # time_str = parts[31]
+                    # Index 9 is amount in Yuan
+                    amt = float(parts[9])
+                    
+                    df = pd.DataFrame({'date': [date_str], 'amount': [amt]})
+                    df['date'] = pd.to_datetime(df['date'])
+                    return df.set_index('date')['amount']
         except Exception as e:
             print(f"Fetch Sina Live failed for {code}: {e}")
         return None
 
+    # 东方财富 K线接口的备用域名 (f51: 日期, f57: 成交额)；各来源之间已有竞速和回退，单个请求不再重试
+    KLINE_URLS = [
+        "https://push2his.eastmoney.com/api/qt/stock/kline/get",
+        "http://push2his.eastmoney.com/api/qt/stock/kline/get",
+        "https://push2.eastmoney.com/api/qt/stock/kline/get"
+    ]
+
+    def _turnover_from_em(self, url, secid, beg):
+        params = {
+            "secid": secid,
+            "fields1": "f1",
+            "fields2": "f51,f57",
+            "klt": "101", # 日线
+            "fqt": "1",
+            "beg": beg,
+            "end": "20500000",
+            "lmt": "800" # 最近800天
+        }
+        # 更新 Headers 模拟浏览器
+        headers = self.headers.copy()
+        headers.update({
+            "Referer": "https://quote.eastmoney.com/",
+            "Accept": "*/*",
+            "Host": "push2.eastmoney.com" if "push2.eastmoney.com" in url else "push2his.eastmoney.com"
+        })
+        # verify=False 避免 SSL 握手失败
+        r = http_client.get(url, params=params, headers=headers, timeout=5, retries=0, verify=False)
+        data = r.json()
+        if data and data['data'] and data['data']['klines']:
+            rows = []
+            for line in data['data']['klines']:
+                dt_str, amt_str = line.split(',')
+                rows.append({'date': dt_str, 'amount': float(amt_str)})
+            df = pd.DataFrame(rows)
+            df['date'] = pd.to_datetime(df['date'])
+            return df.set_index('date')['amount']
+        return None
+
+    def _merge_live(self, series, secid):
+        """
+        用新浪实时成交额补上或覆盖当天 (历史接口通常收盘后才更新)
+        series: index=日期 的成交额，无论哪个来源胜出都在 fetch_one 中统一调用一次
+        """
+        sina_live_code = "sh000001" if secid == "1.000001" else "sz399001"
+        try:
+            live_df = self.fetch_sina_live(sina_live_code)
+            if live_df is not None and not live_df.empty:
+                live_date = live_df.index[0]
+                if live_date not in series.index:
+                    print(f"Appending Sina Live data for {sina_live_code}: {live_date.date()}")
+                series = series.copy()
+                series.loc[live_date] = live_df.iloc[0]
+                series = series.sort_index()
+        except Exception as e_live:
+            print(f"Error fetching live data: {e_live}")
+        return series
+
+    def _turnover_from_sohu(self, secid, beg):
+        # Sohu code: SH="zs_000001", SZ="zs_399106" (Composite, not Component which is smaller)
+        sohu_code = "zs_000001" if secid == "1.000001" else "zs_399106"
+        # Sohu uses YYYYMMDD for start/end
+        today_str = datetime.datetime.now(ZoneInfo('Asia/Shanghai')).strftime("%Y%m%d")
+        start_str = beg if beg and beg != "0" else "20230101"
+        params_sohu = {
+            "code": sohu_code,
+            "start": start_str,
+            "end": today_str,
+            "stat": "1",
+            "order": "D",
+            "period": "d"
+        }
+        r = http_client.get("http://q.stock.sohu.com/hisHq", params=params_sohu, headers=self.headers, timeout=5, retries=0)
+        # Response: [{"hq": [[date, open, close, ..., vol, amt(wan), ...]], "code":...}]
+        data = r.json()
+        if not (isinstance(data, list) and len(data) > 0 and 'hq' in data[0]):
+            return None
+        rows = []
+        for item in data[0]['hq']:
+            # item format: [date, open, close, change, ratio, low, high, vol, amt, ...]
+            if len(item) < 9: continue
+            # Wan Yuan to Yuan: * 10000
+            rows.append({'date': item[0], 'amount': float(item[8]) * 10000})
+        if not rows:
+            return None
+        df = pd.DataFrame(rows)
+        df['date'] = pd.to_datetime(df['date'])
+        return df.set_index('date')['amount']
+
+    def _turnover_from_sina(self, secid):
+        """
+        新浪K线只有成交量，成交额按 成交量 * 12 (平均股价) 估算，只在其他来源都失败时使用
+        """
+        sina_symbol = "sh000001" if secid == "1.000001" else "sz399001"
+        url_sina = "https://quotes.sina.cn/cn/api/json_v2.php/CN_MarketDataService.getKLineData"
+        params_sina = {
+            "symbol": sina_symbol,
+            "scale": "240",
+            "ma": "no",
+            "datalen": "800"
+        }
+        print(f"Trying Sina fallback for {sina_symbol}...")
+        r = http_client.get(url_sina, params=params_sina, headers=self.headers, timeout=5, retries=0)
+        data = r.json()
+        if not (isinstance(data, list) and len(data) > 0):
+            return None
+        # item: {'day': '2024-01-01', 'volume': '123456'}
+        rows = [{'date': item['day'], 'amount': float(item['volume']) * 12.0} for item in data]
+        df = pd.DataFrame(rows)
+        df['date'] = pd.to_datetime(df['date'])
+        print(f"Sina fallback success for {sina_symbol}")
+        return df.set_index('date')['amount']
+
     def get_sh_sz_turnover(self, beg="0"):
         """
         获取沪深两市成交额
@@ -97,192 +209,26 @@ class MarketSentiment:
         """
         # 上证指数 1.000001
         # 深证成指 0.399001
-        
-        # 东方财富 K线接口
-        # f51: 日期, f57: 成交额
-        # 尝试多个备用域名
-        self.kline_urls = [
-            "https://push2his.eastmoney.com/api/qt/stock/kline/get",
-            "http://push2his.eastmoney.com/api/qt/stock/kline/get",
-            "https://push2.eastmoney.com/api/qt/stock/kline/get"
-        ]
-        
-        def fetch_one(secid):
-            params = {
-                "secid": secid,
-                "fields1": "f1",
-                "fields2": "f51,f57",
-                "klt": "101", # 日线
-                "fqt": "1",
-                "beg": beg,
-                "end": "20500000",
-                "lmt": "800" # 最近800天
-            }
-            # 更新 Headers 模拟浏览器
-            headers = self.headers.copy()
-            headers.update({
-                "Referer": "https://quote.eastmoney.com/",
-                "Accept": "*/*",
-                "Host": "push2his.eastmoney.com"
-            })
-            
-            for url in self.kline_urls:
-                # 动态调整 Host
-                if "push2.eastmoney.com" in url:
-                    headers["Host"] = "push2.eastmoney.com"
-                else:
-                    headers["Host"] = "push2his.eastmoney.com"
 
+        def fetch_one(secid):
+            # 东财三个域名与搜狐对冲抓取，取最先返回的有效结果
+            series = _turnover_fetcher(self, secid, beg)
+            if series is None:
+                print(f"All URLs failed for {secid}")
+                # --- Fallback to Sina (Volume -> Estimated Turnover) ---
                 try:
-                    # verify=False 避免 SSL 握手失败
-                    r = requests.get(url, params=params, headers=headers, timeout=5, verify=False)
-                    if r.status_code != 200:
-                        continue
-                        
-                    data = r.json()
-                    if data and data['data'] and data['data']['klines']:
-                        klines = data['data']['klines']
-                        rows = []
-                        for line in klines:
-                            dt_str, amt_str = line.split(',')
-                            rows.append({'date': dt_str, 'amount': float(amt_str)})
-                        df = pd.DataFrame(rows)
-                        df['date'] = pd.to_datetime(df['date'])
-                        return df.set_index('date')['amount']
+                    series = self._turnover_from_sina(secid)
                 except Exception as e:
-                    print(f"Error fetching {url} for {secid}: {e}")
-            
-            print(f"All URLs failed for {secid}")
-            
-            # --- Fallback to Sohu (Has Amount!) ---
-            try:
-                # Sohu code: SH="zs_000001", SZ="zs_399106" (Composite, not Component which is smaller)
-                sohu_code = "zs_000001" if secid == "1.000001" else "zs_399106"
-                
-                # Sohu uses YYYYMMDD for start/end
-                today_str = datetime.datetime.now(ZoneInfo('Asia/Shanghai')).strftime("%Y%m%d")
-                start_str = "20230101" 
-                if beg and beg != "0":
-                    start_str = beg
-                
-                url_sohu = "http://q.stock.sohu.com/hisHq"
-                params_sohu = {
-                    "code": sohu_code,
-                    "start": start_str,
-                    "end": today_str,
-                    "stat": "1",
-                    "order": "D",
-                    "period": "d"
-                }
-                print(f"Trying Sohu fallback for {sohu_code}...")
-                r = requests.get(url_sohu, params=params_sohu, headers=self.headers, timeout=5)
-                # Response: [{"hq": [[date, open, close, ..., vol, amt(wan), ...]], "code":...}]
-                data = r.json()
-                
-                if isinstance(data, list) and len(data) > 0 and 'hq' in data[0]:
-                    hq = data[0]['hq']
-                    rows = []
-                    for item in hq:
-                        # item format: [date, open, close, change, ratio, low, high, vol, amt, ...]
-                        if len(item) < 9: continue
-                        dt_str = item[0]
-                        amt_wan = float(item[8])
-                        # Wan Yuan to Yuan: * 10000
-                        amt = amt_wan * 10000
-                        rows.append({'date': dt_str, 'amount': amt})
-                    
-                    if rows:
-                        df = pd.DataFrame(rows)
-                        df['date'] = pd.to_datetime(df['date'])
-                        print(f"Sohu fallback success for {sohu_code}")
-                        
-                        # Check if we need to append today's data from Sina Live
-                        # Sohu usually updates after close, but sometimes delays.
-                        # Always try to fetch live data for today if Sohu doesn't have it (or even if it does, live might be fresher)
-                        
-                        try:
-                            # Map secid to sina code
-                            sina_live_code = "sh000001" if secid == "1.000001" else "sz399001"
-                            live_df = self.fetch_sina_live(sina_live_code)
-                            
-                            if live_df is not None and not live_df.empty:
-                                live_date = live_df.index[0]
-                                if live_date not in df['date'].values:
-                                    print(f"Appending Sina Live data for {sina_live_code}: {live_date.date()}")
-                                    # live_df index is date, value is amount. Reset to match df format
-                                    live_row = pd.DataFrame({'date': [live_date], 'amount': [live_df.iloc[0]]})
-                                    df = pd.concat([df, live_row], ignore_index=True)
-                                else:
-                                    # Update today's data if exists (realtime is better than hisHq history if same day)
-                                    print(f"Updating today's data from Sina Live for {sina_live_code}")
-                                    df.loc[df['date'] == live_date, 'amount'] = live_df.iloc[0]
-                        except Exception as e_live:
-                            print(f"Error fetching live data: {e_live}")
-
-                        return df.set_index('date')['amount']
-            except Exception as e:
-                 print(f"Sohu fallback failed for {secid}: {e}")
+                    print(f"Sina fallback failed: {e}")
+            if series is not None:
+                return self._merge_live(series, secid)
 
-            # --- Fallback to Sina (Volume -> Estimated Turnover) ---
-            # Try Sina Live FIRST if historical Sina fails or as a supplement?
-            # If Sohu failed, we have NO historical data. 
-            # We can at least return Today's data from Sina Live to keep the app running for today.
-            
+            # 没有历史数据时至少返回今天的实时成交额
             sina_symbol = "sh000001" if secid == "1.000001" else "sz399001"
-            
-            # 1. Try Sina Live for at least TODAY's data
             live_df = self.fetch_sina_live(sina_symbol)
             if live_df is not None:
-                print(f"Sina Live success for {sina_symbol} (Single Day)")
-                # If we only have today, that's better than nothing.
-                # But if user requested historical (datalen=800), we still lack history.
-                # We can try to fetch history from Sina KLine (estimated) and overwrite today with Live.
-            
-            try:
-                # Sina symbol: SH="sh000001", SZ="sz399001"
-                url_sina = "https://quotes.sina.cn/cn/api/json_v2.php/CN_MarketDataService.getKLineData"
-                params_sina = {
-                    "symbol": sina_symbol,
-                    "scale": "240",
-                    "ma": "no",
-                    "datalen": "800"
-                }
-                print(f"Trying Sina fallback for {sina_symbol}...")
-                r = requests.get(url_sina, params=params_sina, headers=self.headers, timeout=5)
-                data = r.json()
-                if isinstance(data, list) and len(data) > 0:
-                     rows = []
-                     for item in data:
-                         # item: {'day': '2024-01-01', 'volume': '123456'}
-                         # Approx: Turnover = Volume(Shares) * 12.0 (Avg Price)
-                         vol = float(item['volume'])
-                         amt = vol * 12.0
-                         rows.append({'date': item['day'], 'amount': amt})
-                     
-                     df = pd.DataFrame(rows)
-                     df['date'] = pd.to_datetime(df['date'])
-                     print(f"Sina fallback success for {sina_symbol}")
-                     
-                     # MERGE LIVE DATA
-                     if live_df is not None:
-                         live_date = live_df.index[0]
-                         mask = df['date'] == live_date
-                         if mask.any():
-                             df.loc[mask, 'amount'] = live_df.iloc[0]
-                             print(f"Overwrote Sina estimated data with Live data for {live_date.date()}")
-                         else:
-                             live_row = pd.DataFrame({'date': [live_date], 'amount': [live_df.iloc[0]]})
-                             df = pd.concat([df, live_row], ignore_index=True)
-                     
-                     return df.set_index('date')['amount']
-            except Exception as e:
-                print(f"Sina fallback failed: {e}")
-
-            if live_df is not None:
-                 print(f"Returning Sina Live data only for {sina_symbol}")
-                 return live_df
-
-            return None
+                print(f"Returning Sina Live data only for {sina_symbol}")
+                return live_df
             return None
 
         sh = fetch_one("1.000001")
@@ -318,7 +264,7 @@ class MarketSentiment:
 
         for market, url in endpoints.items():
             try:
-                r = requests.get(url, headers=self.headers, timeout=10)
+                r = http_client.get(url, headers=self.headers, timeout=10)
                 data = r.json()
                 
                 # Jin10 数据结构: 
@@ -615,6 +561,16 @@ class MarketSentiment:
             print(f"Error calculating temperature: {e}")
             return None
 
+
+# 两市成交额的历史来源，按实测延迟与成功率排序并对冲 (新浪只有估算值，不参与竞速)
+_turnover_fetcher = HedgedFetcher('sh_sz_turnover', [
+    (f"em_{i}", lambda ms, secid, beg, url=url: ms._turnover_from_em(url, secid, beg))
+    for i, url in enumerate(MarketSentiment.KLINE_URLS)
+] + [
+    ('sohu', lambda ms, secid, beg: ms._turnover_from_sohu(secid, beg)),
+])
+
+
 if __name__ == "__main__":
     ms = MarketSentiment()
     df = ms.get_temperature_data()
@@ -1,13 +1,24 @@
 import pandas as pd
-import json
 import random
 import akshare as ak
 import datetime
-import requests
 import time
-from functools import lru_cache
+import hashlib
+import threading
+from collections import OrderedDict
 import numpy as np
-from utils.simulator_logic import calculate_macd, calculate_rsi, process_baohan, find_bi, calculate_bi_and_centers
+from utils.simulator_logic import process_baohan, ChanlunAnalysis
+from utils.chanlun_engine import ChanlunEngine
+from utils import indicators
+from utils.kline_array import KLineArray
+from utils.resample import resample_frame, resample_session
+from utils.kline_store import KLineStore, merge_tail
+from utils import http_client, quotes
+from utils.tdx_formula import compile_formula
+from utils.single_flight import single_flight
+from utils.hedged_fetch import HedgedFetcher
+from utils.holder_cache import HolderCache
+from utils.security_master import get_master
 
 _LOG_TS = {}
 
@@ -19,68 +30,55 @@ def _allow_log(key, cooldown_sec=180):
     _LOG_TS[key] = now
     return True
 
+def _em_has_klines(data):
+    return bool(data and data.get('data') and data['data'].get('klines'))
+
 # Using a simple memory cache for the current session run
 # This will be cleared when the server restarts, satisfying "not stored on server disk"
 def _fetch_em_fund_flow_direct(code, limit=1000):
-    for attempt in range(3):
-        try:
-            c_str = str(code).zfill(6)
-            # Determine secid
-            if c_str.startswith(('6', '9')):
-                secid = f"1.{c_str}"
-            else:
-                secid = f"0.{c_str}"
-                
-            cb_val = f"jQuery{random.randint(1000000000000000000, 9999999999999999999)}_{int(time.time() * 1000)}"
-            _val = int(time.time() * 1000)
-                
-            url = f"https://push2his.eastmoney.com/api/qt/stock/fflow/kline/get?cb={cb_val}&lmt={limit}&klt=101&secid={secid}&fields1=f1,f2,f3,f7&fields2=f51,f52,f53,f54,f55,f56,f57,f58,f59,f60,f61,f62,f63,f64,f65&ut=b2884a393a59ad64002292a3e90d46a5&_={_val}"
-            headers = {
-                "User-Agent": f"Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{random.randint(110, 122)}.0.0.0 Safari/537.36",
-                "Referer": "https://quote.eastmoney.com/",
-                "Accept": "*/*",
-                "Connection": "close"
-            }
+    try:
+        c_str = str(code).zfill(6)
+        # Determine secid
+        if c_str.startswith(('6', '9')):
+            secid = f"1.{c_str}"
+        else:
+            secid = f"0.{c_str}"
             
-            res = requests.get(url, headers=headers, timeout=5)
-            if res.status_code != 200:
-                time.sleep(1)
-                continue
-                
-            text = res.text
-            if "(" not in text or ")" not in text:
-                time.sleep(1)
-                continue
-                
-            json_str = text[text.find("(")+1 : text.rfind(")")]
-            data = json.loads(json_str)
+        cb_val = f"jQuery{random.randint(1000000000000000000, 9999999999999999999)}_{int(time.time() * 1000)}"
+        _val = int(time.time() * 1000)
             
-            if not (data and data.get('data') and data['data'].get('klines')):
-                time.sleep(1)
-                continue
-                
-            klines = data['data']['klines']
-            rows = []
-            for k in klines:
-                parts = k.split(',')
-                # f51: date, f52: main, f53: small, f54: mid, f55: large, f56: super large
-                rows.append({
-                    '日期': parts[0],
-                    '主力净流入-净额': float(parts[1]),
-                    '小单净流入-净额': float(parts[2]),
-                    '中单净流入-净额': float(parts[3]),
-                    '大单净流入-净额': float(parts[4]),
-                    '超大单净流入-净额': float(parts[5]),
-                })
-            return pd.DataFrame(rows)
-        except Exception as e:
-            if attempt == 2:
-                print(f"Direct EM Fund Flow fetch failed for {code}: {e}")
-            else:
-                time.sleep(random.uniform(0.5, 1.5))
+        url = f"https://push2his.eastmoney.com/api/qt/stock/fflow/kline/get?cb={cb_val}&lmt={limit}&klt=101&secid={secid}&fields1=f1,f2,f3,f7&fields2=f51,f52,f53,f54,f55,f56,f57,f58,f59,f60,f61,f62,f63,f64,f65&ut=b2884a393a59ad64002292a3e90d46a5&_={_val}"
+        headers = {
+            "User-Agent": f"Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{random.randint(110, 122)}.0.0.0 Safari/537.36",
+            "Referer": "https://quote.eastmoney.com/",
+        }
+        # 空数据多为被限流，交给传输层重试
+        data = http_client.get_json(url, headers=headers, timeout=5, retries=2, jsonp=True, validate=_em_has_klines)
+            
+        klines = data['data']['klines']
+        rows = []
+        for k in klines:
+            parts = k.split(',')
+            # f51: date, f52: main, f53: small, f54: mid, f55: large, f56: super large
+            rows.append({
+                '日期': parts[0],
+                '主力净流入-净额': float(parts[1]),
+                '小单净流入-净额': float(parts[2]),
+                '中单净流入-净额': float(parts[3]),
+                '大单净流入-净额': float(parts[4]),
+                '超大单净流入-净额': float(parts[5]),
+            })
+        return pd.DataFrame(rows)
+    except Exception as e:
+        print(f"Direct EM Fund Flow fetch failed for {code}: {e}")
     return None
 
-@lru_cache(maxsize=100)
+# 资金流与日线的成功结果只保留这么久 (秒)，与 watchlist_scheduler.FOCUS_INTERVAL['flow'] 一致，
+# 后台定时刷新时能拿到新数据，而不是一直命中第一次的结果
+_FLOW_TTL = 120
+
+
+@single_flight(maxsize=100, ttl=_FLOW_TTL)
 def _fetch_akshare_data(code, market):
     # 优先使用带抗反爬和降级的直连方式
     df = _fetch_em_fund_flow_direct(code)
@@ -97,50 +95,19 @@ def _fetch_akshare_data(code, market):
 
 import concurrent.futures
 
-@lru_cache(maxsize=100)
+@single_flight(maxsize=0)  # 由 _holder_cache 落盘缓存
 def _fetch_stock_info(code):
-    try:
-        import requests
-        c_str = str(code).zfill(6)
-        prefix = 'sh' if c_str.startswith(('6', '9')) else 'sz'
-        url = f"http://qt.gtimg.cn/q={prefix}{code}"
-        res = requests.get(url, timeout=3)
-        if res.status_code == 200 and "~" in res.text:
-            parts = res.text.split("~")
-            if len(parts) > 45:
-                # Tencent qt API index 44 is circulation shares (in shares usually), index 1 is name
-                # We need to return a dictionary that acts like Akshare's df.to_dict('records') or just a direct dict 
-                # Wait, get_stock_info parses `df.to_dict('records')`. If we return a dict directly, we must change get_stock_info too.
-                # Actually, let's just return a dict from _fetch_stock_info and fix get_stock_info.
-                float_shares = float(parts[72]) if parts[72] else None
-                # Wait, ping an bank Tencent returns 19405600653 (shares). 
-                # For 600362 it returns 2075247405 (shares) -> ~20亿.
-                # Oh wait, for 600362, Eastmoney used to return '20.8亿' or '2075247405'.
-                # Let's return a dict formatted for get_stock_info to consume safely.
-                # I will also just return a dataframe to avoid modifying get_stock_info.
-                import pandas as pd
-                return pd.DataFrame([
-                    {'item': '流通股', 'value': float_shares},
-                    {'item': '股票简称', 'value': parts[1]}
-                ])
-    except Exception as e:
-        print(f"Fetch info failed (Tencent) for {code}: {e}")
-    return None
-
-@lru_cache(maxsize=1)
-def _fetch_code_name_map():
-    try:
-        df = ak.stock_info_a_code_name()
-        if df is None or df.empty:
-            return {}
-        codes = df['code'].astype(str).str.zfill(6)
-        names = df['name'].astype(str)
-        return dict(zip(codes, names))
-    except Exception as e:
-        print(f"Fetch code-name map failed: {e}")
-        return {}
+    # 名称与流通股本来自批量行情 (腾讯 qt.gtimg.cn)，与自选股列表共用缓存
+    q = quotes.get_quote(code)
+    if q is None:
+        print(f"Fetch info failed (Tencent) for {code}")
+        return None
+    return pd.DataFrame([
+        {'item': '流通股', 'value': q['float_shares']},
+        {'item': '股票简称', 'value': q['name']}
+    ])
 
-@lru_cache(maxsize=100)
+@single_flight(maxsize=0)  # 由 _holder_cache 落盘缓存
 def _fetch_gdhs(code):
     try:
         # User suggested stock_holder_number, mapped to stock_zh_a_gdhs_detail_em used as modern replacement
@@ -165,78 +132,59 @@ def _fetch_gdhs(code):
         return None
 
 
+# 股东户数与个股信息按报告期落盘缓存，自选股在非交易时段预取
+_holder_cache = HolderCache(fetchers={'gdhs': _fetch_gdhs, 'info': _fetch_stock_info})
+
+
 def _fetch_em_kline_direct(code, klt=101, limit=1000):
-    for attempt in range(3):
-        try:
-            c_str = str(code)
-            # Determine secid
-            if c_str.startswith(('6', '9')):
-                secid = f"1.{c_str}"
-            elif c_str.startswith(('0', '3')):
-                secid = f"0.{c_str}"
-            elif c_str.startswith(('8', '4')):
-                secid = f"0.{c_str}"
-            else:
-                secid = f"0.{c_str}"
-                
-            cb_val = f"jQuery{random.randint(1000000000000000000, 9999999999999999999)}_{int(time.time() * 1000)}"
-            _val = int(time.time() * 1000)
-            
-            # User provided: ut=fa5fd1943c7b386f172d6893dbfba10b
-            url = (
-                f"https://push2his.eastmoney.com/api/qt/stock/kline/get?cb={cb_val}&secid={secid}"
-                "&ut=fa5fd1943c7b386f172d6893dbfba10b"
-                "&fields1=f1,f2,f3,f4,f5,f6&fields2=f51,f52,f53,f54,f55,f56,f57,f58,f59,f60,f61"
-                f"&klt={klt}&fqt=1&end=20500101&lmt={limit}"
-                f"&_={_val}"
-            )
-            
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
-                "Referer": "https://quote.eastmoney.com/",
-                "Accept": "*/*",
-                "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-                "Connection": "close"
-            }
+    try:
+        c_str = str(code)
+        # Determine secid
+        if c_str.startswith(('6', '9')):
+            secid = f"1.{c_str}"
+        elif c_str.startswith(('0', '3')):
+            secid = f"0.{c_str}"
+        elif c_str.startswith(('8', '4')):
+            secid = f"0.{c_str}"
+        else:
+            secid = f"0.{c_str}"
             
-            res = requests.get(url, headers=headers, timeout=5)
-            if res.status_code != 200:
-                time.sleep(1)
-                continue
-                
-            text = res.text
-            if "(" not in text or ")" not in text:
-                time.sleep(1)
-                continue
-                
-            json_str = text[text.find("(")+1 : text.rfind(")")]
-            data = json.loads(json_str)
+        cb_val = f"jQuery{random.randint(1000000000000000000, 9999999999999999999)}_{int(time.time() * 1000)}"
+        _val = int(time.time() * 1000)
+        
+        # User provided: ut=fa5fd1943c7b386f172d6893dbfba10b
+        url = (
+            f"https://push2his.eastmoney.com/api/qt/stock/kline/get?cb={cb_val}&secid={secid}"
+            "&ut=fa5fd1943c7b386f172d6893dbfba10b"
+            "&fields1=f1,f2,f3,f4,f5,f6&fields2=f51,f52,f53,f54,f55,f56,f57,f58,f59,f60,f61"
+            f"&klt={klt}&fqt=1&end=20500101&lmt={limit}"
+            f"&_={_val}"
+        )
+        
+        headers = {
+            "Referer": "https://quote.eastmoney.com/",
+            "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+        }
+        # 只被对冲抓取调用：慢或失败时由其他来源顶上，这里不再内部重试退避
+        data = http_client.get_json(url, headers=headers, timeout=5, retries=0, jsonp=True, validate=_em_has_klines)
             
-            if not (data and data.get('data') and data['data'].get('klines')):
-                # Data payload is invalid or empty
-                time.sleep(1)
-                continue
-                
-            klines = data['data']['klines']
-            rows = []
-            for k in klines:
-                parts = k.split(',')
-                # f51: Date, f52: Open, f53: Close, f54: High, f55: Low, f56: Vol, f57: Amount
-                rows.append({
-                    '日期': parts[0],
-                    '开盘': float(parts[1]),
-                    '收盘': float(parts[2]),
-                    '最高': float(parts[3]),
-                    '最低': float(parts[4]),
-                    '成交量': float(parts[5]),
-                    '成交额': float(parts[6]),
-                })
-            return pd.DataFrame(rows)
-        except Exception as e:
-            if attempt == 2:
-                print(f"Direct EM fetch failed for {code} klt={klt}: {e}")
-            else:
-                time.sleep(random.uniform(0.5, 1.5))
+        klines = data['data']['klines']
+        rows = []
+        for k in klines:
+            parts = k.split(',')
+            # f51: Date, f52: Open, f53: Close, f54: High, f55: Low, f56: Vol, f57: Amount
+            rows.append({
+                '日期': parts[0],
+                '开盘': float(parts[1]),
+                '收盘': float(parts[2]),
+                '最高': float(parts[3]),
+                '最低': float(parts[4]),
+                '成交量': float(parts[5]),
+                '成交额': float(parts[6]),
+            })
+        return pd.DataFrame(rows)
+    except Exception as e:
+        print(f"Direct EM fetch failed for {code} klt={klt}: {e}")
     return None
 
 def _fetch_sina_kline_direct(code, scale=240, datalen=1000):
@@ -249,11 +197,7 @@ def _fetch_sina_kline_direct(code, scale=240, datalen=1000):
             "https://quotes.sina.cn/cn/api/json_v2.php/"
             f"CN_MarketDataService.getKLineData?symbol={symbol}&scale={scale}&ma=no&datalen={datalen}"
         )
-        headers = {
-             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        }
-        resp = requests.get(api_url, headers=headers, timeout=5)
-        raw = resp.json()
+        raw = http_client.get_json(api_url, timeout=5)
         if raw:
             df = pd.DataFrame(raw)
             # Normalize Sina data to match EM/Akshare format
@@ -264,147 +208,251 @@ def _fetch_sina_kline_direct(code, scale=240, datalen=1000):
                 if col in df.columns:
                     df[col] = pd.to_numeric(df[col], errors='coerce')
             
-            # Add '成交额' if missing (Sina doesn't return amount usually in kline, only volume)
-            # We can approximate or leave it NaN?
+            # 新浪K线没有成交额，留空 (不用 成交量*收盘 估算，避免与其他来源的真实成交额混在一起)
             if '成交额' not in df.columns:
-                 # Approximation: Amount = Volume * Close (Roughly)
-                 # Or just leave it as None/0
-                 df['成交额'] = df['成交量'] * df['收盘']
+                df['成交额'] = np.nan
             
             return df
     except Exception as e:
         print(f"Sina direct fetch failed for {code}: {e}")
         return None
 
-@lru_cache(maxsize=100)
-def _fetch_daily_hist(code, start_date, end_date):
-    # Try Sina Direct FIRST for Buy/Sell Assistant (better stability, less anti-scraping)
-    df = _fetch_sina_kline_direct(code, scale=240)
-    if df is not None and not df.empty:
-        # Standardize date format to YYYYMMDD
-        df['日期'] = df['日期'].str.replace('-', '')
-        if start_date:
-            df = df[df['日期'] >= start_date]
-        if end_date:
-            df = df[df['日期'] <= end_date]
-        return df
+def _filter_daily(df, start_date, end_date):
+    if df is None or df.empty:
+        return None
+    # Standardize date format to YYYYMMDD
+    df['日期'] = df['日期'].str.replace('-', '')
+    if start_date:
+        df = df[df['日期'] >= start_date]
+    if end_date:
+        df = df[df['日期'] <= end_date]
+    return df
 
-    # Try Direct EM second
-    df = _fetch_em_kline_direct(code, klt=101)
-    if df is not None and not df.empty:
-        df['日期'] = df['日期'].str.replace('-', '')
-        if start_date:
-            df = df[df['日期'] >= start_date]
-        if end_date:
-            df = df[df['日期'] <= end_date]
-        return df
 
-    try:
-        df = ak.stock_zh_a_hist(symbol=code, period="daily", start_date=start_date, end_date=end_date, adjust="qfq")
+def _volume_in_shares(df):
+    """
+    东财/akshare 的成交量单位为手，统一为 quotes.py 的口径 (股)
+    """
+    if df is None or df.empty or '成交量' not in df.columns:
         return df
-    except Exception as e:
-        print(f"Fetch daily hist failed for {code}: {e}")
-        return None
+    df = df.copy()
+    df['成交量'] = pd.to_numeric(df['成交量'], errors='coerce') * 100
+    return df
 
-@lru_cache(maxsize=300)
-def _fetch_kline_hist(code, period, start_date, end_date):
-    # Fallback to Sina Direct FIRST
-    scale_map = {
-        '5m': 5,
-        '15m': 15,
-        '30m': 30,
-        '60m': 60,
-        '120m': 60,
-        'day': 240,
-        'week': 240,
-    }
-    if period in scale_map:
-        df = _fetch_sina_kline_direct(code, scale=scale_map[period])
-        if df is not None and not df.empty:
-            return df
-            
-    # Try Direct EM second
-    klt_map = {
-        'day': 101,
-        'week': 102,
-        'month': 103,
-        '5m': 5,
-        '15m': 15,
-        '30m': 30,
-        '60m': 60,
-        '120m': 60,
-    }
-    
-    if period in klt_map:
-        df = _fetch_em_kline_direct(code, klt=klt_map[period])
-        if df is not None and not df.empty:
-             return df
 
-    try:
-        period_map = {
-            'day': 'daily',
-            'week': 'weekly',
-        }
-        if period in period_map:
-            return ak.stock_zh_a_hist(
-                symbol=code,
-                period=period_map[period],
-                start_date=start_date,
-                end_date=end_date,
-                adjust="qfq"
-            )
-        minute_map = {
-            '5m': '5',
-            '15m': '15',
-            '30m': '30',
-            '60m': '60',
-            '120m': '60',
-        }
-        if period in minute_map:
-            return ak.stock_zh_a_hist_min_em(
-                symbol=code,
-                period=minute_map[period],
-                adjust="qfq"
-            )
-        return None
-    except Exception as e:
-        print(f"Fetch kline failed for {code} {period}: {e}")
-        return None
+# 日线: 东财直连 / akshare (同为前复权、成交量换算为股)，按实测延迟与成功率排序并对冲。
+# 新浪为不复权价格且没有成交额，不参与竞速，只在两者都失败时兜底
+_daily_fetcher = HedgedFetcher('daily_hist', [
+    ('em', lambda code, start_date, end_date: _volume_in_shares(
+        _filter_daily(_fetch_em_kline_direct(code, klt=101), start_date, end_date))),
+    ('akshare', lambda code, start_date, end_date: _volume_in_shares(ak.stock_zh_a_hist(
+        symbol=code, period="daily", start_date=start_date, end_date=end_date, adjust="qfq"))),
+])
+
+
+@single_flight(maxsize=100, ttl=_FLOW_TTL)
+def _fetch_daily_hist(code, start_date, end_date):
+    df = _daily_fetcher(code, start_date, end_date)
+    if df is None:
+        # 资金流只用当期价格，不落盘，不复权的数据也可以兜底
+        df = _filter_daily(_fetch_sina_kline_direct(code, scale=240), start_date, end_date)
+    return df
+
+
+_EM_KLT = {'day': 101, 'week': 102, 'month': 103, '5m': 5, '15m': 15, '30m': 30, '60m': 60, '120m': 60}
+_AK_PERIOD = {'day': 'daily', 'week': 'weekly'}
+_AK_MINUTE = {'5m': '5', '15m': '15', '30m': '30', '60m': '60', '120m': '60'}
+
+
+def _kline_from_ak(code, period, start_date, end_date, limit=1000):
+    if period in _AK_PERIOD:
+        df = ak.stock_zh_a_hist(symbol=code, period=_AK_PERIOD[period], start_date=start_date,
+                                end_date=end_date, adjust="qfq")
+    else:
+        df = ak.stock_zh_a_hist_min_em(symbol=code, period=_AK_MINUTE[period], adjust="qfq")
+    return _volume_in_shares(df)
+
+
+# 落盘的K线序列: 只用前复权、口径一致的来源 (东财直连与 akshare 同源)，
+# 新浪不复权，尾部接到复权序列上会错位，不参与
+_kline_fetcher = HedgedFetcher('kline_hist', [
+    ('em', lambda code, period, start_date, end_date, limit=1000:
+        _volume_in_shares(_fetch_em_kline_direct(code, klt=_EM_KLT[period], limit=limit)),
+        lambda code, period, *args, **kwargs: period in _EM_KLT),
+    ('akshare', _kline_from_ak,
+        lambda code, period, *args, **kwargs: period in _AK_PERIOD or period in _AK_MINUTE),
+])
+
+
+@single_flight(maxsize=0)  # K线由 KLineStore 落盘缓存，这里只合并同时进行的请求
+def _fetch_kline_hist(code, period, start_date, end_date, limit=1000):
+    return _kline_fetcher(code, period, start_date, end_date, limit)
+
+# --- 本地K线存储：每只股票只下载 5 分钟与日线两条基础序列，其余周期本地合成 ---
+_kline_store = KLineStore()
+# 周期 -> (基础周期, 合成规则)：分钟数按 A 股交易时段合成，'W-FRI' 按自然周合成
+_KLINE_DERIVED = {'15m': ('5m', 15), '30m': ('5m', 30), '60m': ('5m', 60), '120m': ('5m', 120), 'week': ('day', 'W-FRI')}
+# 5 分钟基础序列刚建立时只覆盖约 20 个交易日。合成结果不足 _KLINE_DERIVED_MIN_BARS 根时，
+# 用同级别历史 (种子，首次下载一次后存储，不随 TTL 刷新) 补足基础序列之前的部分
+_KLINE_SEED_PERIOD = {'15m': '15m', '30m': '30m', '60m': '60m', '120m': '60m'}
+_KLINE_DERIVED_MIN_BARS = 240
+_KLINE_DERIVED_CACHE = OrderedDict()  # (code, period) -> (基础序列版本, 合成结果)
+_KLINE_DERIVED_CACHE_SIZE = 64
+_KLINE_DERIVED_LOCK = threading.Lock()
+_KLINE_STORE_TTL = {'day': 300}  # 秒，分钟线默认 60
+# 每条序列最多保留的K线数，保存时截掉最早的部分，读取与计算的耗时不随使用时间增长。
+# 5 分钟约 120 个交易日，合成的 60/120 分钟都不少于 _KLINE_DERIVED_MIN_BARS 根，不再需要种子
+_KLINE_RETENTION = {'5m': 48 * 120, 'day': 2500}
+_KLINE_BARS_PER_DAY = {'5m': 48, '15m': 16, '30m': 8, '60m': 4, 'day': 1}
+_KLINE_FULL_LIMIT = 1000
+_KLINE_TAIL_OVERLAP = 5  # 尾部多取几根与已存储数据重叠，用于校验复权
+
+
+def _kline_tail_limit(period, last_ts, now):
+    """
+    从最后一根已存储K线到现在最多可能新增的K线数 (按交易日估算) 加上重叠根数
+    """
+    days = int(np.busday_count(last_ts.date(), now.date())) + 1
+    return max(days, 1) * _KLINE_BARS_PER_DAY.get(period, 1) + _KLINE_TAIL_OVERLAP
+
+
+# --- 散户数量指数：单只股票与多只股票 (面板) 共用的向量化计算 ---
+def retail_scores(small_net, price, float_shares):
+    """
+    散户分数 = 小单净流入折算的股数 / 流通股 * 10000 (万分比)
+    small_net, price: 同形状数组，单只股票为 (日期,)，面板为 (日期, 股票)；price 低于 0.1 按 0.1 计
+    float_shares: 流通股 (股)，标量或 (股票,)
+    """
+    price = np.maximum(np.asarray(price, dtype=np.float64), 0.1)
+    net_shares_wan = (np.asarray(small_net, dtype=np.float64) / price) / 10000.0
+    return net_shares_wan / (np.asarray(float_shares, dtype=np.float64) / 10000.0) * 10000
+
+
+def retail_count_index(scores, n0):
+    """
+    散户数量指数 N_t = N_0 * prod(1 + score / 10000)，沿日期 (第 0 维) 累乘
+    """
+    return np.asarray(n0, dtype=np.float64) * np.cumprod(1 + np.asarray(scores, dtype=np.float64) / 10000.0, axis=0)
+
+
+def sector_retail_crowding(small_net, price, float_shares, n0=None):
+    """
+    板块"散户拥挤度"：对成分股面板一次算出各股散户分数/数量指数，并按流通股加权汇总
+    small_net, price: DataFrame (索引日期，列为股票代码)；float_shares, n0: Series (索引股票代码)，n0 缺省为 50000
+    返回 {'scores', 'counts': DataFrame, 'aggregate': DataFrame[retail_score, retail_count_index, coverage]}
+    缺数据的日期该股分数记为 0 (数量不变)，不计入当日加权分数；retail_count_index 为成分股数量合计相对期初的百分比
+    """
+    codes = small_net.columns
+    price = price.reindex(index=small_net.index, columns=codes)
+    shares = float_shares.reindex(codes).astype(float)
+    n0 = pd.Series(50000.0, index=codes) if n0 is None else n0.reindex(codes).fillna(50000.0).astype(float)
+
+    scores = pd.DataFrame(retail_scores(small_net.values, price.values, shares.values), index=small_net.index, columns=codes)
+    valid = scores.notna().values & np.isfinite(scores.values)
+    filled = np.where(valid, scores.values, 0.0)
+    counts = pd.DataFrame(retail_count_index(filled, n0.values), index=small_net.index, columns=codes)
+
+    weights = np.where(valid, np.nan_to_num(shares.values), 0.0)
+    weight_sum = weights.sum(axis=1)
+    aggregate = pd.DataFrame({
+        'retail_score': np.divide((filled * weights).sum(axis=1), weight_sum,
+                                  out=np.full(len(scores), np.nan), where=weight_sum > 0),
+        'retail_count_index': counts.values.sum(axis=1) / n0.values.sum() * 100,
+        'coverage': valid.sum(axis=1),
+    }, index=small_net.index)
+    return {'scores': scores, 'counts': counts, 'aggregate': aggregate}
+
+
+# 买卖助手的通达信公式 (QSX 趋势线、放量突破/KDJ 超跌/乖离，三类买点与对应卖点)
+BUY_SELL_FORMULA = """
+MA60:MA(C,60);
+QSUP:=MA60>REF(MA60,1);
+QSX:EMA(C,13);
+VUP:=VOL>MA(VOL,20)*1.5;
+TPM:=CROSS(C,QSX) AND VUP;
+RSV1:=(C-LLV(L,9))/(HHV(H,9)-LLV(L,9))*100;
+K1:=SMA(RSV1,3,1);
+D1:=SMA(K1,3,1);
+J1:=3*K1-2*D1;
+CDM:=REF(J1,1)<0 AND J1>REF(J1,1) AND QSUP;
+MA10:MA(C,10);
+GLL:=(C-MA10)/MA10*100;
+GLV:=MA(ABS(C-MA10)/MA10*100,60)*2.5;
+GLM:=GLL<-GLV AND C>L;
+ZHM:TPM OR CDM OR GLM;
+PDM:=CROSS(QSX,C);
+CBM:=REF(J1,1)>100 AND J1<REF(J1,1) AND NOT(QSUP);
+GLS:=GLL>GLV AND C<H;
+ZHS:PDM OR CBM OR GLS;
+PH:=MAX(H-L,C*0.005);
+BUYY:L-PH*0.6;
+SELLY:H+PH*0.6;
+WAVE:(C-QSX)/QSX*100;
+MA5:MA(C,5);
+MA20:MA(C,20);
+MA30:MA(C,30);
+"""
+MACD_FORMULA = """
+DIF:EMA(C,12)-EMA(C,26);
+DEA:EMA(DIF,9);
+MACD:(DIF-DEA)*2;
+GC:CROSS(DIF,DEA);
+DC:CROSS(DEA,DIF);
+"""
+
+# 买卖助手的增量状态: (code, period) -> _AssistantState
+# 盘中只有最后一根K线在变，历史部分 (公式各节点序列、缠论引擎、RSI 平滑值) 保存下来，刷新时只算最后一根
+_ASSISTANT_STATES = OrderedDict()
+_ASSISTANT_STATES_SIZE = 32
+_ASSISTANT_LOCK = threading.Lock()
+_ASSISTANT_MIN_BARS = 61  # 至少覆盖 MA60 窗口，更短的序列直接全量计算
+_ASSISTANT_COLUMNS = ['qsx', 'buy_signal', 'sell_signal', 'buy_y', 'sell_y', 'wave_pct', 'ma5', 'ma10', 'ma20',
+                      'ma30', 'ma60', 'dif', 'dea', 'macd_hist', 'golden_cross', 'dead_cross']
+_RSI_PERIOD = 14
+
+
+def _history_fingerprint(df):
+    """
+    除最后一根以外的K线 (时间 + 高低收量) 的指纹，用于判断历史是否变化 (复权、补数据、换日)
+    """
+    h = hashlib.blake2b(digest_size=16)
+    idx = df.index[:-1]
+    if isinstance(idx, pd.DatetimeIndex):
+        h.update(idx.asi8.tobytes())
+    else:
+        h.update(pd.util.hash_array(np.asarray(idx, dtype=object)).tobytes())
+    for col in ('high', 'low', 'close', 'volume'):
+        h.update(np.nan_to_num(df[col].to_numpy(dtype=np.float64)[:-1]).tobytes())
+    return h.hexdigest()
+
+
+class _AssistantState:
+    """
+    某只股票某个周期的买卖助手在 "历史K线" (除最后一根) 上的计算结果
+    """
+    def __init__(self, fingerprint, formula, macd, columns, engine, high, close, rsi_smooth, last_buy, last_sell):
+        self.fingerprint = fingerprint
+        self.formula = formula  # BUY_SELL_FORMULA 的 FormulaState
+        self.macd = macd  # MACD_FORMULA 的 FormulaState
+        self.columns = columns  # 输出列在历史上的取值
+        self.engine = engine  # 推入了全部历史K线的 ChanlunEngine
+        self.high = high
+        self.close = close
+        self.rsi_smooth = rsi_smooth  # (上涨均值, 下跌均值)
+        self.last_buy = last_buy  # 历史上最后一个买/卖信号的位置，没有为 -1
+        self.last_sell = last_sell
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.close)
 
-def _fetch_sina_quote(symbol):
-    try:
-        url = f"http://hq.sinajs.cn/list={symbol}"
-        headers = {'Referer': 'http://finance.sina.com.cn'}
-        r = requests.get(url, headers=headers, timeout=1.2)
-        if r.status_code != 200:
-            return None
-        parts = r.text.split('=', 1)
-        if len(parts) < 2:
-            return None
-        val = parts[1].strip().strip('";')
-        if not val:
-            return None
-        q = val.split(',')
-        if len(q) < 10:
-            return None
-        now = datetime.datetime.now()
-        return {
-            'date': pd.to_datetime(now.date()),
-            'open': float(q[1]),
-            'close': float(q[3]),
-            'high': float(q[4]),
-            'low': float(q[5]),
-            'volume': float(q[8]),
-            'amount': float(q[9]),
-        }
-    except Exception:
-        return None
 
 class MoneyFlow:
     """
     Refactored MoneyFlow to have NO server-side persistence (no JSON, no CSV).
     Subscription list should be handled by the UI (storage.user or client local storage).
-    Data caching is done in-memory only.
+    Data caching is done in-memory, except K-line history which lives in the local KLineStore
+    (data/kline_store) and is refreshed tail-only.
     """
     def __init__(self):
         pass
@@ -423,33 +471,35 @@ class MoneyFlow:
                 pass
         return info
 
+    def get_quotes(self, codes):
+        """
+        批量实时行情 {code: {name, price, open, high, low, prev_close, volume, amount, date, float_shares}}
+        """
+        return quotes.get_quotes(codes)
+
+    def watch_codes(self, codes):
+        """
+        登记自选股，非交易时段由 prefetch_holder_data 预取股东户数与个股信息
+        """
+        _holder_cache.watch([str(c).strip().zfill(6) for c in codes if str(c).strip()])
+
+    def prefetch_holder_data(self):
+        """
+        把自选股中缺失或过期的股东户数与个股信息下载到本地，返回刷新的条目数
+        """
+        return _holder_cache.prefetch()
+
     def get_stock_name(self, code):
         code = str(code).strip().zfill(6)
 
-        try:
-            prefix = 'sh' if code.startswith('6') or code.startswith('9') else 'sz'
-            if code.startswith('8') or code.startswith('4'): 
-                prefix = 'bj'
-
-            url = f"http://hq.sinajs.cn/list={prefix}{code}"
-            headers = {'Referer': 'http://finance.sina.com.cn'}
-            r = requests.get(url, headers=headers, timeout=1.2)
-            if r.status_code == 200:
-                parts = r.text.split('=', 1)
-                if len(parts) < 2:
-                    return None
-                val = parts[1].strip().strip('";')
-                if val:
-                    quote_parts = val.split(',')
-                    if len(quote_parts) > 1 and quote_parts[0]:
-                        return quote_parts[0]
-        except Exception as e:
-            print(f"Sina name fetch failed: {e}")
+        # 本地证券主表，不走网络
+        row = get_master().get(code)
+        if row:
+            return row['name']
 
-        name_map = _fetch_code_name_map()
-        name = name_map.get(code)
-        if name:
-            return name
+        q = quotes.get_quote(code)
+        if q and q.get('name'):
+            return q['name']
 
         info = self.get_stock_info(code)
         name = info.get('股票简称')
@@ -459,6 +509,9 @@ class MoneyFlow:
         return None
 
     def guess_market(self, code):
+        market = get_master().market(code)
+        if market:
+            return market
         if code.startswith('6'):
             return 'sh'
         elif code.startswith('9'):
@@ -507,48 +560,126 @@ class MoneyFlow:
         out.set_index('date', inplace=True)
         return out[['open', 'high', 'low', 'close', 'volume', 'amount']]
 
-    def _to_120m(self, df):
-        if df is None or df.empty:
-            return pd.DataFrame()
-        if not isinstance(df.index, pd.DatetimeIndex):
+    def refresh_kline(self, code, period, store=None):
+        """
+        把 code 的 period K线增量更新到本地存储 (TTL 内不下载)，返回存储中的完整K线
+        store: 默认为 _kline_store，全市场选股传入自己的存储
+        """
+        return self._get_stored_kline(code, period, store=store)
+
+    def _get_stored_kline(self, code, period, force_update=False, store=None):
+        """
+        从本地K线存储读取；超过 TTL (或 force_update) 时只下载最后一根已存储K线之后的新K线并接上，
+        尾部接不上或复权基准变化时整段重新下载。下载失败时返回已存储的旧数据
+        store: 默认为 _kline_store，全市场选股使用自己的存储
+        """
+        code = str(code)
+        store = store or _kline_store
+        info = store.info(code, period)
+        stored = store.load(code, period)
+        ttl = _KLINE_STORE_TTL.get(period, 60)
+        if info and not force_update and time.time() - info['refreshed_at'] < ttl:
+            return stored
+
+        end_dt = datetime.datetime.now()
+        end_str = end_dt.strftime('%Y%m%d')
+        daily = period == 'day'
+        if not stored.empty:
+            last_ts = stored.index[-1]
+            limit = _kline_tail_limit(period, last_ts, end_dt)
+            if limit < _KLINE_FULL_LIMIT:
+                start_str = (last_ts - datetime.timedelta(days=2 * _KLINE_TAIL_OVERLAP)).strftime('%Y%m%d') if daily else ''
+                tail = self._normalize_kline_df(_fetch_kline_hist(code, period, start_str, end_str, limit))
+                if tail.empty:
+                    return stored
+                merged = merge_tail(stored, tail)
+                if merged is not None:
+                    return self._save_kline(store, code, period, merged)
+
+        start_str = (end_dt - datetime.timedelta(days=900)).strftime('%Y%m%d') if daily else ''
+        df = self._normalize_kline_df(_fetch_kline_hist(code, period, start_str, end_str, _KLINE_FULL_LIMIT))
+        if df.empty:
+            return stored
+        if not stored.empty and period == '5m':
+            # 基础序列整段重下 (复权基准变化或长期未访问)，种子一并作废
+            self._drop_kline_seeds(store, code)
+        return self._save_kline(store, code, period, df)
+
+    def _save_kline(self, store, code, period, df):
+        """
+        按 _KLINE_RETENTION 截掉最早的K线后保存。5 分钟基础序列被截断后与种子之间会出现缺口，种子一并作废
+        """
+        limit = _KLINE_RETENTION.get(period)
+        if limit and len(df) > limit:
+            df = df.iloc[-limit:]
+            if period == '5m':
+                self._drop_kline_seeds(store, code)
+        store.save(code, period, df)
+        return df
+
+    def _drop_kline_seeds(self, store, code):
+        for seed_period in set(_KLINE_SEED_PERIOD.values()):
+            if store.info(code, seed_period):
+                store.remove(code, seed_period)
+
+    def _get_kline_seed(self, code, period):
+        """
+        合成周期在基础序列之前的历史：本地已有直接用，否则整段下载一次存储
+        """
+        seed = _kline_store.load(code, period)
+        if seed.empty:
+            end_str = datetime.datetime.now().strftime('%Y%m%d')
+            seed = self._normalize_kline_df(_fetch_kline_hist(code, period, '', end_str, _KLINE_FULL_LIMIT))
+            if not seed.empty:
+                _kline_store.save(code, period, seed)
+        return seed
+
+    def _derive_kline(self, code, period, base):
+        """
+        由基础序列合成 period 周期K线，按基础序列版本 (行数与首末K线) 缓存，基础序列没变时直接返回
+        """
+        if base is None or base.empty:
             return pd.DataFrame()
-        agg = df.resample('120min', label='right', closed='right').agg({
-            'open': 'first',
-            'high': 'max',
-            'low': 'min',
-            'close': 'last',
-            'volume': 'sum',
-            'amount': 'sum',
-        })
-        return agg.dropna(subset=['open', 'close', 'high', 'low'])
-
-    def _tdx_sma(self, series, n, m=1):
-        clean = pd.to_numeric(series, errors='coerce').fillna(0.0)
-        if clean.empty:
-            return clean
-        result = []
-        prev = float(clean.iloc[0])
-        for val in clean:
-            prev = (m * float(val) + (n - m) * prev) / n
-            result.append(prev)
-        return pd.Series(result, index=clean.index)
+        key = (str(code), period)
+        version = (len(base), base.index[0], base.index[-1], tuple(base.iloc[-1].tolist()))
+        with _KLINE_DERIVED_LOCK:
+            hit = _KLINE_DERIVED_CACHE.get(key)
+            if hit is not None and hit[0] == version:
+                _KLINE_DERIVED_CACHE.move_to_end(key)
+                return hit[1]
+
+        _, rule = _KLINE_DERIVED[period]
+        if isinstance(rule, int):
+            df = resample_session(base, rule)
+            if len(df) < _KLINE_DERIVED_MIN_BARS:
+                seed = resample_session(self._get_kline_seed(code, _KLINE_SEED_PERIOD[period]), rule)
+                if not seed.empty:
+                    cut = df.index[0]
+                    if seed.index[-1] >= cut:
+                        # 基础序列的第一根合成K线可能不完整，以种子为准
+                        df = pd.concat([seed[seed.index <= cut], df[df.index > cut]])
+                    else:
+                        df = pd.concat([seed, df])
+        else:
+            df = resample_frame(base, rule)
+
+        with _KLINE_DERIVED_LOCK:
+            _KLINE_DERIVED_CACHE[key] = (version, df)
+            _KLINE_DERIVED_CACHE.move_to_end(key)
+            while len(_KLINE_DERIVED_CACHE) > _KLINE_DERIVED_CACHE_SIZE:
+                _KLINE_DERIVED_CACHE.popitem(last=False)
+        return df
 
     def get_kline_data(self, code, period='day', force_update=False):
-        if force_update:
-            _fetch_kline_hist.cache_clear()
         end_dt = datetime.datetime.now()
-        if period in ['day', 'week']:
-            start_dt = end_dt - datetime.timedelta(days=900)
-            raw_df = _fetch_kline_hist(code, period, start_dt.strftime('%Y%m%d'), end_dt.strftime('%Y%m%d'))
-        else:
-            raw_df = _fetch_kline_hist(code, period, '', '')
-        df = self._normalize_kline_df(raw_df)
+        base_period, _ = _KLINE_DERIVED.get(period, (period, None))
+        df = self._get_stored_kline(code, base_period, force_update)
         if period == 'day':
             try:
                 start_recent = (end_dt - datetime.timedelta(days=10)).strftime('%Y%m%d')
                 end_recent = end_dt.strftime('%Y%m%d')
                 recent_ak = ak.stock_zh_a_hist(symbol=code, period='daily', start_date=start_recent, end_date=end_recent, adjust='qfq')
-                recent_df = self._normalize_kline_df(recent_ak)
+                recent_df = self._normalize_kline_df(_volume_in_shares(recent_ak))
                 if not recent_df.empty:
                     df = pd.concat([df, recent_df]).sort_index()
                     df = df[~df.index.duplicated(keep='last')]
@@ -556,32 +687,24 @@ class MoneyFlow:
                 if _allow_log(f"recent_daily_fallback_{code}", cooldown_sec=300):
                     print(f"Fetch recent daily fallback failed for {code}: {e}")
 
-            symbol = f"{'sh' if str(code).startswith(('6', '9')) else 'sz'}{str(code).zfill(6)}"
-            if str(code).startswith(('8', '4')):
-                symbol = f"bj{str(code).zfill(6)}"
-            quote_row = _fetch_sina_quote(symbol)
-            if quote_row and quote_row['close'] > 0:
-                qd = quote_row['date']
-                if qd not in df.index or abs(float(df.loc[qd, 'close']) - quote_row['close']) > 1e-8:
+            q = quotes.get_quote(code)
+            if q and q['price'] and q['price'] > 0 and pd.notna(q['date']):
+                qd = q['date']
+                if qd not in df.index or abs(float(df.loc[qd, 'close']) - q['price']) > 1e-8:
                     df.loc[qd, ['open', 'high', 'low', 'close', 'volume', 'amount']] = [
-                        quote_row['open'], quote_row['high'], quote_row['low'], quote_row['close'], quote_row['volume'], quote_row['amount']
+                        q['open'], q['high'], q['low'], q['price'], q['volume'], q['amount']
                     ]
                 df = df.sort_index()
 
-        if period == '120m':
-            df = self._to_120m(df)
-        elif period == 'week' and not df.empty:
-            df = df.resample('W-FRI').agg({
-                'open': 'first',
-                'high': 'max',
-                'low': 'min',
-                'close': 'last',
-                'volume': 'sum',
-                'amount': 'sum',
-            }).dropna(subset=['open', 'high', 'low', 'close'])
+        if period in _KLINE_DERIVED:
+            df = self._derive_kline(code, period, df)
         return df
 
-    def build_buy_sell_assistant(self, kline_df):
+    def build_buy_sell_assistant(self, kline_df, cache_key=None):
+        """
+        cache_key: 如 (code, period)。给定时保存历史部分的计算状态，之后只有最后一根K线变化
+        (盘中刷新) 时增量计算，结果与全量计算一致
+        """
         if kline_df is None or kline_df.empty:
             return {'kline': pd.DataFrame(), 'analysis': {}}
         df = kline_df.copy()
@@ -624,64 +747,134 @@ class MoneyFlow:
             # print(f"Volume projection failed: {e}")
             pass
 
-        ma60 = close.rolling(60, min_periods=1).mean()
-        qsup = ma60 > ma60.shift(1)
-        qsx = close.ewm(span=13, adjust=False).mean()
-        vup = volume > (volume.rolling(20, min_periods=1).mean() * 1.5)
-        tpm = (close > qsx) & (close.shift(1) <= qsx.shift(1)) & vup
-        llv9 = low.rolling(9, min_periods=1).min()
-        hhv9 = high.rolling(9, min_periods=1).max()
-        rsv1 = ((close - llv9) / (hhv9 - llv9).replace(0, pd.NA) * 100).fillna(0)
-        k1 = self._tdx_sma(rsv1, 3, 1)
-        d1 = self._tdx_sma(k1, 3, 1)
-        j1 = 3 * k1 - 2 * d1
-        cdm = (j1.shift(1) < 0) & (j1 > j1.shift(1)) & qsup
-        ma10 = close.rolling(10, min_periods=1).mean()
-        gll = ((close - ma10) / ma10.replace(0, pd.NA) * 100).fillna(0)
-        avggl = (((close - ma10).abs() / ma10.replace(0, pd.NA) * 100).fillna(0)).rolling(60, min_periods=1).mean()
-        glv = avggl * 2.5
-        glm = (gll < -glv) & (close > low)
-        zhm = (tpm | cdm | glm).fillna(False)
-        pdm = (qsx > close) & (qsx.shift(1) <= close.shift(1))
-        cbm = (j1.shift(1) > 100) & (j1 < j1.shift(1)) & (~qsup)
-        gls = (gll > glv) & (close < high)
-        zhs = (pdm | cbm | gls).fillna(False)
-        ph = pd.concat([(high - low), close * 0.005], axis=1).max(axis=1).fillna(0)
-        buy_y = low - ph * 0.6
-        sell_y = high + ph * 0.6
-        wave_pct = ((close - qsx) / qsx.replace(0, pd.NA) * 100).fillna(0)
-        ma5 = close.rolling(5, min_periods=1).mean()
-        ma10_line = close.rolling(10, min_periods=1).mean()
-        ma20 = close.rolling(20, min_periods=1).mean()
-        ma30 = close.rolling(30, min_periods=1).mean()
-        ma60_line = close.rolling(60, min_periods=1).mean()
-        macd = calculate_macd(close.ffill().bfill().tolist())
-        dif = pd.Series(macd.get('dif', []), index=df.index[-len(macd.get('dif', [])):]) if macd.get('dif') else pd.Series(0.0, index=df.index)
-        dea = pd.Series(macd.get('dea', []), index=df.index[-len(macd.get('dea', [])):]) if macd.get('dea') else pd.Series(0.0, index=df.index)
-        hist = pd.Series(macd.get('hist', []), index=df.index[-len(macd.get('hist', [])):]) if macd.get('hist') else pd.Series(0.0, index=df.index)
-        dif = dif.reindex(df.index).fillna(0.0)
-        dea = dea.reindex(df.index).fillna(0.0)
-        hist = hist.reindex(df.index).fillna(0.0)
-        golden_cross = (dif > dea) & (dif.shift(1) <= dea.shift(1))
-        dead_cross = (dif < dea) & (dif.shift(1) >= dea.shift(1))
+        incremental = cache_key is not None and len(df) > _ASSISTANT_MIN_BARS and \
+            not any(np.isnan(df[col].to_numpy(dtype=np.float64)).any() for col in ('high', 'low', 'close'))
+        if incremental:
+            fingerprint = _history_fingerprint(df)
+            with _ASSISTANT_LOCK:
+                state = _ASSISTANT_STATES.get(cache_key)
+                if state is not None:
+                    _ASSISTANT_STATES.move_to_end(cache_key)
+            if state is not None and state.fingerprint == fingerprint and len(state) == len(df) - 1:
+                return self._step_buy_sell_assistant(state, df, volume)
+
+        values = compile_formula(BUY_SELL_FORMULA).evaluate({'close': close.values, 'high': high.values,
+                                                              'low': low.values, 'vol': volume.values})
+        res = {name: pd.Series(v, index=df.index) for name, v in values.items()}
+        zhm = res['ZHM'] > 0
+        zhs = res['ZHS'] > 0
+        wave_pct = res['WAVE']
+        macd_state = compile_formula(MACD_FORMULA).prime({'close': close.ffill().bfill().values})
+        macd = {name: pd.Series(v, index=df.index).fillna(0.0) for name, v in macd_state.outputs.items()}
+        dif, dea, hist = macd['DIF'], macd['DEA'], macd['MACD']
+        golden_cross = macd['GC'] > 0
+        dead_cross = macd['DC'] > 0
         out = df.copy()
-        out['qsx'] = qsx
+        out['qsx'] = res['QSX']
         out['buy_signal'] = zhm
         out['sell_signal'] = zhs
-        out['buy_y'] = buy_y
-        out['sell_y'] = sell_y
+        out['buy_y'] = res['BUYY']
+        out['sell_y'] = res['SELLY']
         out['wave_pct'] = wave_pct
-        out['ma5'] = ma5
-        out['ma10'] = ma10_line
-        out['ma20'] = ma20
-        out['ma30'] = ma30
-        out['ma60'] = ma60_line
+        out['ma5'] = res['MA5']
+        out['ma10'] = res['MA10']
+        out['ma20'] = res['MA20']
+        out['ma30'] = res['MA30']
+        out['ma60'] = res['MA60']
         out['dif'] = dif
         out['dea'] = dea
         out['macd_hist'] = hist
         out['golden_cross'] = golden_cross.fillna(False)
         out['dead_cross'] = dead_cross.fillna(False)
         analysis = self.build_chanlun_assistant(df, zhm, zhs, wave_pct)
+        if incremental:
+            self._save_assistant_state(cache_key, fingerprint, df, out, macd_state)
+        return {'kline': out, 'analysis': analysis}
+
+    def _save_assistant_state(self, cache_key, fingerprint, df, out, macd_state):
+        """
+        全量计算之后，把除最后一根以外的部分保存为增量状态 (公式都只依赖当前及之前的K线，截掉最后一根即为历史上的结果)
+        """
+        hist_df = df.iloc[:-1]
+        inputs = {'close': hist_df['close'].values, 'high': hist_df['high'].values,
+                  'low': hist_df['low'].values, 'vol': hist_df['volume'].fillna(0).values}
+        closes = hist_df['close'].to_numpy(dtype=np.float64)
+        delta = np.diff(closes)
+        alpha = 1.0 / _RSI_PERIOD
+        rsi_smooth = (indicators.recursive_smooth(np.clip(delta, 0, None), alpha)[-1],
+                      indicators.recursive_smooth(-np.clip(delta, None, 0), alpha)[-1])
+        buy_pos = np.flatnonzero(out['buy_signal'].values[:-1])
+        sell_pos = np.flatnonzero(out['sell_signal'].values[:-1])
+        state = _AssistantState(
+            fingerprint,
+            compile_formula(BUY_SELL_FORMULA).prime(inputs),
+            macd_state.head(len(hist_df)),
+            {col: out[col].values[:-1] for col in _ASSISTANT_COLUMNS},
+            ChanlunEngine(KLineArray.from_dataframe(hist_df)),
+            hist_df['high'].to_numpy(dtype=np.float64),
+            closes,
+            rsi_smooth,
+            int(buy_pos[-1]) if len(buy_pos) else -1,
+            int(sell_pos[-1]) if len(sell_pos) else -1,
+        )
+        with _ASSISTANT_LOCK:
+            _ASSISTANT_STATES[cache_key] = state
+            _ASSISTANT_STATES.move_to_end(cache_key)
+            while len(_ASSISTANT_STATES) > _ASSISTANT_STATES_SIZE:
+                _ASSISTANT_STATES.popitem(last=False)
+
+    def _step_buy_sell_assistant(self, state, df, volume):
+        """
+        历史未变时只计算最后一根K线: 公式节点、MACD、RSI 递推一步，缠论引擎试推最后一根后回滚
+        """
+        last = df.iloc[-1]
+        c, h, l = float(last['close']), float(last['high']), float(last['low'])
+        res = compile_formula(BUY_SELL_FORMULA).step(state.formula, {'close': c, 'high': h, 'low': l,
+                                                                     'vol': float(volume.iloc[-1])})
+        macd = compile_formula(MACD_FORMULA).step(state.macd, {'close': c})
+        new = {
+            'qsx': res['QSX'], 'buy_signal': res['ZHM'] > 0, 'sell_signal': res['ZHS'] > 0,
+            'buy_y': res['BUYY'], 'sell_y': res['SELLY'], 'wave_pct': res['WAVE'],
+            'ma5': res['MA5'], 'ma10': res['MA10'], 'ma20': res['MA20'], 'ma30': res['MA30'], 'ma60': res['MA60'],
+            'dif': macd['DIF'], 'dea': macd['DEA'], 'macd_hist': macd['MACD'],
+            'golden_cross': macd['GC'] > 0, 'dead_cross': macd['DC'] > 0,
+        }
+        out = pd.concat([df, pd.DataFrame({col: np.append(state.columns[col], new[col]) for col in _ASSISTANT_COLUMNS},
+                                          index=df.index)], axis=1)
+
+        alpha = 1.0 / _RSI_PERIOD
+        delta = c - state.close[-1]
+        up = alpha * max(delta, 0.0) + (1.0 - alpha) * state.rsi_smooth[0]
+        down = alpha * max(-delta, 0.0) + (1.0 - alpha) * state.rsi_smooth[1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi_last = float(100 - (100 / (1 + np.float64(up) / down)))
+        if np.isnan(rsi_last):
+            rsi_last = 50.0
+
+        n = len(state)
+        last_buy = n if new['buy_signal'] else state.last_buy
+        last_sell = n if new['sell_signal'] else state.last_sell
+        last_signal = '暂无'
+        if last_buy >= 0 or last_sell >= 0:
+            last_signal = f'最近信号：{"买" if last_buy > last_sell else "卖"}'
+
+        if isinstance(df.index, pd.DatetimeIndex) and 'date' not in df.columns:
+            # 与 KLineArray.from_dataframe(df).record(-1) 相同，省去整表转换
+            bar = {'date': df.index[-1], 'open': float(last['open']), 'high': h, 'low': l, 'close': c,
+                   'volume': float(last['volume'])}
+        else:
+            bar = KLineArray.from_dataframe(df.iloc[-1:])[0]
+        with state.lock:
+            token = state.engine.checkpoint()
+            state.engine.push(bar)
+            bi_points = state.engine.bi_points()
+            centers = state.engine.bi_and_centers()[1]
+            state.engine.rollback(token)
+
+        analysis = self._compose_chanlun_assistant(
+            bi_points, centers, c, float(macd['DIF']), float(macd['DEA']), rsi_last,
+            float(res['MA5']), float(res['MA10']), float(res['MA20']), float(res['MA60']),
+            float(np.nanmax(np.append(state.high[-29:], h))), last_signal, float(res['WAVE']))
         return {'kline': out, 'analysis': analysis}
 
     def build_chanlun_assistant(self, df, buy_signal=None, sell_signal=None, wave_pct=None):
@@ -704,20 +897,35 @@ class MoneyFlow:
                 'bi_points': []
             }
         closes = pd.to_numeric(df['close'], errors='coerce').ffill().bfill().tolist()
-        macd = calculate_macd(closes)
-        rsi = calculate_rsi(closes)
-        rsi_last = float(rsi[-1]) if rsi else 50.0
-        records = df.reset_index().rename(columns={'index': 'date'}).to_dict('records')
-        processed = process_baohan(records)
-        bi_points = find_bi(processed)
-        _, centers = calculate_bi_and_centers(processed)
-        series_close = pd.Series(closes)
-        ma5 = series_close.rolling(5, min_periods=1).mean()
-        ma10 = series_close.rolling(10, min_periods=1).mean()
-        ma20 = pd.Series(closes).rolling(20, min_periods=1).mean()
-        ma60 = pd.Series(closes).rolling(60, min_periods=1).mean()
-        trend_up = closes[-1] > ma20.iloc[-1] > ma60.iloc[-1]
-        trend_down = closes[-1] < ma20.iloc[-1] < ma60.iloc[-1]
+        # 均线和 MACD 与买卖助手同一套公式，增量计算时的取值与这里一致
+        macd = compile_formula(MACD_FORMULA).evaluate({'close': closes}, ['DIF', 'DEA'])
+        dif, dea = macd['DIF'], macd['DEA']
+        rsi = indicators.rsi(closes)
+        rsi_last = float(rsi[-1]) if len(rsi) else 50.0
+        analysis = ChanlunAnalysis(process_baohan(KLineArray.from_dataframe(df)))
+        ma = compile_formula(BUY_SELL_FORMULA).evaluate({'close': closes}, ['MA5', 'MA10', 'MA20', 'MA60'])
+        last_signal = '暂无'
+        if buy_signal is not None and sell_signal is not None and len(df) > 0:
+            buy_idx = list(df.index[buy_signal]) if hasattr(buy_signal, '__iter__') else []
+            sell_idx = list(df.index[sell_signal]) if hasattr(sell_signal, '__iter__') else []
+            if buy_idx or sell_idx:
+                last_buy = buy_idx[-1] if buy_idx else pd.Timestamp.min
+                last_sell = sell_idx[-1] if sell_idx else pd.Timestamp.min
+                last_signal = f'最近信号：{"买" if last_buy > last_sell else "卖"}'
+        pressure_price = float(pd.to_numeric(df['high'], errors='coerce').tail(30).max())
+        wave_val = float(wave_pct.iloc[-1]) if wave_pct is not None and not wave_pct.empty else 0.0
+        return self._compose_chanlun_assistant(
+            analysis.bi_points, analysis.centers, closes[-1],
+            dif[-1] if len(dif) else None, dea[-1] if len(dea) else None, rsi_last,
+            ma['MA5'][-1], ma['MA10'][-1], ma['MA20'][-1], ma['MA60'][-1], pressure_price, last_signal, wave_val)
+
+    def _compose_chanlun_assistant(self, bi_points, centers, close, dif, dea, rsi_last,
+                                   ma5, ma10, ma20, ma60, pressure_price, last_signal, wave_val):
+        """
+        由最后一根K线上的各项数值拼出缠论助手文案 (全量与增量计算共用)
+        """
+        trend_up = close > ma20 > ma60
+        trend_down = close < ma20 < ma60
         if trend_up:
             mid_term = '多头趋势'
         elif trend_down:
@@ -725,8 +933,8 @@ class MoneyFlow:
         else:
             mid_term = '震荡整理'
         short_term = '观望'
-        if macd.get('dif') and macd.get('dea'):
-            if macd['dif'][-1] > macd['dea'][-1]:
+        if dif is not None and dea is not None:
+            if dif > dea:
                 short_term = '短线偏多'
             else:
                 short_term = '短线偏空'
@@ -734,23 +942,14 @@ class MoneyFlow:
         if len(bi_points) >= 2:
             tail = bi_points[-1]['type']
             structure = f'{structure} · 最近{ "底分型" if tail == "bottom" else "顶分型"}'
-        if ma5.iloc[-1] > ma10.iloc[-1] > ma20.iloc[-1] > ma60.iloc[-1]:
+        if ma5 > ma10 > ma20 > ma60:
             ma_alignment = '多头排列'
-        elif ma5.iloc[-1] < ma10.iloc[-1] < ma20.iloc[-1] < ma60.iloc[-1]:
+        elif ma5 < ma10 < ma20 < ma60:
             ma_alignment = '空头排列'
         else:
             ma_alignment = '均线缠绕'
-        last_signal = '暂无'
-        if buy_signal is not None and sell_signal is not None and len(df) > 0:
-            buy_idx = list(df.index[buy_signal]) if hasattr(buy_signal, '__iter__') else []
-            sell_idx = list(df.index[sell_signal]) if hasattr(sell_signal, '__iter__') else []
-            if buy_idx or sell_idx:
-                last_buy = buy_idx[-1] if buy_idx else pd.Timestamp.min
-                last_sell = sell_idx[-1] if sell_idx else pd.Timestamp.min
-                last_signal = f'最近信号：{"买" if last_buy > last_sell else "卖"}'
-        support_price = float(ma20.iloc[-1])
-        risk_price = float(ma60.iloc[-1])
-        pressure_price = float(pd.to_numeric(df['high'], errors='coerce').tail(30).max())
+        support_price = float(ma20)
+        risk_price = float(ma60)
         buy_low = support_price * 0.992
         buy_high = support_price * 1.012
         sell_low = pressure_price * 0.988
@@ -760,7 +959,6 @@ class MoneyFlow:
             f"反弹至{sell_low:.2f}~{sell_high:.2f}可分批止盈，突破后看量能决定是否续持",
             f"当前为{ma_alignment}，建议单次仓位不超过3成并按信号逐步加减"
         ]
-        wave_val = float(wave_pct.iloc[-1]) if wave_pct is not None and not wave_pct.empty else 0.0
         summary = f'{mid_term}，{short_term}，{ma_alignment}，波段值{wave_val:+.2f}%'
         bi_render = []
         for p in bi_points[-50:]: # Increase to last 50 points to be safe
@@ -775,7 +973,7 @@ class MoneyFlow:
             'structure': structure,
             'short_term': short_term,
             'mid_term': mid_term,
-            'macd': '金叉' if macd.get('dif') and macd.get('dea') and macd['dif'][-1] > macd['dea'][-1] else '死叉',
+            'macd': '金叉' if dif is not None and dea is not None and dif > dea else '死叉',
             'rsi': round(rsi_last, 1),
             'last_signal': last_signal,
             'summary': summary,
@@ -789,15 +987,24 @@ class MoneyFlow:
             'bi_points': bi_render
         }
 
+    def flow_fetched_at(self, code):
+        """
+        get_flow_data 所用资金流数据的实际下载时间 (北京时间)，没有缓存时为 None
+        """
+        ts = _fetch_akshare_data.fetched_at(code, self.guess_market(code))
+        if ts is None:
+            return None
+        return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).replace(tzinfo=None) + datetime.timedelta(hours=8)
+
     def get_flow_data(self, code, force_update=False):
         market = self.guess_market(code)
         
         if force_update:
             _fetch_akshare_data.cache_clear() 
             _fetch_stock_info.cache_clear()
-            _fetch_code_name_map.cache_clear()
             _fetch_gdhs.cache_clear()
             _fetch_daily_hist.cache_clear()
+            _holder_cache.refresh_async(code, 'gdhs')
         
         # --- Parallel Fetching ---
         # We fetch flow (essential), then others (optional/supporting)
@@ -844,41 +1051,45 @@ class MoneyFlow:
 
         hist_df = None
         info = {}
-        gdhs_df = None
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-            future_info = executor.submit(_fetch_stock_info, code)
-            # gdhs can be slow, we might timeout inside usages if needed, or rely on logic below
-            future_gdhs = executor.submit(_fetch_gdhs, code)
+        # 股东户数与个股信息优先用本地缓存 (过期时后台刷新)；本地没有 (或强制刷新信息) 时才现场下载，
+        # 下载在缓存自己的线程池中进行，等待超时后继续在后台完成并落盘，下次直接命中
+        info_df = _holder_cache.lookup(code, 'info')
+        gdhs_df = _holder_cache.lookup(code, 'gdhs')
+        future_info = _holder_cache.refresh_async(code, 'info') if info_df is None or force_update else None
+        future_gdhs = _holder_cache.refresh_async(code, 'gdhs') if gdhs_df is None else None
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
             future_hist = executor.submit(_fetch_daily_hist, code, start_date_str, end_date_str)
-            
-            # Wait for results with optional timeout for the slower ones?
-            # We wait for all, but simple try-except on result()
-            
-            try:
-                info_df = future_info.result(timeout=5)
-                if info_df is not None and not info_df.empty:
-                    try:
-                        records = info_df.to_dict('records')
-                        for row in records:
-                            info[row['item']] = row['value']
-                    except: pass
-            except Exception as e:
-                print(f"Parallel fetch info failed: {e}")
+
+            if future_info is not None:
+                try:
+                    fetched = future_info.result(timeout=5)
+                    if fetched is not None:
+                        info_df = fetched
+                except Exception as e:
+                    print(f"Parallel fetch info failed: {e}")
+            if info_df is not None and not info_df.empty:
+                try:
+                    records = info_df.to_dict('records')
+                    for row in records:
+                        info[row['item']] = row['value']
+                except: pass
 
             try:
                 hist_df = future_hist.result(timeout=8)
             except Exception as e:
                 print(f"Parallel fetch hist failed: {e}")
 
-            try:
-                # GDHS is the problematic one. Give it 3 seconds max.
-                gdhs_df = future_gdhs.result(timeout=3)
-            except concurrent.futures.TimeoutError:
-                print(f"Parallel fetch gdhs TIMEOUT for {code}")
-                gdhs_df = None # Will fallback to default
-            except Exception as e:
-                print(f"Parallel fetch gdhs failed: {e}")
+            if future_gdhs is not None:
+                try:
+                    # GDHS is the problematic one. Give it 3 seconds max.
+                    gdhs_df = future_gdhs.result(timeout=3)
+                except concurrent.futures.TimeoutError:
+                    print(f"Parallel fetch gdhs TIMEOUT for {code}, continuing in background")
+                    gdhs_df = None # Will fallback to default
+                except Exception as e:
+                    print(f"Parallel fetch gdhs failed: {e}")
         
         # --- Calculate Estimated Retail Count (New Formula) ---
         # Formula: N_t = N_{t-1} - F_net / (P_avg * S_per)
@@ -921,7 +1132,6 @@ class MoneyFlow:
                     p_avg_series = df['收盘价']
                 else: 
                      # Should rarely happen
-                     import numpy as np
                      p_avg_series = pd.Series(10.0, index=df.index)
 
             # C. Initial Value (N_0) and S_per preparation
@@ -1014,9 +1224,6 @@ class MoneyFlow:
             main_col = '主力净流入-净额'
             
             if main_col in df.columns:
-                retail_counts = []
-                current_N = N_prev
-                
                 if N_prev <= 0: N_prev = 50000.0
                 
                 # Float Shares in Wan (10000)
@@ -1027,47 +1234,25 @@ class MoneyFlow:
                 if float_shares_wan <= 0: float_shares_wan = 1000.0
 
                 sorted_dates = df.index.sort_values()
+
+                # P_avg：优先历史收盘价，其次资金流自带收盘价，都没有按 10 元
+                fallback_p = df['收盘价'].reindex(sorted_dates) if '收盘价' in df.columns else pd.Series(10.0, index=sorted_dates)
+                p = np.where(sorted_dates.isin(p_avg_series.index), p_avg_series.reindex(sorted_dates).values, fallback_p.values)
                 
-                retail_scores = []
-                
-                for date in sorted_dates:
-                    # P_avg
-                    if date in p_avg_series.index:
-                        p = float(p_avg_series.loc[date])
-                    elif '收盘价' in df.columns:
-                        p = float(df.loc[date, '收盘价'])
-                    else:
-                        p = 10.0
-                    
-                    if p <= 0.1: p = 0.1
-                    
-                    # Core Logic Change: Purely based on '小单' (Small orders)
-                    # Because intermediate orders (中单) can be mixed with Quant/Hot Money.
-                    small_col = '小单净流入-净额'
-                    f_net = float(df.loc[date, small_col]) if small_col in df.columns else (float(df.loc[date, main_col]) * -0.5)
-
-                    # Convert small net inflow amount to shares
-                    net_shares_wan = (f_net / p) / 10000.0
-
-                    score = (net_shares_wan / float_shares_wan) * 10000
-                    if date == sorted_dates[-1]: print(f'DEBUG: small_net={f_net} score={score}')
-
-                    # Since we use small order net inflow directly:
-                    # f_net > 0 => Retail buys => Score > 0 => Count UP
-                    display_score = score
-                    change_pct = display_score / 10000.0
-                    delta_N = current_N * change_pct
-                    retail_scores.append(display_score)
-                    
-                    current_N = current_N + delta_N
-                    retail_counts.append(current_N)
+                # Core Logic Change: Purely based on '小单' (Small orders)
+                # Because intermediate orders (中单) can be mixed with Quant/Hot Money.
+                small_col = '小单净流入-净额'
+                if small_col in df.columns:
+                    f_net = df[small_col].reindex(sorted_dates).values
+                else:
+                    f_net = df[main_col].reindex(sorted_dates).values * -0.5
 
-                # Store the user's score 
-                rc_series = pd.Series(retail_counts, index=sorted_dates).round(2)
-                df['retail_count_index'] = rc_series
+                # f_net > 0 => Retail buys => Score > 0 => Count UP
+                scores = retail_scores(f_net, p, float_shares_wan * 10000.0)
+                df['retail_count_index'] = pd.Series(retail_count_index(scores, N_prev), index=sorted_dates).round(2)
                 
                 # Direct Score for Bar Chart
-                df['retail_score'] = pd.Series(retail_scores, index=sorted_dates).round(2)
+                df['retail_score'] = pd.Series(scores, index=sorted_dates).round(2)
 
         except Exception as e:
             print(f"Retail count calc failed (New Formula): {e}")
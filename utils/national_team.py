@@ -9,6 +9,7 @@ from zoneinfo import ZoneInfo
 from utils.social_security_fund import SocialSecurityFund
 from utils.fund_radar import FundRadar
 from utils.simulator_logic import calculate_rsi, calculate_bollinger_bands
+from utils import quotes
 
 
 class NationalTeamSelector:
@@ -311,25 +312,7 @@ class NationalTeamSelector:
             except Exception:
                 time.sleep(0.5)
 
-        # 2. 如果历史行情失败，尝试获取实时行情作为兜底（至少有最新价）
-        try:
-            df = ak.stock_zh_a_spot_em()
-            # 过滤出当前股票
-            row = df[df['代码'] == code]
-            if not row.empty:
-                price = row.iloc[0]['最新价']
-                try:
-                    price = float(price)
-                    return {
-                        'price': price, 
-                        'ma5': None, 'ma10': None, 'ma20': None,
-                        'rsi': None, 'bb_upper': None, 'bb_middle': None, 'bb_lower': None
-                    }
-                except:
-                    pass
-        except Exception:
-            pass
-            
+        # 历史行情失败的代码由 get_stock_ma_map 统一用批量实时行情兜底
         return None
 
     def get_stock_ma_map(self, codes, force_update=False, progress_callback=None):
@@ -374,6 +357,19 @@ class NationalTeamSelector:
                         # 每20条或者全部完成时输出
                         if completed % 20 == 0 or completed == total:
                             progress_callback(completed, total, f"获取行情数据: {completed}/{total}")
+
+            # 历史行情失败的股票用批量实时行情兜底（至少有最新价），整批只需一两次请求
+            failed = [code for code in missing if code not in result]
+            if failed:
+                for code, q in quotes.get_quotes(failed).items():
+                    if q.get('price'):
+                        cache[code] = {
+                            'price': q['price'],
+                            'ma5': None, 'ma10': None, 'ma20': None,
+                            'rsi': None, 'bb_upper': None, 'bb_middle': None, 'bb_lower': None,
+                            'timestamp': time.time()
+                        }
+                        result[code] = cache[code]
                         
             self._save_cache(self.ma_cache_file, cache)
         return result
@@ -0,0 +1,159 @@
+"""
+批量实时行情
+
+腾讯 qt.gtimg.cn 与新浪 hq.sinajs.cn 都支持一次请求多个代码 (逗号分隔)。
+这里按批请求，解析出名称、最新价、开高低、成交量/额和流通股本，并按代码做短 TTL 缓存，
+供自选股列表、国家队表格和 MoneyFlow.get_kline_data 的盘中K线修补共用。
+
+    quotes = get_quotes(['600519', '000001'])   # {code: {...}}，取不到的代码不在结果中
+    q = get_quote('600519')                      # 单个代码，取不到为 None
+
+字段: code, name, price, open, high, low, prev_close, volume (股), amount (元), date (当日), float_shares (股，仅腾讯)
+"""
+import threading
+import time
+
+import pandas as pd
+
+from utils import http_client
+
+QUOTE_TTL = 10  # 秒
+TENCENT_BATCH = 60
+SINA_BATCH = 80
+TENCENT_URL = "http://qt.gtimg.cn/q="
+SINA_URL = "http://hq.sinajs.cn/list="
+SINA_HEADERS = {'Referer': 'http://finance.sina.com.cn'}
+
+_cache = {}  # code -> (时间戳, quote)
+_lock = threading.Lock()
+
+
+def market_symbol(code):
+    """
+    600000 -> sh600000, 000001 -> sz000001, 8xxxxx/4xxxxx -> bj
+    """
+    code = str(code).strip().zfill(6)
+    if code.startswith(('6', '9')):
+        return 'sh' + code
+    if code.startswith(('8', '4')):
+        return 'bj' + code
+    return 'sz' + code
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_tencent(text):
+    """
+    v_sh600000="1~浦发银行~600000~最新价~昨收~今开~成交量(手)~...~时间(30)~...~最高(33)~最低(34)~...~成交额万(37)~...~流通股本(72)~...";
+    """
+    out = {}
+    for line in text.split(';'):
+        if '="' not in line:
+            continue
+        f = line.split('="', 1)[1].rstrip('"').split('~')
+        if len(f) < 38 or not f[2]:
+            continue
+        price = _float(f[3])
+        volume = _float(f[6])
+        amount = _float(f[37])
+        out[f[2]] = {
+            'code': f[2],
+            'name': f[1],
+            'price': price,
+            'open': _float(f[5]),
+            'high': _float(f[33]),
+            'low': _float(f[34]),
+            'prev_close': _float(f[4]),
+            'volume': volume * 100 if volume is not None else None,
+            'amount': amount * 1e4 if amount is not None else None,
+            'date': pd.to_datetime(f[30][:8], format='%Y%m%d', errors='coerce'),
+            'float_shares': _float(f[72]) if len(f) > 72 and f[72] else None,
+        }
+    return out
+
+
+def _parse_sina(text):
+    """
+    var hq_str_sh600000="名称,今开,昨收,最新价,最高,最低,买一,卖一,成交量(股),成交额(元),...,日期(30),时间(31),...";
+    """
+    out = {}
+    for line in text.split(';'):
+        if '="' not in line or 'hq_str_' not in line:
+            continue
+        symbol = line.split('hq_str_', 1)[1].split('=', 1)[0]
+        f = line.split('="', 1)[1].rstrip('"').split(',')
+        if len(f) < 31 or not f[0]:
+            continue
+        code = symbol[2:]
+        out[code] = {
+            'code': code,
+            'name': f[0],
+            'price': _float(f[3]),
+            'open': _float(f[1]),
+            'high': _float(f[4]),
+            'low': _float(f[5]),
+            'prev_close': _float(f[2]),
+            'volume': _float(f[8]),
+            'amount': _float(f[9]),
+            'date': pd.to_datetime(f[30], errors='coerce'),
+            'float_shares': None,
+        }
+    return out
+
+
+def _fetch_batch(url, codes, parse, headers=None):
+    symbols = ','.join(market_symbol(c) for c in codes)
+    try:
+        resp = http_client.get(url + symbols, headers=headers, timeout=3)
+        resp.encoding = 'gbk'
+        return parse(resp.text)
+    except Exception as e:
+        print(f"[Quotes] Batch fetch failed ({len(codes)} codes from {url}): {e}")
+        return {}
+
+
+def fetch_quotes(codes):
+    """
+    不走缓存，直接批量请求：先腾讯，取不到的代码再走新浪
+    """
+    codes = [str(c).strip().zfill(6) for c in codes]
+    result = {}
+    for i in range(0, len(codes), TENCENT_BATCH):
+        result.update(_fetch_batch(TENCENT_URL, codes[i:i + TENCENT_BATCH], _parse_tencent))
+    missing = [c for c in codes if c not in result]
+    for i in range(0, len(missing), SINA_BATCH):
+        result.update(_fetch_batch(SINA_URL, missing[i:i + SINA_BATCH], _parse_sina, SINA_HEADERS))
+    return {c: result[c] for c in codes if c in result}
+
+
+def get_quotes(codes, ttl=QUOTE_TTL):
+    """
+    批量取行情，ttl 秒内取过的代码直接用缓存，其余合并成尽量少的请求
+    """
+    codes = list(dict.fromkeys(str(c).strip().zfill(6) for c in codes))
+    now = time.time()
+    with _lock:
+        cached = {c: _cache[c][1] for c in codes if c in _cache and now - _cache[c][0] < ttl}
+    missing = [c for c in codes if c not in cached]
+    if missing:
+        fresh = fetch_quotes(missing)
+        with _lock:
+            for c, q in fresh.items():
+                _cache[c] = (now, q)
+        cached.update(fresh)
+    return {c: cached[c] for c in codes if c in cached}
+
+
+def get_quote(code, ttl=QUOTE_TTL):
+    code = str(code).strip().zfill(6)
+    return get_quotes([code], ttl).get(code)
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
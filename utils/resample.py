@@ -0,0 +1,147 @@
+"""
+K线重采样 (向量化)
+
+先确定每个分组的起点，再用 np.maximum/np.minimum/np.add.reduceat 一次聚合出所有大级别K线。
+分组方式:
+- 固定根数: 模拟器用 5/20/60 根日线合成周/月/季K
+- 自然周 / 自然月: 带日期的序列按 W-FRI (标签为当周周五) 或月末分组
+- 分钟周期: 如 '120min'，右闭右标签，与 pandas resample(rule, label='right', closed='right') 一致
+- A 股交易时段: 5 分钟K线合成 15/30/60/120 分钟K线，按交易分钟计数跳过午休 (resample_session)
+
+bar_index_map 给出"原始K线位置 -> 所属大级别K线序号"的查表数组，定位当前日线所在的周/月K为 O(1)。
+"""
+import numpy as np
+import pandas as pd
+
+OHLC_COLUMNS = ('open', 'high', 'low', 'close')
+SUM_COLUMNS = ('volume', 'amount')
+# A 股连续竞价时段 (自零点起的分钟数)：9:30-11:30, 13:00-15:00
+SESSIONS = ((9 * 60 + 30, 11 * 60 + 30), (13 * 60, 15 * 60))
+
+
+def fixed_group_starts(n, period):
+    """
+    每 period 根一组的分组起点
+    """
+    return np.arange(0, n, period, dtype=np.int64)
+
+
+def calendar_labels(times, rule):
+    """
+    每根K线所属周期的标签 (DatetimeIndex)
+    rule: 'W' / 'W-FRI' 自然周 (标签为当周周五)，'M' / 'ME' 自然月 (标签为月末)，
+          其他按 pandas 频率字符串向上取整 (如 '120min'，右闭右标签)
+    """
+    idx = pd.DatetimeIndex(times)
+    if rule in ('W', 'W-FRI'):
+        day = idx.normalize()
+        return day + pd.to_timedelta((4 - day.weekday) % 7, unit='D')
+    if rule in ('M', 'ME'):
+        return idx.normalize() + pd.offsets.MonthEnd(0)
+    return idx.ceil(rule)
+
+
+def session_labels(times, minutes):
+    """
+    分钟K线 (标签为K线结束时间) 合成 minutes 分钟K线时所属的标签:
+    从 9:30 起按交易分钟计数，午休不计，每 minutes 分钟一组，标签为该组结束时间。
+    如 60 分钟为 10:30 / 11:30 / 14:00 / 15:00，120 分钟为 11:30 / 15:00；
+    集合竞价等时段外的K线并入最近的一组
+    """
+    idx = pd.DatetimeIndex(times)
+    day = idx.normalize()
+    tod = np.asarray((idx - day).total_seconds(), dtype=np.float64) / 60
+    (m_open, m_close), (a_open, a_close) = SESSIONS
+    morning = m_close - m_open
+    total = morning + a_close - a_open
+    traded = np.where(tod <= m_close, tod - m_open, morning + np.maximum(tod - a_open, 0))
+    end = np.minimum(np.ceil(np.clip(traded, 1, total) / minutes) * minutes, total)
+    end_tod = np.where(end <= morning, m_open + end, a_open + end - morning)
+    return day + pd.to_timedelta(end_tod, unit='min')
+
+
+def label_group_starts(labels):
+    """
+    按标签变化切分分组 (序列需已按时间排序)，返回 (分组起点, 每组标签)
+    """
+    labels = np.asarray(labels)
+    if len(labels) == 0:
+        return np.array([], dtype=np.int64), labels
+    starts = np.r_[0, np.flatnonzero(labels[1:] != labels[:-1]) + 1].astype(np.int64)
+    return starts, labels[starts]
+
+
+def bar_index_map(starts, n):
+    """
+    原始K线位置 -> 所属分组序号
+    """
+    return np.repeat(np.arange(len(starts), dtype=np.int64), np.diff(np.r_[starts, n]))
+
+
+def _first_valid(values, starts):
+    n = len(values)
+    pos = np.minimum.reduceat(np.where(np.isnan(values), n, np.arange(n)), starts)
+    out = np.full(len(starts), np.nan)
+    ok = pos < n
+    out[ok] = values[pos[ok]]
+    return out
+
+
+def _last_valid(values, starts):
+    n = len(values)
+    pos = np.maximum.reduceat(np.where(np.isnan(values), -1, np.arange(n)), starts)
+    out = np.full(len(starts), np.nan)
+    ok = pos >= 0
+    out[ok] = values[pos[ok]]
+    return out
+
+
+def reduce_ohlc(starts, open, high, low, close, volume=None, amount=None):
+    """
+    按分组起点聚合，返回 dict of np.ndarray:
+    开盘取组内第一个有效值，收盘取最后一个有效值，最高/最低忽略 NaN 取极值，量额求和
+    """
+    out = {
+        'open': _first_valid(np.asarray(open, dtype=np.float64), starts),
+        'high': np.fmax.reduceat(np.asarray(high, dtype=np.float64), starts),
+        'low': np.fmin.reduceat(np.asarray(low, dtype=np.float64), starts),
+        'close': _last_valid(np.asarray(close, dtype=np.float64), starts),
+    }
+    for name, values in (('volume', volume), ('amount', amount)):
+        if values is not None:
+            out[name] = np.add.reduceat(np.nan_to_num(np.asarray(values, dtype=np.float64)), starts)
+    return out
+
+
+def resample_frame(df, rule):
+    """
+    以 DatetimeIndex 为索引的K线 DataFrame 重采样 ('W-FRI' / 'M' / '120min' 等)，
+    结果等同于 df.resample(rule, ...).agg(first/max/min/last/sum).dropna(subset=OHLC)
+    """
+    if df is None or df.empty:
+        return pd.DataFrame()
+    df = df.sort_index()
+    return _aggregate(df, calendar_labels(df.index, rule))
+
+
+def resample_session(df, minutes):
+    """
+    A 股分钟K线按交易时段合成 minutes 分钟K线 (见 session_labels)，输入周期需整除 minutes
+    """
+    if df is None or df.empty:
+        return pd.DataFrame()
+    df = df.sort_index()
+    return _aggregate(df, session_labels(df.index, minutes))
+
+
+def _aggregate(df, labels):
+    starts, labels = label_group_starts(labels)
+    cols = {name: df[name].to_numpy(dtype=np.float64) for name in OHLC_COLUMNS + SUM_COLUMNS if name in df.columns}
+    agg = reduce_ohlc(
+        starts,
+        cols.get('open', np.full(len(df), np.nan)), cols.get('high', np.full(len(df), np.nan)),
+        cols.get('low', np.full(len(df), np.nan)), cols.get('close', np.full(len(df), np.nan)),
+        cols.get('volume'), cols.get('amount'),
+    )
+    out = pd.DataFrame({name: agg[name] for name in cols}, index=pd.DatetimeIndex(labels, name=df.index.name))
+    return out.dropna(subset=[c for c in OHLC_COLUMNS if c in out.columns])
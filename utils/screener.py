@@ -0,0 +1,291 @@
+"""
+全市场选股
+
+买卖助手 (build_buy_sell_assistant) 和缠论助手一次只算一只股票。选股器把全部 A 股的日线从本地存储
+(data/screener_store，格式同 KLineStore) 读成 (股票数, K线数) 的面板，分两遍计算：
+- 向量化: 买卖助手公式与 MACD 公式直接在面板上求值，取最后一根的买卖信号、金叉死叉、均线排列，
+  以及最后三根原始K线的分型
+- 进程池: 笔识别要逐根做包含处理，按股票分块交给多个进程，得到笔/中枢数量、最近的笔端点
+结果为每只股票一行的 DataFrame (索引为代码)，用 screen() 过滤和排序。
+
+    screener = MarketScreener()
+    screener.refresh()          # 增量下载日线到本地 (联网，盘后执行)
+    result = screener.run()     # 不联网，默认按最近买点排序
+    screen(result, {'buy_signal': True, 'ma_alignment': '多头排列'}, sort_by='wave_pct')
+
+与单只股票的买卖助手相比: 不做盘中成交量折算，面板只取最后 PANEL_BARS 根K线 (MA60 等指标与
+全量序列的取值在开头几十根之后一致)。
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.kline_array import KLineArray
+from utils.kline_store import KLineStore
+from utils.simulator_logic import ChanlunAnalysis, identify_fenxing, process_baohan
+from utils.tdx_formula import compile_formula
+
+SCREENER_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'screener_store')
+SCREENER_MAX_ENTRIES = 8000  # 全市场约 5000 只，留出新股余量
+SCREENER_IDLE_DAYS = 365
+PANEL_BARS = 250  # 约一年日线
+MIN_BARS = 61  # 至少覆盖 MA60 窗口，更短的 (次新股) 不参与
+STROKE_CHUNK = 200  # 进程池每个任务处理的股票数
+MAX_WORKERS = 8
+REFRESH_THREADS = 4
+REFRESH_PAUSE = 0.2  # 下载时每只股票之后的间隔 (秒)，避免被限流
+# 默认排序: 最近出现买点的在前，其次波段值 (偏离 QSX 趋势线) 小的在前
+DEFAULT_SORT = (['bars_since_buy', 'wave_pct'], [True, True])
+
+
+def default_workers():
+    return max(1, min(os.cpu_count() or 1, MAX_WORKERS))
+
+
+class Panel:
+    """
+    K线数相同的一组股票: codes 对应行，各列为 (股票数, K线数) 的二维数组，date 为纳秒时间戳
+    """
+    __slots__ = ('codes', 'date', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, codes, records):
+        stacked = np.stack(records)
+        self.codes = list(codes)
+        self.date = np.ascontiguousarray(stacked['date'])
+        self.open = np.ascontiguousarray(stacked['open'])
+        self.high = np.ascontiguousarray(stacked['high'])
+        self.low = np.ascontiguousarray(stacked['low'])
+        self.close = np.ascontiguousarray(stacked['close'])
+        self.volume = np.nan_to_num(stacked['volume'])
+
+    def __len__(self):
+        return len(self.codes)
+
+
+def load_panels(store, codes, bars=PANEL_BARS, min_bars=MIN_BARS, period='day'):
+    """
+    读取各股票最后 bars 根K线，按K线数分组拼成面板 (绝大多数股票在同一组)，不足 min_bars 的跳过
+    """
+    groups = {}
+    for code in codes:
+        rec = store.load_records(code, period, tail=bars)
+        if len(rec) >= min_bars:
+            groups.setdefault(len(rec), []).append((code, rec))
+    panels = []
+    for _, items in sorted(groups.items(), key=lambda kv: -len(kv[1])):
+        codes_, records = zip(*items)
+        panels.append(Panel(codes_, records))
+    return panels
+
+
+def _fill(x):
+    """
+    沿时间轴先向前再向后填充 NaN (同 Series.ffill().bfill())
+    """
+    valid = ~np.isnan(x)
+    idx = np.arange(x.shape[-1])
+    prev = np.maximum.accumulate(np.where(valid, idx, 0), axis=-1)
+    first = np.argmax(valid, axis=-1)[:, None]
+    return np.take_along_axis(x, np.where(idx < first, first, prev), axis=-1)
+
+
+def _bars_since(mask):
+    """
+    最后一次为真距最后一根的K线数，从未为真时为 NaN
+    """
+    n = mask.shape[-1]
+    last = np.where(mask, np.arange(n), -1).max(axis=-1)
+    return np.where(last >= 0, n - 1 - last, np.nan)
+
+
+def scan_panel(panel):
+    """
+    向量化一遍: 在整个面板上求值买卖助手与 MACD 公式，返回每只股票最后一根K线的状态
+    """
+    from utils.money_flow import BUY_SELL_FORMULA, MACD_FORMULA
+
+    res = compile_formula(BUY_SELL_FORMULA).evaluate(
+        {'close': panel.close, 'high': panel.high, 'low': panel.low, 'vol': panel.volume},
+        ['ZHM', 'ZHS', 'WAVE', 'MA5', 'MA10', 'MA20', 'MA60'])
+    macd = compile_formula(MACD_FORMULA).evaluate({'close': _fill(panel.close)})
+    macd = {name: np.nan_to_num(v) for name, v in macd.items()}
+
+    close = panel.close[:, -1]
+    buy, sell = res['ZHM'] > 0, res['ZHS'] > 0
+    since_buy, since_sell = _bars_since(buy), _bars_since(sell)
+    dif, dea = macd['DIF'][:, -1], macd['DEA'][:, -1]
+    ma5, ma10, ma20, ma60 = (res[name][:, -1] for name in ('MA5', 'MA10', 'MA20', 'MA60'))
+
+    # 与缠论助手的文案一致
+    last_signal = np.select([np.isnan(since_buy) & np.isnan(since_sell),
+                             np.nan_to_num(since_buy, nan=np.inf) < np.nan_to_num(since_sell, nan=np.inf)],
+                            ['暂无', '买'], '卖')
+    ma_alignment = np.select([(ma5 > ma10) & (ma10 > ma20) & (ma20 > ma60),
+                              (ma5 < ma10) & (ma10 < ma20) & (ma20 < ma60)], ['多头排列', '空头排列'], '均线缠绕')
+    mid_term = np.select([(close > ma20) & (ma20 > ma60), (close < ma20) & (ma20 < ma60)],
+                         ['多头趋势', '空头趋势'], '震荡整理')
+    # 最后三根原始K线的分型 (顶分型优先，规则同 identify_fenxing，未做包含处理)
+    h, l = panel.high[:, -3:], panel.low[:, -3:]
+    top = (h[:, 1] > h[:, 0]) & (h[:, 1] > h[:, 2])
+    bottom = ~top & (l[:, 1] < l[:, 0]) & (l[:, 1] < l[:, 2])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct_chg = (close / panel.close[:, -2] - 1) * 100
+    return pd.DataFrame({
+        'date': pd.DatetimeIndex(panel.date[:, -1].astype('datetime64[ns]')),
+        'close': close,
+        'pct_chg': pct_chg,
+        'bars': panel.close.shape[1],
+        'buy_signal': buy[:, -1],
+        'sell_signal': sell[:, -1],
+        'bars_since_buy': since_buy,
+        'bars_since_sell': since_sell,
+        'last_signal': last_signal,
+        'wave_pct': res['WAVE'][:, -1],
+        'dif': dif,
+        'dea': dea,
+        'macd_hist': macd['MACD'][:, -1],
+        'macd': np.where(dif > dea, '金叉', '死叉'),
+        'golden_cross': macd['GC'][:, -1] > 0,
+        'dead_cross': macd['DC'][:, -1] > 0,
+        'bars_since_golden_cross': _bars_since(macd['GC'] > 0),
+        'ma_alignment': ma_alignment,
+        'mid_term': mid_term,
+        'fractal': np.select([top, bottom], ['top', 'bottom'], ''),
+    }, index=pd.Index(panel.codes, name='code'))
+
+
+def _stroke_state(time_, open_, high, low, close):
+    """
+    单只股票: 包含处理后识别笔和中枢 (与缠论助手同一套函数)
+    """
+    merged = process_baohan(KLineArray(time_, open_, high, low, close, time_kind='datetime'))
+    analysis = ChanlunAnalysis(merged)
+    points = analysis.bi_points
+    last_type, last_price, last_date, since = '', np.nan, pd.NaT, np.nan
+    if points:
+        p = points[-1]
+        t = (merged.high_time if p['type'] == 'top' else merged.low_time)[p['index']]
+        last_type, last_price, last_date = p['type'], p['price'], pd.Timestamp(int(t))
+        since = len(time_) - 1 - int(np.searchsorted(time_, t))
+    return (len(points), len(analysis.centers), last_type, last_price, last_date, since,
+            identify_fenxing(merged) or '')
+
+
+def _stroke_chunk(time_, open_, high, low, close):
+    return [_stroke_state(time_[i], open_[i], high[i], low[i], close[i]) for i in range(len(time_))]
+
+
+STROKE_COLUMNS = ['bi_count', 'center_count', 'last_point', 'last_point_price', 'last_point_date',
+                  'bars_since_point', 'merged_fractal']
+
+
+def scan_strokes(panels, workers=None):
+    """
+    进程池一遍: 按股票分块并行识别笔，workers<=1 时在当前进程内计算
+    返回 DataFrame: 笔数、中枢数、最近笔端点 (top/bottom)、其价格与日期、之后的原始K线数、
+    包含处理后最后三根的分型
+    """
+    workers = default_workers() if workers is None else workers
+    codes, tasks = [], []
+    for p in panels:
+        for start in range(0, len(p), STROKE_CHUNK):
+            part = slice(start, start + STROKE_CHUNK)
+            codes.extend(p.codes[part])
+            tasks.append((p.date[part], p.open[part], p.high[part], p.low[part], p.close[part]))
+    if workers <= 1 or len(tasks) <= 1:
+        chunks = [_stroke_chunk(*t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            chunks = list(pool.map(_stroke_chunk, *zip(*tasks)))
+    rows = [row for chunk in chunks for row in chunk]
+    return pd.DataFrame(rows, columns=STROKE_COLUMNS, index=pd.Index(codes, name='code'))
+
+
+def screen(result, conditions=None, sort_by=None, ascending=True, limit=None):
+    """
+    过滤并排序选股结果
+    conditions: {列名: 值}，值可以是单个值 (相等)、list/tuple/set (属于其一) 或 fn(Series) -> 布尔 Series
+    sort_by: 列名或列名列表，缺省为 DEFAULT_SORT；NaN 排在最后
+    """
+    df = result
+    for col, cond in (conditions or {}).items():
+        if callable(cond):
+            mask = cond(df[col])
+        elif isinstance(cond, (list, tuple, set)):
+            mask = df[col].isin(list(cond))
+        else:
+            mask = df[col] == cond
+        df = df[mask]
+    if sort_by is None:
+        sort_by, ascending = DEFAULT_SORT
+    df = df.sort_values(sort_by, ascending=ascending, na_position='last', kind='stable')
+    return df.head(limit) if limit else df
+
+
+class MarketScreener:
+    """
+    store: 日线所在的 KLineStore，默认 data/screener_store (与个股页面的存储分开，
+    避免全市场数据把常用股票挤出 money_flow 的 LRU)
+    master: 提供 codes() / get(code) 的证券主表，默认 get_master()
+    """
+    def __init__(self, store=None, master=None, bars=PANEL_BARS, workers=None):
+        self.store = store or KLineStore(SCREENER_STORE_DIR, max_entries=SCREENER_MAX_ENTRIES,
+                                         max_idle_days=SCREENER_IDLE_DAYS)
+        self._master = master
+        self.bars = bars
+        self.workers = default_workers() if workers is None else workers
+        self.timings = {}
+
+    @property
+    def master(self):
+        if self._master is None:
+            from utils.security_master import get_master
+            self._master = get_master()
+        return self._master
+
+    def refresh(self, codes=None, threads=REFRESH_THREADS, pause=REFRESH_PAUSE):
+        """
+        把日线增量下载到本地存储 (已存储的只补尾部)，返回成功的股票数
+        """
+        from utils.money_flow import MoneyFlow
+        mf = MoneyFlow()
+        codes = self.master.codes() if codes is None else codes
+
+        def one(code):
+            try:
+                df = mf.refresh_kline(code, 'day', store=self.store)
+            except Exception as e:
+                print(f"[MarketScreener] Refresh failed for {code}: {e}")
+                return False
+            time.sleep(pause)
+            return not df.empty
+
+        with self.store.batch(), ThreadPoolExecutor(max_workers=threads) as pool:
+            return sum(pool.map(one, codes))
+
+    def run(self, codes=None):
+        """
+        对本地存储中的股票计算选股结果 (不联网)，按 DEFAULT_SORT 排序；各阶段耗时记入 self.timings
+        """
+        codes = self.master.codes() if codes is None else codes
+        t0 = time.perf_counter()
+        panels = load_panels(self.store, codes, self.bars)
+        t1 = time.perf_counter()
+        if not panels:
+            self.timings = {'stocks': 0, 'load': t1 - t0, 'signals': 0.0, 'strokes': 0.0, 'total': t1 - t0}
+            return pd.DataFrame()
+        signals = pd.concat([scan_panel(p) for p in panels])
+        t2 = time.perf_counter()
+        strokes = scan_strokes(panels, self.workers)
+        t3 = time.perf_counter()
+
+        result = signals.join(strokes)
+        rows = [self.master.get(code) for code in result.index]
+        result.insert(0, 'name', [row['name'] if row else '' for row in rows])
+        self.timings = {'stocks': len(result), 'load': t1 - t0, 'signals': t2 - t1, 'strokes': t3 - t2,
+                        'total': t3 - t0}
+        return screen(result)
@@ -6,8 +6,9 @@ import datetime
 import pandas as pd
 import akshare as ak
 import numpy as np
-from utils.simulator_logic import calculate_macd, calculate_rsi, process_baohan, find_bi, calculate_bollinger_bands, calculate_bi_and_centers
+from utils.simulator_logic import calculate_macd, calculate_rsi, process_baohan, calculate_bollinger_bands, ChanlunAnalysis
 from utils.fund_radar import FundRadar
+from utils.kline_array import KLineArray
 
 class SectorAnalyzer:
     CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'sector_history_cache')
@@ -325,14 +326,16 @@ class SectorAnalyzer:
         ma60 = series_close.rolling(window=60).mean().fillna(0).tolist()
         
         # 2. Chan Lun Bi
-        # Convert df to list of dicts for process_baohan
-        klines = df.to_dict('records')
+        # Columnar K-lines: process_baohan returns a merged KLineArray
+        klines = KLineArray.from_dataframe(df)
         processed_klines = process_baohan(klines)
-        bi_points = find_bi(processed_klines)
+        # Bi points and centers share one fractal chain
+        analysis = ChanlunAnalysis(processed_klines)
+        bi_points = analysis.bi_points
         
         # 3. Calculate Centers (Pivot Boxes)
         # Using processed klines for consistency
-        _, centers = calculate_bi_and_centers(processed_klines)
+        centers = analysis.centers
         
         # 4. Analysis & Judgment
         status = "震荡"
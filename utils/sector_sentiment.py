@@ -1,4 +1,4 @@
-import requests
+from utils import http_client
 import pandas as pd
 import numpy as np
 import os
@@ -121,16 +121,16 @@ class SectorSentiment:
             "filter": "" 
         }
         try:
-            resp = requests.get(url, params=params, timeout=5)
-            if resp.status_code == 200:
-                data = resp.json()
-                if data.get('result') and data['result'].get('data'):
-                    # mapping = {} # Don't clear, just update/overwrite
-                    for item in data['result']['data']:
-                        mapping[item['BOARD_NAME']] = item['BOARD_CODE']
-                    self.em_sector_map = mapping
-                    print(f"Loaded {len(mapping)} sectors from EastMoney (CSV + API)")
-                    return mapping
+            # 失败时沿用 CSV 映射，不再重试
+            resp = http_client.get(url, params=params, timeout=5, retries=0)
+            data = resp.json()
+            if data.get('result') and data['result'].get('data'):
+                # mapping = {} # Don't clear, just update/overwrite
+                for item in data['result']['data']:
+                    mapping[item['BOARD_NAME']] = item['BOARD_CODE']
+                self.em_sector_map = mapping
+                print(f"Loaded {len(mapping)} sectors from EastMoney (CSV + API)")
+                return mapping
         except Exception as e:
             print(f"Failed to load EM sector map from Web: {e}")
             
@@ -182,15 +182,15 @@ class SectorSentiment:
             "filter": f'(BOARD_CODE="{em_code}")'
         }
         try:
-            resp = requests.get(url, params=params, timeout=5)
-            if resp.status_code == 200:
-                data = resp.json()
-                if data.get('result') and data['result'].get('data'):
-                    df = pd.DataFrame(data['result']['data'])
-                    df['TRADE_DATE'] = pd.to_datetime(df['TRADE_DATE'])
-                    df['FIN_BUY_AMT'] = pd.to_numeric(df['FIN_BUY_AMT'], errors='coerce')
-                    df = df.set_index('TRADE_DATE').sort_index()
-                    return df
+            # 失败时按成交额比例估算，不再重试
+            resp = http_client.get(url, params=params, timeout=5, retries=0)
+            data = resp.json()
+            if data.get('result') and data['result'].get('data'):
+                df = pd.DataFrame(data['result']['data'])
+                df['TRADE_DATE'] = pd.to_datetime(df['TRADE_DATE'])
+                df['FIN_BUY_AMT'] = pd.to_numeric(df['FIN_BUY_AMT'], errors='coerce')
+                df = df.set_index('TRADE_DATE').sort_index()
+                return df
         except Exception as e:
             print(f"Failed to fetch EM history for {em_code}: {e}")
         return None
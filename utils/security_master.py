@@ -0,0 +1,263 @@
+"""
+本地证券主表 (代码 / 名称 / 市场 / 拼音首字母)
+
+沪、深、京三个交易所的 A 股列表每天刷新一次，保存在 data/security_master.json，
+首次使用时才加载。内存中建排序数组索引，不走网络:
+- 代码前缀:     二分查找排序后的代码
+- 拼音首字母前缀: 二分查找排序后的首字母 (如 GZMT -> 贵州茅台)
+- 名称子串:     所有名称拼成一个字符串做 str.find，再二分定位到行
+
+    master = get_master()
+    master.get('600519')        # {'code': '600519', 'name': '贵州茅台', 'market': 'sh', 'initials': 'GZMT'}
+    master.search('茅台')        # 按 代码前缀 > 首字母前缀 > 名称子串 排序，最多 limit 条
+
+主表缺失或过期时在后台线程刷新，期间照常用已有数据 (缺失时为空) 应答。
+拼音首字母优先用 pypinyin (可选依赖)，没有安装时按 GB2312 一级汉字的拼音区间推算。
+"""
+import bisect
+import datetime
+import json
+import os
+import threading
+import time
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:  # 可选依赖
+    lazy_pinyin = None
+
+try:
+    import akshare as ak
+except ImportError:
+    ak = None
+
+MASTER_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'security_master.json')
+SEARCH_LIMIT = 10
+RETRY_INTERVAL = 600  # 刷新失败后至少隔多久再试 (秒)
+
+# GB2312 一级汉字按拼音排序，每个声母的起始区位码
+_GB2312_INITIALS = [
+    (0xB0A1, 'A'), (0xB0C5, 'B'), (0xB2C1, 'C'), (0xB4EE, 'D'), (0xB6EA, 'E'), (0xB7A2, 'F'),
+    (0xB8C1, 'G'), (0xB9FE, 'H'), (0xBBF7, 'J'), (0xBFA6, 'K'), (0xC0AC, 'L'), (0xC2E8, 'M'),
+    (0xC4C3, 'N'), (0xC5B6, 'O'), (0xC5BE, 'P'), (0xC6DA, 'Q'), (0xC8BB, 'R'), (0xC8F6, 'S'),
+    (0xCBFA, 'T'), (0xCDDA, 'W'), (0xCEF4, 'X'), (0xD1B9, 'Y'), (0xD4D1, 'Z'),
+]
+_GB2312_LEVEL1_END = 0xD7F9
+_GB2312_CODES = [c for c, _ in _GB2312_INITIALS]
+# 股票名称里常见的多音字按名称中的读音取首字母 (银行、重庆、长城、厦门、西藏)
+_POLYPHONES = {'行': 'H', '重': 'C', '长': 'C', '厦': 'X', '藏': 'Z', '乐': 'L', '调': 'T'}
+
+
+def _char_initial(ch):
+    if ch in _POLYPHONES:
+        return _POLYPHONES[ch]
+    try:
+        raw = ch.encode('gb2312')
+    except UnicodeEncodeError:
+        return ''
+    if len(raw) != 2:
+        return ''
+    code = raw[0] << 8 | raw[1]
+    if code < _GB2312_CODES[0] or code > _GB2312_LEVEL1_END:
+        return ''  # 二级汉字按部首排序，无法推算
+    return _GB2312_INITIALS[bisect.bisect_right(_GB2312_CODES, code) - 1][1]
+
+
+def pinyin_initials(name):
+    """
+    '贵州茅台' -> 'GZMT'，'*ST 海航' -> 'STHH'；字母数字保留，其余符号忽略
+    """
+    if lazy_pinyin is not None:
+        parts = lazy_pinyin(name, style=Style.FIRST_LETTER, errors=lambda s: list(s))
+        text = ''.join(parts)
+    else:
+        text = ''.join(ch if ch.isascii() else _char_initial(ch) for ch in name)
+    return ''.join(ch for ch in text.upper() if ch.isalnum() and ch.isascii())
+
+
+def fetch_master():
+    """
+    从交易所列表拉取全部 A 股，返回 [(code, name, market), ...]
+    """
+    if ak is None:
+        return []
+    sources = [
+        ('sh', lambda: ak.stock_info_sh_name_code(symbol='主板A股'), '证券代码', '证券简称'),
+        ('sh', lambda: ak.stock_info_sh_name_code(symbol='科创板'), '证券代码', '证券简称'),
+        ('sz', lambda: ak.stock_info_sz_name_code(symbol='A股列表'), 'A股代码', 'A股简称'),
+        ('bj', ak.stock_info_bj_name_code, '证券代码', '证券简称'),
+    ]
+    rows = []
+    for market, fetch, code_col, name_col in sources:
+        try:
+            df = fetch()
+            codes = df[code_col].astype(str).str.zfill(6)
+            names = df[name_col].astype(str).str.replace(' ', '', regex=False)
+            rows.extend((c, n, market) for c, n in zip(codes, names))
+        except Exception as e:
+            print(f"[SecurityMaster] Fetch {market} list failed: {e}")
+    return rows
+
+
+class _Index:
+    """一次性建好的只读索引，刷新时整体替换，查询中途不会看到半新半旧的数据"""
+
+    def __init__(self, rows):
+        rows = sorted(set(tuple(r) for r in rows))  # (code, name, market, initials)，按代码排序
+        self.rows = rows
+        self.codes = [r[0] for r in rows]
+        self.by_code = {r[0]: i for i, r in enumerate(rows)}
+        by_initials = sorted((r[3], i) for i, r in enumerate(rows))
+        self.initials = [k for k, _ in by_initials]
+        self.initials_rows = [i for _, i in by_initials]
+        # 名称拼成一个字符串，'\n' 分隔；name_starts[i] 为第 i 行名称的起始偏移
+        self.names = '\n'.join(r[1] for r in rows)
+        self.name_starts = []
+        offset = 0
+        for r in rows:
+            self.name_starts.append(offset)
+            offset += len(r[1]) + 1
+
+    def row(self, i):
+        code, name, market, initials = self.rows[i]
+        return {'code': code, 'name': name, 'market': market, 'initials': initials}
+
+    def search(self, text, limit):
+        hits = []
+        seen = set()
+
+        def add(i):
+            if i not in seen:
+                seen.add(i)
+                hits.append(i)
+            return len(hits) >= limit
+
+        if text.isdigit():
+            lo = bisect.bisect_left(self.codes, text)
+            hi = bisect.bisect_left(self.codes, text + '\x7f')
+            for i in range(lo, min(hi, lo + limit)):
+                if add(i):
+                    break
+        elif text.isascii() and text.isalnum():
+            key = text.upper()
+            lo = bisect.bisect_left(self.initials, key)
+            hi = bisect.bisect_left(self.initials, key + '\x7f')
+            for j in range(lo, min(hi, lo + limit)):
+                if add(self.initials_rows[j]):
+                    break
+
+        if len(hits) < limit and '\n' not in text:
+            pos = self.names.find(text)
+            while pos != -1 and len(hits) < limit:
+                i = bisect.bisect_right(self.name_starts, pos) - 1
+                add(i)
+                # 跳到下一行名称继续查找
+                next_start = self.name_starts[i + 1] if i + 1 < len(self.name_starts) else len(self.names)
+                pos = self.names.find(text, next_start)
+        return [self.row(i) for i in hits]
+
+
+class SecurityMaster:
+    def __init__(self, path=MASTER_FILE, fetch=fetch_master):
+        self.path = path
+        self.fetch = fetch
+        self._lock = threading.Lock()
+        self._index = _Index([])
+        self._loaded = False
+        self._refreshing = False
+        self._last_attempt = 0
+        self.updated = None
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        with open(self.path, 'r', encoding='utf-8') as f:
+                            content = json.load(f)
+                        self._index = _Index(content.get('rows', []))
+                        self.updated = content.get('_meta', {}).get('updated')
+                    except (OSError, ValueError):
+                        pass
+                    self._loaded = True
+        # 每天刷新一次 (服务跨天运行时也会触发)
+        if self.updated != datetime.date.today().isoformat() and time.time() - self._last_attempt > RETRY_INTERVAL:
+            self.refresh_async()
+        return self._index
+
+    def refresh(self):
+        """同步拉取并落盘，拉取失败时保留原数据；返回是否成功"""
+        rows = self.fetch()
+        if not rows:
+            return False
+        rows = [(c, n, m, pinyin_initials(n)) for c, n, m in rows]
+        index = _Index(rows)
+        updated = datetime.date.today().isoformat()
+        content = {'_meta': {'updated': updated, 'count': len(index.rows)}, 'rows': index.rows}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(content, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[SecurityMaster] Save failed: {e}")
+        with self._lock:
+            self._index = index
+            self.updated = updated
+            self._loaded = True
+        return True
+
+    def refresh_async(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+            self._last_attempt = time.time()
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[SecurityMaster] Refresh failed: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def __len__(self):
+        return len(self._ensure_loaded().rows)
+
+    def codes(self):
+        """全部代码 (已排序)"""
+        return list(self._ensure_loaded().codes)
+
+    def get(self, code):
+        index = self._ensure_loaded()
+        i = index.by_code.get(str(code).strip().zfill(6))
+        return None if i is None else index.row(i)
+
+    def market(self, code):
+        row = self.get(code)
+        return row['market'] if row else None
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        """
+        代码前缀、拼音首字母前缀、名称子串三种匹配，按此优先级去重合并
+        """
+        index = self._ensure_loaded()
+        text = str(text or '').strip()
+        return index.search(text, limit) if text else []
+
+
+_master = None
+_master_lock = threading.Lock()
+
+
+def get_master():
+    global _master
+    if _master is None:
+        with _master_lock:
+            if _master is None:
+                _master = SecurityMaster()
+    return _master
@@ -5,7 +5,7 @@ API: POST https://www.chinamoney.com.cn/ags/ms/cm-u-bk-shibor/ShiborChrt?lang=CN
 """
 
 import pandas as pd
-import requests
+from utils import http_client
 import datetime
 import os
 from typing import Optional
@@ -98,7 +98,7 @@ class ShiborDataManager:
         返回 DataFrame，列: date, O/N, 1W, 2W, 1M, 3M, 6M, 9M, 1Y
         """
         try:
-            r = requests.post(
+            r = http_client.post(
                 self.API_URL,
                 headers=self.headers,
                 timeout=15,
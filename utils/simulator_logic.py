@@ -1,30 +1,20 @@
 import numpy as np
-import random
 import pandas as pd
+import threading
+from collections import OrderedDict
+from functools import cached_property
+from utils import indicators
+from utils.resample import fixed_group_starts, calendar_labels, label_group_starts, bar_index_map, reduce_ohlc
+from utils.kline_array import KLineArray, fractal_positions
+from utils.chanlun_engine import (
+    detect_fenxing, merge_baohan, feed_fenxing, make_bi, build_centers, build_zhongshu_shapes,
+)
 
 def calculate_ema(values, span):
-    values = np.array(values, dtype=float)
-    if len(values) == 0:
-        return np.array([])
-    alpha = 2 / (span + 1)
-    ema = np.zeros_like(values)
-    ema[0] = values[0]
-    for i in range(1, len(values)):
-        ema[i] = alpha * values[i] + (1 - alpha) * ema[i-1]
-    return ema
+    return indicators.ema(values, span)
 
 def calculate_macd(close_prices, fast_period=12, slow_period=26, signal_period=9):
-    values = np.array(close_prices, dtype=float)
-    if len(values) == 0:
-        return {'dif': [], 'dea': [], 'hist': []}
-        
-    ema_fast = calculate_ema(values, fast_period)
-    ema_slow = calculate_ema(values, slow_period)
-    
-    dif = ema_fast - ema_slow
-    dea = calculate_ema(dif, signal_period)
-    hist = (dif - dea) * 2
-    
+    dif, dea, hist = indicators.macd(close_prices, fast_period, slow_period, signal_period)
     return {
         'dif': dif.tolist(),
         'dea': dea.tolist(),
@@ -35,138 +25,135 @@ def calculate_rsi(prices, period=14):
     """
     计算RSI
     """
-    prices = pd.Series(prices)
-    if len(prices) < period + 1:
-        return [50.0] * len(prices)
-        
-    delta = prices.diff()
-    up = delta.clip(lower=0)
-    down = -1 * delta.clip(upper=0)
-    
-    ma_up = up.ewm(com=period-1, adjust=False).mean()
-    ma_down = down.ewm(com=period-1, adjust=False).mean()
-    
-    rs = ma_up / ma_down
-    rsi = 100 - (100 / (1 + rs))
-    return rsi.fillna(50.0).tolist()
+    return indicators.rsi(prices, period).tolist()
 
 def calculate_bollinger_bands(prices, period=20, num_std=2):
     """
     计算布林线
     """
-    prices = pd.Series(prices)
+    prices = indicators.as_float_array(prices)
     if len(prices) < period:
         return {
             'upper': prices.tolist(),
             'middle': prices.tolist(),
             'lower': prices.tolist()
         }
-        
-    middle = prices.rolling(window=period).mean()
-    std = prices.rolling(window=period).std()
-    upper = middle + (std * num_std)
-    lower = middle - (std * num_std)
-    
+
+    upper, middle, lower = indicators.bollinger(prices, period, num_std)
+
     return {
-        'upper': upper.fillna(0).tolist(),
-        'middle': middle.fillna(0).tolist(),
-        'lower': lower.fillna(0).tolist()
+        'upper': np.nan_to_num(upper, nan=0.0).tolist(),
+        'middle': np.nan_to_num(middle, nan=0.0).tolist(),
+        'lower': np.nan_to_num(lower, nan=0.0).tolist()
     }
 
 
-def generate_simulation_data(initial_price=100, length=300):
+# 变盘周期类型 (基于真实市场的变盘周期)，权重：短期波动最常见，中期次之
+# short_strong: 3-5 日强势整理; short_std: 5-9 日常见短线波段; medium_fib: 斐波那契时间窗 ±2;
+# medium_month: 1-2 个月 (周线级别调整); long: 长期 (由于模拟长度限制，适当缩小)
+CYCLE_WEIGHTS = np.array([0.30, 0.35, 0.25, 0.08, 0.02])
+CYCLE_LOW = np.array([3, 5, 0, 20, 60])
+CYCLE_HIGH = np.array([5, 9, 0, 60, 100])
+FIB_BASES = np.array([13, 21, 34, 55])
+PRICE_FLOOR, PRICE_CAP = 1.0, 1000.0
+
+def _cycle_trends(rng, n_games, length):
+    """
+    每根K线的趋势偏置 (n_games, length)：先整批抽取变盘周期长度和每段趋势，再按周期展开
     """
-    生成模拟的K线数据
+    n_cycles = length // 3 + 1 # 最短周期为3天，足够覆盖全部K线
+    cycle_type = rng.choice(len(CYCLE_WEIGHTS), size=(n_games, n_cycles), p=CYCLE_WEIGHTS)
+    lengths = rng.integers(CYCLE_LOW[cycle_type], CYCLE_HIGH[cycle_type] + 1)
+    fib = cycle_type == 2
+    lengths[fib] = FIB_BASES[rng.integers(0, len(FIB_BASES), fib.sum())] + rng.integers(-2, 3, fib.sum())
+    # 趋势偏置: 每天倾向涨/跌多少百分比
+    trends = rng.normal(0, 0.005, (n_games, n_cycles))
+
+    # 每根K线所属的周期: 各行的周期终点加上行偏移后拼成一个有序数组，一次 searchsorted
+    ends = np.cumsum(lengths, axis=1)
+    stride = int(ends[:, -1].max()) + 1
+    offsets = np.arange(n_games)[:, None] * stride
+    pos = np.searchsorted((ends + offsets).ravel(), (np.arange(length) + offsets).ravel(), side='right')
+    bar_cycle = pos.reshape(n_games, length) - np.arange(n_games)[:, None] * n_cycles
+    return np.take_along_axis(trends, bar_cycle, axis=1)
+
+def _clamped_closes(start_price, ratio):
     """
-    data = []
+    按日涨跌幅比例连乘出收盘价，并限制在 [PRICE_FLOOR, PRICE_CAP] 内。
+    触及边界后需从截断价重新连乘，只对越界的行逐段修正 (很少发生)。
+    """
+    closes = start_price * np.cumprod(ratio, axis=1)
+    for row in np.flatnonzero(((closes > PRICE_CAP) | (closes < PRICE_FLOOR)).any(axis=1)):
+        path, r = closes[row], ratio[row]
+        start, base = 0, start_price
+        while start < len(path):
+            seg = base * np.cumprod(r[start:])
+            bad = np.flatnonzero((seg > PRICE_CAP) | (seg < PRICE_FLOOR))
+            if not bad.size:
+                path[start:] = seg
+                break
+            j = bad[0]
+            path[start:start + j] = seg[:j]
+            base = path[start + j] = min(PRICE_CAP, max(PRICE_FLOOR, seg[j]))
+            start += j + 1
+    return closes
+
+def generate_simulation_paths(n_games, length, initial_price=100, seed=None):
+    """
+    批量生成 n_games 局互相独立的模拟行情，返回 {'open', 'high', 'low', 'close'}，每项为 (n_games, length) 数组
+    seed: 随机种子，相同种子得到相同行情；为 None 时从全局 np.random 取种子 (np.random.seed 仍然有效)
+    """
+    if seed is None:
+        # 显式 int64: Windows 上 NumPy<2 的默认整数是 int32，装不下 2**32
+        seed = int(np.random.randint(0, 2**32, dtype=np.int64))
+    rng = np.random.default_rng(seed)
     # 确保初始价格在合理范围内 (1~1000)
     initial_price = max(5.0, min(950.0, float(initial_price)))
-    price = initial_price
-    trend = 0  # 趋势因子 (百分比)
-    days_until_change = 0 # 距离下次变盘的天数
-
-    for i in range(length):
-        # 1. 确定今日涨跌停限制 (昨收 * 1.1 / 0.9)
-        # 涨跌幅最大 10%
-        limit_up = round(price * 1.10, 2)
-        limit_down = round(price * 0.90, 2)
-        
-        # 2. 只有在价格范围内 (1~1000) 才有效
-        limit_up = min(limit_up, 1000.0)
-        limit_down = max(limit_down, 1.0)
-        
-        # 随机改变趋势 (基于真实市场的变盘周期)
-        if days_until_change <= 0: 
-            # 趋势偏置: 每天倾向涨/跌多少百分比 (-1% 到 1%)
-            trend = np.random.normal(0, 0.005)
-            
-            # 根据真实市场规律选择周期类型
-            cycle_type = random.choices(
-                ['short_strong', 'short_std', 'medium_fib', 'medium_month', 'long'],
-                weights=[0.30, 0.35, 0.25, 0.08, 0.02], # 权重：短期波动最常见，中期次之
-                k=1
-            )[0]
-            
-            if cycle_type == 'short_strong':
-                # 3-5个交易日 (强势整理周期)
-                days_until_change = random.randint(3, 5)
-            elif cycle_type == 'short_std':
-                # 5-9个交易日 (常见短线波段)
-                days_until_change = random.randint(5, 9)
-            elif cycle_type == 'medium_fib':
-                # 斐波那契时间窗 (13, 21, 34, 55)，加少量随机扰动
-                base = random.choice([13, 21, 34, 55])
-                days_until_change = base + random.randint(-2, 2)
-            elif cycle_type == 'medium_month':
-                # 1-2个月 (周线级别调整)
-                days_until_change = random.randint(20, 60)
-            else:
-                # 长期 (由于模拟长度限制，适当缩小)
-                days_until_change = random.randint(60, 100)
-        
-        days_until_change -= 1 
-            
-        # 3. 生成开盘价 (Pre-market fluctuation)
-        # 多数时候平开，偶尔小幅高开低开
-        open_shock = np.random.normal(0, 0.005) 
-        open_p = price * (1 + open_shock)
-        
-        # 4. 生成收盘价 (Day fluctuation based on trend)
-        # 日内波动 ~2% + 趋势
-        day_change = np.random.normal(0, 0.02) + trend
-        close_p = price * (1 + day_change)
-        
-        # 5. 生成最高最低 (High/Low)
-        # 基于open/close 扩展
-        raw_high = max(open_p, close_p) * (1 + abs(np.random.normal(0, 0.01)))
-        raw_low = min(open_p, close_p) * (1 - abs(np.random.normal(0, 0.01)))
-        
-        # 6. 修正所有价格到限制范围内
-        def clamp(val):
-            return max(limit_down, min(limit_up, val))
-            
-        open_p = clamp(open_p)
-        close_p = clamp(close_p)
-        high_p = clamp(raw_high)
-        low_p = clamp(raw_low)
-        
-        # 7. 再次确保逻辑一致性 (H >= max(O,C), L <= min(O,C))
-        high_p = max(high_p, open_p, close_p)
-        low_p = min(low_p, open_p, close_p)
-
-        data.append({
-            'time': i,
-            'open': round(open_p, 2),
-            'high': round(high_p, 2),
-            'low': round(low_p, 2),
-            'close': round(close_p, 2)
-        })
-        
-        price = close_p
+    shape = (n_games, length)
+
+    trend = _cycle_trends(rng, n_games, length)
+    # 多数时候平开，偶尔小幅高开低开；日内波动 ~2% + 趋势；最高最低基于 open/close 扩展
+    open_shock = rng.normal(0, 0.005, shape)
+    day_change = rng.normal(0, 0.02, shape) + trend
+    high_shock = np.abs(rng.normal(0, 0.01, shape))
+    low_shock = np.abs(rng.normal(0, 0.01, shape))
+
+    # 涨跌停限制: 昨收 * 1.1 / 0.9，且价格在 1~1000 内
+    close = _clamped_closes(initial_price, np.clip(1 + day_change, 0.90, 1.10))
+    prev = np.empty(shape)
+    prev[:, 0] = initial_price
+    prev[:, 1:] = close[:, :-1]
+    limit_up = np.minimum(prev * 1.10, PRICE_CAP)
+    limit_down = np.maximum(prev * 0.90, PRICE_FLOOR)
+
+    open_p = np.clip(prev * (1 + open_shock), limit_down, limit_up)
+    high_p = np.clip(np.maximum(open_p, close) * (1 + high_shock), limit_down, limit_up)
+    low_p = np.clip(np.minimum(open_p, close) * (1 - low_shock), limit_down, limit_up)
+    # 再次确保逻辑一致性 (H >= max(O,C), L <= min(O,C))
+    high_p = np.maximum(high_p, np.maximum(open_p, close))
+    low_p = np.minimum(low_p, np.minimum(open_p, close))
+
+    return {
+        'open': np.round(open_p, 2),
+        'high': np.round(high_p, 2),
+        'low': np.round(low_p, 2),
+        'close': np.round(close, 2),
+    }
+
+def generate_simulation_data(initial_price=100, length=300, seed=None):
+    """
+    生成模拟的K线数据 (单局，list of dict + MACD)
+    seed: 随机种子，便于复盘同一局行情
+    """
+    paths = generate_simulation_paths(1, length, initial_price, seed)
+    cols = [paths[name][0].tolist() for name in ('open', 'high', 'low', 'close')]
+    data = [
+        {'time': i, 'open': o, 'high': h, 'low': l, 'close': c}
+        for i, (o, h, l, c) in enumerate(zip(*cols))
+    ]
 
     # 计算MACD
-    closes = [d['close'] for d in data]
-    macd = calculate_macd(closes)
+    macd = calculate_macd(cols[3])
     
     return data, macd
 
@@ -177,7 +164,12 @@ def identify_fenxing(klines):
     """
     if len(klines) < 3:
         return None
-        
+
+    if isinstance(klines, KLineArray):
+        _, is_top = fractal_positions(klines.high[-3:], klines.low[-3:])
+        if len(is_top) == 0: return None
+        return 'top' if is_top[0] else 'bottom'
+
     k1, k2, k3 = klines[-3], klines[-2], klines[-1]
     
     # 简单的顶分型定义：中间K线高点最高，底不最低（这里简化，严谨缠论需要包含处理）
@@ -194,9 +186,11 @@ def identify_fenxing(klines):
 def process_baohan(klines_data):
     """
     处理K线包含关系
-    input: list of dict {'time', 'open', 'high', 'low', 'close'}
-    output: list of dict (processed)
+    input: list of dict {'time', 'open', 'high', 'low', 'close'} 或 KLineArray
+    output: list of dict (processed)；输入为 KLineArray 时返回合并后的 KLineArray
     """
+    if isinstance(klines_data, KLineArray):
+        return _process_baohan_array(klines_data)
     if not klines_data:
         return []
         
@@ -215,74 +209,113 @@ def process_baohan(klines_data):
         
     result = [processed[0]]
     direction = 1 # 1 for up, -1 for down (default up)
-    
-    for i in range(1, len(processed)):
-        curr = processed[i]
-        prev = result[-1]
-        
-        # Ensure dates are initialized
-        if 'high_date' not in prev: prev['high_date'] = prev['date']
-        if 'low_date' not in prev: prev['low_date'] = prev['date']
-        curr_high_date = curr.get('high_date', curr['date'])
-        curr_low_date = curr.get('low_date', curr['date'])
-        
-        # 判断包含关系: (High1 >= High2 and Low1 <= Low2) or (High2 >= High1 and Low2 <= Low1)
-        is_included = (prev['high'] >= curr['high'] and prev['low'] <= curr['low']) or \
-                      (curr['high'] >= prev['high'] and curr['low'] <= prev['low'])
-                      
-        if is_included:
-            # 处理包含
+    for curr in processed[1:]:
+        direction = merge_baohan(result, curr, direction)
+    return result
+
+def _process_baohan_array(k):
+    """
+    process_baohan 的列式实现，返回合并后的 KLineArray (high_time/low_time 为真实极值时间)
+    """
+    n = len(k)
+    if n == 0:
+        return k[0:0]
+    highs, lows, times = k.high.tolist(), k.low.tolist(), k.time.tolist()
+    high_times, low_times = k.high_time.tolist(), k.low_time.tolist()
+    rh, rl, rt, rht, rlt, src = [highs[0]], [lows[0]], [times[0]], [high_times[0]], [low_times[0]], [0]
+    direction = 1
+
+    for i in range(1, n):
+        h, l = highs[i], lows[i]
+        ph, pl = rh[-1], rl[-1]
+        if (ph >= h and pl <= l) or (h >= ph and l <= pl):
             if direction == 1: # 向上趋势，取高高，低高
-                if curr['high'] >= prev['high']:
-                    new_high = curr['high']
-                    new_high_date = curr_high_date
-                else:
-                    new_high = prev['high']
-                    new_high_date = prev['high_date']
-                    
-                if curr['low'] >= prev['low']: # Low should be max(L1, L2)
-                    new_low = curr['low']
-                    new_low_date = curr_low_date
-                else:
-                    new_low = prev['low']
-                    new_low_date = prev['low_date']
+                if h >= ph: rh[-1], rht[-1] = h, high_times[i]
+                if l >= pl: rl[-1], rlt[-1] = l, low_times[i]
             else: # 向下趋势，取低低，高低
-                if curr['high'] <= prev['high']: # High should be min(H1, H2)
-                    new_high = curr['high']
-                    new_high_date = curr_high_date
-                else:
-                    new_high = prev['high']
-                    new_high_date = prev['high_date']
-                    
-                if curr['low'] <= prev['low']:
-                    new_low = curr['low']
-                    new_low_date = curr_low_date
-                else:
-                    new_low = prev['low']
-                    new_low_date = prev['low_date']
-            
-            # 更新前一根K线（合并）
-            result[-1]['high'] = new_high
-            result[-1]['low'] = new_low
-            result[-1]['high_date'] = new_high_date
-            result[-1]['low_date'] = new_low_date
-            # date通常取后一根的date (logical time)
-            result[-1]['date'] = curr['date']
-            result[-1]['original'] = curr['original'] # Keep reference to latest
-            
+                if h <= ph: rh[-1], rht[-1] = h, high_times[i]
+                if l <= pl: rl[-1], rlt[-1] = l, low_times[i]
+            rt[-1] = times[i]
+            src[-1] = i
         else:
-            # 确定新趋势方向 (如果不是包含，则确定新方向)
-            if curr['high'] > prev['high']:
+            if h > ph:
                 direction = 1
-            elif curr['low'] < prev['low']:
+            elif l < pl:
                 direction = -1
-            
-            # Initialize dates for new independent bar
-            curr['high_date'] = curr_high_date
-            curr['low_date'] = curr_low_date
-            result.append(curr)
-            
-    return result
+            rh.append(h); rl.append(l); rt.append(times[i])
+            rht.append(high_times[i]); rlt.append(low_times[i]); src.append(i)
+
+    # 开收盘价和成交量沿用合并组中最后一根K线 (对应 dict 版本的 'original')
+    src = np.asarray(src)
+    return KLineArray(rt, k.open[src], rh, rl, k.close[src], k.volume[src],
+                      high_time=rht, low_time=rlt, time_kind=k.time_kind)
+
+def _fenxing_chain(klines):
+    """
+    识别分型并按顶底交替规则连接成端点链，find_bi 与笔/中枢计算共用这一份实现。
+    规则：同类分型保留更极端者；异类分型间隔>=3 (老笔) 才成笔，否则忽略。
+    KLineArray 走向量化分型识别，list of dict 逐根判断。
+    """
+    points = []
+    if isinstance(klines, KLineArray):
+        positions, is_top = fractal_positions(klines.high, klines.low)
+        highs, lows = klines.high, klines.low
+        for pos, top in zip(positions.tolist(), is_top.tolist()):
+            if top:
+                feed_fenxing(points, {'type': 'top', 'index': pos, 'price': float(highs[pos])})
+            else:
+                feed_fenxing(points, {'type': 'bottom', 'index': pos, 'price': float(lows[pos])})
+        return points
+
+    for i in range(1, len(klines) - 1):
+        k2 = klines[i]
+        fx_type = detect_fenxing(klines[i-1], k2, klines[i+1])
+        if fx_type == 'top':
+            feed_fenxing(points, {'type': 'top', 'index': i, 'price': k2['high']})
+        elif fx_type == 'bottom':
+            feed_fenxing(points, {'type': 'bottom', 'index': i, 'price': k2['low']})
+    return points
+
+def _chain_to_bi_list(klines, points):
+    """
+    端点链 -> calculate_bi_and_centers 格式的笔
+    """
+    if not isinstance(klines, KLineArray):
+        return [make_bi(p1, p2, klines) for p1, p2 in zip(points, points[1:])]
+
+    # dict 版本取 k2.get('date', '')：原始模拟器K线没有 'date' 键，合并后的K线以 time 作为 date
+    k = klines
+    has_date = k.time_kind != 'index' or k.is_merged
+    bi_list = []
+    for p1, p2 in zip(points, points[1:]):
+        bi_list.append({
+            'start_index': p1['index'],
+            'start_val': p1['price'],
+            'start_date': k.time_value(k.time[p1['index']]) if has_date else '',
+            'end_index': p2['index'],
+            'end_val': p2['price'],
+            'end_date': k.time_value(k.time[p2['index']]) if has_date else '',
+            'type': 'up' if p2['price'] > p1['price'] else 'down'
+        })
+    return bi_list
+
+def _chain_to_bi_points(klines, points):
+    """
+    端点链 -> find_bi 格式的端点 (合并K线优先使用真实的最高/最低点日期)
+    """
+    if isinstance(klines, KLineArray):
+        k = klines
+        return [
+            {'type': p['type'], 'index': p['index'], 'price': p['price'],
+             'date': k.time_value(k.high_time[p['index']] if p['type'] == 'top' else k.low_time[p['index']])}
+            for p in points
+        ]
+    bi_points = []
+    for p in points:
+        k = klines[p['index']]
+        date = k.get('high_date', k['date']) if p['type'] == 'top' else k.get('low_date', k['date'])
+        bi_points.append({'type': p['type'], 'index': p['index'], 'price': p['price'], 'date': date})
+    return bi_points
 
 def find_bi(processed_klines):
     """
@@ -292,546 +325,355 @@ def find_bi(processed_klines):
     """
     if len(processed_klines) < 5:
         return []
-        
-    fx_list = []
-    # 1. Find all FenXing (Fractals)
-    for i in range(1, len(processed_klines)-1):
-        k1 = processed_klines[i-1]
-        k2 = processed_klines[i]
-        k3 = processed_klines[i+1]
-        
-        # Use real dates if available, else logical date
-        k2_high_date = k2.get('high_date', k2['date'])
-        k2_low_date = k2.get('low_date', k2['date'])
-        
-        if k2['high'] > k1['high'] and k2['high'] > k3['high']:
-            fx_list.append({'type': 'top', 'index': i, 'price': k2['high'], 'date': k2_high_date})
-        elif k2['low'] < k1['low'] and k2['low'] < k3['low']:
-            fx_list.append({'type': 'bottom', 'index': i, 'price': k2['low'], 'date': k2_low_date})
-            
-    if not fx_list:
-        return []
-        
-    # 2. Connect FenXing to form Bi
-    # 规则：
-    # a. 顶底交替
-    # b. 中间至少隔3根K线 (index diff >= 4) ? 
-    #    标准缠论：顶分型与底分型之间至少有一根K线不属于这两个分型，即 index diff >= 3 (e.g. 1(top), 2, 3, 4(bottom)) -> 4-1=3 ?
-    #    Strictly: Top(i), Bottom(j) -> j > i+3 (at least 3 K-lines between the peak and valley points? No, between the constituent K-lines)
-    #    Simpler rule: Index difference >= 4 (Top is at i, Bottom at j, j-i >= 4)
-    
-    bi_points = []
-    # Find first strong point to start? Or just start from first valid pair
-    
-    # 简单回溯算法
-    # 找到最高/最低点作为起点
-    
-    last_bi = fx_list[0]
-    bi_points.append(last_bi)
-    
-    for fx in fx_list[1:]:
-        if fx['type'] == last_bi['type']:
-            # Same type, check if better (higher top or lower bottom)
-            if fx['type'] == 'top':
-                if fx['price'] > last_bi['price']:
-                    bi_points[-1] = fx # Replace with higher top
-                    last_bi = fx
-            else: # bottom
-                if fx['price'] < last_bi['price']:
-                    bi_points[-1] = fx # Replace with lower bottom
-                    last_bi = fx
-        else:
-            # Different type, check distance
-            # Standard Chan Lun (New Pen): Top and Bottom fractals must be separated by at least one K-line (index diff >= 4).
-            # Old Pen (Common): Top and Bottom fractals just need to be non-overlapping (index diff >= 3).
-            # We use Old Pen (>=3) here to be consistent with visualization expectations and capture more turns.
-            if fx['index'] - last_bi['index'] >= 3:
-                bi_points.append(fx)
-                last_bi = fx
-            else:
-                # Distance too short, ignore
-                pass
-                
-    return bi_points
+    return _chain_to_bi_points(processed_klines, _fenxing_chain(processed_klines))
 
-def check_divergence(klines, macd_data, index, lookback=30):
+def _scan_divergence(klines, hists, index, lookback):
     """
-    检查背驰，返回描述和需要高亮的形状数据
+    直接扫描前 lookback 根K线判断背驰，返回值格式同 DivergenceIndex.query
     """
-    if index < lookback: return None, []
-    
     current_k = klines[index]
-    current_hist = macd_data['hist'][index]
+    current_hist = hists[index]
     
     # 以前 lookback 根K线作为参考系
     start_lookback = index - lookback
     prev_klines = klines[start_lookback:index]
-    prev_hists = macd_data['hist'][start_lookback:index]
+    prev_hists = hists[start_lookback:index]
     
-    if not prev_klines: return None, []
+    if not len(prev_klines): return None
 
     # ---底背驰判断---
     # 条件1：创新低
     min_prev_low = float('inf')
     min_prev_idx = -1
     
-    for i, k in enumerate(prev_klines):
-        if k['low'] < min_prev_low:
-            min_prev_low = k['low']
-            # i 是相对 prev_klines 的索引，min_prev_idx 需要是全局索引
-            min_prev_idx = start_lookback + i
+    if isinstance(prev_klines, KLineArray):
+        rel = int(np.argmin(prev_klines.low))
+        min_prev_low, min_prev_idx = float(prev_klines.low[rel]), start_lookback + rel
+    else:
+        for i, k in enumerate(prev_klines):
+            if k['low'] < min_prev_low:
+                min_prev_low = k['low']
+                # i 是相对 prev_klines 的索引，min_prev_idx 需要是全局索引
+                min_prev_idx = start_lookback + i
             
     if current_k['low'] < min_prev_low:
         # 条件2：MACD绿柱没有创新低 (动能衰竭)
         min_hist_prev = min(prev_hists)
-        
         # 找到前低MACD的索引，用于画图
-        min_hist_idx_rel = prev_hists.index(min_hist_prev)
-        min_hist_idx = start_lookback + min_hist_idx_rel
+        min_hist_idx = start_lookback + list(prev_hists).index(min_hist_prev)
         
         if current_hist < 0 and current_hist > min_hist_prev:
-            shapes = [
-                # 1. K线图：背驰连线 (加粗实线)
-                {
-                    'type': 'line',
-                    'xref': 'x', 'yref': 'y',
-                    'x0': min_prev_idx, 'y0': min_prev_low,
-                    'x1': index, 'y1': current_k['low'],
-                    'line': {'color': 'rgb(128, 128, 128)', 'width': 3} # 灰色
-                },
-                # 2. K线图：背驰区间背景 (淡红高亮)
-                {
-                    'type': 'rect',
-                    'xref': 'x', 'yref': 'y',
-                    'x0': min_prev_idx,
-                    'x1': index,
-                    'y0': min(min_prev_low, current_k['low']) * 0.99, # 稍微扩一点范围
-                    'y1': max(min_prev_low, current_k['low']) * 1.01,
-                    'fillcolor': 'rgba(254, 202, 202, 0.4)', # Red-200
-                    'line': {'width': 0}
-                },
-                # 3. MACD图：背驰连线 (虚线指示)
-                {
-                    'type': 'line',
-                    'xref': 'x', 'yref': 'y2', # 指向副图Y轴
-                    'x0': min_hist_idx, 'y0': min_hist_prev,
-                    'x1': index, 'y1': current_hist,
-                    'line': {'color': 'rgb(128, 128, 128)', 'width': 2, 'dash': 'dot'} 
-                }
-            ]
-            return "底背驰（价格新低但绿柱未加深）", shapes
+            return 'bottom', min_prev_idx, min_prev_low, min_hist_idx, min_hist_prev
             
     # ---顶背驰判断---
     # 条件1：创新高
     max_prev_high = float('-inf')
     max_prev_idx = -1
     
-    for i, k in enumerate(prev_klines):
-        if k['high'] > max_prev_high:
-            max_prev_high = k['high']
-            max_prev_idx = start_lookback + i
+    if isinstance(prev_klines, KLineArray):
+        rel = int(np.argmax(prev_klines.high))
+        max_prev_high, max_prev_idx = float(prev_klines.high[rel]), start_lookback + rel
+    else:
+        for i, k in enumerate(prev_klines):
+            if k['high'] > max_prev_high:
+                max_prev_high = k['high']
+                max_prev_idx = start_lookback + i
             
     if current_k['high'] > max_prev_high:
         # 条件2：MACD红柱没有创新高
         max_hist_prev = max(prev_hists)
-        
-        # 找到前高MACD的索引
-        max_hist_idx_rel = prev_hists.index(max_hist_prev)
-        max_hist_idx = start_lookback + max_hist_idx_rel
+        max_hist_idx = start_lookback + list(prev_hists).index(max_hist_prev)
         
         if current_hist > 0 and current_hist < max_hist_prev:
-            shapes = [
-                # 1. K线图：背驰连线 (加粗实线)
-                {
-                    'type': 'line',
-                    'xref': 'x', 'yref': 'y',
-                    'x0': max_prev_idx, 'y0': max_prev_high,
-                    'x1': index, 'y1': current_k['high'],
-                    'line': {'color': 'rgb(128, 128, 128)', 'width': 3} # 灰色
-                },
-                # 2. K线图：背驰区间背景 (淡绿高亮)
-                {
-                    'type': 'rect',
-                    'xref': 'x', 'yref': 'y',
-                    'x0': max_prev_idx,
-                    'x1': index,
-                    'y0': min(max_prev_high, current_k['high']) * 0.99,
-                    'y1': max(max_prev_high, current_k['high']) * 1.01,
-                    'fillcolor': 'rgba(187, 247, 208, 0.4)', # Green-200
-                    'line': {'width': 0}
-                },
-                # 3. MACD图：背驰连线 (虚线指示)
-                {
-                    'type': 'line',
-                    'xref': 'x', 'yref': 'y2', # 指向副图Y轴
-                    'x0': max_hist_idx, 'y0': max_hist_prev,
-                    'x1': index, 'y1': current_hist,
-                    'line': {'color': 'rgb(128, 128, 128)', 'width': 2, 'dash': 'dot'}
-                }
-            ]
-            return "顶背驰（价格新高但红柱未增长）", shapes
+            return 'top', max_prev_idx, max_prev_high, max_hist_idx, max_hist_prev
             
-    return None, []
+    return None
+
+def check_divergence(klines, macd_data, index, lookback=30, div_index=None):
+    """
+    检查背驰，返回描述和需要高亮的形状数据
+    div_index: 可选的 DivergenceIndex (对整条序列预先建好)，区间极值改为 O(1) 查询
+    """
+    if index < lookback: return None, []
+
+    if div_index is not None:
+        hit = div_index.query(index, lookback)
+    else:
+        hit = _scan_divergence(klines, macd_data['hist'], index, lookback)
+    if hit is None:
+        return None, []
+
+    kind, prev_idx, prev_price, hist_idx, hist_prev = hit
+    current_k = klines[index]
+    current_hist = macd_data['hist'][index]
+    price = current_k['low'] if kind == 'bottom' else current_k['high']
+    shapes = [
+        # 1. K线图：背驰连线 (加粗实线)
+        {
+            'type': 'line',
+            'xref': 'x', 'yref': 'y',
+            'x0': prev_idx, 'y0': prev_price,
+            'x1': index, 'y1': price,
+            'line': {'color': 'rgb(128, 128, 128)', 'width': 3} # 灰色
+        },
+        # 2. K线图：背驰区间背景 (底背驰淡红，顶背驰淡绿)
+        {
+            'type': 'rect',
+            'xref': 'x', 'yref': 'y',
+            'x0': prev_idx,
+            'x1': index,
+            'y0': min(prev_price, price) * 0.99, # 稍微扩一点范围
+            'y1': max(prev_price, price) * 1.01,
+            'fillcolor': 'rgba(254, 202, 202, 0.4)' if kind == 'bottom' else 'rgba(187, 247, 208, 0.4)', # Red-200 / Green-200
+            'line': {'width': 0}
+        },
+        # 3. MACD图：背驰连线 (虚线指示)
+        {
+            'type': 'line',
+            'xref': 'x', 'yref': 'y2', # 指向副图Y轴
+            'x0': hist_idx, 'y0': hist_prev,
+            'x1': index, 'y1': current_hist,
+            'line': {'color': 'rgb(128, 128, 128)', 'width': 2, 'dash': 'dot'}
+        }
+    ]
+    if kind == 'bottom':
+        return "底背驰（价格新低但绿柱未加深）", shapes
+    return "顶背驰（价格新高但红柱未增长）", shapes
 
 def resample_klines(daily_data, period):
     """
     将日线数据重采样为更大级别的数据 (周K, 月K等)
-    period: 聚合的K线数量，例如 5 (周), 20 (月), 60 (季)
+    period: 聚合的K线数量，例如 5 (周), 20 (月), 60 (季)；
+            带日期的序列也可传 'W' (自然周) / 'M' (自然月)
+    daily_data: list of dict 或 KLineArray
     """
-    resampled = []
-    if not daily_data:
+    if not len(daily_data):
         return [], calculate_macd([]) # 返回空MACD结构
 
-    # 按固定周期分块
-    for i in range(0, len(daily_data), period):
-        chunk = daily_data[i : i + period]
-        if not chunk: continue
-        
-        # 聚合
-        open_p = chunk[0]['open']
-        close_p = chunk[-1]['close']
-        high_p = max(d['high'] for d in chunk)
-        low_p = min(d['low'] for d in chunk)
-        
-        # 使用新的索引作为time
-        new_time = len(resampled)
-        
-        resampled.append({
-            'time': new_time,
-            'open': open_p,
-            'high': high_p,
-            'low': low_p,
-            'close': close_p,
-            # 保留原始的对应日线索引范围，用于UI映射
-            'start_day_idx': chunk[0]['time'],
-            'end_day_idx': chunk[-1]['time']
-        })
+    if isinstance(daily_data, KLineArray):
+        k = daily_data
+    elif 'time' in daily_data[0]:
+        k = KLineArray.from_records(daily_data)
+    else:
+        k = KLineArray.from_dataframe(pd.DataFrame(daily_data))
+
+    labels = None
+    if isinstance(period, str):
+        if k.time_kind == 'index':
+            raise ValueError("Calendar resampling requires dated klines")
+        starts, labels = label_group_starts(calendar_labels(k.time.astype('datetime64[ns]'), period))
+    else:
+        starts = fixed_group_starts(len(k), period)
+    agg = reduce_ohlc(starts, k.open, k.high, k.low, k.close, k.volume)
+    ends = np.r_[starts[1:], len(k)] - 1
+    # 保留原始的对应日线范围，用于UI映射：模拟器数据记录 time，带日期的序列记录行位置
+    day_pos = k.time if k.time_kind == 'index' else np.arange(len(k))
+
+    resampled = []
+    for i in range(len(starts)):
+        bar = {
+            'time': i, # 使用新的索引作为time
+            'open': float(agg['open'][i]),
+            'high': float(agg['high'][i]),
+            'low': float(agg['low'][i]),
+            'close': float(agg['close'][i]),
+            'start_day_idx': int(day_pos[starts[i]]),
+            'end_day_idx': int(day_pos[ends[i]]),
+        }
+        if labels is not None:
+            bar['date'] = k.time_value(pd.Timestamp(labels[i]).value)
+        resampled.append(bar)
         
     # 计算新级别的MACD
-    closes = [d['close'] for d in resampled]
-    macd = calculate_macd(closes)
+    macd = calculate_macd(agg['close'].tolist())
     
     return resampled, macd
 
+def day_to_bar_map(resampled):
+    """
+    日线位置 -> 所属大级别K线序号的查表数组 (O(1) 定位当前日线所在的周/月K)
+    resampled: resample_klines 的输出，start_day_idx/end_day_idx 从 0 开始连续覆盖全部日线
+    """
+    if not resampled:
+        return np.array([], dtype=np.int64)
+    starts = np.array([k['start_day_idx'] for k in resampled], dtype=np.int64)
+    return bar_index_map(starts, resampled[-1]['end_day_idx'] + 1)
+
+def _locate_bar(bars, bar_map, day_idx):
+    """
+    day_idx 所在的大级别K线序号，找不到返回 -1；有查表数组时 O(1)，否则线性查找
+    """
+    if bar_map is not None:
+        return int(bar_map[day_idx]) if 0 <= day_idx < len(bar_map) else -1
+    for i, b in enumerate(bars):
+        if b['start_day_idx'] <= day_idx <= b['end_day_idx']:
+            return i
+    return -1
+
 def calculate_bi_and_zhongshu_shapes(klines):
     """
     计算并返回笔（Bi）和中枢（Zhongshu/Box）的形状数据
     简化版逻辑，仅用于模拟器展示辅助
     """
-    shapes = []
-    
-    # 1. 识别所有分型点 (Fenxing Points)
-    fenxings = [] # list of {'index': i, 'type': 'top'/'bottom', 'val': price}
-    
-    # 这里需要遍历整个序列来通过交替规则确认笔
-    # 注意：klines 是截止到当前的全部数据，我们重新计算整个历史的笔
-    for i in range(2, len(klines)):
-        subset = klines[i-2 : i+1]
-        fx_type = identify_fenxing(subset)
-        if fx_type:
-            # 简化版笔识别逻辑：
-            # 1. 必须是一顶一底交替
-            # 2. 顶底之间至少间隔一定K线 (这里设为3根，即中间有K线)
-            k2 = subset[1]
-            # k2的索引在全局序列中是 i-1
-            k2_idx = i - 1
-            val = k2['high'] if fx_type == 'top' else k2['low']
-            
-            if not fenxings:
-                # 第一个分型直接接纳
-                fenxings.append({'index': k2_idx, 'type': fx_type, 'val': val})
-            else:
-                last = fenxings[-1]
-                if last['type'] != fx_type:
-                    # 类型不同，检查距离
-                    if k2_idx - last['index'] >= 3:
-                        fenxings.append({'index': k2_idx, 'type': fx_type, 'val': val})
-                    # 如果距离太近，忽略这个新分型（或者这是一个更优的分型？）
-                    # 简化处理：忽略过近的转折
-                else:
-                    # 类型相同，保留更极端的那个
-                    if fx_type == 'top':
-                        if val > last['val']:
-                            fenxings[-1] = {'index': k2_idx, 'type': fx_type, 'val': val}
-                    else:
-                        if val < last['val']:
-                            fenxings[-1] = {'index': k2_idx, 'type': fx_type, 'val': val}
-
-    # 2. 生成笔的连线 (Bi Shapes)
-    bi_segments = [] 
-    for i in range(len(fenxings) - 1):
-        p1 = fenxings[i]
-        p2 = fenxings[i+1]
-        
-        shapes.append({
-            'type': 'line',
-            'xref': 'x', 'yref': 'y',
-            'x0': p1['index'], 'y0': p1['val'],
-            'x1': p2['index'], 'y1': p2['val'],
-            'line': {'color': 'rgba(70, 70, 70, 0.6)', 'width': 2}, # 深灰色实线
-            # 'layer': 'below' # Plotly shape layer (not supported directly in dict always, simplified)
-        })
-        bi_segments.append({
-            'x0': p1['index'], 'y0': p1['val'],
-            'x1': p2['index'], 'y1': p2['val']
-        })
-
-    # 3. 生成中枢矩形 (Zhongshu Shapes)
-    # 逻辑：连续三笔重叠部分 -> 升级逻辑：合并重叠/连续的中枢为大级别中枢
-    raw_zhongshus = []
-    if len(bi_segments) >= 3:
-        for i in range(len(bi_segments) - 2):
-            b1 = bi_segments[i]
-            b2 = bi_segments[i+1]
-            b3 = bi_segments[i+2]
-            
-            # 计算三笔价格区间的交集 (中枢核心区域)
-            r1 = (min(b1['y0'], b1['y1']), max(b1['y0'], b1['y1']))
-            r2 = (min(b2['y0'], b2['y1']), max(b2['y0'], b2['y1']))
-            r3 = (min(b3['y0'], b3['y1']), max(b3['y0'], b3['y1']))
-            
-            overlap_min = max(r1[0], r2[0], r3[0])
-            overlap_max = min(r1[1], r2[1], r3[1])
-            
-            if overlap_min < overlap_max:
-                # 存在有效中枢区域
-                raw_zhongshus.append({
-                    'x0': b1['x0'], 
-                    'x1': b3['x1'],
-                    'y0': overlap_min,
-                    'y1': overlap_max
-                })
-
-    # 合并重叠的中枢 (Expansion/Extension)
-    merged_zhongshus = []
-    if raw_zhongshus:
-        # 按开始时间排序 (通常已经是顺序的)
-        current_z = raw_zhongshus[0]
-        
-        for i in range(1, len(raw_zhongshus)):
-            next_z = raw_zhongshus[i]
-            
-            # 判断是否重叠 (Overlap)
-            # 1. 时间上：raw_zhongshus 是基于滑动窗口生成的，天生时间重叠/连续
-            # 2. 空间上：判断价格区间是否有交集
-            mn = max(current_z['y0'], next_z['y0'])
-            mx = min(current_z['y1'], next_z['y1'])
-            
-            if mn < mx:
-                # 存在价格交集，视为同一中枢的延伸/扩张 -> 合并
-                # 新的范围：时间并集，价格并集 (体现大级别/扩张范围)
-                # 注：缠论严格定义中枢级别升级需要9段，或者两个独立中枢波动区间重叠。
-                # 这里做视觉简化：凡是连在一起且价格重叠的，都画成一个大框。
-                current_z['x1'] = max(current_z['x1'], next_z['x1'])
-                current_z['y0'] = min(current_z['y0'], next_z['y0'])
-                current_z['y1'] = max(current_z['y1'], next_z['y1'])
-            else:
-                # 不重叠，结束当前中枢，开始下一个
-                merged_zhongshus.append(current_z)
-                current_z = next_z
-        
-        merged_zhongshus.append(current_z)
-
-    # 生成最终形状
-    for z in merged_zhongshus:
-        shapes.append({
-            'type': 'rect',
-            'xref': 'x', 'yref': 'y',
-            'x0': z['x0'], 
-            'x1': z['x1'],
-            'y0': z['y0'],
-            'y1': z['y1'],
-            'fillcolor': 'rgba(255, 165, 0, 0.15)', # 橙色半透明
-            'line': {'width': 0},
-        })
-        # 画边框
-        shapes.append({
-             'type': 'rect',
-             'xref': 'x', 'yref': 'y',
-             'x0': z['x0'], 
-             'x1': z['x1'],
-             'y0': z['y0'],
-             'y1': z['y1'],
-             'line': {'color': 'rgba(255, 165, 0, 0.6)', 'width': 1.5, 'dash': 'dot'}, # 加粗一点边框
-             'fillcolor': 'rgba(0,0,0,0)'
-        })
-
-    return shapes
+    return build_zhongshu_shapes(_chain_to_bi_list(klines, _fenxing_chain(klines)))
 
 def calculate_bi_and_centers(klines):
     """
     计算笔和中枢，返回结构化数据（非图形Shapes）
     """
-    # 1. 识别分型
-    fenxings = []
-    for i in range(2, len(klines)):
-        subset = klines[i-2 : i+1]
-        fx_type = identify_fenxing(subset)
-        if fx_type:
-            k2 = subset[1]
-            k2_idx = i - 1
-            val = k2['high'] if fx_type == 'top' else k2['low']
-            date = k2.get('date', '')
-            
-            if not fenxings:
-                fenxings.append({'index': k2_idx, 'type': fx_type, 'val': val, 'date': date})
-            else:
-                last = fenxings[-1]
-                if last['type'] != fx_type:
-                    if k2_idx - last['index'] >= 3:
-                        fenxings.append({'index': k2_idx, 'type': fx_type, 'val': val, 'date': date})
-                else:
-                    if fx_type == 'top':
-                        if val > last['val']:
-                            fenxings[-1] = {'index': k2_idx, 'type': fx_type, 'val': val, 'date': date}
-                    else:
-                        if val < last['val']:
-                            fenxings[-1] = {'index': k2_idx, 'type': fx_type, 'val': val, 'date': date}
-                            
-    # 2. 生成笔
-    bi_list = []
-    for i in range(len(fenxings) - 1):
-        p1 = fenxings[i]
-        p2 = fenxings[i+1]
-        bi_list.append({
-            'start_index': p1['index'],
-            'start_val': p1['val'],
-            'start_date': p1['date'],
-            'end_index': p2['index'],
-            'end_val': p2['val'],
-            'end_date': p2['date'],
-            'type': 'up' if p2['val'] > p1['val'] else 'down'
-        })
-        
-    # 3. 生成中枢
-    centers = []
-    if len(bi_list) >= 3:
-        raw_centers = []
-        for i in range(len(bi_list) - 2):
-            b1 = bi_list[i]
-            b2 = bi_list[i+1]
-            b3 = bi_list[i+2]
-            
-            min1, max1 = min(b1['start_val'], b1['end_val']), max(b1['start_val'], b1['end_val'])
-            min2, max2 = min(b2['start_val'], b2['end_val']), max(b2['start_val'], b2['end_val'])
-            min3, max3 = min(b3['start_val'], b3['end_val']), max(b3['start_val'], b3['end_val'])
-            
-            zg = min(max1, max2, max3)
-            zd = max(min1, min2, min3)
-            
-            if zg > zd:
-                raw_centers.append({
-                    'start_index': b1['end_index'], # 逻辑起点调整为 b1 的结束（即 b2 的开始），去除进入笔
-                    'end_index': b3['end_index'], 
-                    'visual_end_index': b2['end_index'], 
-                    'start_date': b1['end_date'], # 对应 b2.start_date
-                    'end_date': b3['end_date'],
-                    'visual_end_date': b2['end_date'],
-                    'zg': zg,
-                    'zd': zd,
-                    'is_up': b1['type'] == 'up' # 记录方向，后续可选用于颜色区分
-                })
-        
-        # 合并重叠的中枢
-        if raw_centers:
-            curr = raw_centers[0]
-            # 默认使用 visual_end 作为显示结束
-            curr['end_index'] = curr['visual_end_index']
-            curr['end_date'] = curr['visual_end_date']
-            
-            for next_c in raw_centers[1:]:
-                mn = max(curr['zd'], next_c['zd'])
-                mx = min(curr['zg'], next_c['zg'])
-                
-                if mn < mx:
-                    # 合并
-                    # 只要有重叠，就延伸到下一个中枢的视觉结束点
-                    curr['end_index'] = max(curr['end_index'], next_c['visual_end_index'])
-                    curr['end_date'] = next_c['visual_end_date'] 
-                    
-                    # 区间合并策略：取并集（保持最大包容性）
-                    curr['zd'] = min(curr['zd'], next_c['zd'])
-                    curr['zg'] = max(curr['zg'], next_c['zg'])
-                else:
-                    centers.append(curr)
-                    curr = next_c
-                    # 初始化新中枢的结束时间
-                    curr['end_index'] = curr['visual_end_index']
-                    curr['end_date'] = curr['visual_end_date']
-            centers.append(curr)
-            
-    return bi_list, centers
+    bi_list = _chain_to_bi_list(klines, _fenxing_chain(klines))
+    return bi_list, build_centers(bi_list)
+
+class ChanlunAnalysis:
+    """
+    某一时刻的缠论结构分析结果：分型链、笔、中枢、背驰和当前分型。
+    形状绘制、操作评价和资金页缠论助手读取同一个对象，各部分首次访问时才计算且只算一次。
+    klines: 截止到当前的K线 (list of dict 或 KLineArray)；index: 当前K线位置，默认最后一根
+    engine: 可选的 ChanlunEngine，与 klines 同步时笔/中枢形状直接取其增量结果
+    div_index: 可选的 DivergenceIndex (以 klines 为前缀的整条序列上建立)，背驰改为 O(1) 查询
+    """
+    def __init__(self, klines, macd_data=None, index=None, engine=None, div_index=None):
+        self.klines = klines
+        self.macd_data = macd_data
+        self.index = len(klines) - 1 if index is None else index
+        self.engine = engine if engine is not None and len(engine) == len(klines) else None
+        self.div_index = div_index if div_index is not None and len(div_index) > self.index else None
+
+    @cached_property
+    def points(self):
+        """分型链端点"""
+        return _fenxing_chain(self.klines)
+
+    @cached_property
+    def bi_points(self):
+        """find_bi 格式的笔端点 (klines 应为包含处理后的K线)"""
+        if len(self.klines) < 5:
+            return []
+        return _chain_to_bi_points(self.klines, self.points)
+
+    @cached_property
+    def bi_list(self):
+        return _chain_to_bi_list(self.klines, self.points)
+
+    @cached_property
+    def centers(self):
+        return build_centers(self.bi_list)
+
+    @cached_property
+    def zhongshu_shapes(self):
+        """笔连线和中枢矩形 (calculate_bi_and_zhongshu_shapes 口径)"""
+        if self.engine is not None:
+            return self.engine.shapes()
+        return build_zhongshu_shapes(self.bi_list)
+
+    @cached_property
+    def divergence(self):
+        """(背驰描述, 背驰形状)，没有 MACD 数据时为 (None, [])"""
+        if self.macd_data is None:
+            return None, []
+        return check_divergence(self.klines, self.macd_data, self.index, div_index=self.div_index)
+
+    @cached_property
+    def fenxing(self):
+        """当前K线与前两根构成的分型: 'top' / 'bottom' / None"""
+        return identify_fenxing(self.klines[max(0, self.index-2):self.index+1])
+
+    @cached_property
+    def fenxing_shapes(self):
+        """当前分型的高亮框"""
+        if not self.fenxing:
+            return []
+        k_subset = self.klines[self.index-2 : self.index+1]
+        max_h = max(k['high'] for k in k_subset)
+        min_l = min(k['low'] for k in k_subset)
+
+        if self.fenxing == 'bottom':
+            box_color = 'rgba(255, 0, 0, 0.1)' # 偏红
+            border_color = 'rgba(255, 0, 0, 0.5)'
+        else:
+            box_color = 'rgba(0, 128, 0, 0.1)' # 偏绿
+            border_color = 'rgba(0, 128, 0, 0.5)'
 
-def get_chanlun_shapes(klines, macd_data, current_index):
+        return [{
+            'type': 'rect',
+            'xref': 'x', 'yref': 'y',
+            'x0': self.index - 2 - 0.4,
+            'x1': self.index + 0.4,
+            'y0': min_l,
+            'y1': max_h,
+            'fillcolor': box_color,
+            'line': {'color': border_color, 'width': 1, 'dash': 'solid'}
+        }]
+
+    @property
+    def shapes(self):
+        """全部高亮形状：笔和中枢、背驰、当前分型 (每次返回新列表)"""
+        return self.zhongshu_shapes + self.divergence[1] + self.fenxing_shapes
+
+_ANALYSIS_CACHE = OrderedDict()
+_ANALYSIS_CACHE_SIZE = 32
+_ANALYSIS_LOCK = threading.Lock()
+
+def get_chanlun_analysis(klines, macd_data=None, index=None, engine=None, div_index=None):
+    """
+    获取 ChanlunAnalysis，按 (K线序列对象, 长度, MACD 对象, index, engine, div_index) 缓存，
+    同一次操作评价或同一只股票分析中的多处调用共享一份计算结果。
+    每次都传入新序列的一次性分析请直接构造 ChanlunAnalysis，以免挤掉模拟器的缓存
+    """
+    if index is None:
+        index = len(klines) - 1
+    refs = (klines, macd_data, engine, div_index)
+    key = (id(klines), len(klines), id(macd_data), index, id(engine), id(div_index))
+    with _ANALYSIS_LOCK:
+        cached = _ANALYSIS_CACHE.get(key)
+        # 缓存持有对象引用，id 不会被复用；这里再核对一次身份以防万一
+        if cached is not None and all(a is b for a, b in zip(cached[0], refs)):
+            _ANALYSIS_CACHE.move_to_end(key)
+            return cached[1]
+        analysis = ChanlunAnalysis(klines, macd_data, index, engine, div_index)
+        _ANALYSIS_CACHE[key] = (refs, analysis)
+        if len(_ANALYSIS_CACHE) > _ANALYSIS_CACHE_SIZE:
+            _ANALYSIS_CACHE.popitem(last=False)
+    return analysis
+
+def get_chanlun_shapes(klines, macd_data, current_index, engine=None, div_index=None):
     """
     计算并返回K线对应的笔、中枢、分型和背驰形状
     功能集成，用于任意级别的K线分析
+    engine: 可选的 ChanlunEngine，已推入与 klines 相同的K线时直接复用其增量结果
+    div_index: 可选的 DivergenceIndex (见 ChanlunAnalysis)
     """
-    highlight_shapes = []
-    
-    # 1. 笔和中枢
-    # 为了性能，可以只计算最近的一段，但为了准确性，这里传入全部历史（klines是切片过的）
-    # 在模拟器中 current_index < 400 左右，计算开销可控
-    bi_zhongshu_shapes = calculate_bi_and_zhongshu_shapes(klines)
-    highlight_shapes.extend(bi_zhongshu_shapes)
-    
-    # 2. 背驰
-    divergence_desc, divergence_shapes = check_divergence(klines, macd_data, current_index)
-    if divergence_shapes:
-        highlight_shapes.extend(divergence_shapes)
-    
-    # 3. 分型（当前K线）
-    recent_k = klines[max(0, current_index-2):current_index+1]
-    fenxing = identify_fenxing(recent_k)
-    
-    if fenxing:
-        k_subset = klines[current_index-2 : current_index+1]
-        if k_subset:
-            max_h = max(k['high'] for k in k_subset)
-            min_l = min(k['low'] for k in k_subset)
-            
-            if fenxing == 'bottom':
-                box_color = 'rgba(255, 0, 0, 0.1)' # 偏红
-                border_color = 'rgba(255, 0, 0, 0.5)'
-            else:
-                box_color = 'rgba(0, 128, 0, 0.1)' # 偏绿
-                border_color = 'rgba(0, 128, 0, 0.5)'
-            
-            highlight_shapes.append({
-                'type': 'rect',
-                'xref': 'x', 'yref': 'y',
-                'x0': current_index - 2 - 0.4, 
-                'x1': current_index + 0.4,
-                'y0': min_l,
-                'y1': max_h,
-                'fillcolor': box_color,
-                'line': {'color': border_color, 'width': 1, 'dash': 'solid'}
-            })
-            
-    return highlight_shapes
+    return get_chanlun_analysis(klines, macd_data, current_index, engine, div_index).shapes
 
-def analyze_action(action, klines, macd_data, current_index):
+def _closes(klines, end):
+    """
+    前 end 根K线的收盘价 (KLineArray 直接返回数组视图)
+    """
+    if isinstance(klines, KLineArray):
+        return klines.close[:end]
+    return [k['close'] for k in klines[:end]]
+
+def analyze_action(action, klines, macd_data, current_index, engine=None, div_index=None):
     """
     评价用户的操作，结合分型、MACD和背驰
     action: 'buy', 'sell', 'hold'
     current_index: 当前K线在总数据中的索引
+    engine / div_index: 可选的增量引擎和背驰索引 (见 get_chanlun_shapes)
     """
     # 基础数据准备
-    recent_k = klines[max(0, current_index-2):current_index+1]
     dif = macd_data['dif'][current_index]
     dea = macd_data['dea'][current_index]
     hist = macd_data['hist'][current_index]
     hist_prev = macd_data['hist'][current_index-1] if current_index > 0 else 0
     
-    # 形态判断
-    fenxing = identify_fenxing(recent_k)
-    divergence_desc, divergence_shapes = check_divergence(klines, macd_data, current_index)
-    
-    # 收集需要高亮的区域形状 (使用重构后的函数)
-    highlight_shapes = get_chanlun_shapes(klines, macd_data, current_index)
+    # 形态判断 (分型、背驰和高亮形状来自同一份结构分析)
+    analysis = get_chanlun_analysis(klines, macd_data, current_index, engine, div_index)
+    fenxing = analysis.fenxing
+    divergence_desc, divergence_shapes = analysis.divergence
+    highlight_shapes = analysis.shapes
     
     # 均线辅助 (MA5, MA20)
-    closes = [k['close'] for k in klines[:current_index+1]]
+    closes = _closes(klines, current_index+1)
     ma5 = np.mean(closes[-5:]) if len(closes) >= 5 else closes[-1]
     ma20 = np.mean(closes[-20:]) if len(closes) >= 20 else closes[-1]
     trend = "多头" if ma5 > ma20 else "空头"
@@ -914,7 +756,7 @@ def analyze_action(action, klines, macd_data, current_index):
     
     return "\n\n".join(msg), score, highlight_shapes
 
-def _analyze_level_status(klines, macd_data, idx):
+def _analyze_level_status(klines, macd_data, idx, div_index=None):
     """
     辅助函数：分析单个级别的趋势和结构
     返回: stats 字典 (以前是tuple)
@@ -923,7 +765,7 @@ def _analyze_level_status(klines, macd_data, idx):
         return None
         
     # 1. 均线趋势
-    closes = [k['close'] for k in klines[:idx+1]]
+    closes = _closes(klines, idx+1)
     ma5 = np.mean(closes[-5:]) if len(closes) >= 5 else closes[-1]
     ma20 = np.mean(closes[-20:]) if len(closes) >= 20 else closes[-1]
     trend = 'UP' if ma5 > ma20 else 'DOWN'
@@ -931,15 +773,15 @@ def _analyze_level_status(klines, macd_data, idx):
     
     signals = []
     
-    # 2. 分型
-    range_k = klines[:idx+1] # 传入全部历史供切片
-    fenxing = identify_fenxing(range_k) # identify_fenxing 内部会取最后3根
+    # 2. 分型 (截止 idx 的最后3根)
+    analysis = get_chanlun_analysis(klines, macd_data, idx, div_index=div_index)
+    fenxing = analysis.fenxing
     if fenxing == 'top': signals.append('顶分型')
     elif fenxing == 'bottom': signals.append('底分型')
     
     # 3. 背驰 (只看最近的)
     try:
-        div_desc, _ = check_divergence(klines, macd_data, idx)
+        div_desc, _ = analysis.divergence
         if div_desc:
             if '顶背驰' in div_desc: signals.append('顶背驰')
             if '底背驰' in div_desc: signals.append('底背驰')
@@ -971,35 +813,30 @@ def _analyze_level_status(klines, macd_data, idx):
         'macd_desc': macd_desc
     }
 
-def analyze_advanced_action(action, current_idx, day_data, day_macd, week_data, week_macd, month_data, month_macd):
+def analyze_advanced_action(action, current_idx, day_data, day_macd, week_data, week_macd, month_data, month_macd, engine=None, week_map=None, month_map=None,
+                            div_index=None, week_div_index=None, month_div_index=None):
     """
     高级模式分析，结合日、周、月线进行联动分析
+    engine: 可选的日线 ChanlunEngine (见 get_chanlun_shapes)
+    week_map / month_map: 可选的 day_to_bar_map 查表数组，省去每次线性查找周/月K
+    div_index / week_div_index / month_div_index: 可选的日/周/月线 DivergenceIndex
     """
     # 1. 基础日线分析 (保持原有的日线评价逻辑)
     # day_msg 格式通常为: "**市场状态**: ... \n\n **评价**: ..."
-    day_msg_text, day_score, day_shapes = analyze_action(action, day_data, day_macd, current_idx)
+    day_msg_text, day_score, day_shapes = analyze_action(action, day_data, day_macd, current_idx, engine, div_index)
     
     # 2. 寻找对应的周、月线索引
     c_time = day_data[current_idx]['time']
     
-    week_idx = -1
-    for i, w in enumerate(week_data):
-        if w['start_day_idx'] <= c_time <= w['end_day_idx']:
-            week_idx = i
-            break
-            
-    month_idx = -1
-    for i, m in enumerate(month_data):
-        if m['start_day_idx'] <= c_time <= m['end_day_idx']:
-            month_idx = i
-            break
+    week_idx = _locate_bar(week_data, week_map, c_time)
+    month_idx = _locate_bar(month_data, month_map, c_time)
             
     if week_idx < 0:
         return day_msg_text + "\n\n(大级别数据不足)", day_score, day_shapes
 
     # 3. 分析大级别状态
-    w_stats = _analyze_level_status(week_data, week_macd, week_idx)
-    m_stats = _analyze_level_status(month_data, month_macd, month_idx)
+    w_stats = _analyze_level_status(week_data, week_macd, week_idx, week_div_index)
+    m_stats = _analyze_level_status(month_data, month_macd, month_idx, month_div_index)
     
     if not w_stats or not m_stats:
         return day_msg_text + "\n\n(大级别数据不足)", day_score, day_shapes
@@ -0,0 +1,174 @@
+"""
+请求合并 (single-flight)
+
+同一个抓取函数、同样参数的调用在进行中时，后来的调用不再发请求，直接等待第一个调用的结果。
+开盘时多个用户同时打开同一只热门股票，只会向上游发一次请求。
+
+- 成功结果按 LRU 缓存 (maxsize=0 时不缓存，只合并进行中的调用)，替代原来的 functools.lru_cache；
+  给定 ttl 时成功结果只保留 ttl 秒，fetched_at() 返回缓存结果的实际抓取时间
+- 失败 (抛异常，或返回 None / 空 dict / 空 DataFrame) 只缓存 error_ttl 秒，之后重新请求；
+  lru_cache 会把失败的 None 一直缓存到重启
+- 线程与 asyncio 都可用: fetch(code) 在线程中阻塞等待，await fetch.acall(code) 不占用线程等待
+- 统计每个函数的调用数、实际执行数、合并数、缓存命中与失败缓存命中
+
+    @single_flight(maxsize=100, error_ttl=30)
+    def _fetch_gdhs(code): ...
+
+    df = _fetch_gdhs('600519')
+    df = await _fetch_gdhs.acall('600519')
+    _fetch_gdhs.cache_clear()
+    from utils import single_flight as sf
+    sf.stats()   # {'utils.money_flow._fetch_gdhs': {'calls': .., 'coalesced': .., ...}}
+"""
+import asyncio
+import functools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+ERROR_TTL = 30  # 秒
+
+_KWARGS = object()  # 参数键中分隔位置参数与关键字参数
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def is_failure(result):
+    if result is None:
+        return True
+    if isinstance(result, (dict, list)):
+        return not result
+    empty = getattr(result, 'empty', None)
+    return isinstance(empty, bool) and empty
+
+
+class SingleFlight:
+    def __init__(self, fn, maxsize=128, error_ttl=ERROR_TTL, ttl=None):
+        self.fn = fn
+        self.maxsize = maxsize
+        self.error_ttl = error_ttl
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> Future
+        self._cache = OrderedDict()  # key -> (抓取时的 monotonic, 抓取时的 time.time(), 成功结果)
+        self._failures = {}  # key -> (过期时间, 结果, 异常)
+        self._stats = {'calls': 0, 'executions': 0, 'coalesced': 0, 'cache_hits': 0, 'failure_hits': 0, 'failures': 0}
+        functools.update_wrapper(self, fn)
+
+    @staticmethod
+    def _key(args, kwargs):
+        return args + (_KWARGS,) + tuple(sorted(kwargs.items())) if kwargs else args
+
+    def _cached(self, key):
+        """未过期的缓存项，没有时返回 None (调用方持有锁)"""
+        entry = self._cache.get(key)
+        if entry is not None and self.ttl is not None and time.monotonic() - entry[0] >= self.ttl:
+            del self._cache[key]
+            entry = None
+        return entry
+
+    def _begin(self, key):
+        """
+        返回 (是否已有结果, 结果或 Future, 是否由本次调用执行)
+        """
+        with self._lock:
+            self._stats['calls'] += 1
+            entry = self._cached(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                self._stats['cache_hits'] += 1
+                return True, entry[2], False
+            failed = self._failures.get(key)
+            if failed is not None:
+                if failed[0] > time.monotonic():
+                    self._stats['failure_hits'] += 1
+                    if failed[2] is not None:
+                        raise failed[2]
+                    return True, failed[1], False
+                del self._failures[key]
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats['coalesced'] += 1
+                return False, future, False
+            future = Future()
+            self._inflight[key] = future
+            self._stats['executions'] += 1
+            return False, future, True
+
+    def _run(self, key, future, args, kwargs):
+        try:
+            result = self.fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, None, e)
+            raise
+        self._finish(key, future, result, None)
+        return result
+
+    def _finish(self, key, future, result, error):
+        with self._lock:
+            self._inflight.pop(key, None)
+            if error is not None or is_failure(result):
+                self._stats['failures'] += 1
+                if self.error_ttl > 0:
+                    self._failures[key] = (time.monotonic() + self.error_ttl, result, error)
+            elif self.maxsize:
+                self._cache[key] = (time.monotonic(), time.time(), result)
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def __call__(self, *args, **kwargs):
+        key = self._key(args, kwargs)
+        done, value, leader = self._begin(key)
+        if done:
+            return value
+        if leader:
+            return self._run(key, value, args, kwargs)
+        return value.result()
+
+    async def acall(self, *args, **kwargs):
+        """asyncio 版本：由本次调用执行时放到默认线程池，等待他人的调用时不占线程"""
+        key = self._key(args, kwargs)
+        done, value, leader = self._begin(key)
+        if done:
+            return value
+        if leader:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._run, key, value, args, kwargs)
+        return await asyncio.wrap_future(value)
+
+    def fetched_at(self, *args, **kwargs):
+        """这组参数的缓存结果的抓取时间 (time.time())，没有缓存或已过期时为 None"""
+        with self._lock:
+            entry = self._cached(self._key(args, kwargs))
+            return None if entry is None else entry[1]
+
+    def cache_clear(self):
+        """清空成功与失败缓存 (进行中的调用不受影响)"""
+        with self._lock:
+            self._cache.clear()
+            self._failures.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, inflight=len(self._inflight), cached=len(self._cache))
+
+
+def single_flight(maxsize=128, error_ttl=ERROR_TTL, ttl=None):
+    def decorator(fn):
+        flight = SingleFlight(fn, maxsize=maxsize, error_ttl=error_ttl, ttl=ttl)
+        with _registry_lock:
+            _registry[f'{fn.__module__}.{fn.__qualname__}'] = flight
+        return flight
+    return decorator
+
+
+def stats():
+    with _registry_lock:
+        flights = dict(_registry)
+    return {name: flight.stats() for name, flight in flights.items()}
@@ -0,0 +1,239 @@
+"""
+策略批量评估
+
+analyze_action 只能评价单个位置上的一次操作。这里把同一套评分口径 (分型、背驰、MA5/MA20 趋势、MACD 柱)
+向量化为逐根K线的特征数组，让一条规则 (策略) 在成千上万条模拟或真实行情的每一根K线上运行，
+统计命中率、收益和回撤的分布以及吞吐量 (根/秒)，用来检验教程中"极佳操作"等规则的统计表现。
+
+    report = run_generated(n_series=1000, length=2000, policy='tutorial')
+    report = run_cached(load_cached_klines(), policy='divergence')
+
+约定: 信号 1=买入 (BUY)，-1=卖出 (SELL)，0=观望 (HOLD)；买卖均以信号当根收盘价全仓成交。
+"""
+import concurrent.futures
+import glob
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils import indicators
+from utils.divergence import DivergenceIndex, BOTTOM, TOP
+from utils.kline_array import KLineArray, fractal_positions
+from utils.simulator_logic import generate_simulation_paths
+
+BUY, SELL, HOLD = 1, -1, 0
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'sector_history_cache')
+
+
+def _trailing_mean(close, period):
+    """
+    analyze_action 口径的均线：不足 period 根时取当根收盘价
+    """
+    out = close.copy()
+    if len(close) >= period:
+        out[period - 1:] = np.lib.stride_tricks.sliding_window_view(close, period).mean(axis=1)
+    return out
+
+
+def signal_features(klines, macd=None, lookback=30):
+    """
+    逐根K线的评分特征 (判断口径与 analyze_action 一致)，返回 dict of np.ndarray:
+    close, hist, hist_prev, fenxing (1=底分型, -1=顶分型, 0=无), divergence (1=底背驰, -1=顶背驰, 0=无), bull (MA5>MA20)
+    """
+    close = klines.close
+    if macd is None:
+        hist = indicators.macd(close)[2]
+    else:
+        hist = np.asarray(macd['hist'], dtype=np.float64)
+    hist_prev = np.r_[0.0, hist[:-1]]
+
+    # 当前K线与前两根构成的分型，中间一根位于 i-1
+    fenxing = np.zeros(len(close), dtype=np.int8)
+    pos, is_top = fractal_positions(klines.high, klines.low)
+    fenxing[pos + 1] = np.where(is_top, TOP, BOTTOM)
+
+    divergence = DivergenceIndex(klines.low, klines.high, hist).flags(lookback)
+    bull = _trailing_mean(close, 5) > _trailing_mean(close, 20)
+    return {
+        'close': close, 'hist': hist, 'hist_prev': hist_prev,
+        'fenxing': fenxing, 'divergence': divergence, 'bull': bull,
+    }
+
+
+def action_scores(f, action):
+    """
+    向量化的 analyze_action 评分 (1 合理/极佳, 0 中性, -1 失误)，逐根给出在该位置执行 action 的得分
+    """
+    div, fx, bull, hist, hist_prev = f['divergence'], f['fenxing'], f['bull'], f['hist'], f['hist_prev']
+    if action == 'buy':
+        conds = [div == BOTTOM, (fx == BOTTOM) & bull, fx == BOTTOM, (hist > 0) & (hist > hist_prev)]
+        return np.select(conds, [1, 1, 0, 0], default=-1).astype(np.int8)
+    if action == 'sell':
+        conds = [div == TOP, (fx == TOP) & ~bull, fx == TOP, (hist < 0) & (hist < hist_prev)]
+        return np.select(conds, [1, 1, 0, 0], default=-1).astype(np.int8)
+    conds = [div != 0, (fx == BOTTOM) & bull, (fx == TOP) & ~bull]
+    return np.select(conds, [-1, 0, 0], default=1).astype(np.int8)
+
+
+# --- 内置策略：特征 -> 信号数组 ---
+def policy_tutorial(f):
+    """教程评分为 1 的买卖点 (一买/一卖、顺势二三买卖)"""
+    return (action_scores(f, 'buy') == 1).astype(np.int8) - (action_scores(f, 'sell') == 1).astype(np.int8)
+
+
+def policy_divergence(f):
+    """只做背驰：底背驰买入，顶背驰卖出"""
+    return f['divergence'].astype(np.int8)
+
+
+def policy_fenxing(f):
+    """只看分型：底分型买入，顶分型卖出"""
+    return f['fenxing'].astype(np.int8)
+
+
+POLICIES = {
+    'tutorial': policy_tutorial,
+    'divergence': policy_divergence,
+    'fenxing': policy_fenxing,
+}
+
+
+def backtest(close, signals, horizon=5):
+    """
+    单条行情的回测：全仓买入/清仓卖出，返回信号命中数、交易次数、收益和最大回撤。
+    命中: 买入信号后第 horizon 根收盘价更高，卖出信号后更低。
+    """
+    n = len(close)
+    sig_idx = np.flatnonzero(signals)
+    last = np.maximum.accumulate(np.where(signals != 0, np.arange(n), -1))
+    pos = np.where(last >= 0, signals[np.maximum(last, 0)] == BUY, False)
+
+    ret = np.zeros(n)
+    ret[1:] = pos[:-1] * (close[1:] / close[:-1] - 1)
+    equity = np.cumprod(1 + ret)
+    drawdown = 1 - equity / np.maximum.accumulate(equity)
+
+    judged = sig_idx[sig_idx + horizon < n]
+    moves = np.sign(close[judged + horizon] - close[judged])
+    return {
+        'bars': n,
+        'signals': int(len(judged)),
+        'hits': int(np.sum(moves == signals[judged])),
+        'trades': int(np.sum(pos[1:] & ~pos[:-1]) + pos[0]),
+        'pnl': float(equity[-1] - 1),
+        'max_drawdown': float(drawdown.max()) if n else 0.0,
+    }
+
+
+def evaluate_series(klines, policy='tutorial', horizon=5, lookback=30, macd=None):
+    """
+    在一条行情的每一根K线上运行策略并回测
+    policy: POLICIES 中的名称，或 features -> signals 的函数 (多进程时需为模块级函数)
+    """
+    func = POLICIES[policy] if isinstance(policy, str) else policy
+    f = signal_features(klines, macd, lookback)
+    return backtest(f['close'], func(f), horizon)
+
+
+def _paths_to_klines(paths, row):
+    n = paths['close'].shape[1]
+    return KLineArray(np.arange(n), paths['open'][row], paths['high'][row], paths['low'][row], paths['close'][row])
+
+
+def _evaluate_generated_chunk(args):
+    policy, seed, n_series, length, initial_price, horizon, lookback = args
+    paths = generate_simulation_paths(n_series, length, initial_price, seed=seed)
+    return [evaluate_series(_paths_to_klines(paths, row), policy, horizon, lookback) for row in range(n_series)]
+
+
+def _evaluate_klines_chunk(args):
+    policy, series, horizon, lookback = args
+    return [evaluate_series(k, policy, horizon, lookback) for k in series]
+
+
+def _run(func, tasks, workers):
+    """
+    workers<=1 时在当前进程顺序执行，否则使用进程池
+    """
+    if workers is not None and workers <= 1:
+        return [r for t in tasks for r in func(t)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        return [r for chunk in pool.map(func, tasks) for r in chunk]
+
+
+def summarize(results, elapsed):
+    """
+    汇总各条行情的回测结果：命中率、收益/回撤分位数和吞吐量
+    """
+    if not results:
+        return {'series': 0, 'bars': 0, 'signals': 0, 'hit_rate': None, 'trades': 0,
+                'pnl': {}, 'max_drawdown': {}, 'elapsed': elapsed, 'bars_per_sec': 0.0}
+    bars = sum(r['bars'] for r in results)
+    signals = sum(r['signals'] for r in results)
+    hits = sum(r['hits'] for r in results)
+
+    def dist(values):
+        values = np.asarray(values)
+        q = np.percentile(values, [5, 25, 50, 75, 95])
+        return {'mean': float(values.mean()), 'p5': float(q[0]), 'p25': float(q[1]),
+                'median': float(q[2]), 'p75': float(q[3]), 'p95': float(q[4])}
+
+    return {
+        'series': len(results),
+        'bars': bars,
+        'signals': signals,
+        'hit_rate': hits / signals if signals else None,
+        'trades': sum(r['trades'] for r in results),
+        'pnl': dist([r['pnl'] for r in results]),
+        'max_drawdown': dist([r['max_drawdown'] for r in results]),
+        'elapsed': elapsed,
+        'bars_per_sec': bars / elapsed if elapsed > 0 else float('inf'),
+    }
+
+
+def run_generated(n_series=1000, length=2000, policy='tutorial', seed=0, initial_price=20,
+                  horizon=5, lookback=30, workers=None, chunk_size=50):
+    """
+    在 n_series 局模拟行情上评估策略 (离线可用)。workers=None 使用全部 CPU，<=1 为单进程
+    """
+    seeds = np.random.SeedSequence(seed).generate_state((n_series + chunk_size - 1) // chunk_size)
+    tasks = []
+    for i, s in enumerate(seeds.tolist()):
+        count = min(chunk_size, n_series - i * chunk_size)
+        tasks.append((policy, s, count, length, initial_price, horizon, lookback))
+    start = time.perf_counter()
+    results = _run(_evaluate_generated_chunk, tasks, workers)
+    return summarize(results, time.perf_counter() - start)
+
+
+def run_cached(series, policy='tutorial', horizon=5, lookback=30, workers=None, chunk_size=20):
+    """
+    在已缓存的真实K线上评估策略。series: KLineArray 的列表或 {名称: KLineArray}
+    """
+    series = list(series.values()) if isinstance(series, dict) else list(series)
+    series = [k for k in series if len(k) > lookback]
+    tasks = [(policy, series[i:i + chunk_size], horizon, lookback) for i in range(0, len(series), chunk_size)]
+    start = time.perf_counter()
+    results = _run(_evaluate_klines_chunk, tasks, workers)
+    return summarize(results, time.perf_counter() - start)
+
+
+def load_cached_klines(cache_dir=CACHE_DIR):
+    """
+    读取板块历史K线缓存 (SectorAnalyzer.fetch_history 写入的 JSON)，返回 {板块名: KLineArray}
+    离线评估不检查缓存有效期
+    """
+    out = {}
+    for path in sorted(glob.glob(os.path.join(cache_dir, '*.json'))):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                df = pd.DataFrame(json.load(f))
+            if df.empty or not {'date', 'open', 'high', 'low', 'close'} <= set(df.columns):
+                continue
+            out[os.path.splitext(os.path.basename(path))[0]] = KLineArray.from_dataframe(df.sort_values('date'))
+        except Exception as e:
+            print(f"[StrategyEval] Skip cache {path}: {e}")
+    return out
@@ -0,0 +1,588 @@
+"""
+通达信公式引擎
+
+把通达信 (TDX) 风格的指标公式解析成表达式 DAG (相同子表达式只保留一个节点)，
+再按拓扑顺序在 NumPy 数组上一次性求值。输入可以是一只股票的一维序列 (bars,)，
+也可以是多只股票的二维面板 (stocks, bars)，时间轴始终为最后一维。
+
+    f = compile_formula('''
+        MA60:=MA(C,60);
+        QSX:EMA(C,13);
+        BUY:CROSS(C,QSX) AND VOL>MA(VOL,20)*1.5;
+    ''')
+    out = f.evaluate({'close': close, 'vol': volume})     # {'QSX': ..., 'BUY': ...}
+
+    state = f.prime({'close': close[:-1], 'vol': volume[:-1]})   # 历史部分只算一次
+    last = f.step(state, {'close': close[-1], 'vol': volume[-1]})  # 盘中只算最后一根，与 evaluate 逐位一致
+
+语法: NAME:=expr (中间变量)、NAME:expr (输出)、expr (匿名输出，命名为 OUT1, OUT2 ...)，语句以 ; 分隔，
+{...} 和 // 为注释，输出后的 ",COLORRED" 之类绘图属性会被忽略。
+运算: + - * / > < >= <= = <> AND OR，前缀 NOT (NOT C>1 即 NOT(C>1))，以及 FUNCTIONS 中的函数。
+口径: 比较和逻辑运算返回 1.0/0.0；除以 0 得 0；MA/HHV/LLV/SUM/COUNT 开头不足 N 根时按已有数据计算，
+N=0 表示从第一根累计 (与 MoneyFlow 中 rolling(min_periods=1) 的写法一致)。
+"""
+import re
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+
+# 行情变量别名 -> 标准名；evaluate 的输入按标准名 (不区分大小写) 匹配
+INPUT_ALIASES = {
+    'C': 'CLOSE', 'CLOSE': 'CLOSE',
+    'O': 'OPEN', 'OPEN': 'OPEN',
+    'H': 'HIGH', 'HIGH': 'HIGH',
+    'L': 'LOW', 'LOW': 'LOW',
+    'V': 'VOL', 'VOL': 'VOL', 'VOLUME': 'VOL',
+    'AMO': 'AMOUNT', 'AMOUNT': 'AMOUNT',
+}
+
+_TOKEN_RE = re.compile(r"""
+    (?P<num>\d+\.\d*|\.\d+|\d+)
+  | (?P<name>[A-Za-z_一-鿿][A-Za-z0-9_一-鿿]*)
+  | (?P<op>:=|>=|<=|<>|!=|==|&&|\|\||[-+*/><=(),:;])
+  | (?P<space>\s+)
+""", re.VERBOSE)
+_COMMENT_RE = re.compile(r"\{[^}]*\}|//[^\n]*")
+
+_BINARY = {
+    'OR': 1, 'AND': 2,
+    '>': 3, '<': 3, '>=': 3, '<=': 3, '=': 3, '<>': 3,
+    '+': 4, '-': 4,
+    '*': 5, '/': 5,
+}
+_OP_ALIASES = {'&&': 'AND', '||': 'OR', '==': '=', '!=': '<>'}
+_COMMUTATIVE = {'+', '*', 'AND', 'OR', '=', '<>', 'MAX', 'MIN'}
+
+
+class FormulaError(ValueError):
+    """公式语法错误、未知函数/变量或缺少输入"""
+
+
+# --- 数组内核 (时间轴为最后一维) ---
+def _truth(x):
+    return (x != 0) & ~np.isnan(x)
+
+
+def _bool(x):
+    return np.asarray(x, dtype=np.float64)
+
+
+def _shift(x, n):
+    out = np.full_like(x, np.nan)
+    if n == 0:
+        return x.copy()
+    if n < x.shape[-1]:
+        out[..., n:] = x[..., :-n]
+    return out
+
+
+def _window_sum(x, n):
+    """
+    最近 n 根 (含当根) 之和，开头不足 n 根时对已有数据求和；n=0 为累计和
+    窗口内直接求和 (不用累计和相减)，价格不变时均线不会因舍入误差出现微小波动
+    """
+    if n <= 0:
+        return np.cumsum(x, axis=-1)
+    if n == 1:
+        return x.copy()
+    pad = np.zeros(x.shape[:-1] + (n - 1,))
+    return sliding_window_view(np.concatenate([pad, x], axis=-1), n, axis=-1).sum(axis=-1)
+
+
+def _window_count(valid, n):
+    c = np.cumsum(valid, axis=-1, dtype=np.int64)
+    if n <= 0:
+        return c
+    out = c.copy()
+    out[..., n:] -= c[..., :-n]
+    return out
+
+
+def _ma(x, n):
+    """
+    均线 = 窗口和 / 有效根数，另有两条规则保证相等的比较结果严格成立 (如 MA60>REF(MA60,1))：
+    窗口内各值相同时取该值；窗口满且移出的值与移入的值相等时沿用上一根的均值。
+    窗口和按窗口内容直接求和，增量计算 (_ma_step) 对同一窗口求和，两者逐位一致。
+    """
+    valid = ~np.isnan(x)
+    total = _window_sum(np.where(valid, x, 0.0), n)
+    count = _window_count(valid, n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / np.maximum(count, 1), np.nan)
+    hi = _extreme(x, n, np.nanmax, np.fmax.accumulate, -np.inf)
+    lo = _extreme(x, n, np.nanmin, np.fmin.accumulate, np.inf)
+    mean = np.where(hi == lo, hi, mean)
+    if 0 < n < x.shape[-1]:
+        same = np.zeros(x.shape, dtype=bool)
+        same[..., n:] = x[..., n:] == x[..., :-n]
+        source = np.maximum.accumulate(np.where(same, 0, np.arange(x.shape[-1])), axis=-1)
+        mean = np.take_along_axis(mean, source, axis=-1)
+    return mean
+
+
+def _smooth_raw(x, alpha):
+    """
+    以首值为基准的递推 r[i] = alpha * (x[i] - x[0]) + (1 - alpha) * r[i-1]，r[0] = 0
+    """
+    if x.shape[-1] == 0:
+        return x.copy()
+    return lfilter([alpha], [1.0, -(1.0 - alpha)], x - x[..., :1], axis=-1)
+
+
+def _smooth(x, alpha):
+    """
+    y[i] = alpha * x[i] + (1 - alpha) * y[i-1]，y[0] = x[0] (见 indicators.recursive_smooth)
+    按 x[0] + _smooth_raw 计算: 首值严格等于 x[0]，从头不变的序列 (如停牌) 结果严格等于该值
+    """
+    return _smooth_raw(x, alpha) + x[..., :1]
+
+
+def _extreme(x, n, func, accumulate, pad_value):
+    if n <= 0:
+        return accumulate(x, axis=-1)
+    if n == 1:
+        return x.copy()
+    pad = np.full(x.shape[:-1] + (n - 1,), pad_value)
+    return func(sliding_window_view(np.concatenate([pad, x], axis=-1), n, axis=-1), axis=-1)
+
+
+def _std(x, n):
+    out = np.full_like(x, np.nan)
+    if 1 < n <= x.shape[-1]:
+        out[..., n - 1:] = sliding_window_view(x, n, axis=-1).std(axis=-1, ddof=1)
+    return out
+
+
+def _barslast(x):
+    t = _truth(x)
+    idx = np.arange(x.shape[-1])
+    last = np.maximum.accumulate(np.where(t, idx, -1), axis=-1)
+    return np.where(last >= 0, idx - last, np.nan).astype(np.float64)
+
+
+def _div(a, b):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(b == 0, 0.0, a / np.where(b == 0, 1.0, b))
+
+
+def _count(x, n):
+    return _window_count(_truth(x), n).astype(np.float64)
+
+
+def _every(x, n):
+    bars = np.minimum(np.arange(1, x.shape[-1] + 1), n) if n > 0 else np.arange(1, x.shape[-1] + 1)
+    return _bool(_window_count(_truth(x), n) == bars)
+
+
+# 函数名 -> (参数个数, 需为常数的参数位置, 实现)
+FUNCTIONS = {
+    'REF': (2, (1,), lambda x, n: _shift(x, int(n))),
+    'MA': (2, (1,), lambda x, n: _ma(x, int(n))),
+    'EMA': (2, (1,), lambda x, n: _smooth(x, 2.0 / (n + 1))),
+    'SMA': (3, (1, 2), lambda x, n, m: _smooth(np.nan_to_num(x, nan=0.0), m / n)),
+    'HHV': (2, (1,), lambda x, n: _extreme(x, int(n), np.nanmax, np.fmax.accumulate, -np.inf)),
+    'LLV': (2, (1,), lambda x, n: _extreme(x, int(n), np.nanmin, np.fmin.accumulate, np.inf)),
+    'SUM': (2, (1,), lambda x, n: _window_sum(np.nan_to_num(x, nan=0.0), int(n))),
+    'COUNT': (2, (1,), lambda x, n: _count(x, int(n))),
+    'EVERY': (2, (1,), lambda x, n: _every(x, int(n))),
+    'EXIST': (2, (1,), lambda x, n: _bool(_count(x, int(n)) > 0)),
+    'STD': (2, (1,), lambda x, n: _std(x, int(n))),
+    'CROSS': (2, (), lambda a, b: _bool((a > b) & (_shift(a, 1) <= _shift(b, 1)))),
+    'IF': (3, (), lambda c, a, b: np.where(_truth(c), a, b)),
+    'IFF': (3, (), lambda c, a, b: np.where(_truth(c), a, b)),
+    'ABS': (1, (), np.abs),
+    'MAX': (2, (), np.fmax),
+    'MIN': (2, (), np.fmin),
+    'NOT': (1, (), lambda x: _bool(~_truth(x))),
+    'BARSLAST': (1, (), _barslast),
+}
+
+_OPERATORS = {
+    '+': np.add, '-': np.subtract, '*': np.multiply, '/': _div,
+    '>': lambda a, b: _bool(a > b), '<': lambda a, b: _bool(a < b),
+    '>=': lambda a, b: _bool(a >= b), '<=': lambda a, b: _bool(a <= b),
+    '=': lambda a, b: _bool(a == b), '<>': lambda a, b: _bool(a != b),
+    'AND': lambda a, b: _bool(_truth(a) & _truth(b)),
+    'OR': lambda a, b: _bool(_truth(a) | _truth(b)),
+    'NEG': np.negative,
+}
+
+
+# --- 增量内核: 由历史序列 (h) 和新一根的值 (x) 计算新一根的结果，own 为该节点自身的历史
+# (EMA/SMA 传入的是 _smooth_raw 序列) ---
+def _window(h, x, n, pad=None):
+    """最近 n 根 (含新的一根) 组成的窗口，n=0 为全部；给定 pad 时不足 n 根在前面补齐 (与 _window_sum 一致)"""
+    keep = h.shape[-1] if n <= 0 else min(n - 1, h.shape[-1])
+    parts = [h[..., h.shape[-1] - keep:], x[..., None]]
+    if pad is not None and 0 < n and keep < n - 1:
+        parts.insert(0, np.full(x.shape + (n - 1 - keep,), pad))
+    return np.concatenate(parts, axis=-1)
+
+
+def _ma_step(own, arg, n):
+    h, x = arg
+    n = int(n)
+    w = _window(h, x, n)
+    valid = ~np.isnan(w)
+    count = valid.sum(axis=-1)
+    if n <= 0:
+        total = np.cumsum(np.where(valid, w, 0.0), axis=-1)[..., -1]
+    else:
+        total = np.where(~np.isnan(_window(h, x, n, pad=0.0)), _window(h, x, n, pad=0.0), 0.0).sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / np.maximum(count, 1), np.nan)
+    hi, lo = np.fmax.reduce(w, axis=-1), np.fmin.reduce(w, axis=-1)
+    mean = np.where(hi == lo, hi, mean)
+    if 0 < n <= h.shape[-1]:
+        mean = np.where(x == h[..., -n], own[..., -1], mean)
+    return mean
+
+
+def _smooth_step(raw, h, x, alpha):
+    """raw 为历史上的 _smooth_raw 序列，递推一步的算式与 lfilter 相同，结果逐位一致"""
+    base = h[..., 0]
+    return (alpha * (x - base) + (1.0 - alpha) * raw[..., -1]) + base
+
+
+def _count_step(arg, n):
+    return _truth(_window(*arg, int(n))).sum(axis=-1).astype(np.float64)
+
+
+def _std_step(arg, n):
+    n = int(n)
+    h, x = arg
+    if n <= 1 or h.shape[-1] + 1 < n:
+        return np.full(x.shape, np.nan)
+    return _window(h, x, n).std(axis=-1, ddof=1)
+
+
+def _cross_step(a, b):
+    return _bool((a[1] > b[1]) & (a[0][..., -1] <= b[0][..., -1]))
+
+
+def _barslast_step(own, arg):
+    return np.where(_truth(arg[1]), 0.0, own[..., -1] + 1)
+
+
+# EMA/SMA 的平滑系数 (由常数参数计算)，prime 时据此额外保存 _smooth_raw 序列
+_SMOOTH_ALPHA = {
+    'EMA': lambda n: 2.0 / (n + 1),
+    'SMA': lambda n, m: m / n,
+}
+
+_STEPS = {
+    'REF': lambda own, x, n: x[1] if int(n) == 0 else (x[0][..., -int(n)] if int(n) <= x[0].shape[-1]
+                                                       else np.full(x[1].shape, np.nan)),
+    'MA': _ma_step,
+    'EMA': lambda raw, x, n: _smooth_step(raw, x[0], x[1], 2.0 / (n + 1)),
+    'SMA': lambda raw, x, n, m: _smooth_step(raw, np.nan_to_num(x[0], nan=0.0), np.nan_to_num(x[1], nan=0.0), m / n),
+    'HHV': lambda own, x, n: np.fmax(own[..., -1], x[1]) if int(n) <= 0 else np.fmax.reduce(_window(*x, int(n)), axis=-1),
+    'LLV': lambda own, x, n: np.fmin(own[..., -1], x[1]) if int(n) <= 0 else np.fmin.reduce(_window(*x, int(n)), axis=-1),
+    'SUM': lambda own, x, n: (own[..., -1] + np.nan_to_num(x[1], nan=0.0) if int(n) <= 0
+                              else np.nan_to_num(_window(*x, int(n), pad=0.0), nan=0.0).sum(axis=-1)),
+    'COUNT': lambda own, x, n: _count_step(x, n),
+    'EVERY': lambda own, x, n: _bool(_count_step(x, n) == (x[0].shape[-1] + 1 if int(n) <= 0
+                                                            else min(int(n), x[0].shape[-1] + 1))),
+    'EXIST': lambda own, x, n: _bool(_count_step(x, n) > 0),
+    'STD': lambda own, x, n: _std_step(x, n),
+    'CROSS': lambda own, a, b: _cross_step(a, b),
+    'BARSLAST': _barslast_step,
+}
+
+
+def _tokenize(source):
+    source = _COMMENT_RE.sub(' ', source)
+    tokens, pos = [], 0
+    while pos < len(source):
+        m = _TOKEN_RE.match(source, pos)
+        if m is None:
+            raise FormulaError(f"无法识别的字符 {source[pos]!r} (位置 {pos})")
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == 'space':
+            continue
+        text = m.group()
+        if kind == 'name':
+            text = text.upper()
+            if text in ('AND', 'OR'):
+                kind = 'op'
+        elif kind == 'op':
+            text = _OP_ALIASES.get(text, text)
+        tokens.append((kind, text))
+    return tokens
+
+
+class Formula:
+    """
+    编译后的公式。nodes 为拓扑有序的 DAG 节点 (op, args)，outputs 为 [(名称, 节点号)]，
+    inputs 为用到的行情变量 (标准名)
+    """
+    def __init__(self, source):
+        self.source = source
+        self.nodes = []
+        self._ids = {}
+        self.variables = {}
+        self.outputs = []
+        self.inputs = set()
+        self._parse(_tokenize(source))
+
+    # --- 构建 DAG ---
+    def _node(self, op, args):
+        if op in _COMMUTATIVE:
+            args = tuple(sorted(args))
+        key = (op, args)
+        node_id = self._ids.get(key)
+        if node_id is None:
+            node_id = self._ids[key] = len(self.nodes)
+            self.nodes.append(key)
+        return node_id
+
+    def _const(self, value):
+        return self._node('CONST', (float(value),))
+
+    # --- 语法分析 (递归下降 + 运算符优先级) ---
+    def _parse(self, tokens):
+        self._tokens, self._pos = tokens, 0
+        anonymous = 0
+        while self._peek() is not None:
+            if self._peek() == ('op', ';'):
+                self._pos += 1
+                continue
+            name, output = None, True
+            if self._peek()[0] == 'name' and self._peek(1) in (('op', ':='), ('op', ':')):
+                name = self._peek()[1]
+                output = self._peek(1)[1] == ':'
+                self._pos += 2
+            node_id = self._expr(0)
+            if self._peek() == ('op', ','):
+                # 绘图属性 (COLORRED、LINETHICK2、NODRAW 等)，求值时忽略
+                while self._peek() not in (None, ('op', ';')):
+                    self._pos += 1
+            if self._peek() not in (None, ('op', ';')):
+                raise FormulaError(f"语句 {name or ''} 后有多余内容: {self._peek()[1]!r}")
+            if name is None:
+                anonymous += 1
+                name = f"OUT{anonymous}"
+            if name in INPUT_ALIASES or name in FUNCTIONS:
+                raise FormulaError(f"变量名 {name} 与行情变量或函数重名")
+            self.variables[name] = node_id
+            if output:
+                self.outputs = [(n, i) for n, i in self.outputs if n != name] + [(name, node_id)]
+        del self._tokens, self._pos
+
+    def _peek(self, offset=0):
+        i = self._pos + offset
+        return self._tokens[i] if i < len(self._tokens) else None
+
+    def _take(self, expected=None):
+        tok = self._peek()
+        if tok is None:
+            raise FormulaError("公式意外结束")
+        if expected is not None and tok != ('op', expected):
+            raise FormulaError(f"缺少 {expected!r}，遇到 {tok[1]!r}")
+        self._pos += 1
+        return tok
+
+    def _expr(self, min_prec):
+        left = self._unary()
+        while True:
+            tok = self._peek()
+            if tok is None or tok[0] != 'op' or tok[1] not in _BINARY or _BINARY[tok[1]] <= min_prec:
+                return left
+            self._pos += 1
+            right = self._expr(_BINARY[tok[1]])
+            left = self._node(tok[1], (left, right))
+
+    def _unary(self):
+        tok = self._peek()
+        if tok == ('op', '-'):
+            self._pos += 1
+            return self._node('NEG', (self._unary(),))
+        if tok == ('op', '+'):
+            self._pos += 1
+            return self._unary()
+        if tok == ('name', 'NOT') and self._peek(1) != ('op', '('):
+            # 前缀 NOT 比比较运算松、比 AND 紧: NOT C>1 AND V>0 即 NOT(C>1) AND V>0
+            self._pos += 1
+            return self._node('NOT', (self._expr(_BINARY['AND']),))
+        return self._atom()
+
+    def _atom(self):
+        kind, text = self._take()
+        if kind == 'num':
+            return self._const(text)
+        if kind == 'op' and text == '(':
+            node_id = self._expr(0)
+            self._take(')')
+            return node_id
+        if kind != 'name':
+            raise FormulaError(f"意外的符号 {text!r}")
+        if self._peek() == ('op', '('):
+            return self._call(text)
+        if text in self.variables:
+            return self.variables[text]
+        if text in INPUT_ALIASES:
+            self.inputs.add(INPUT_ALIASES[text])
+            return self._node('INPUT', (INPUT_ALIASES[text],))
+        raise FormulaError(f"未定义的变量 {text}")
+
+    def _call(self, name):
+        if name not in FUNCTIONS:
+            raise FormulaError(f"不支持的函数 {name}")
+        arity, const_args, _ = FUNCTIONS[name]
+        self._take('(')
+        args = [self._expr(0)]
+        while self._peek() == ('op', ','):
+            self._pos += 1
+            args.append(self._expr(0))
+        self._take(')')
+        if len(args) != arity:
+            raise FormulaError(f"{name} 需要 {arity} 个参数，实际 {len(args)} 个")
+        for i in const_args:
+            if self.nodes[args[i]][0] != 'CONST':
+                raise FormulaError(f"{name} 的第 {i + 1} 个参数必须是常数")
+        return self._node(name, tuple(args))
+
+    # --- 求值 ---
+    def evaluate(self, data, outputs=None):
+        """
+        data: {变量名: 数组} 或 DataFrame (列名不区分大小写，close/high/low/open/vol(volume)/amount)，
+              每个数组形状为 (bars,) 或 (stocks, bars)
+        outputs: 需要的变量名列表 (可含中间变量)，缺省为全部输出变量
+        返回 {名称: float64 数组}
+        """
+        wanted = self._wanted(outputs)
+        arrays = self._read_inputs(data, self._needed([i for _, i in wanted]))
+        shape = next(iter(arrays.values())).shape if arrays else (0,)
+        values = self._run(arrays, wanted, shape)
+        return {name: values[i] for name, i in wanted}
+
+    def prime(self, data, outputs=None):
+        """
+        在历史K线上完整求值一次并保留所有节点的序列，之后用 step 只计算新增的一根
+        """
+        wanted = self._wanted(outputs)
+        arrays = self._read_inputs(data, self._needed([i for _, i in wanted]))
+        shape = next(iter(arrays.values())).shape if arrays else (0,)
+        if shape[-1] == 0:
+            raise FormulaError("prime 需要至少一根历史K线")
+        raw = {}
+        values = self._run(arrays, wanted, shape, raw)
+        return FormulaState(wanted, values, shape, raw)
+
+    def step(self, state, bar):
+        """
+        在 prime 的历史之后追加一根K线，返回该根上各输出的值 (单只为 0 维数组，面板为 (stocks,) 数组)。
+        不修改 state，盘中同一根K线反复变化时可以重复调用。
+        bar: {变量名: 标量或 (stocks,) 数组}
+        """
+        hist = state.values
+        arrays = self._read_inputs(bar, hist)
+        cur = {}
+        for node_id in sorted(hist):
+            op, args = self.nodes[node_id]
+            if op == 'CONST':
+                cur[node_id] = args[0]
+            elif op == 'INPUT':
+                cur[node_id] = np.broadcast_to(arrays[args[0]], state.shape[:-1])
+            elif op in _OPERATORS:
+                cur[node_id] = _OPERATORS[op](*(cur[a] for a in args))
+            elif op in _STEPS:
+                const_args = FUNCTIONS[op][1]
+                params = [self.nodes[a][1][0] if i in const_args else (hist[a], np.broadcast_to(cur[a], state.shape[:-1]))
+                          for i, a in enumerate(args)]
+                cur[node_id] = _STEPS[op](state.raw.get(node_id, hist[node_id]), *params)
+            else:
+                cur[node_id] = FUNCTIONS[op][2](*(np.asarray(cur[a], dtype=np.float64) for a in args))
+        return {name: np.broadcast_to(cur[i], state.shape[:-1]).astype(np.float64) for name, i in state.wanted}
+
+    def _read_inputs(self, data, node_ids):
+        """取出 node_ids 用到的行情变量"""
+        required = {self.nodes[i][1][0] for i in node_ids if self.nodes[i][0] == 'INPUT'}
+        arrays = {}
+        for key in data:
+            std = INPUT_ALIASES.get(str(key).upper())
+            if std in required:
+                arrays[std] = np.asarray(data[key], dtype=np.float64)
+        missing = required - set(arrays)
+        if missing:
+            raise FormulaError(f"缺少输入: {', '.join(sorted(missing))}")
+        return arrays
+
+    def _wanted(self, outputs):
+        if outputs is None:
+            return self.outputs
+        unknown = [n for n in outputs if n not in self.variables]
+        if unknown:
+            raise FormulaError(f"未定义的变量 {', '.join(unknown)}")
+        return [(n, self.variables[n]) for n in outputs]
+
+    def _run(self, arrays, wanted, shape, raw=None):
+        """
+        按节点号 (即拓扑序) 计算 wanted 依赖的全部节点，返回 {节点号: 与 shape 同形的数组}
+        raw: 给定时填入 EMA/SMA 节点的 _smooth_raw 序列 (增量计算用)
+        """
+        values = {}
+        for node_id in sorted(self._needed([i for _, i in wanted])):
+            op, args = self.nodes[node_id]
+            if op == 'CONST':
+                values[node_id] = args[0]  # 标量，运算时广播
+            elif op == 'INPUT':
+                values[node_id] = arrays[args[0]]
+            elif op in _OPERATORS:
+                values[node_id] = _OPERATORS[op](*(values[a] for a in args))
+            else:
+                _, const_args, func = FUNCTIONS[op]
+                params = [self.nodes[a][1][0] if i in const_args else np.broadcast_to(values[a], shape)
+                          for i, a in enumerate(args)]
+                if raw is not None and op in _SMOOTH_ALPHA:
+                    x = np.nan_to_num(params[0], nan=0.0) if op == 'SMA' else params[0]
+                    raw[node_id] = _smooth_raw(x, _SMOOTH_ALPHA[op](*params[1:]))
+                    values[node_id] = raw[node_id] + x[..., :1]
+                else:
+                    values[node_id] = func(*params)
+        return {i: np.broadcast_to(v, shape).astype(np.float64) for i, v in values.items()}
+
+    def _needed(self, roots):
+        needed, stack = set(), list(roots)
+        while stack:
+            node_id = stack.pop()
+            if node_id in needed:
+                continue
+            needed.add(node_id)
+            op, args = self.nodes[node_id]
+            if op not in ('CONST', 'INPUT'):
+                stack.extend(args)
+        return needed
+
+    __call__ = evaluate
+
+
+class FormulaState:
+    """
+    Formula.prime 的结果: values 为 {节点号: 历史序列}，outputs 为 {输出名: 历史序列}
+    """
+    def __init__(self, wanted, values, shape, raw=None):
+        self.wanted = wanted
+        self.values = values
+        self.shape = shape
+        self.raw = raw or {}
+        self.outputs = {name: values[i] for name, i in wanted}
+
+    def __len__(self):
+        return self.shape[-1]
+
+    def head(self, length):
+        """前 length 根K线上的状态 (公式只依赖当前及之前的K线，直接截取即可)"""
+        return FormulaState(self.wanted, {i: v[..., :length] for i, v in self.values.items()},
+                            self.shape[:-1] + (length,), {i: v[..., :length] for i, v in self.raw.items()})
+
+
+@lru_cache(maxsize=128)
+def compile_formula(source):
+    """
+    编译公式 (按源码缓存)，返回 Formula
+    """
+    return Formula(source)
@@ -0,0 +1,261 @@
+"""
+自选股后台预计算
+
+浏览器把自选股列表 (localStorage 中的 stock_subscriptions) 登记到服务端，调度器按市场时钟在后台刷新
+资金流 (get_flow_data) 与买卖助手 (get_kline_data + build_buy_sell_assistant)，点击时直接用预计算结果：
+- 盘中: 当前屏幕上显示的那一项 (资金流或某周期的买卖助手) 每 FOCUS_INTERVAL 秒刷新，
+  其余自选股每 WATCH_INTERVAL 秒刷新
+- 盘后/休市: 每个结果在最近一次收盘后刷新一次，之后不再请求
+- 全局请求预算 (令牌桶)，资金流一次约 3 个请求，买卖助手约 1 个；预算不足时等待，优先处理屏幕上的股票
+- 结果带计算时间 (北京时间，取数据的实际下载时间)，页面据此显示数据新鲜度
+
+    scheduler = get_scheduler()
+    scheduler.watch(client_id, ['600519', '000001'])
+    scheduler.focus(client_id, 'assistant', '600519', period='day')
+    entry = scheduler.get('assistant', '600519', 'day')   # None 表示没有可用结果，需现场计算
+    entry.value, entry.computed_at
+"""
+import asyncio
+import datetime
+import threading
+import time
+
+from utils.fund_radar import FundRadar
+from utils.single_flight import is_failure
+
+FOCUS_INTERVAL = {'flow': 120, 'assistant': 30}  # 秒，盘中屏幕上的股票
+WATCH_INTERVAL = {'flow': 900, 'assistant': 300}  # 秒，盘中其余自选股
+JOB_COST = {'flow': 3, 'assistant': 1}  # 每个任务大约发出的上游请求数
+REQUEST_BUDGET_PER_MIN = 60
+RETRY_AFTER = 120  # 任务失败后多久再试 (秒)
+IDLE_SLEEP = 1.0
+DEFAULT_PERIOD = 'day'
+
+
+def cn_now():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) + datetime.timedelta(hours=8)
+
+
+def last_session_close(now):
+    """
+    now (北京时间) 之前最近一个交易日的 15:00
+    """
+    day = now.date()
+    for _ in range(20):
+        close = datetime.datetime.combine(day, datetime.time(15, 0))
+        if close <= now and FundRadar.is_trading_day(close):
+            return close
+        day -= datetime.timedelta(days=1)
+    return None
+
+
+class RequestBudget:
+    """
+    令牌桶: 每分钟补充 per_minute 个，最多攒 burst 个
+    """
+    def __init__(self, per_minute=REQUEST_BUDGET_PER_MIN, burst=None, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.burst = burst or per_minute
+        self.clock = clock
+        self.tokens = float(self.burst)
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def take(self, cost):
+        """
+        够用时扣除并返回 0，否则返回还需等待的秒数
+        """
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= cost:
+                self.tokens -= cost
+                return 0.0
+            return (cost - self.tokens) / self.rate
+
+
+class Result:
+    """
+    compute 的返回值可以包一层 Result，指明数据的实际下载时间 (北京时间)，
+    数据来自上游缓存时计算时间早于现在
+    """
+    __slots__ = ('value', 'computed_at')
+
+    def __init__(self, value, computed_at=None):
+        self.value = value
+        self.computed_at = computed_at
+
+
+class Entry:
+    __slots__ = ('value', 'computed_at', 'failed_at')
+
+    def __init__(self, value=None, computed_at=None, failed_at=None):
+        self.value = value
+        self.computed_at = computed_at
+        self.failed_at = failed_at
+
+
+class WatchlistScheduler:
+    """
+    compute: {kind: fn(code, period) -> 结果}，返回 None / 空表视为失败
+    is_trading / last_close: 市场时钟 (参数为北京时间)，测试时可替换
+    """
+    def __init__(self, compute, budget=None, now=cn_now, is_trading=FundRadar.is_trading_time,
+                 last_close=last_session_close):
+        self.compute = compute
+        self.budget = budget or RequestBudget()
+        self.now = now
+        self.is_trading = is_trading
+        self.last_close = last_close
+        self._lock = threading.Lock()
+        self._watch = {}  # client_id -> set(code)
+        self._focus = {}  # client_id -> (kind, code, period)
+        self._results = {}  # (kind, code, period) -> Entry
+        self.stats = {'runs': 0, 'failures': 0, 'served': 0, 'missed': 0}
+
+    # --- 登记 ---
+    def watch(self, client_id, codes):
+        with self._lock:
+            self._watch[client_id] = {str(c) for c in codes}
+
+    def focus(self, client_id, kind, code, period=DEFAULT_PERIOD):
+        """
+        登记屏幕上正在显示的一项，只有这一项按 FOCUS_INTERVAL 刷新 (资金流不分周期)
+        """
+        with self._lock:
+            self._focus[client_id] = (kind, str(code), None if kind == 'flow' else period)
+
+    def forget(self, client_id):
+        """客户端断开时调用"""
+        with self._lock:
+            self._watch.pop(client_id, None)
+            self._focus.pop(client_id, None)
+
+    # --- 结果 ---
+    def store(self, kind, code, period, value, computed_at=None):
+        """页面现场计算的结果也存进来，供其他页面与后续点击使用；computed_at 缺省为现在"""
+        with self._lock:
+            self._results[(kind, str(code), period)] = Entry(value, computed_at or self.now())
+
+    def get(self, kind, code, period=None):
+        """
+        可直接使用的结果 (按非屏幕股票的节奏仍未过期)，没有时返回 None
+        """
+        key = (kind, str(code), period)
+        with self._lock:
+            entry = self._results.get(key)
+        if entry is None or entry.value is None or self._stale(kind, entry, self.now(), False):
+            self.stats['missed'] += 1
+            return None
+        self.stats['served'] += 1
+        return entry
+
+    def _stale(self, kind, entry, now, focused):
+        if entry.computed_at is None:
+            return True
+        if self.is_trading(now):
+            interval = (FOCUS_INTERVAL if focused else WATCH_INTERVAL)[kind]
+            return (now - entry.computed_at).total_seconds() >= interval
+        close = self.last_close(now)
+        return close is not None and entry.computed_at < close
+
+    # --- 调度 ---
+    def _targets(self):
+        with self._lock:
+            focused = set(self._focus.values())
+            targets = set(focused)
+            for codes in self._watch.values():
+                for code in codes:
+                    targets.update({('flow', code, None), ('assistant', code, DEFAULT_PERIOD)})
+            # 不再被关注的结果丢弃
+            for key in [k for k in self._results if k not in targets]:
+                del self._results[key]
+            return targets, focused
+
+    def next_job(self):
+        """
+        最该刷新的任务: 屏幕上的优先，其次是最久未刷新的；都不需要刷新时返回 None
+        """
+        now = self.now()
+        targets, focused = self._targets()
+        best = None
+        for key in targets:
+            with self._lock:
+                entry = self._results.get(key)
+            if entry is not None:
+                if entry.failed_at is not None and (now - entry.failed_at).total_seconds() < RETRY_AFTER:
+                    continue
+                if not self._stale(key[0], entry, now, key in focused):
+                    continue
+            rank = (key not in focused, entry.computed_at if entry and entry.computed_at else datetime.datetime.min, key)
+            if best is None or rank < best:
+                best = rank
+        return None if best is None else best[2]
+
+    def run_job(self, key):
+        kind, code, period = key
+        self.stats['runs'] += 1
+        try:
+            value = self.compute[kind](code, period)
+        except Exception as e:
+            print(f"[WatchlistScheduler] {kind} failed for {code}: {e}")
+            value = None
+        computed_at = None
+        if isinstance(value, Result):
+            value, computed_at = value.value, value.computed_at
+        with self._lock:
+            entry = self._results.setdefault(key, Entry())
+            if is_failure(value):
+                self.stats['failures'] += 1
+                entry.failed_at = self.now()
+            else:
+                entry.value, entry.computed_at, entry.failed_at = value, computed_at or self.now(), None
+
+    async def run(self):
+        """后台循环，每次只执行一个任务，受全局请求预算限制"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                key = self.next_job()
+                if key is None:
+                    await asyncio.sleep(IDLE_SLEEP)
+                    continue
+                wait = self.budget.take(JOB_COST[key[0]])
+                if wait > 0:
+                    # 等待期间可能有更重要的任务 (切换了股票)，醒来后重新挑选
+                    await asyncio.sleep(min(wait, IDLE_SLEEP))
+                    continue
+                await loop.run_in_executor(None, self.run_job, key)
+            except Exception as e:
+                print(f"[WatchlistScheduler] Loop error: {e}")
+                await asyncio.sleep(IDLE_SLEEP)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                from utils.money_flow import MoneyFlow
+                mf = MoneyFlow()
+
+                def assistant(code, period):
+                    kline_df = mf.get_kline_data(code, period or DEFAULT_PERIOD)
+                    if kline_df is None or kline_df.empty:
+                        return None
+                    return kline_df, mf.build_buy_sell_assistant(kline_df, (code, period or DEFAULT_PERIOD))
+
+                def flow(code, period):
+                    value = mf.get_flow_data(code)
+                    return Result(value, mf.flow_fetched_at(code))
+
+                _scheduler = WatchlistScheduler({
+                    'flow': flow,
+                    'assistant': assistant,
+                })
+    return _scheduler